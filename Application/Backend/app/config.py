@@ -69,5 +69,65 @@ class Settings(BaseModel):
     FIREBASE_CREDENTIALS_JSON: str = os.getenv("FIREBASE_CREDENTIALS_JSON", "")
     FIREBASE_PROJECT_ID: str = os.getenv("FIREBASE_PROJECT_ID", "")
 
+    # Фоновый планировщик (один лидер на все воркеры через advisory lock)
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+    SCHEDULER_LEADER_RETRY_SEC: int = int(os.getenv("SCHEDULER_LEADER_RETRY_SEC", "15"))
+    SCHEDULER_JITTER_SEC: int = int(os.getenv("SCHEDULER_JITTER_SEC", "3"))
+    AUTO_ADVANCE_INTERVAL_SEC: int = int(os.getenv("AUTO_ADVANCE_INTERVAL_SEC", "10"))
+    TARIFF_EXPIRY_CHECK_INTERVAL_SEC: int = int(os.getenv("TARIFF_EXPIRY_CHECK_INTERVAL_SEC", "600"))
+    PHOTO_CLEANUP_INTERVAL_SEC: int = int(os.getenv("PHOTO_CLEANUP_INTERVAL_SEC", "3600"))
+    AVATAR_VARIANTS_INTERVAL_SEC: int = int(os.getenv("AVATAR_VARIANTS_INTERVAL_SEC", "300"))
+    SEWERAGE_RECOMPUTE_INTERVAL_SEC: int = int(os.getenv("SEWERAGE_RECOMPUTE_INTERVAL_SEC", "30"))
+    LINE_PAYMENTS_BACKFILL_INTERVAL_SEC: int = int(os.getenv("LINE_PAYMENTS_BACKFILL_INTERVAL_SEC", "300"))
+    NOTIFICATION_ARCHIVE_INTERVAL_SEC: int = int(os.getenv("NOTIFICATION_ARCHIVE_INTERVAL_SEC", "3600"))
+    # Входящие callback AzeriCard: добор пропущенных и повторы после ошибок (сам callback
+    # проводится сразу после ответа шлюзу в принявшем его воркере)
+    AZERICARD_INBOX_INTERVAL_SEC: int = int(os.getenv("AZERICARD_INBOX_INTERVAL_SEC", "15"))
+    AZERICARD_INBOX_MAX_ATTEMPTS: int = int(os.getenv("AZERICARD_INBOX_MAX_ATTEMPTS", "10"))
+
+    # Архив уведомлений: прочитанные старше N месяцев уходят в notifications_archive.
+    # NOTIFICATION_RETENTION_MONTHS — сроки по типам (TYPE=N через запятую, 0 — не архивировать).
+    NOTIFICATION_ARCHIVE_AFTER_MONTHS: int = int(os.getenv("NOTIFICATION_ARCHIVE_AFTER_MONTHS", "6"))
+    NOTIFICATION_RETENTION_MONTHS: str = os.getenv(
+        "NOTIFICATION_RETENTION_MONTHS", "APPEAL=0,CONTRACT_APPROVAL=24,CONTRACT_DECISION=24"
+    )
+
+    # SSE-поток уведомлений (/api/notifications/stream) через LISTEN/NOTIFY
+    NOTIFICATION_STREAM_ENABLED: bool = os.getenv("NOTIFICATION_STREAM_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+    NOTIFICATION_STREAM_HEARTBEAT_SEC: int = int(os.getenv("NOTIFICATION_STREAM_HEARTBEAT_SEC", "25"))
+
+    # Учёт SQL на запрос (Server-Timing, N+1, /api/system/sql-stats)
+    SQL_STATS_ENABLED: bool = os.getenv("SQL_STATS_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+    SQL_STATS_SAMPLE_RATE: float = float(os.getenv("SQL_STATS_SAMPLE_RATE", "0.1"))
+    SQL_STATS_N1_THRESHOLD: int = int(os.getenv("SQL_STATS_N1_THRESHOLD", "10"))
+    SQL_STATS_LOG_MIN_QUERIES: int = int(os.getenv("SQL_STATS_LOG_MIN_QUERIES", "50"))
+
+    # /metrics (Prometheus). Пусто — без авторизации (закрывать на уровне балансировщика)
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+    # Хранилище загрузок: local (каталог uploads/) или s3 (любой S3-совместимый, например MinIO)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "local").strip().lower()
+    STORAGE_LOCAL_ROOT: str = os.getenv("STORAGE_LOCAL_ROOT", "uploads")
+    STORAGE_S3_BUCKET: str = os.getenv("STORAGE_S3_BUCKET", "")
+    STORAGE_S3_PREFIX: str = os.getenv("STORAGE_S3_PREFIX", "")
+    STORAGE_S3_ENDPOINT_URL: str = os.getenv("STORAGE_S3_ENDPOINT_URL", "")
+    STORAGE_S3_REGION: str = os.getenv("STORAGE_S3_REGION", "us-east-1")
+    STORAGE_S3_ACCESS_KEY: str = os.getenv("STORAGE_S3_ACCESS_KEY", "")
+    STORAGE_S3_SECRET_KEY: str = os.getenv("STORAGE_S3_SECRET_KEY", "")
+    STORAGE_S3_URL_TTL_SEC: int = int(os.getenv("STORAGE_S3_URL_TTL_SEC", "3600"))
+    # Публичный адрес бакета/CDN: если задан, /uploads/<key> редиректит туда вместо подписанной ссылки
+    STORAGE_PUBLIC_BASE_URL: str = os.getenv("STORAGE_PUBLIC_BASE_URL", "")
+    # Отдача /uploads фронтовым прокси: "" — сам воркер, nginx — X-Accel-Redirect, sendfile — X-Sendfile
+    UPLOADS_ACCEL_MODE: str = os.getenv("UPLOADS_ACCEL_MODE", "").strip().lower()
+    # internal-location nginx, смотрящий на STORAGE_LOCAL_ROOT
+    UPLOADS_ACCEL_PREFIX: str = os.getenv("UPLOADS_ACCEL_PREFIX", "/_uploads")
+
+    # Кэш справочников для фильтров (блоки, резиденты) в памяти воркера
+    REFERENCE_CACHE_TTL_SEC: int = int(os.getenv("REFERENCE_CACHE_TTL_SEC", "300"))
+    # Лента новостей для жителей (GET /api/news/public): кэш готовых ответов в памяти воркера
+    NEWS_CACHE_TTL_SEC: int = int(os.getenv("NEWS_CACHE_TTL_SEC", "300"))
+    # Шина инвалидации кэшей между воркерами (LISTEN/NOTIFY cache_invalidation)
+    CACHE_BUS_ENABLED: bool = os.getenv("CACHE_BUS_ENABLED", "1").strip().lower() not in {"0", "false", "no", "off"}
+
 
 settings = Settings()
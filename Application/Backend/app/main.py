@@ -1,14 +1,17 @@
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from sqlalchemy.orm import Session
 from .config import settings
 from .database import Base, engine, SessionLocal
 from .models import User, RoleEnum
 from .security import hash_password
-from .routers import auth_routes, dashboard, api_users, api_blocks, api_tariffs, api_residents, api_readings, api_tenants, api_invoices, api_payments, api_notifications, api_dashboard, api_logs, api_qr, api_payment, api_resident_dashboard, api_news, api_azericard, api_sales, push_routes
+from .services.sql_stats import SqlStatsMiddleware, install_sql_stats
+from .services.metrics import MetricsMiddleware, render_metrics
+from .services.search import trigram_index_ddl
+from .services.notification_counters import notification_counter_ddl
+from .routers import auth_routes, dashboard, api_users, api_blocks, api_tariffs, api_residents, api_readings, api_tenants, api_invoices, api_payments, api_notifications, api_dashboard, api_logs, api_qr, api_payment, api_resident_dashboard, api_news, api_azericard, api_sales, push_routes, api_system, api_reference, uploads
 
 
 def init_db():
@@ -48,6 +51,10 @@ def init_db():
     finally:
         db.close()
 
+# Ключ advisory lock, сериализующий run_bootstrap_schema между воркерами.
+BOOTSTRAP_LOCK_KEY = 52_710_043
+
+
 def run_bootstrap_schema():
     """
     Мягкие DDL: новые поля и таблицы — безопасно на каждом старте.
@@ -94,6 +101,8 @@ def run_bootstrap_schema():
         "ALTER TABLE meter_readings ADD COLUMN IF NOT EXISTS stable_fee_net NUMERIC(18,2);",
         "ALTER TABLE meter_readings ADD COLUMN IF NOT EXISTS stable_fee_vat NUMERIC(18,2);",
         "ALTER TABLE meter_readings ADD COLUMN IF NOT EXISTS stable_fee_total NUMERIC(18,2);",
+        # Invoice lines: погашено по строке (services/line_payments.py); NULL — ещё не посчитано
+        "ALTER TABLE invoice_lines ADD COLUMN IF NOT EXISTS amount_paid NUMERIC(18,2);",
         # News table
         """
         CREATE TABLE IF NOT EXISTS news (
@@ -102,7 +111,7 @@ def run_bootstrap_schema():
           content TEXT NOT NULL,
           icon VARCHAR(50) NOT NULL DEFAULT 'info',
           icon_color VARCHAR(50) NOT NULL DEFAULT '#667eea',
-          target_blocks TEXT NULL,
+          target_blocks JSONB NULL,
           is_active BOOLEAN NOT NULL DEFAULT TRUE,
           priority INTEGER NOT NULL DEFAULT 0,
           published_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
@@ -123,6 +132,7 @@ def run_bootstrap_schema():
           created_by_id INTEGER NULL REFERENCES users(id) ON DELETE SET NULL
         );
         """,
+        "ALTER TABLE meter_reading_photos ADD COLUMN IF NOT EXISTS thumb_path VARCHAR(255);",
         # M2M таблица (если не создана)
         """
         CREATE TABLE IF NOT EXISTS user_residents (
@@ -233,7 +243,28 @@ def run_bootstrap_schema():
         "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS appeal_workflow VARCHAR(40);",
         "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS staff_message TEXT;",
         "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS workflow_updated_at TIMESTAMP WITHOUT TIME ZONE;",
-        "ALTER TABLE news ADD COLUMN IF NOT EXISTS target_blocks TEXT;",
+        "ALTER TABLE news ADD COLUMN IF NOT EXISTS target_blocks JSONB;",
+        # target_blocks был TEXT с JSON-строкой: битые значения и пустой список — «всем» (NULL)
+        """
+        DO $$
+        DECLARE r RECORD;
+        BEGIN
+          IF (SELECT data_type FROM information_schema.columns
+              WHERE table_schema = current_schema() AND table_name = 'news' AND column_name = 'target_blocks') = 'text' THEN
+            FOR r IN SELECT id, target_blocks FROM news WHERE target_blocks IS NOT NULL LOOP
+              BEGIN
+                PERFORM r.target_blocks::jsonb;
+              EXCEPTION WHEN others THEN
+                UPDATE news SET target_blocks = NULL WHERE id = r.id;
+              END;
+            END LOOP;
+            ALTER TABLE news ALTER COLUMN target_blocks TYPE JSONB USING NULLIF(btrim(target_blocks), '')::jsonb;
+            UPDATE news SET target_blocks = NULL
+            WHERE target_blocks IS NOT NULL
+              AND (jsonb_typeof(target_blocks) <> 'array' OR target_blocks = '[]'::jsonb);
+          END IF;
+        END $$;
+        """,
         # Multi-terminal support for AzeriCard
         "ALTER TABLE online_transactions ADD COLUMN IF NOT EXISTS terminal_category VARCHAR(32);",
         # Saved cards for card-on-file / tokenization
@@ -355,36 +386,121 @@ def run_bootstrap_schema():
         """,
         "CREATE INDEX IF NOT EXISTS idx_sales_contracts_status ON sales_contracts(status);",
         "CREATE INDEX IF NOT EXISTS idx_sales_contracts_created_by ON sales_contracts(created_by_id);",
-        # Backfill: for existing PaymentApplications without line distributions,
-        # compute proportional splits and insert them.
+        # Состояние фоновых задач планировщика (пишет воркер-лидер)
         """
-        INSERT INTO payment_application_lines (application_id, invoice_line_id, amount)
-        SELECT
-            pa.id,
-            il.id,
-            ROUND(pa.amount_applied * il.amount_total / NULLIF(inv.amount_total, 0), 2)
-        FROM payment_applications pa
-        JOIN invoices inv ON inv.id = pa.invoice_id
-        JOIN invoice_lines il ON il.invoice_id = inv.id
-        WHERE NOT EXISTS (
-            SELECT 1 FROM payment_application_lines pal WHERE pal.application_id = pa.id
-        )
-        AND inv.amount_total > 0;
+        CREATE TABLE IF NOT EXISTS scheduler_jobs (
+          name VARCHAR(64) PRIMARY KEY,
+          interval_sec INTEGER NOT NULL DEFAULT 0,
+          leader VARCHAR(128) NULL,
+          last_started_at TIMESTAMPTZ NULL,
+          last_finished_at TIMESTAMPTZ NULL,
+          last_duration_ms INTEGER NULL,
+          last_processed INTEGER NULL,
+          backlog INTEGER NULL,
+          last_error TEXT NULL,
+          runs INTEGER NOT NULL DEFAULT 0,
+          failures INTEGER NOT NULL DEFAULT 0
+        );
+        """,
+        # Очередь авто-списания аванса (резидент → когда проверить)
+        """
+        CREATE TABLE IF NOT EXISTS auto_advance_queue (
+          resident_id INTEGER PRIMARY KEY REFERENCES residents(id) ON DELETE CASCADE,
+          available_at TIMESTAMPTZ NOT NULL,
+          reason VARCHAR(32) NULL,
+          enqueued_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
         """,
+        "CREATE INDEX IF NOT EXISTS ix_auto_advance_queue_available_at ON auto_advance_queue(available_at);",
+        # Входящие callback AzeriCard: приём отдельно от проведения платежа
+        """
+        CREATE TABLE IF NOT EXISTS azericard_callback_inbox (
+          order_id VARCHAR(32) PRIMARY KEY,
+          payload TEXT NOT NULL,
+          status VARCHAR(16) NOT NULL DEFAULT 'PENDING',
+          result VARCHAR(32) NULL,
+          attempts INTEGER NOT NULL DEFAULT 0,
+          last_error TEXT NULL,
+          received_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+          available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+          processed_at TIMESTAMPTZ NULL
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_azericard_callback_inbox_pending ON azericard_callback_inbox(available_at) WHERE status = 'PENDING';",
+        # Пересчёт авто-канализации открытых счетов после смены sewerage_percent тарифа
+        """
+        CREATE TABLE IF NOT EXISTS sewerage_recompute_queue (
+          tariff_id INTEGER PRIMARY KEY REFERENCES tariffs(id) ON DELETE CASCADE,
+          after_invoice_id INTEGER NOT NULL DEFAULT 0,
+          enqueued_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """,
+        # Первичное наполнение очереди из уже открытых счетов (повторный запуск ничего не меняет)
+        """
+        INSERT INTO auto_advance_queue (resident_id, available_at, reason)
+        SELECT i.resident_id,
+               MIN((i.due_date::timestamp AT TIME ZONE 'Asia/Baku') + INTERVAL '3 days'),
+               'BOOTSTRAP'
+        FROM invoices i
+        WHERE i.status IN ('ISSUED', 'PARTIAL') AND i.due_date IS NOT NULL
+        GROUP BY i.resident_id
+        ON CONFLICT (resident_id) DO NOTHING;
+        """,
+        # ==========================================================
+        #  Индексы под горячие фильтры списков/дашборда.
+        #  Проверка планов: python scripts/check_query_plans.py
+        # ==========================================================
+        "CREATE INDEX IF NOT EXISTS idx_meter_readings_meter_date ON meter_readings(resident_meter_id, reading_date);",
+        "CREATE INDEX IF NOT EXISTS idx_meter_readings_reading_date ON meter_readings(reading_date);",
+        "CREATE INDEX IF NOT EXISTS idx_meter_readings_tariff ON meter_readings(tariff_id);",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_lines_meter_reading ON invoice_lines(meter_reading_id);",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_lines_payment_pending ON invoice_lines(invoice_id) WHERE amount_paid IS NULL;",
+        "CREATE INDEX IF NOT EXISTS idx_resident_meters_resident ON resident_meters(resident_id);",
+        "CREATE INDEX IF NOT EXISTS idx_payment_applications_invoice ON payment_applications(invoice_id);",
+        "CREATE INDEX IF NOT EXISTS idx_payment_applications_payment ON payment_applications(payment_id);",
+        # varchar_pattern_ops: и равенство, и LIKE 'AUTOADV:%' при любой collation БД
+        "CREATE INDEX IF NOT EXISTS idx_payment_applications_reference ON payment_applications(reference varchar_pattern_ops);",
+        "CREATE INDEX IF NOT EXISTS idx_payment_application_lines_application ON payment_application_lines(application_id);",
+        "CREATE INDEX IF NOT EXISTS idx_payment_application_lines_invoice_line ON payment_application_lines(invoice_line_id);",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_lines_invoice ON invoice_lines(invoice_id);",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_status_due ON invoices(status, due_date);",
+        # invoices(resident_id, period_year, period_month) уже покрыт uq_invoice_resident_period
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_status_created ON notifications(user_id, status, created_at);",
+        # Архивация (services/notification_archive.py): кандидаты — только прочитанные
+        "CREATE INDEX IF NOT EXISTS idx_notifications_read_created ON notifications(created_at) WHERE status = 'READ';",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_archive_user_created ON notifications_archive(user_id, created_at);",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_archive_created ON notifications_archive(created_at);",
+        # «Уже уведомляли» (notified_user_ids) ищет и в архиве по типу + related_id
+        "CREATE INDEX IF NOT EXISTS idx_notifications_archive_type_related ON notifications_archive(notification_type, related_id) WHERE related_id IS NOT NULL;",
+        # Новости для жителей (services/news_feed.py): активные по приоритету и фильтр блоков `?|`
+        "CREATE INDEX IF NOT EXISTS idx_news_active_priority ON news(priority DESC, published_at DESC) WHERE is_active;",
+        "CREATE INDEX IF NOT EXISTS idx_news_target_blocks ON news USING GIN (target_blocks);",
+        "CREATE INDEX IF NOT EXISTS idx_reading_logs_created_at ON reading_logs(created_at);",
+        "CREATE INDEX IF NOT EXISTS idx_payments_resident_received ON payments(resident_id, received_at);",
+        "CREATE INDEX IF NOT EXISTS idx_payments_received_at ON payments(received_at);",
+        # pg_trgm GIN под поиск '%q%' в списках (services/search.py)
+        *trigram_index_ddl(),
+        # Счётчики непрочитанных уведомлений: триггер + первичное наполнение
+        *notification_counter_ddl(),
     ]
     from .database import engine
     with engine.begin() as conn:
+        # Воркеры gunicorn стартуют одновременно: DDL выполняет один, остальные ждут и видят готовую схему.
+        conn.exec_driver_sql("SELECT pg_advisory_xact_lock(%s)", (BOOTSTRAP_LOCK_KEY,))
         for sql in ddl_statements:
             conn.exec_driver_sql(sql)
 
-    # Гарантируем папку для аватаров
-    os.makedirs("uploads/avatars", exist_ok=True)
-    os.makedirs("uploads/meter_readings", exist_ok=True)
+    # Каталог локального хранилища загрузок (services/storage.py)
+    if settings.STORAGE_BACKEND != "s3":
+        os.makedirs(settings.STORAGE_LOCAL_ROOT, exist_ok=True)
 
 
 
 def create_app() -> FastAPI:
     app = FastAPI(title="FastAPI Admin (Dark)")
+    install_sql_stats(engine)
+    app.add_middleware(SqlStatsMiddleware)
+    app.add_middleware(MetricsMiddleware)
     app.add_middleware(SessionMiddleware, secret_key=settings.SESSION_SECRET_KEY, session_cookie=settings.COOKIE_NAME)
 
     # Разрешаем запросы с фронта (для разработки разрешаем все localhost origins)
@@ -403,8 +519,7 @@ def create_app() -> FastAPI:
         expose_headers=["*"],
     )
 
-    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-
+    app.include_router(uploads.router)
     app.include_router(auth_routes.router)
     app.include_router(dashboard.router)
     app.include_router(api_users.router)
@@ -425,22 +540,58 @@ def create_app() -> FastAPI:
     app.include_router(api_azericard.router)
     app.include_router(api_sales.router)
     app.include_router(push_routes.router)
+    app.include_router(api_system.router)
+    app.include_router(api_reference.router)
     @app.get("/healthz")
     def healthz():
         return {"ok": True}
 
+    @app.get("/metrics", include_in_schema=False)
+    def metrics(request: Request):
+        if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        body, content_type = render_metrics()
+        return Response(content=body, media_type=content_type)
+
     # /favicon.ico обслуживает Express (public/favicon.ico — брендовое дерево Royal Park).
     # Бэкенд-редирект на Bootstrap CDN удалён: он перебивал наш логотип.
 
     @app.on_event("startup")
-    def _start_auto_advance_scheduler():
-        from .services.auto_advance_scheduler import start_auto_advance_scheduler
-        start_auto_advance_scheduler()
+    def _validate_azericard_keys():
+        # Битый ключ — воркер не стартует, а не 500 на первой оплате; заодно прогревает кэш ключей.
+        from .services.azericard import validate_keys
+        checked = validate_keys()
+        if checked:
+            print(f"[azericard] keys ok: {', '.join(checked)}")
+
+    @app.on_event("startup")
+    def _start_scheduler():
+        # Поток есть в каждом воркере, но задачи выполняет только лидер (advisory lock).
+        from .services.jobs import register_default_jobs
+        from .services.scheduler import start_scheduler
+        register_default_jobs()
+        start_scheduler()
+
+    @app.on_event("shutdown")
+    def _stop_scheduler():
+        from .services.scheduler import stop_scheduler
+        stop_scheduler()
+
+    @app.on_event("startup")
+    def _start_cache_bus():
+        from .services.cache_bus import start_cache_bus
+        start_cache_bus()
+
+    @app.on_event("shutdown")
+    def _stop_pg_listener():
+        # общий LISTEN-поток: шина кэшей и SSE уведомлений
+        from .services.pg_listen import stop_listener
+        stop_listener()
 
     @app.on_event("shutdown")
-    def _stop_auto_advance_scheduler():
-        from .services.auto_advance_scheduler import stop_auto_advance_scheduler
-        stop_auto_advance_scheduler()
+    def _stop_image_workers():
+        from .services.image_workers import shutdown_image_workers
+        shutdown_image_workers()
 
     return app
 
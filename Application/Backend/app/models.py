@@ -3,9 +3,10 @@ from datetime import datetime, date
 from decimal import Decimal
 from sqlalchemy import (
     String, Integer, Enum, Boolean, DateTime, ForeignKey, UniqueConstraint, 
-    Numeric, Text, Table, Column, Date
+    Numeric, Text, Table, Column, Date, JSON
 )
 from sqlalchemy import Enum as SAEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy import text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .database import Base
@@ -174,6 +175,25 @@ class OnlineTransaction(Base):
     invoice = relationship("Invoice", lazy="joined")
 
 
+class AzericardCallbackInbox(Base):
+    """
+    Принятые callback AzeriCard (по одному на ORDER). Эндпоинт только сохраняет запрос и отвечает,
+    платёж проводит обработчик (services/azericard_inbox.py) под блокировкой строки.
+    """
+    __tablename__ = "azericard_callback_inbox"
+
+    order_id = Column(String(32), primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON полей callback как пришли
+    status = Column(String(16), nullable=False, default="PENDING", server_default="PENDING")  # PENDING / DONE / FAILED
+    # CONFIRMED / DECLINED / SIGNATURE_FAILED / NOT_FOUND / ALREADY_PROCESSED
+    result = Column(String(32), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), nullable=False, server_default=text("NOW()"))
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=text("NOW()"))
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class SavedCard(Base):
     __tablename__ = "saved_cards"
     __table_args__ = (
@@ -435,6 +455,7 @@ class MeterReadingPhoto(Base):
     meter_reading = relationship("MeterReading", lazy="joined")
 
     file_path: Mapped[str] = mapped_column(String(255), nullable=False)
+    thumb_path: Mapped[str | None] = mapped_column(String(255), nullable=True)  # превью для списков
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), default=datetime.utcnow)
     expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
     created_by_id: Mapped[int | None] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
@@ -511,6 +532,8 @@ class InvoiceLine(Base):
     amount_net: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
     amount_vat: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
     amount_total: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    # Погашено по строке; поддерживает services/line_payments.py (NULL — ещё не посчитано)
+    amount_paid: Mapped[Decimal | None] = mapped_column(Numeric(18, 2), nullable=True)
 
 
 class ResidentService(Base):
@@ -592,6 +615,54 @@ class Notification(Base):
     resident: Mapped["Resident"] = relationship("Resident", lazy="joined")
 
 
+class NotificationArchive(Base):
+    """
+    Прочитанные уведомления старше срока хранения своего типа. Переносит задача
+    notification-archive (services/notification_archive.py); id сохраняются,
+    колонки — как у notifications, плюс archived_at. Читается только по запросу (?archived=true).
+    """
+    __tablename__ = "notifications_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    resident_id: Mapped[int | None] = mapped_column(ForeignKey("residents.id", ondelete="SET NULL"), nullable=True)
+
+    message: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[NotificationStatus] = mapped_column(
+        SAEnum(NotificationStatus, name="notification_status"),
+        default=NotificationStatus.READ,
+        nullable=False,
+    )
+    notification_type: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    related_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+    read_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+
+    appeal_workflow: Mapped[str | None] = mapped_column(String(40), nullable=True)
+    staff_message: Mapped[str | None] = mapped_column(Text, nullable=True)
+    workflow_updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=False), nullable=True)
+
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=text("NOW()"))
+
+    user: Mapped["User"] = relationship("User", lazy="joined")
+    resident: Mapped["Resident"] = relationship("Resident", lazy="joined")
+
+
+class NotificationUnreadCounter(Base):
+    """
+    Число непрочитанных уведомлений по области видимости. Ведётся триггером на notifications
+    (services/notification_counters.py), приложение его только читает.
+    scope='admin', user_id=0 — общие админ-уведомления; 'admin', id — персональные админские;
+    'user', id — кабинет жителя.
+    """
+    __tablename__ = "notification_unread_counters"
+
+    scope: Mapped[str] = mapped_column(String(16), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    unread: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class News(Base):
     """
     Новости для отображения пользователям.
@@ -609,8 +680,8 @@ class News(Base):
     
     icon: Mapped[str] = mapped_column(String(50), nullable=False, default='info')  
     icon_color: Mapped[str] = mapped_column(String(50), nullable=False, default='#667eea')  
-    # JSON list of block names (e.g., ["A","B"]), null means "all"
-    target_blocks: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Список имён блоков (["A","B"]), NULL — всем. JSONB + GIN: фильтр `?|` в SQL (services/news_feed.py)
+    target_blocks: Mapped[list[str] | None] = mapped_column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True)
     
     
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -775,3 +846,58 @@ class SalesContractInstallment(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), default=datetime.utcnow)
 
     contract: Mapped["SalesContract"] = relationship("SalesContract", back_populates="installments")
+
+
+# =====================================================
+#  Очередь авто-списания аванса
+# =====================================================
+
+class AutoAdvanceQueueItem(Base):
+    """
+    Резидент, которого нужно проверить на авто-списание аванса не раньше available_at.
+    Ставится при выставлении счёта (available_at = срок оплаты + grace) и при поступлении денег.
+    """
+    __tablename__ = "auto_advance_queue"
+
+    resident_id: Mapped[int] = mapped_column(ForeignKey("residents.id", ondelete="CASCADE"), primary_key=True)
+    available_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    reason: Mapped[str | None] = mapped_column(String(32), nullable=True)  # INVOICE_ISSUED / PAYMENT / ...
+    enqueued_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=text("NOW()"))
+
+
+class SewerageRecomputeQueueItem(Base):
+    """
+    WATER-тариф, у которого изменился sewerage_percent: открытые счета с его показаниями
+    нужно пересчитать (строка авто-канализации и доля воды). Обрабатывается пачками по id счёта.
+    """
+    __tablename__ = "sewerage_recompute_queue"
+
+    tariff_id: Mapped[int] = mapped_column(ForeignKey("tariffs.id", ondelete="CASCADE"), primary_key=True)
+    after_invoice_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # курсор пачек
+    enqueued_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=text("NOW()"))
+
+
+# =====================================================
+#  Фоновый планировщик: состояние задач (видно со всех воркеров)
+# =====================================================
+
+class SchedulerJobState(Base):
+    """
+    Последний запуск фоновой задачи планировщика.
+    Пишет только воркер-лидер, читают все (для /api/system/jobs).
+    """
+    __tablename__ = "scheduler_jobs"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    interval_sec: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    leader: Mapped[str | None] = mapped_column(String(128), nullable=True)  # host:pid воркера-лидера
+
+    last_started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_duration_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_processed: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    backlog: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    runs: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failures: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
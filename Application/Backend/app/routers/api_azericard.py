@@ -3,18 +3,19 @@ from __future__ import annotations
 import json
 from decimal import Decimal
 from typing import Any, Optional
-from urllib.parse import urlparse
+from urllib.parse import quote, urlparse
 
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from pydantic import BaseModel
 from sqlalchemy import func
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from ..config import settings
 from ..database import get_db
-from ..models import Invoice, OnlineTransaction, Payment, PaymentApplication, PaymentLog, PaymentMethod, Resident
+from ..models import AzericardCallbackInbox, Invoice, OnlineTransaction, Payment, PaymentApplication, PaymentLog, PaymentMethod, Resident
 from ..utils import now_baku
 from ..services.azericard import (
     CALLBACK_SIGN_FIELDS,
@@ -34,10 +35,17 @@ from ..services.azericard import (
     generate_p_sign,
     verify_callback_signature,
 )
+from ..services.auto_advance_queue import enqueue_payment_pool
+from ..services.azericard_inbox import INBOX_PENDING, PAID_RESULTS, process_order_after_response, store_callback
 from .api_payment_logic import apply_payment_to_invoice, apply_payment_to_invoices
 
 router = APIRouter(prefix="/api/azericard", tags=["azericard-api"])
 
+# online_transactions.order_id / azericard_callback_inbox.order_id — VARCHAR(32)
+ORDER_ID_MAX_LEN = 32
+# Автообновление страницы «платёж проводится» (GET /result)
+RESULT_REFRESH_SEC = 2
+
 
 class InitiateRequest(BaseModel):
     resident_id: int
@@ -277,8 +285,13 @@ def initiate_payment(
 @router.post("/callback")
 async def azericard_callback(
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
+    """
+    Приём callback: проверка подписи, запись в azericard_callback_inbox и сразу ответ шлюзу.
+    Платёж проводится после ответа (services/azericard_inbox.py); итог — GET /result.
+    """
     data: dict[str, str] = {}
     try:
         form = await request.form()
@@ -295,12 +308,59 @@ async def azericard_callback(
     order_id = _pick(data, "ORDER", "order")
     if not order_id:
         raise HTTPException(status_code=400, detail="ORDER is required")
+    if len(order_id) > ORDER_ID_MAX_LEN:
+        raise HTTPException(status_code=400, detail="ORDER is too long")
 
-    tx = db.query(OnlineTransaction).filter(OnlineTransaction.order_id == order_id).first()
-    if not tx:
+    # Подпись — до записи в inbox: чужой callback не должен занять ORDER и вытеснить настоящий.
+    if not await run_in_threadpool(_callback_signature_ok, db, order_id, data):
+        if _wants_html(request):
+            return RedirectResponse(url=f"/api/azericard/fail?order_id={quote(order_id)}&reason=signature", status_code=302)
+        raise HTTPException(status_code=400, detail="Invalid callback signature")
+
+    queued = await run_in_threadpool(store_callback, db, order_id, data)
+    if queued:
+        background_tasks.add_task(process_order_after_response, order_id)
+    if _wants_html(request):
+        return RedirectResponse(url=f"/api/azericard/result?order_id={quote(order_id)}", status_code=302)
+    return {"ok": True, "order_id": order_id, "status": "ACCEPTED" if queued else "DUPLICATE"}
+
+
+def _callback_signature_ok(db: Session, order_id: str, data: dict[str, str]) -> bool:
+    """Проверка подписи ключом терминала заказа (ключи закэшированы — дёшево). Ничего не пишет."""
+    row = db.query(OnlineTransaction.terminal_category).filter(OnlineTransaction.order_id == order_id).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    category = row.terminal_category
+    callback_group = _resolve_group_from_callback_data(data)
+    _ensure_gateway_config(category, terminal_group=callback_group)
+    return verify_callback_signature(data, category=category, terminal_group=callback_group)
+
+
+def process_gateway_callback(db: Session, order_id: str, data: dict[str, str]) -> str:
+    """
+    Проводит принятый callback. Вызывается обработчиком inbox под блокировкой его строки;
+    коммитит вызывающий код. Возвращает итог: CONFIRMED / DECLINED / SIGNATURE_FAILED /
+    NOT_FOUND / ALREADY_PROCESSED. Ошибки конфигурации шлюза — исключением (повтор позже).
+    """
+    tx = (
+        db.query(OnlineTransaction)
+        .filter(OnlineTransaction.order_id == order_id)
+        .with_for_update(of=OnlineTransaction)
+        .first()
+    )
+    if not tx:
+        return "NOT_FOUND"
     if tx.payment_id:
-        return {"ok": True, "order_id": order_id, "payment_id": tx.payment_id, "status": "ALREADY_PROCESSED"}
+        return "ALREADY_PROCESSED"
+
+    category = tx.terminal_category
+    callback_group = _resolve_group_from_callback_data(data)
+    _ensure_gateway_config(category, terminal_group=callback_group)
+
+    # Эндпоинт уже проверил подпись; повтор — на случай записей, попавших в inbox в обход него.
+    # Поля транзакции пишем только из подписанного callback.
+    if not verify_callback_signature(data, category=category, terminal_group=callback_group):
+        return "SIGNATURE_FAILED"
 
     tx.callback_payload = json.dumps(data, ensure_ascii=False)
     tx.rrn = _pick(data, "RRN", "rrn")
@@ -310,26 +370,12 @@ async def azericard_callback(
     tx.rc = _pick(data, "RC", "rc")
     tx.trtype = _pick(data, "TRTYPE", "trtype") or tx.trtype
 
-    category = tx.terminal_category
-    callback_group = _resolve_group_from_callback_data(data)
-    _ensure_gateway_config(category, terminal_group=callback_group)
-
-    signature_ok = verify_callback_signature(data, category=category, terminal_group=callback_group)
     action = _pick(data, "ACTION", "action")
     status_ok = action == "0"
-    if not signature_ok:
-        tx.gateway_status = "SIGNATURE_FAILED"
-        db.commit()
-        if _wants_html(request):
-            return RedirectResponse(url=f"/api/azericard/fail?order_id={order_id}&reason=signature", status_code=302)
-        raise HTTPException(status_code=400, detail="Invalid callback signature")
 
     if not status_ok:
         tx.gateway_status = "DECLINED"
-        db.commit()
-        if _wants_html(request):
-            return RedirectResponse(url=f"/api/azericard/fail?order_id={order_id}&reason=declined", status_code=302)
-        return {"ok": False, "order_id": order_id, "status": "DECLINED"}
+        return "DECLINED"
 
     payment = Payment(
         resident_id=tx.resident_id,
@@ -374,10 +420,8 @@ async def azericard_callback(
             details=f"AzeriCard confirmed ORDER={order_id} [{category}]; invoice_applied={float(applied_amount)}",
         )
     )
-    db.commit()
-    if _wants_html(request):
-        return RedirectResponse(url=f"/api/azericard/success?order_id={order_id}", status_code=302)
-    return {"ok": True, "order_id": order_id, "payment_id": payment.id}
+    enqueue_payment_pool(db, tx.resident_id)
+    return "CONFIRMED"
 
 
 def _try_save_card_token(db: Session, tx: OnlineTransaction, callback_data: dict) -> None:
@@ -565,6 +609,43 @@ def _get_session_user_id(request: Request) -> Optional[int]:
     return None
 
 
+# Итог callback для fail-страницы: reason=...
+_FAIL_REASONS = {
+    "SIGNATURE_FAILED": "signature",
+    "DECLINED": "declined",
+    "NOT_FOUND": "not_found",
+}
+
+
+@router.get("/result")
+def payment_result(request: Request, order_id: str, db: Session = Depends(get_db)):
+    """
+    Итог принятого callback. Браузер: пока проводится — страница с автообновлением,
+    затем редирект на /success или /fail. JSON: только status/result записи inbox.
+    """
+    item = db.get(AzericardCallbackInbox, order_id)
+    if _wants_html(request):
+        if item is None:
+            return RedirectResponse(url=f"/api/azericard/fail?order_id={quote(order_id)}&reason=not_found", status_code=302)
+        if item.status == INBOX_PENDING:
+            return HTMLResponse(f"""
+    <html><head><meta http-equiv="refresh" content="{RESULT_REFRESH_SEC}"></head>
+    <body style="font-family:Arial,sans-serif;padding:24px;">
+      <h2>Processing payment…</h2>
+      <p>This page will update automatically.</p>
+    </body></html>
+    """)
+        if item.result in PAID_RESULTS:
+            return RedirectResponse(url=f"/api/azericard/success?order_id={quote(order_id)}", status_code=302)
+        reason = _FAIL_REASONS.get(item.result or "", "error")
+        return RedirectResponse(url=f"/api/azericard/fail?order_id={quote(order_id)}&reason={reason}", status_code=302)
+
+    if item is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    # Без авторизации: только состояние, без id платежа и служебных полей.
+    return {"ok": item.result in PAID_RESULTS, "order_id": order_id, "status": item.status, "result": item.result}
+
+
 @router.get("/success", response_class=HTMLResponse)
 def payment_success_page(order_id: str | None = None):
     order_suffix = f"&order_id={order_id}" if order_id else ""
@@ -12,10 +12,14 @@ from ..models import (
     User, RoleEnum, Block, Resident,
     Invoice, InvoiceStatus, InvoiceLine,
     PaymentApplication, Payment, PaymentMethod,
-    Tariff, ResidentMeter, MeterReading, MeterType, CustomerType, user_residents
+    MeterReading, user_residents
 )
 from ..deps import get_current_user
 from ..utils import to_baku_datetime, create_invoice_notification, now_baku, build_invoice_number
+from ..services.auto_advance_queue import enqueue_residents
+from ..services.billing import refresh_invoice
+from ..services.line_payments import invoice_line_payment_map
+from ..services.search import apply_search
 
 
 router = APIRouter(prefix="/api/invoices", tags=["invoices-api"])
@@ -120,9 +124,7 @@ def _list_invoices_internal(
         query = query.filter(Invoice.period_year == year)
     if month:
         query = query.filter(Invoice.period_month == month)
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(or_(Invoice.number.ilike(like), Invoice.notes.ilike(like)))
+    query = apply_search(query, q, Invoice.number, Invoice.notes)
     
     total = query.count()
     last_page = max(1, (total + per_page - 1) // per_page)
@@ -188,9 +190,6 @@ def _list_invoices_internal(
     if needs_commit:
         db.commit()
     
-    # Получаем блоки и резидентов для формирования данных
-    blocks = {b.id: b for b in db.query(Block).all()}
-    
     resident_ids = [int(inv.resident_id) for inv in items if inv.resident_id]
     resident_user_names = _resident_user_names_map(db, resident_ids)
     resident_user_phones = _resident_user_phones_map(db, resident_ids)
@@ -198,7 +197,7 @@ def _list_invoices_internal(
     result = []
     for inv in items:
         resident = inv.resident
-        block = blocks.get(resident.block_id)
+        block = resident.block
         
         result.append({
             "id": inv.id,
@@ -235,11 +234,6 @@ def _list_invoices_internal(
     
     return {
         "invoices": result,
-        "blocks": [{"id": b.id, "name": b.name} for b in blocks.values()],
-        "residents": [
-            {"id": r.id, "block_name": blocks.get(r.block_id).name if blocks.get(r.block_id) else "", "unit_number": r.unit_number}
-            for r in db.query(Resident).all()
-        ],
         "pagination": {
             "page": page,
             "per_page": per_page,
@@ -350,6 +344,7 @@ def _bulk_issue_internal(
         cnt += 1
     
     try:
+        enqueue_residents(db, [inv.resident_id for inv in invoices_to_process])
         db.commit()
     except Exception as e:
         db.rollback()
@@ -427,6 +422,8 @@ def bulk_notify_api(
         invoice_ids.append(inv.id)
         cnt += 1
     
+    if due:
+        enqueue_residents(db, [inv.resident_id for inv in invoices])
     db.commit()
     db.expire_all()
 
@@ -551,292 +548,19 @@ def _money2(x: Decimal) -> Decimal:
     return (x or Decimal("0")).quantize(Decimal("0.01"))
 
 
-def _effective_sewerage_percent(tariff: Tariff | None) -> Decimal:
-    if not tariff or tariff.meter_type != MeterType.WATER:
-        return Decimal("0")
-    try:
-        percent = Decimal(str(getattr(tariff, "sewerage_percent", 0) or 0))
-    except Exception:
-        percent = Decimal("0")
-    return percent if percent > 0 else Decimal("0")
-
-
-def _parse_selected_line_ids(reference: str | None) -> list[int]:
-    if not reference:
-        return []
-    marker = "LINESEL:"
-    idx = reference.find(marker)
-    if idx < 0:
-        return []
-    raw = reference[idx + len(marker):].split("|")[0]
-    out: list[int] = []
-    for token in raw.split(","):
-        token = token.strip()
-        if not token:
-            continue
-        try:
-            out.append(int(token))
-        except Exception:
-            continue
-    return out
-
-
-def _is_water_line_description(desc: str | None) -> bool:
-    low = (desc or "").lower()
-    return ("вода" in low) or ("water" in low) or ("meter_cold_water" in low)
-
-
-def _is_sewerage_line_description(desc: str | None) -> bool:
-    low = (desc or "").lower()
-    return ("канализац" in low) or ("sewerage" in low) or ("meter_sewerage" in low)
-
-
-def _normalize_selected_line_ids_for_water_sewer(
-    selected_ids: list[int],
-    line_desc_by_id: dict[int, str],
-) -> list[int]:
-    ids = [int(x) for x in (selected_ids or []) if int(x) > 0]
-    if not ids:
-        return []
-
-    unique_ids = list(dict.fromkeys(ids))
-    selected_has_bundle = any(
-        _is_water_line_description(line_desc_by_id.get(lid))
-        or _is_sewerage_line_description(line_desc_by_id.get(lid))
-        for lid in unique_ids
-    )
-    if not selected_has_bundle:
-        return unique_ids
-
-    sewer_ids = [
-        lid for lid, desc in line_desc_by_id.items()
-        if _is_sewerage_line_description(desc)
-    ]
-    water_ids = [
-        lid for lid, desc in line_desc_by_id.items()
-        if _is_water_line_description(desc)
-    ]
-    if not sewer_ids or not water_ids:
-        return unique_ids
-
-    for lid in sewer_ids + water_ids:
-        if lid not in unique_ids:
-            unique_ids.append(lid)
-
-    def _key(lid: int) -> tuple[int, int]:
-        if lid in sewer_ids:
-            return (0, unique_ids.index(lid))
-        if lid in water_ids:
-            return (1, unique_ids.index(lid))
-        return (2, unique_ids.index(lid))
-
-    return [lid for lid in sorted(unique_ids, key=_key)]
-
-
-def _build_invoice_line_payment_map(
-    lines: list[InvoiceLine],
-    apps: list[PaymentApplication],
-) -> dict[int, dict]:
-    sorted_lines = sorted(lines, key=lambda l: l.id or 0)
-    line_desc_by_id = {
-        int(l.id): (l.description or "")
-        for l in sorted_lines
-        if l.id is not None
-    }
-    line_totals = {int(l.id): Decimal(str(l.amount_total or 0)) for l in sorted_lines if l.id is not None}
-    paid_by_line = {lid: Decimal("0") for lid in line_totals}
-
-    def allocate(amount: Decimal, line_ids: list[int]) -> Decimal:
-        remaining_amt = Decimal(str(amount or 0))
-        for lid in line_ids:
-            if remaining_amt <= 0:
-                break
-            if lid not in line_totals:
-                continue
-            capacity = max(line_totals[lid] - paid_by_line[lid], Decimal("0"))
-            if capacity <= 0:
-                continue
-            take = min(capacity, remaining_amt)
-            paid_by_line[lid] += take
-            remaining_amt -= take
-        return remaining_amt
-
-    ordered_apps = sorted(
-        apps or [],
-        key=lambda a: (
-            a.created_at or datetime.min,
-            a.id or 0,
-        ),
-    )
-    default_order = list(line_totals.keys())
-    for app in ordered_apps:
-        app_amt = Decimal(str(getattr(app, "amount_applied", 0) or 0))
-        if app_amt <= 0:
-            continue
-        selected_ids = _parse_selected_line_ids(getattr(app, "reference", None))
-        if selected_ids:
-            normalized_selected_ids = _normalize_selected_line_ids_for_water_sewer(selected_ids, line_desc_by_id)
-            allocate(app_amt, normalized_selected_ids)
-        else:
-            allocate(app_amt, default_order)
-
-    result: dict[int, dict] = {}
-    for lid, total in line_totals.items():
-        paid = _money2(paid_by_line.get(lid, Decimal("0")))
-        remaining = _money2(max(total - paid, Decimal("0")))
-        if remaining <= Decimal("0.0001"):
-            status_text = "Оплачена"
-        elif paid > Decimal("0.0001"):
-            status_text = "Частично"
-        else:
-            status_text = "Не оплачена"
-        result[lid] = {"paid": paid, "remaining": remaining, "status": status_text}
-    return result
-
-
-def _ensure_auto_sewerage_line(db: Session, inv: Invoice) -> None:
-    """
-    Гарантирует наличие синтетической строки "Канализация (авто)" как % от суммы воды.
-    Логику держим здесь, чтобы:
-    - новые счета работали сразу,
-    - старые счета (созданные до внедрения) подтягивали строку при открытии.
-    """
-    if not inv or not inv.id:
-        return
-
-    # Реальные показания/начисления по счёту (только те, что привязаны к meter_reading_id)
-    rows = (
-        db.query(InvoiceLine, MeterReading, ResidentMeter.meter_type)
-        .join(InvoiceLine, InvoiceLine.meter_reading_id == MeterReading.id)
-        .join(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
-        .filter(InvoiceLine.invoice_id == inv.id)
-        .all()
-    )
-
-    has_real_sewerage = any(mt == MeterType.SEWERAGE for _ln, _rd, mt in rows)
-
-    auto_line = (
-        db.query(InvoiceLine)
-        .filter(
-            InvoiceLine.invoice_id == inv.id,
-            InvoiceLine.meter_reading_id.is_(None),
-            InvoiceLine.description.ilike("Канализация%"),
-        )
-        .first()
-    )
-
-    if has_real_sewerage:
-        # На случай, если раньше применяли "деление" для INDIVIDUAL — восстановим воду из MeterReading
-        for ln, rd, mt in rows:
-            if mt == MeterType.WATER:
-                ln.amount_net = _money2(Decimal(str(rd.amount_net or 0)))
-                ln.amount_vat = _money2(Decimal(str(rd.amount_vat or 0)))
-                ln.amount_total = _money2(Decimal(str(rd.amount_total or 0)))
-                ln.description = f"Вода {float(Decimal(str(rd.consumption or 0)))} м³"
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    water_rows = [(ln, rd) for ln, rd, mt in rows if mt == MeterType.WATER]
-    if not water_rows:
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    sew_net = Decimal("0")
-    sew_vat = Decimal("0")
-    sew_total = Decimal("0")
-    water_cons = Decimal("0")
-    sewer_cons = Decimal("0")
-
-    for ln, rd in water_rows:
-        water_cons += Decimal(str(rd.consumption or 0))
-
-        base_net = _money2(Decimal(str(rd.amount_net or 0)))
-        base_vat = _money2(Decimal(str(rd.amount_vat or 0)))
-        base_total = _money2(Decimal(str(rd.amount_total or 0)))
-
-        t = db.get(Tariff, rd.tariff_id) if rd.tariff_id else None
-        percent = _effective_sewerage_percent(t)
-        if percent <= 0:
-            ln.amount_net = base_net
-            ln.amount_vat = base_vat
-            ln.amount_total = base_total
-            ln.description = f"Вода {float(Decimal(str(rd.consumption or 0)))} м³"
-            continue
-
-        k = percent / Decimal("100")
-
-        consumption = Decimal(str(rd.consumption or 0))
-        if getattr(t, "customer_type", None) == CustomerType.INDIVIDUAL:
-            new_net = _money2(base_net * (Decimal("1") - k))
-            new_vat = _money2(base_vat * (Decimal("1") - k))
-            new_total = _money2(base_total * (Decimal("1") - k))
-
-            ln.amount_net = new_net
-            ln.amount_vat = new_vat
-            ln.amount_total = new_total
-
-            sew_net += (base_net - new_net)
-            sew_vat += (base_vat - new_vat)
-            sew_total += (base_total - new_total)
-            water_display_cons = consumption * (Decimal("1") - k)
-            sewer_display_cons = consumption * k
-            ln.description = f"Вода {float(water_display_cons)} м³"
-            sewer_cons += sewer_display_cons
-        else:
-            ln.amount_net = base_net
-            ln.amount_vat = base_vat
-            ln.amount_total = base_total
-
-            sew_net += _money2(base_net * k)
-            sew_vat += _money2(base_vat * k)
-            sew_total += _money2(base_total * k)
-            ln.description = f"Вода {float(consumption)} м³"
-            sewer_cons += consumption * k
-
-    if sew_total <= 0:
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    # Для инвойса канализация выводится только как начисление (без объёма).
-    desc = "Канализация"
-
-    if auto_line:
-        auto_line.description = desc
-        auto_line.amount_net = _money2(sew_net)
-        auto_line.amount_vat = _money2(sew_vat)
-        auto_line.amount_total = _money2(sew_total)
-    else:
-        db.add(InvoiceLine(
-            invoice_id=inv.id,
-            meter_reading_id=None,
-            description=desc,
-            amount_net=_money2(sew_net),
-            amount_vat=_money2(sew_vat),
-            amount_total=_money2(sew_total),
-        ))
-
-
 def _get_invoice_detail_internal(db: Session, invoice_id: int):
     """Внутренняя функция для получения деталей счета (без авторизации)."""
     inv = db.get(Invoice, invoice_id)
     if not inv:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    canonical_number = build_invoice_number(db, inv.resident_id, inv.period_year, inv.period_month)
-    if inv.number != canonical_number:
-        inv.number = canonical_number
-        db.commit()
-        db.refresh(inv)
+    # Чтение ничего не пишет: авто-канализацию поддерживает services.billing при записи,
+    # номер сохраняется при выставлении и при смене привязки жителя (utils.sync_invoice_numbers) —
+    # показываем сохранённый, как в списках, поиске и выгрузках.
+    number = inv.number or build_invoice_number(db, inv.resident_id, inv.period_year, inv.period_month)
     
     resident = inv.resident
     block = resident.block if resident else None
-    
-    # Автодобавление "Канализация" как % от воды (если настроено)
-    _ensure_auto_sewerage_line(db, inv)
-    db.flush()
 
     # Получаем строки счета
     lines = db.query(InvoiceLine).filter(InvoiceLine.invoice_id == inv.id).all()
@@ -874,21 +598,6 @@ def _get_invoice_detail_internal(db: Session, invoice_id: int):
                 continue  # Пропускаем - скрываем применение от реального платежа
         apps.append(app)
     
-    # Пересчитываем amount_total из строк счета на случай, если он устарел
-    lines_sum = db.query(
-        func.coalesce(func.sum(InvoiceLine.amount_total), 0)
-    ).filter(InvoiceLine.invoice_id == inv.id).scalar() or 0
-    
-    # Обновляем amount_total в счете, если он отличается от суммы строк
-    if abs(float(inv.amount_total or 0) - float(lines_sum)) > 0.01:
-        inv.amount_total = Decimal(str(lines_sum))
-        # Также пересчитываем net и vat
-        net_sum = db.query(func.coalesce(func.sum(InvoiceLine.amount_net), 0)).filter(InvoiceLine.invoice_id == inv.id).scalar() or 0
-        vat_sum = db.query(func.coalesce(func.sum(InvoiceLine.amount_vat), 0)).filter(InvoiceLine.invoice_id == inv.id).scalar() or 0
-        inv.amount_net = Decimal(str(net_sum))
-        inv.amount_vat = Decimal(str(vat_sum))
-        db.commit()
-    
     # Считаем paid_total по ВСЕМ применениям (включая скрытые), для правильного расчета остатка
     paid_total = db.query(func.coalesce(func.sum(PaymentApplication.amount_applied), 0))\
                    .filter(PaymentApplication.invoice_id == inv.id).scalar() or 0
@@ -1012,9 +721,8 @@ def _get_invoice_detail_internal(db: Session, invoice_id: int):
             return "Строительство"
         return None
 
-    # Распределяем оплату по строкам с учётом выбранных строк (LINESEL)
-    # Используем все применения (all_apps), а не отфильтрованные apps для отображения.
-    line_payment_map = _build_invoice_line_payment_map(lines, all_apps)
+    # Оплата по строкам (с учётом LINESEL) хранится в invoice_lines.amount_paid — см. services/line_payments.py
+    line_payment_map = invoice_line_payment_map(db, lines)
     
     # Разделяем стабильный тариф в отдельную строку, как в user panel
     reading_ids = [line.meter_reading_id for line in lines if line.meter_reading_id]
@@ -1186,7 +894,7 @@ def _get_invoice_detail_internal(db: Session, invoice_id: int):
         "resident_code": f"{block.name if block else ''} / {resident.unit_number}" if block else resident.unit_number,
         "resident_user_full_name": resident_user_names.get(int(inv.resident_id)) if inv.resident_id else None,
         "resident_user_phone": resident_user_phones.get(int(inv.resident_id)) if inv.resident_id else None,
-        "number": inv.number,
+        "number": number,
         "status": inv.status.value,
         "due_date": inv.due_date,
         "notes": inv.notes,
@@ -1258,11 +966,14 @@ def _update_invoice_internal(db: Session, invoice_id: int, due_date: Optional[st
         # Канонический номер счета для финансовой уникальности
         inv.number = build_invoice_number(db, inv.resident_id, inv.period_year, inv.period_month)
         inv.status = InvoiceStatus.ISSUED
+        enqueue_residents(db, [inv.resident_id])
         db.commit()
         db.refresh(inv)
         # Создаем уведомления для пользователей
         create_invoice_notification(db, inv)
     else:
+        if inv.due_date:
+            enqueue_residents(db, [inv.resident_id])
         db.commit()
         db.refresh(inv)
         # Если счет уже был ISSUED и мы обновили due_date, также создаем уведомления
@@ -1363,6 +1074,9 @@ def _reissue_invoice_internal(db: Session, invoice_id: int, due_date: Optional[s
     
     # Меняем статус на ISSUED
     inv.status = InvoiceStatus.ISSUED
+    # Тариф мог измениться, пока счёт был отменён (отменённые очередь пересчёта пропускает)
+    refresh_invoice(db, inv)
+    enqueue_residents(db, [inv.resident_id])
     
     db.commit()
     db.refresh(inv)
@@ -3,7 +3,7 @@ API endpoints for News management
 Supports multilingual content (ru, az, en)
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -14,10 +14,15 @@ from ..database import get_db
 from ..models import News, User, RoleEnum
 from ..deps import get_current_user
 from ..utils import create_news_notification
+from ..services import news_feed
+from ..services.etag import etag_matches
 
 
 router = APIRouter(prefix="/api/news", tags=["news-api"])
 
+# Кабинет перепроверяет ленту на каждом просмотре; 304, пока лента не изменилась
+PUBLIC_NEWS_CACHE_CONTROL = "no-cache"
+
 
 class NewsTranslation(BaseModel):
     ru: str
@@ -76,6 +81,7 @@ class NewsListOut(BaseModel):
 # Public endpoint - get active news for users
 @router.get("/public", response_model=NewsListOut)
 def get_public_news(
+    request: Request,
     db: Session = Depends(get_db),
     lang: Optional[str] = Query("ru", regex="^(ru|az|en)$"),
     limit: int = Query(10, ge=1, le=100),
@@ -84,60 +90,14 @@ def get_public_news(
     """
     Get list of active news for users.
     Returns only active news that are published and not expired.
+    Filtering, ordering and limit run in SQL; the body is cached per (blocks, limit)
+    (services/news_feed.py). All translations are returned, `lang` does not change the body.
     """
-    now = datetime.utcnow()
-    
-    query = db.query(News).filter(
-        News.is_active == True,
-        News.published_at <= now
-    )
-    
-    # Filter by expiration
-    from sqlalchemy import or_
-    query = query.filter(
-        or_(News.expires_at.is_(None), News.expires_at > now)
-    )
-    
-    items = query.order_by(News.priority.desc(), News.published_at.desc()).all()
-
-    block_filter = []
-    if blocks:
-        block_filter = [b.strip() for b in blocks.split(",") if b.strip()]
-    
-    result_items = []
-    for item in items:
-        # Parse JSON fields
-        title_dict = json.loads(item.title) if isinstance(item.title, str) else item.title
-        content_dict = json.loads(item.content) if isinstance(item.content, str) else item.content
-        target_blocks = None
-        if item.target_blocks:
-            try:
-                target_blocks = json.loads(item.target_blocks)
-            except Exception:
-                target_blocks = None
-
-        if block_filter and target_blocks:
-            if not any(b in target_blocks for b in block_filter):
-                continue
-        
-        result_items.append(NewsOut(
-            id=item.id,
-            title=title_dict,
-            content=content_dict,
-            icon=item.icon,
-            icon_color=item.icon_color,
-            is_active=item.is_active,
-            priority=item.priority,
-            published_at=item.published_at,
-            expires_at=item.expires_at,
-            created_at=item.created_at,
-            updated_at=item.updated_at,
-            created_by_name=item.created_by.full_name if item.created_by else None,
-            target_blocks=target_blocks,
-        ))
-    
-    result_items = result_items[:limit]
-    return {"items": result_items, "total": len(result_items)}
+    feed = news_feed.get_public_feed(db, news_feed.normalize_blocks(blocks), limit)
+    headers = {"ETag": feed.etag, "Cache-Control": PUBLIC_NEWS_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), feed.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=feed.body, media_type="application/json", headers=headers)
 
 
 # Admin endpoints - CRUD operations
@@ -158,12 +118,7 @@ def list_news_admin(
     for item in items:
         title_dict = json.loads(item.title) if isinstance(item.title, str) else item.title
         content_dict = json.loads(item.content) if isinstance(item.content, str) else item.content
-        target_blocks = None
-        if item.target_blocks:
-            try:
-                target_blocks = json.loads(item.target_blocks)
-            except Exception:
-                target_blocks = None
+        target_blocks = item.target_blocks or None
         
         result_items.append(NewsOut(
             id=item.id,
@@ -218,7 +173,7 @@ def create_news(
         published_at=published_at_dt,
         expires_at=expires_at_dt,
         created_by_id=user.id,
-        target_blocks=json.dumps(payload.target_blocks) if payload.target_blocks else None,
+        target_blocks=payload.target_blocks or None,
     )
     
     db.add(news)
@@ -264,12 +219,7 @@ def get_news_admin(
     title_dict = json.loads(news.title) if isinstance(news.title, str) else news.title
     content_dict = json.loads(news.content) if isinstance(news.content, str) else news.content
     
-    target_blocks = None
-    if news.target_blocks:
-        try:
-            target_blocks = json.loads(news.target_blocks)
-        except Exception:
-            target_blocks = None
+    target_blocks = news.target_blocks or None
 
     return NewsOut(
         id=news.id,
@@ -326,7 +276,7 @@ def update_news(
         else:
             news.expires_at = None  # Clear expiration if empty string
     if payload.target_blocks is not None:
-        news.target_blocks = json.dumps(payload.target_blocks) if payload.target_blocks else None
+        news.target_blocks = payload.target_blocks or None
     
     news.updated_at = datetime.utcnow()
     
@@ -342,12 +292,7 @@ def update_news(
     title_dict = json.loads(news.title) if isinstance(news.title, str) else news.title
     content_dict = json.loads(news.content) if isinstance(news.content, str) else news.content
     
-    target_blocks = None
-    if news.target_blocks:
-        try:
-            target_blocks = json.loads(news.target_blocks)
-        except Exception:
-            target_blocks = None
+    target_blocks = news.target_blocks or None
 
     return NewsOut(
         id=news.id,
@@ -1,21 +1,36 @@
+import asyncio
 import json
 from typing import List, Optional
 from datetime import datetime, timedelta
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 
-from ..database import get_db
+from ..config import settings
+from ..database import SessionLocal, get_db
 from ..models import (
     User, RoleEnum,
-    Notification, NotificationStatus,
+    Notification, NotificationStatus, NotificationArchive,
     AppealWorkflow,
     Resident, Block,
 )
 from ..deps import get_current_user
+from ..services import notification_stream
+from ..services.notification_counters import (
+    ADMIN_NOTIFICATION_TYPES,
+    ADMIN_PERSONAL_NOTIFICATION_TYPES,
+    SCOPE_ADMIN,
+    SCOPE_USER,
+    admin_unread_count,
+    read_counters,
+    user_unread_count,
+)
 from ..services.push_service import send_push_to_users
+from ..services.search import apply_search
 from ..utils import get_user_locale_code, tr_locale
 from fastapi import Request
 from ..security import get_user_id_from_session
@@ -36,10 +51,6 @@ def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -
 
 
 router = APIRouter(prefix="/api/notifications", tags=["notifications-api"])
-ADMIN_NOTIFICATION_TYPES = {"APPEAL", "TARIFF_EXPIRED"}
-# Персональные админ-уведомления: доставляются конкретному user_id
-# (видны только адресату, независимо от его роли).
-ADMIN_PERSONAL_NOTIFICATION_TYPES = {"CONTRACT_APPROVAL", "CONTRACT_DECISION"}
 
 
 # Pydantic models
@@ -132,6 +143,7 @@ def _list_notifications_internal(
     per_page: int = 25,
     current_user: Optional[User] = None,
     scope: Optional[str] = None,
+    archived: bool = False,
 ):
     """Внутренняя функция для получения списка уведомлений.
 
@@ -143,68 +155,62 @@ def _list_notifications_internal(
         * общие админ-уведомления (APPEAL, TARIFF_EXPIRED, исторические NULL),
         * персональные админ-уведомления (CONTRACT_APPROVAL, CONTRACT_DECISION) —
           только те, которые адресованы текущему пользователю.
+
+    ``archived`` — читать notifications_archive (прочитанные старше срока хранения) вместо notifications.
     """
     from sqlalchemy import or_, and_
     scope_value = (scope or "").strip().lower()
+    model = NotificationArchive if archived else Notification
 
     if scope_value == "appeals":
         type_clauses = [
-            Notification.notification_type == "APPEAL",
-            Notification.notification_type == None,
+            model.notification_type == "APPEAL",
+            model.notification_type == None,
         ]
     else:
         type_clauses = [
-            Notification.notification_type.in_(list(ADMIN_NOTIFICATION_TYPES)),
-            Notification.notification_type == None,
+            model.notification_type.in_(list(ADMIN_NOTIFICATION_TYPES)),
+            model.notification_type == None,
         ]
         if current_user is not None:
             type_clauses.append(
                 and_(
-                    Notification.notification_type.in_(list(ADMIN_PERSONAL_NOTIFICATION_TYPES)),
-                    Notification.user_id == current_user.id,
+                    model.notification_type.in_(list(ADMIN_PERSONAL_NOTIFICATION_TYPES)),
+                    model.user_id == current_user.id,
                 )
             )
 
-    query = db.query(Notification).join(User, User.id == Notification.user_id).filter(
+    query = db.query(model).join(User, User.id == model.user_id).filter(
         or_(*type_clauses)
     )
     
     # Join с Resident для фильтрации
     if resident_id or block_id or q:
-        query = query.outerjoin(Resident, Resident.id == Notification.resident_id)
+        query = query.outerjoin(Resident, Resident.id == model.resident_id)
         if block_id:
             query = query.outerjoin(Block, Block.id == Resident.block_id)
     
     # Фильтр по статусу
     if status_filter and status_filter.upper() in {s.value for s in NotificationStatus}:
         status_enum = NotificationStatus(status_filter.upper())
-        query = query.filter(Notification.status == status_enum)
+        query = query.filter(model.status == status_enum)
     
     # Фильтр по резиденту
     if resident_id:
-        query = query.filter(Notification.resident_id == resident_id)
+        query = query.filter(model.resident_id == resident_id)
     
     # Фильтр по блоку
     if block_id:
         query = query.filter(Block.name == block_id)
     
     # Поиск
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Notification.message.ilike(like),
-                User.full_name.ilike(like),
-                User.phone.ilike(like),
-                User.email.ilike(like),
-            )
-        )
+    query = apply_search(query, q, model.message, User.full_name, User.phone, User.email)
     
     total = query.count()
     last_page = max(1, (total + per_page - 1) // per_page)
     page = max(1, min(page, last_page))
     
-    notifications = query.order_by(Notification.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+    notifications = query.order_by(model.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
     
     result = [_build_notification_out(notif) for notif in notifications]
     
@@ -224,10 +230,11 @@ def _get_notification_internal(
     notification_id: int,
     mark_read: bool = True,
 ):
-    """Внутренняя функция для получения одного уведомления."""
+    """Внутренняя функция для получения одного уведомления (перенесённые в архив — по id из архива)."""
     notif = db.query(Notification).filter(Notification.id == notification_id).first()
     if not notif:
-        return None
+        archived = db.get(NotificationArchive, notification_id)
+        return _build_notification_out(archived) if archived else None
 
     if mark_read and notif.status == NotificationStatus.UNREAD:
         notif.status = NotificationStatus.READ
@@ -247,6 +254,7 @@ def list_notifications(
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=200),
     scope: Optional[str] = Query(None, description='"appeals" — только обращения жителей; по умолчанию — общий админ-список.'),
+    archived: bool = Query(False, description="true — архив (прочитанные старше срока хранения)."),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -262,6 +270,7 @@ def list_notifications(
             per_page=per_page,
             current_user=current_user,
             scope=scope,
+            archived=archived,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -276,6 +285,7 @@ def list_notifications_public(
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=200),
     scope: Optional[str] = Query(None, description='"appeals" — только обращения жителей.'),
+    archived: bool = Query(False, description="true — архив (прочитанные старше срока хранения)."),
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_optional),
 ):
@@ -293,6 +303,7 @@ def list_notifications_public(
             per_page=per_page,
             current_user=current_user,
             scope=scope,
+            archived=archived,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -303,24 +314,8 @@ def get_unread_count_public(
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_optional),
 ):
-    """Получить количество непрочитанных уведомлений для админ-панели."""
-    from sqlalchemy import func, or_, and_
-    type_clauses = [
-        Notification.notification_type.in_(list(ADMIN_NOTIFICATION_TYPES)),
-        Notification.notification_type == None,
-    ]
-    if current_user is not None:
-        type_clauses.append(
-            and_(
-                Notification.notification_type.in_(list(ADMIN_PERSONAL_NOTIFICATION_TYPES)),
-                Notification.user_id == current_user.id,
-            )
-        )
-    count = db.query(func.count(Notification.id)).filter(
-        Notification.status == NotificationStatus.UNREAD,
-        or_(*type_clauses)
-    ).scalar()
-    return {"count": count or 0}
+    """Получить количество непрочитанных уведомлений для админ-панели (из счётчиков)."""
+    return {"count": admin_unread_count(db, current_user.id if current_user is not None else None)}
 
 
 @router.get("/user/me")
@@ -328,6 +323,7 @@ def get_user_notifications(
     status: Optional[str] = Query(None, alias="status"),
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=100),
+    archived: bool = Query(False, description="true — архив (прочитанные старше срока хранения)."),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -335,22 +331,23 @@ def get_user_notifications(
     # ВАЖНО: В личном кабинете жителя НЕ показываем его собственные обращения (APPEAL),
     # так как они отображаются в отдельном разделе "Обращения".
     # Показываем только уведомления о счетах, новостях и сообщения от администрации.
-    query = db.query(Notification).filter(
-        Notification.user_id == current_user.id,
-        Notification.notification_type != "APPEAL",
-        Notification.notification_type != None # Исключаем старые обращения без типа
+    model = NotificationArchive if archived else Notification
+    query = db.query(model).filter(
+        model.user_id == current_user.id,
+        model.notification_type != "APPEAL",
+        model.notification_type != None # Исключаем старые обращения без типа
     )
     
     # Фильтр по статусу
     if status and status.upper() in {s.value for s in NotificationStatus}:
         status_enum = NotificationStatus(status.upper())
-        query = query.filter(Notification.status == status_enum)
+        query = query.filter(model.status == status_enum)
     
     total = query.count()
     last_page = max(1, (total + per_page - 1) // per_page)
     page = max(1, min(page, last_page))
     
-    notifications = query.order_by(Notification.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+    notifications = query.order_by(model.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
     
     result = []
     for notif in notifications:
@@ -407,15 +404,89 @@ def get_user_unread_count(
     current_user: User = Depends(get_current_user),
 ):
     """Получить количество непрочитанных уведомлений текущего пользователя."""
-    from sqlalchemy import func
-    # Считаем только те уведомления, которые не являются обращениями самого жителя
-    count = db.query(func.count(Notification.id)).filter(
-        Notification.user_id == current_user.id,
-        Notification.status == NotificationStatus.UNREAD,
-        Notification.notification_type != "APPEAL",
-        Notification.notification_type != None
-    ).scalar()
-    return {"count": count or 0}
+    # Обращения самого жителя (APPEAL) в счётчик кабинета не входят
+    return {"count": user_unread_count(db, current_user.id)}
+
+
+_STREAM_RETRY_MS = 5000
+
+
+def _stream_user_id(request: Request, scope: str) -> int:
+    """Авторизация SSE-потока в короткой сессии: сам поток живёт часами и соединение из пула не держит."""
+    db = SessionLocal()
+    try:
+        user = get_current_user_optional(request, db)
+        if user is None:
+            raise HTTPException(status_code=401)
+        if scope == SCOPE_ADMIN and user.role == RoleEnum.RESIDENT:
+            raise HTTPException(status_code=403)
+        return int(user.id)
+    finally:
+        db.close()
+
+
+def _read_stream_counters(keys) -> dict:
+    db = SessionLocal()
+    try:
+        return read_counters(db, keys)
+    finally:
+        db.close()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.get("/stream")
+async def stream_notifications(
+    request: Request,
+    scope: str = Query(SCOPE_USER, pattern="^(admin|user)$"),
+):
+    """
+    SSE-поток уведомлений текущей сессии вместо опроса unread-count.
+    event: count — {"count": N} при подключении и при каждом изменении;
+    event: notification — сводка нового уведомления (id, notification_type, message, ...).
+    scope=admin — бейдж админки, scope=user — кабинет жителя.
+    """
+    if not settings.NOTIFICATION_STREAM_ENABLED:
+        raise HTTPException(status_code=503, detail="Notification stream is disabled")
+    user_id = await run_in_threadpool(_stream_user_id, request, scope)
+    keys = notification_stream.stream_keys(scope, user_id)
+    heartbeat = max(1, settings.NOTIFICATION_STREAM_HEARTBEAT_SEC)
+
+    async def events():
+        sub = notification_stream.subscribe(keys)
+        try:
+            counts = await run_in_threadpool(_read_stream_counters, keys)
+            sent = sum(counts.values())
+            yield f"retry: {_STREAM_RETRY_MS}\n\n"
+            yield _sse("count", {"count": sent})
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                if event is notification_stream.RESYNC:
+                    counts = await run_in_threadpool(_read_stream_counters, keys)
+                else:
+                    counts[event["key"]] = event["unread"]
+                total = sum(counts.values())
+                if total != sent:
+                    sent = total
+                    yield _sse("count", {"count": sent})
+                if event.get("notification"):
+                    yield _sse("notification", event["notification"])
+        finally:
+            notification_stream.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/{notification_id}")
@@ -592,7 +663,10 @@ def delete_notification(
     current_user: User = Depends(get_current_user),
 ):
     """Удалить уведомление (требует авторизации)."""
-    notif = db.query(Notification).filter(Notification.id == notification_id).first()
+    notif = (
+        db.query(Notification).filter(Notification.id == notification_id).first()
+        or db.get(NotificationArchive, notification_id)
+    )
     if not notif:
         raise HTTPException(status_code=404, detail="Notification not found")
     
@@ -608,7 +682,10 @@ def delete_notification_public(
     db: Session = Depends(get_db),
 ):
     """Удалить уведомление (публичный endpoint без авторизации)."""
-    notif = db.query(Notification).filter(Notification.id == notification_id).first()
+    notif = (
+        db.query(Notification).filter(Notification.id == notification_id).first()
+        or db.get(NotificationArchive, notification_id)
+    )
     if not notif:
         raise HTTPException(status_code=404, detail="Notification not found")
     
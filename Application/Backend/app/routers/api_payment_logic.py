@@ -17,14 +17,14 @@ from sqlalchemy import func
 
 from ..models import (
     Invoice,
-    InvoiceLine,
     InvoiceStatus,
     Payment,
     PaymentApplication,
-    PaymentApplicationLine,
     PaymentLog,
     user_residents,
 )
+from ..services.auto_advance_queue import enqueue_residents
+from ..services.line_payments import sync_line_payments
 from ..utils import now_baku
 
 
@@ -41,7 +41,8 @@ def _to_int(val: str | None) -> int | None:
 
 
 def _recompute_invoice_status(db: Session, inv: Invoice) -> None:
-    """Recompute invoice status based on applied amounts."""
+    """Recompute invoice status and per-line paid amounts after applications changed."""
+    sync_line_payments(db, inv.id)
     paid = (
         db.query(func.coalesce(func.sum(PaymentApplication.amount_applied), 0))
         .filter(PaymentApplication.invoice_id == inv.id)
@@ -49,6 +50,7 @@ def _recompute_invoice_status(db: Session, inv: Invoice) -> None:
         or Decimal("0")
     )
     total = Decimal(inv.amount_total or 0)
+    was_closed = inv.status in (InvoiceStatus.PAID, InvoiceStatus.OVERPAID)
     if paid <= 0:
         inv.status = inv.status if inv.status == InvoiceStatus.CANCELED else InvoiceStatus.ISSUED
     elif paid < total:
@@ -57,34 +59,9 @@ def _recompute_invoice_status(db: Session, inv: Invoice) -> None:
         inv.status = InvoiceStatus.PAID
     else:
         inv.status = InvoiceStatus.OVERPAID
-
-
-def _record_line_distribution(
-    db: Session,
-    application_id: int,
-    invoice_id: int,
-    amount_applied: Decimal,
-) -> None:
-    """Persist per-invoice-line breakdown for a PaymentApplication."""
-    lines = db.query(InvoiceLine).filter(InvoiceLine.invoice_id == invoice_id).all()
-    if not lines:
-        return
-    inv_total = sum(Decimal(str(ln.amount_total or 0)) for ln in lines)
-    if inv_total <= 0:
-        return
-    rows: list[tuple[int, Decimal]] = []
-    for ln in lines:
-        share = round(amount_applied * Decimal(str(ln.amount_total or 0)) / inv_total, 2)
-        rows.append((ln.id, share))
-    total_shares = sum(r[1] for r in rows)
-    diff = round(amount_applied - total_shares, 2)
-    if diff != 0 and rows:
-        largest_idx = max(range(len(rows)), key=lambda i: rows[i][1])
-        rows[largest_idx] = (rows[largest_idx][0], rows[largest_idx][1] + diff)
-    for line_id, amt in rows:
-        db.add(PaymentApplicationLine(
-            application_id=application_id, invoice_line_id=line_id, amount=amt,
-        ))
+    if was_closed and inv.status in (InvoiceStatus.ISSUED, InvoiceStatus.PARTIAL):
+        # Оплаченный счёт снова открыт (пересчёт суммы) — в очередь авто-аванса
+        enqueue_residents(db, [inv.resident_id])
 
 
 def auto_apply_advance(
@@ -189,7 +166,6 @@ def auto_apply_advance(
                 )
                 db.add(new_app)
                 db.flush()
-                _record_line_distribution(db, new_app.id, inv.id, apply_amt)
             else:
                 existing_app = (
                     db.query(PaymentApplication)
@@ -203,7 +179,6 @@ def auto_apply_advance(
                     existing_app.amount_applied = Decimal(existing_app.amount_applied or 0) + apply_amt
                     existing_app.reference = "ADVANCE"
                     db.flush()
-                    _record_line_distribution(db, existing_app.id, inv.id, apply_amt)
                 else:
                     new_app = PaymentApplication(
                         payment_id=p.id,
@@ -214,7 +189,6 @@ def auto_apply_advance(
                     )
                     db.add(new_app)
                     db.flush()
-                    _record_line_distribution(db, new_app.id, inv.id, apply_amt)
 
             pay_leftover[p.id] = left - apply_amt
             inv_left -= apply_amt
@@ -482,7 +456,6 @@ def apply_advance_to_invoice(
         )
         db.add(new_app)
         db.flush()
-        _record_line_distribution(db, new_app.id, inv.id, apply_amt)
         pay_leftover[p.id] = left - apply_amt
         remaining_to_apply -= apply_amt
 
@@ -600,7 +573,6 @@ def apply_advance_with_limit(
             )
             db.add(new_app)
             db.flush()
-            _record_line_distribution(db, new_app.id, inv.id, apply_amt)
             pay_leftover[p.id] = left - apply_amt
             inv_need -= apply_amt
             remaining_to_apply -= apply_amt
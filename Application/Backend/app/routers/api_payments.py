@@ -5,7 +5,7 @@ from decimal import Decimal
 from fastapi import APIRouter, Depends, HTTPException, Query, Form
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import func
 
 from ..database import get_db
 from ..models import (
@@ -17,6 +17,8 @@ from ..deps import get_current_user
 from ..utils import now_baku, to_baku_datetime
 from ..utils import build_invoice_number
 from .api_payment_logic import auto_apply_advance, _recompute_invoice_status, _to_int
+from ..services.auto_advance_queue import enqueue_payment_pool
+from ..services.search import apply_search
 
 
 router = APIRouter(prefix="/api/payments", tags=["payments-api"])
@@ -247,9 +249,7 @@ def _list_payments_internal(
     # Фильтр ADVANCE применяется только в расчетах балансов (dashboard, графики)
     # Но в списке платежей админ должен видеть все операции, включая списания из аванса
 
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(or_(Payment.reference.ilike(like), Payment.comment.ilike(like)))
+    query = apply_search(query, q, Payment.reference, Payment.comment)
     
     total = query.count()
     last_page = max(1, (total + per_page - 1) // per_page)
@@ -443,6 +443,8 @@ def create_payment_api(
 
     # НЕ ПРИМЕНЯЕМ АВТОМАТИЧЕСКИ (по просьбе пользователя для прозрачности)
     # auto_apply_advance(db, payment.resident_id)
+    # Но просроченные счета (после grace) закроет фоновая очередь авто-аванса.
+    enqueue_payment_pool(db, p.resident_id)
     
     db.commit()
     db.refresh(p)
@@ -488,6 +490,7 @@ def create_payment_public(
 
     # НЕ ПРИМЕНЯЕМ АВТОМАТИЧЕСКИ
     # auto_apply_advance(db, payment.resident_id)
+    enqueue_payment_pool(db, p.resident_id)
     
     db.commit()
     db.refresh(p)
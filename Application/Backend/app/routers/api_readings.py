@@ -1,48 +1,40 @@
 from typing import List, Optional
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
-from io import BytesIO
 import json
 import os
-from uuid import uuid4
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, UploadFile, File, Form
-from PIL import Image, ImageOps, UnidentifiedImageError
 from pydantic import BaseModel
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_, exists
+from sqlalchemy import and_, case, func, or_, exists, select, true, type_coerce
 
 from ..database import get_db
 from ..models import (
     User, RoleEnum, Block, Resident, ResidentMeter,
     MeterType, Tariff, MeterReading, ReadingLog, MeterReadingPhoto,
-    Invoice, InvoiceLine, InvoiceStatus, CustomerType, PaymentApplication
+    Invoice, InvoiceLine, InvoiceStatus, CustomerType
 )
 from ..deps import get_current_user
+from ..services.auto_advance_queue import enqueue_residents
+from ..services.billing import effective_sewerage_percent, refresh_invoice
+from ..services.line_payments import is_sewerage_line_description, line_paid_amounts
+from ..services.meter_photos import PHOTO_TTL_DAYS, photo_keys, photo_url, store_upload, submit_photo_processing
+from ..services.reference_data import METER_DISPLAY
+from ..services.search import apply_search
+from ..services.storage import UploadTooLargeError, delete_unreferenced, release_after_commit
+from ..services.metrics import UPLOAD_SIZE
 from .api_payment_logic import auto_apply_advance
 
 
 router = APIRouter(prefix="/api/readings", tags=["readings-api"])
 
+
 def money(x: Decimal) -> Decimal:
     """Округление денег до 2 знаков."""
     return x.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
 
-def _effective_sewerage_percent(tariff: Tariff | None) -> Decimal:
-    """
-    Канализация берётся только из WATER-тарифа.
-    Если % не задан (0) — авто-канализация не применяется.
-    """
-    if not tariff or tariff.meter_type != MeterType.WATER:
-        return Decimal("0")
-    try:
-        percent = Decimal(str(getattr(tariff, "sewerage_percent", 0) or 0))
-    except Exception:
-        percent = Decimal("0")
-    return percent if percent > 0 else Decimal("0")
-
-
 def _apply_consumption_multiplier(consumption: Decimal, tariff: Tariff | None, meter_type: MeterType | None) -> Decimal:
     """
     Умножает расход на коэффициент тарифа (если включено).
@@ -76,167 +68,70 @@ def _is_period_paid(db: Session, resident_id: int, year: int, month: int) -> boo
     return bool(inv)
 
 
-def _is_water_line_desc(desc: str | None) -> bool:
-    low = (desc or "").lower()
-    return ("вода" in low) or ("water" in low) or ("meter_cold_water" in low)
-
-
-def _is_sewer_line_desc(desc: str | None) -> bool:
-    low = (desc or "").lower()
-    return ("канализац" in low) or ("sewerage" in low) or ("meter_sewerage" in low)
-
-
-def _invoice_line_payment_state_for_period(
+def _period_line_payment_states(
     db: Session,
-    resident_id: int,
+    resident_ids: list[int],
     year: int,
     month: int,
-) -> dict[int, dict]:
+) -> dict[int, dict[int, dict]]:
     """
-    Детализация оплаты по строкам инвойса за период.
-    Возвращает карту: line_id -> {meter_reading_id, description, line_total, paid_amount, remaining_amount}.
+    Детализация оплаты по строкам счетов за период для нескольких резидентов одним запросом.
+    Возвращает карту: resident_id -> line_id -> {meter_reading_id, description, line_total, paid_amount, remaining_amount}.
+    Погашение берётся из invoice_lines.amount_paid (services/line_payments.py), а не пересчитывается.
     """
-    inv = (
-        db.query(Invoice)
+    if not resident_ids:
+        return {}
+    rows = (
+        db.query(
+            Invoice.resident_id,
+            InvoiceLine.id,
+            InvoiceLine.invoice_id,
+            InvoiceLine.meter_reading_id,
+            InvoiceLine.description,
+            InvoiceLine.amount_total,
+            InvoiceLine.amount_paid,
+        )
+        .join(InvoiceLine, InvoiceLine.invoice_id == Invoice.id)
         .filter(
-            Invoice.resident_id == resident_id,
+            Invoice.resident_id.in_(resident_ids),
             Invoice.period_year == year,
             Invoice.period_month == month,
             Invoice.status != InvoiceStatus.CANCELED,
         )
-        .first()
-    )
-    if not inv:
-        return {}
-
-    apps = (
-        db.query(PaymentApplication)
-        .filter(PaymentApplication.invoice_id == inv.id)
-        .order_by(PaymentApplication.created_at.asc(), PaymentApplication.id.asc())
+        .order_by(InvoiceLine.invoice_id.asc(), InvoiceLine.id.asc())
         .all()
     )
-    all_lines = (
-        db.query(InvoiceLine)
-        .filter(InvoiceLine.invoice_id == inv.id)
-        .order_by(InvoiceLine.id.asc())
-        .all()
-    )
-    if not all_lines:
-        return {}
-
-    line_totals: dict[int, Decimal] = {
-        int(line.id): money(Decimal(str(line.amount_total or 0)))
-        for line in all_lines
-        if line.id is not None
-    }
-    paid_by_line: dict[int, Decimal] = {lid: Decimal("0") for lid in line_totals}
-    line_desc_by_id: dict[int, str] = {
-        int(line.id): (line.description or "")
-        for line in all_lines
-        if line.id is not None
-    }
-    line_reading_id_by_id: dict[int, int | None] = {
-        int(line.id): (int(line.meter_reading_id) if line.meter_reading_id is not None else None)
-        for line in all_lines
-        if line.id is not None
-    }
-
-    def _parse_selected_line_ids(reference: str | None) -> list[int]:
-        if not reference:
-            return []
-        marker = "LINESEL:"
-        idx = reference.find(marker)
-        if idx < 0:
-            return []
-        raw = reference[idx + len(marker):].split("|")[0]
-        out: list[int] = []
-        for token in raw.split(","):
-            token = token.strip()
-            if not token:
-                continue
-            try:
-                out.append(int(token))
-            except Exception:
-                continue
-        return out
-
-    def _is_water_line_desc(desc: str | None) -> bool:
-        low = (desc or "").lower()
-        return ("вода" in low) or ("water" in low) or ("meter_cold_water" in low)
-
-    def _is_sewer_line_desc(desc: str | None) -> bool:
-        low = (desc or "").lower()
-        return ("канализац" in low) or ("sewerage" in low) or ("meter_sewerage" in low)
-
-    def _normalize_selected_ids(selected_ids: list[int]) -> list[int]:
-        ids = [int(x) for x in (selected_ids or []) if int(x) > 0]
-        if not ids:
-            return []
-        unique_ids = list(dict.fromkeys(ids))
-        selected_has_bundle = any(
-            _is_water_line_desc(line_desc_by_id.get(lid)) or _is_sewer_line_desc(line_desc_by_id.get(lid))
-            for lid in unique_ids
-        )
-        if not selected_has_bundle:
-            return unique_ids
-
-        sewer_ids = [lid for lid, desc in line_desc_by_id.items() if _is_sewer_line_desc(desc)]
-        water_ids = [lid for lid, desc in line_desc_by_id.items() if _is_water_line_desc(desc)]
-        if not sewer_ids or not water_ids:
-            return unique_ids
-
-        for lid in sewer_ids + water_ids:
-            if lid not in unique_ids:
-                unique_ids.append(lid)
-
-        def _key(lid: int) -> tuple[int, int]:
-            if lid in sewer_ids:
-                return (0, unique_ids.index(lid))
-            if lid in water_ids:
-                return (1, unique_ids.index(lid))
-            return (2, unique_ids.index(lid))
-
-        return [lid for lid in sorted(unique_ids, key=_key)]
-
-    def _allocate(amount: Decimal, line_ids: list[int]) -> None:
-        remaining_amt = Decimal(str(amount or 0))
-        for lid in line_ids:
-            if remaining_amt <= 0:
-                break
-            if lid not in line_totals:
-                continue
-            cap = max(line_totals[lid] - paid_by_line[lid], Decimal("0"))
-            if cap <= 0:
-                continue
-            take = min(cap, remaining_amt)
-            paid_by_line[lid] += take
-            remaining_amt -= take
-
-    default_order = sorted(line_totals.keys())
-    for app in apps:
-        amt = Decimal(str(app.amount_applied or 0))
-        if amt <= 0:
-            continue
-        selected_ids = _parse_selected_line_ids(getattr(app, "reference", None))
-        if selected_ids:
-            _allocate(amt, _normalize_selected_ids(selected_ids))
-        else:
-            _allocate(amt, default_order)
-
-    result: dict[int, dict] = {}
-    for lid, total in line_totals.items():
-        paid = money(paid_by_line.get(lid, Decimal("0")))
-        remaining = max(total - paid, Decimal("0"))
-        result[lid] = {
-            "meter_reading_id": line_reading_id_by_id.get(lid),
-            "description": line_desc_by_id.get(lid) or "",
+    # Активный счёт за период один; если их вдруг несколько — берём первый.
+    invoice_by_resident: dict[int, int] = {}
+    for row in rows:
+        invoice_by_resident.setdefault(int(row.resident_id), int(row.invoice_id))
+    rows = [row for row in rows if invoice_by_resident[int(row.resident_id)] == int(row.invoice_id)]
+    paid_by_line = line_paid_amounts(db, rows)
+
+    result: dict[int, dict[int, dict]] = {}
+    for row in rows:
+        total = money(Decimal(str(row.amount_total or 0)))
+        paid = paid_by_line.get(int(row.id), Decimal("0"))
+        result.setdefault(int(row.resident_id), {})[int(row.id)] = {
+            "meter_reading_id": int(row.meter_reading_id) if row.meter_reading_id is not None else None,
+            "description": row.description or "",
             "line_total": float(total),
             "paid_amount": float(paid),
-            "remaining_amount": float(money(remaining)),
+            "remaining_amount": float(money(max(total - paid, Decimal("0")))),
         }
     return result
 
 
+def _invoice_line_payment_state_for_period(
+    db: Session,
+    resident_id: int,
+    year: int,
+    month: int,
+) -> dict[int, dict]:
+    """Детализация оплаты по строкам инвойса за период (line_id -> {...}, см. _period_line_payment_states)."""
+    return _period_line_payment_states(db, [resident_id], year, month).get(int(resident_id), {})
+
+
 def _meter_reading_payment_lock_map(
     db: Session,
     resident_id: int,
@@ -251,10 +146,13 @@ def _meter_reading_payment_lock_map(
     - строка считается заблокированной, если покрыта полностью.
     - Авто-канализация (meter_reading_id = None) учитывается первой и блокирует WATER показания.
     """
-    line_state = _invoice_line_payment_state_for_period(db, resident_id, year, month)
-    if not line_state:
-        return {}
+    return _payment_lock_map_from_line_state(
+        _invoice_line_payment_state_for_period(db, resident_id, year, month)
+    )
 
+
+def _payment_lock_map_from_line_state(line_state: dict[int, dict]) -> dict[int, dict]:
+    """Карта блокировок meter_reading_id -> {...} из уже посчитанной детализации по строкам."""
     lock_map: dict[int, dict] = {}
     for _, state in line_state.items():
         meter_reading_id = state.get("meter_reading_id")
@@ -271,145 +169,6 @@ def _meter_reading_payment_lock_map(
     return lock_map
 
 
-def _upsert_auto_sewerage_line_for_invoice(
-    db: Session,
-    inv: Invoice,
-    all_period_readings: list[MeterReading],
-) -> None:
-    """
-    Авто-канализация как % от воды:
-    - если есть реальные SEWERAGE-показания, авто-строку удаляем;
-    - иначе считаем по WATER-тарифам (Tariff.sewerage_percent).
-    """
-    if not inv or not inv.id:
-        return
-
-    readings = all_period_readings or []
-    has_real_sewerage = any(
-        (rd.resident_meter and rd.resident_meter.meter_type == MeterType.SEWERAGE)
-        for rd in readings
-    )
-
-    auto_line = (
-        db.query(InvoiceLine)
-        .filter(
-            InvoiceLine.invoice_id == inv.id,
-            InvoiceLine.meter_reading_id.is_(None),
-            InvoiceLine.description.ilike("Канализация%"),
-        )
-        .first()
-    )
-
-    if has_real_sewerage:
-        # Восстанавливаем WATER-строки как исходные начисления из MeterReading.
-        for rd in readings:
-            if rd.resident_meter and rd.resident_meter.meter_type == MeterType.WATER:
-                line = (
-                    db.query(InvoiceLine)
-                    .filter(InvoiceLine.invoice_id == inv.id, InvoiceLine.meter_reading_id == rd.id)
-                    .first()
-                )
-                if line:
-                    line.amount_net = money(Decimal(str(rd.amount_net or 0)))
-                    line.amount_vat = money(Decimal(str(rd.amount_vat or 0)))
-                    line.amount_total = money(Decimal(str(rd.amount_total or 0)))
-                    line.description = f"Вода {float(Decimal(str(rd.consumption or 0)))} м³"
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    water_readings = [
-        rd for rd in readings
-        if rd.resident_meter and rd.resident_meter.meter_type == MeterType.WATER
-    ]
-    if not water_readings:
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    sew_net = Decimal("0")
-    sew_vat = Decimal("0")
-    sew_total = Decimal("0")
-    sewer_cons = Decimal("0")
-
-    for rd in water_readings:
-        line = (
-            db.query(InvoiceLine)
-            .filter(InvoiceLine.invoice_id == inv.id, InvoiceLine.meter_reading_id == rd.id)
-            .first()
-        )
-        if not line:
-            continue
-
-        base_net = money(Decimal(str(rd.amount_net or 0)))
-        base_vat = money(Decimal(str(rd.amount_vat or 0)))
-        base_total = money(Decimal(str(rd.amount_total or 0)))
-
-        t = db.get(Tariff, rd.tariff_id) if rd.tariff_id else None
-        percent = _effective_sewerage_percent(t)
-        if percent <= 0:
-            line.amount_net = base_net
-            line.amount_vat = base_vat
-            line.amount_total = base_total
-            line.description = f"Вода {float(Decimal(str(rd.consumption or 0)))} м³"
-            continue
-
-        k = percent / Decimal("100")
-        consumption = Decimal(str(rd.consumption or 0))
-
-        if getattr(t, "customer_type", None) == CustomerType.INDIVIDUAL:
-            # Для физлиц делим WATER-строку на воду и канализацию (без роста total).
-            new_net = money(base_net * (Decimal("1") - k))
-            new_vat = money(base_vat * (Decimal("1") - k))
-            new_total = money(base_total * (Decimal("1") - k))
-
-            line.amount_net = new_net
-            line.amount_vat = new_vat
-            line.amount_total = new_total
-
-            sew_net += (base_net - new_net)
-            sew_vat += (base_vat - new_vat)
-            sew_total += (base_total - new_total)
-
-            water_display_cons = consumption * (Decimal("1") - k)
-            sewer_display_cons = consumption * k
-            line.description = f"Вода {float(water_display_cons)} м³"
-            sewer_cons += sewer_display_cons
-        else:
-            # Для юрлиц WATER остаётся как есть, канализация добавляется сверху.
-            line.amount_net = base_net
-            line.amount_vat = base_vat
-            line.amount_total = base_total
-
-            sew_net += money(base_net * k)
-            sew_vat += money(base_vat * k)
-            sew_total += money(base_total * k)
-            line.description = f"Вода {float(consumption)} м³"
-            sewer_cons += consumption * k
-
-    if sew_total <= 0:
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    # Для инвойса канализация выводится без объёма (м3).
-    desc = "Канализация"
-    if auto_line:
-        auto_line.description = desc
-        auto_line.amount_net = money(sew_net)
-        auto_line.amount_vat = money(sew_vat)
-        auto_line.amount_total = money(sew_total)
-    else:
-        db.add(InvoiceLine(
-            invoice_id=inv.id,
-            meter_reading_id=None,
-            description=desc,
-            amount_net=money(sew_net),
-            amount_vat=money(sew_vat),
-            amount_total=money(sew_total),
-        ))
-
-
 def get_gas_annual_prev(db: Session, meter_id: int, period_start: datetime) -> Decimal:
     """Газ: годовой объём ДО начала периода (для накопительного тарифа)."""
     year_start = datetime(period_start.year, 1, 1)
@@ -608,83 +367,137 @@ class ReadingCreate(BaseModel):
     note: Optional[str] = None
 
 
-PHOTO_TTL_DAYS = 90
-PHOTO_COMPRESS_THRESHOLD_BYTES = int(os.getenv("METER_PHOTO_COMPRESS_THRESHOLD_BYTES", str(3 * 1024 * 1024)))
-PHOTO_TARGET_MAX_BYTES = int(os.getenv("METER_PHOTO_TARGET_MAX_BYTES", str(1 * 1024 * 1024)))
-PHOTO_JPEG_QUALITY_START = int(os.getenv("METER_PHOTO_JPEG_QUALITY_START", "85"))
-PHOTO_JPEG_QUALITY_MIN = int(os.getenv("METER_PHOTO_JPEG_QUALITY_MIN", "45"))
-PHOTO_JPEG_QUALITY_STEP = int(os.getenv("METER_PHOTO_JPEG_QUALITY_STEP", "10"))
+def delete_meter_photo_for_reading(db: Session, reading_id: int) -> None:
+    photo = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.meter_reading_id == reading_id).first()
+    if not photo:
+        return
+    release_after_commit(db, photo_keys(photo))
+    db.delete(photo)
 
 
-def _compress_meter_photo_if_needed(raw_bytes: bytes, original_ext: str) -> tuple[bytes, str]:
+def delete_reading_lines(db: Session, reading_id: int) -> set[int]:
     """
-    Сжимает тяжёлые фото счётчиков.
-    Если файл маленький или сжать не удалось — возвращаем исходный файл как есть.
+    Удаляет строки счетов по показанию через ORM (не Query.delete): after_flush-хук
+    services/azericard.py сбрасывает кэш разбивки этих счетов во всех воркерах.
+    Возвращает id затронутых счетов.
     """
-    if len(raw_bytes) <= PHOTO_COMPRESS_THRESHOLD_BYTES:
-        return raw_bytes, original_ext
-
-    try:
-        with Image.open(BytesIO(raw_bytes)) as img:
-            normalized = ImageOps.exif_transpose(img)
-            if normalized.mode not in {"RGB", "L"}:
-                normalized = normalized.convert("RGB")
-            elif normalized.mode == "L":
-                normalized = normalized.convert("RGB")
-
-            best_bytes = raw_bytes
-            quality = max(PHOTO_JPEG_QUALITY_MIN, PHOTO_JPEG_QUALITY_START)
-
-            while quality >= PHOTO_JPEG_QUALITY_MIN:
-                out = BytesIO()
-                normalized.save(out, format="JPEG", quality=quality, optimize=True)
-                candidate = out.getvalue()
-
-                if len(candidate) < len(best_bytes):
-                    best_bytes = candidate
-                if len(candidate) <= PHOTO_TARGET_MAX_BYTES:
-                    return candidate, ".jpg"
+    invoice_ids: set[int] = set()
+    for line in db.query(InvoiceLine).filter(InvoiceLine.meter_reading_id == reading_id).all():
+        invoice_ids.add(line.invoice_id)
+        db.delete(line)
+    return invoice_ids
 
-                quality -= max(1, PHOTO_JPEG_QUALITY_STEP)
 
-            if len(best_bytes) < len(raw_bytes):
-                return best_bytes, ".jpg"
-            return raw_bytes, original_ext
-    except (UnidentifiedImageError, OSError, ValueError):
-        return raw_bytes, original_ext
-
-
-def _photo_disk_path(photo: MeterReadingPhoto) -> str:
-    return os.path.join("uploads", photo.file_path)
+# ====== List readings ======
+_LIST_ALLOWED_TYPES = {"ELECTRIC", "GAS", "WATER", "SEWERAGE", "SERVICE", "RENT", "CONSTRUCTION"}
 
 
-def cleanup_expired_meter_photos(db: Session) -> None:
-    now = datetime.utcnow()
-    expired = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.expires_at <= now).all()
-    for photo in expired:
-        try:
-            path = _photo_disk_path(photo)
-            if os.path.exists(path):
-                os.remove(path)
-        except Exception:
-            pass
-        db.delete(photo)
-
+def _period_split_subquery(
+    block_id: Optional[int],
+    resident_id: Optional[int],
+    query_types: set[str],
+    q: Optional[str],
+    from_dt: datetime,
+    to_dt: datetime,
+):
+    """
+    Показания периода, уже разложенные на «воду» и «авто-канализацию» (по строке на показание).
 
-def delete_meter_photo_for_reading(db: Session, reading_id: int) -> None:
-    photo = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.meter_reading_id == reading_id).first()
-    if not photo:
-        return
-    try:
-        path = _photo_disk_path(photo)
-        if os.path.exists(path):
-            os.remove(path)
-    except Exception:
-        pass
-    db.delete(photo)
+    Авто-канализация считается только для WATER-показаний резидента, у которого в выборке
+    нет реального SEWERAGE (оконная функция по резиденту), и только при % в WATER-тарифе:
+    - INDIVIDUAL: вода = total*(1-k), канализация = total - вода;
+    - иначе: вода = total целиком, канализация = total*k.
+    Округление до копеек — как money() (ROUND_HALF_UP, суммы неотрицательные).
+    """
+    cons = func.coalesce(MeterReading.consumption, 0)
+    total = func.coalesce(MeterReading.amount_total, 0)
+    k = case(
+        (and_(Tariff.meter_type == MeterType.WATER, Tariff.sewerage_percent > 0), Tariff.sewerage_percent / 100),
+        else_=0,
+    )
+    base = (
+        select(
+            MeterReading.id.label("id"),
+            ResidentMeter.resident_id.label("resident_id"),
+            ResidentMeter.id.label("meter_id"),
+            ResidentMeter.meter_type.label("meter_type"),
+            MeterReading.reading_date.label("reading_date"),
+            cons.label("cons"),
+            total.label("total"),
+            k.label("k"),
+            (Tariff.customer_type == CustomerType.INDIVIDUAL).label("individual"),
+            func.max(case((ResidentMeter.meter_type == MeterType.SEWERAGE, 1), else_=0))
+            .over(partition_by=ResidentMeter.resident_id)
+            .label("has_real_sewer"),
+        )
+        .join(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
+        .join(Resident, Resident.id == ResidentMeter.resident_id)
+        .outerjoin(Tariff, Tariff.id == MeterReading.tariff_id)
+        # Показываем показания и неактивных счётчиков: они уже записаны и входят в период.
+        .where(MeterReading.reading_date >= from_dt, MeterReading.reading_date < to_dt)
+    )
+    if block_id:
+        base = base.where(Resident.block_id == block_id)
+    if resident_id:
+        base = base.where(Resident.id == resident_id)
+    if query_types:
+        base = base.where(ResidentMeter.meter_type.in_([MeterType(t) for t in query_types]))
+    base = apply_search(
+        base, q, Resident.unit_number, Resident.owner_full_name, Resident.owner_phone, Resident.owner_email
+    )
+    b = base.subquery("period_readings")
+
+    split = and_(b.c.meter_type == MeterType.WATER, b.c.has_real_sewer == 0, b.c.k > 0)
+    individual_split = and_(split, b.c.individual)
+    individual_water_total = func.round(b.c.total * (1 - b.c.k), 2)
+    consumption_type = MeterReading.consumption.type
+    return select(
+        b.c.id,
+        b.c.resident_id,
+        b.c.meter_id,
+        b.c.meter_type,
+        b.c.reading_date,
+        # Расход с точностью колонки показаний, а не тарифного процента.
+        type_coerce(case((individual_split, b.c.cons * (1 - b.c.k)), else_=b.c.cons), consumption_type).label("meter_cons"),
+        case((individual_split, individual_water_total), else_=b.c.total).label("meter_total"),
+        type_coerce(case((split, b.c.cons * b.c.k), else_=0), consumption_type).label("sewer_cons"),
+        case(
+            (individual_split, b.c.total - individual_water_total),
+            (split, func.round(b.c.total * b.c.k, 2)),
+            else_=0,
+        ).label("sewer_total"),
+    ).subquery("period_split")
+
+
+def _payment_meta(meta_items: list[dict], fallback_total: Decimal) -> tuple[Decimal, Decimal, Decimal]:
+    """(line_total, paid, remaining) по строкам инвойса; без строк — всё ещё не выставлено и не оплачено."""
+    if not meta_items:
+        line_total = money(fallback_total)
+        return line_total, Decimal("0"), line_total
+    line_total = money(sum((Decimal(str(m.get("line_total", 0) or 0)) for m in meta_items), Decimal("0")))
+    paid = money(sum((Decimal(str(m.get("paid_amount", 0) or 0)) for m in meta_items), Decimal("0")))
+    remaining = money(sum((Decimal(str(m.get("remaining_amount", 0) or 0)) for m in meta_items), Decimal("0")))
+    return line_total, paid, remaining
+
+
+def _overview_meter_entry(display_type: str, unit: str, consumption, total, line_total: Decimal, paid: Decimal, remaining: Decimal) -> dict:
+    is_paid = line_total > Decimal("0.0001") and remaining <= Decimal("0.0001")
+    is_partial = paid > Decimal("0.0001") and remaining > Decimal("0.0001")
+    return {
+        "type": display_type,
+        "consumption": consumption,
+        "unit": unit,
+        "total": total,
+        "is_paid": is_paid,
+        "is_partial": is_partial,
+        "is_editable": paid <= Decimal("0.0001"),
+        "payment_status": "Оплачено" if is_paid else ("Частично" if is_partial else "Не оплачено"),
+        "paid_amount": float(paid),
+        "remaining_amount": float(remaining),
+        "line_total_amount": float(line_total),
+    }
 
 
-# ====== List readings ======
 @router.get("/")
 def list_readings(
     db: Session = Depends(get_db),
@@ -699,23 +512,11 @@ def list_readings(
 ):
     """
     Список показаний за выбранный месяц (агрегировано по резидентам).
-    """
-    blocks = db.query(Block).order_by(Block.name.asc()).all()
-
-    # Выпадашка резидентов (по блоку/поиску)
-    residents_q = db.query(Resident).order_by(Resident.unit_number.asc())
-    if block_id:
-        residents_q = residents_q.filter(Resident.block_id == block_id)
-    if q:
-        like = f"%{q.strip()}%"
-        residents_q = residents_q.filter(
-            (Resident.unit_number.ilike(like)) |
-            (Resident.owner_full_name.ilike(like)) |
-            (Resident.owner_phone.ilike(like)) |
-            (Resident.owner_email.ilike(like))
-        )
-    residents = residents_q.all()
 
+    Агрегация по резидентам/счётчикам и пагинация — в SQL (GROUP BY + LIMIT/OFFSET);
+    оплата по строкам инвойса считается только для резидентов текущей страницы.
+    Блоки и резиденты для фильтров — из общего справочника GET /api/reference.
+    """
     now = datetime.utcnow()
     year = year or now.year
     month = month or now.month
@@ -723,18 +524,7 @@ def list_readings(
     from_dt = datetime(year, month, 1)
     to_dt = datetime(year + (1 if month == 12 else 0), (1 if month == 12 else month + 1), 1)
 
-    # Показания за период
-    # ВАЖНО: Показываем показания для всех счётчиков (активных и неактивных),
-    # так как показания уже были записаны и должны отображаться в истории
-    readings_q = db.query(MeterReading).join(ResidentMeter).join(Resident)
-    # УБРАЛИ фильтр is_active == True, чтобы показывать все показания за период
-    if block_id:
-        readings_q = readings_q.filter(Resident.block_id == block_id)
-    if resident_id:
-        readings_q = readings_q.filter(Resident.id == resident_id)
-    allowed_types = {"ELECTRIC", "GAS", "WATER", "SEWERAGE", "SERVICE", "RENT", "CONSTRUCTION"}
-    selected_types = [t for t in (meter_type or []) if t in allowed_types]
-    selected_types_set = set(selected_types)
+    selected_types_set = {t for t in (meter_type or []) if t in _LIST_ALLOWED_TYPES}
     filter_by_meter_type = bool(selected_types_set)
     include_water = (not filter_by_meter_type) or ("WATER" in selected_types_set)
     include_sewerage = (not filter_by_meter_type) or ("SEWERAGE" in selected_types_set)
@@ -744,305 +534,140 @@ def list_readings(
     query_types = set(selected_types_set)
     if filter_by_meter_type and include_sewerage and not include_water:
         query_types.add("WATER")
-    if query_types:
-        readings_q = readings_q.filter(ResidentMeter.meter_type.in_([MeterType(t) for t in query_types]))
-    if q:
-        like = f"%{q.strip()}%"
-        readings_q = readings_q.filter(
-            (Resident.unit_number.ilike(like)) |
-            (Resident.owner_full_name.ilike(like)) |
-            (Resident.owner_phone.ilike(like)) |
-            (Resident.owner_email.ilike(like))
-        )
 
-    readings_q = readings_q.filter(
-        MeterReading.reading_date >= from_dt,
-        MeterReading.reading_date < to_dt,
-    )
-    period_readings = readings_q.all()
-    
-    # Сначала определяем, есть ли реальная канализация за период у резидента.
-    real_sewerage_resident_ids: set[int] = set()
-    for rd in period_readings:
-        meter = rd.resident_meter
-        if meter and meter.meter_type == MeterType.SEWERAGE:
-            real_sewerage_resident_ids.add(meter.resident_id)
-
-    # Агрегат по счётчикам
-    rows: dict[int, dict] = {}
-    for rd in period_readings:
-        meter = rd.resident_meter
-        res_id = meter.resident_id
-
-        # Единицы: ELECTRIC -> кВт·ч; GAS/WATER/SEWERAGE -> м³; SERVICE/RENT/CONSTRUCTION -> мес.
-        if meter.meter_type == MeterType.ELECTRIC:
-            unit = "кВт·ч"
-        elif meter.meter_type in {MeterType.GAS, MeterType.WATER, MeterType.SEWERAGE}:
-            unit = "м³"
-        else:
-            unit = "мес."
-
-        entry = rows.setdefault(res_id, {"resident": meter.resident, "meters": {}, "max_reading_date": None})
-        cons = Decimal(rd.consumption or 0)
-        total = Decimal(rd.amount_total or 0)
-
-        def ensure_mrow():
-            return entry["meters"].setdefault(meter.id, {
-                "meter": meter,
-                "unit": unit,
-                "consumption": Decimal("0"),
-                "total": Decimal("0"),
-                "reading_ids": [],
-            })
+    s = _period_split_subquery(block_id, resident_id, query_types, q, from_dt, to_dt)
+    # WATER попадает в выборку и как источник авто-канализации — строкой счётчика он идёт, только если выбран.
+    meter_included = true() if include_water else (s.c.meter_type != MeterType.WATER)
+
+    sewer_total = func.coalesce(func.sum(s.c.sewer_total), 0)
+    meters_total = func.coalesce(func.sum(case((meter_included, s.c.meter_total), else_=0)), 0)
+    resident_total = (meters_total + sewer_total) if include_sewerage else meters_total
+    has_meters = func.sum(case((meter_included, 1), else_=0)) > 0
+    per_resident = (
+        select(
+            s.c.resident_id,
+            Resident.unit_number,
+            Block.name.label("block_name"),
+            func.max(s.c.reading_date).label("reading_date"),
+            resident_total.label("total_amount"),
+        )
+        .join(Resident, Resident.id == s.c.resident_id)
+        .outerjoin(Block, Block.id == Resident.block_id)
+        .group_by(s.c.resident_id, Resident.unit_number, Block.name)
+        .having(or_(has_meters, sewer_total > 0) if include_sewerage else has_meters)
+    ).subquery("per_resident")
+
+    total, grand_total = db.execute(
+        select(func.count(), func.coalesce(func.sum(per_resident.c.total_amount), 0))
+    ).one()
+    last_page = max(1, (total + per_page - 1) // per_page)
+    if page > last_page:
+        page = last_page
 
-        # Если у резидента нет реального SEWERAGE-счётчика — показываем авто-канализацию как отдельный тариф.
-        if meter.meter_type == MeterType.WATER and res_id not in real_sewerage_resident_ids:
-            t = rd.tariff
-            percent = _effective_sewerage_percent(t)
-            if percent > 0:
-                k = percent / Decimal("100")
-                if getattr(t, "customer_type", None) == CustomerType.INDIVIDUAL:
-                    water_cons = cons * (Decimal("1") - k)
-                    water_total = money(total * (Decimal("1") - k))
-                    sewer_cons = cons * k
-                    sewer_total = money(total - water_total)
-                else:
-                    water_cons = cons
-                    water_total = total
-                    sewer_cons = cons * k
-                    sewer_total = money(total * k)
-
-                if include_water:
-                    mrow = ensure_mrow()
-                    mrow["consumption"] += water_cons
-                    mrow["total"] += water_total
-                    mrow["reading_ids"].append(int(rd.id))
-
-                if include_sewerage:
-                    auto_sewer = entry.setdefault("auto_sewer", {
-                        "consumption": Decimal("0"),
-                        "total": Decimal("0"),
-                        "unit": "м³",
-                    })
-                    auto_sewer["consumption"] += sewer_cons
-                    auto_sewer["total"] += sewer_total
-            else:
-                if include_water:
-                    mrow = ensure_mrow()
-                    mrow["consumption"] += cons
-                    mrow["total"] += total
-                    mrow["reading_ids"].append(int(rd.id))
-        else:
-            meter_type_value = meter.meter_type.value
-            if (not filter_by_meter_type) or (meter_type_value in selected_types_set):
-                mrow = ensure_mrow()
-                mrow["consumption"] += cons
-                mrow["total"] += total
-                mrow["reading_ids"].append(int(rd.id))
-
-        # Нужна "последняя" запись за период для сортировки (новые сверху)
-        cur_max = entry.get("max_reading_date")
-        if cur_max is None or rd.reading_date > cur_max:
-            entry["max_reading_date"] = rd.reading_date
+    # Сортировка: последние записи сверху — новые ID резидентов первыми.
+    page_residents = db.execute(
+        select(per_resident)
+        .order_by(per_resident.c.resident_id.desc())
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
+    page_ids = [int(r.resident_id) for r in page_residents]
+
+    meters_by_resident: dict[int, list] = {rid: [] for rid in page_ids}
+    sewer_by_resident: dict[int, tuple] = {}
+    if page_ids:
+        meter_rows = db.execute(
+            select(
+                s.c.resident_id,
+                s.c.meter_id,
+                s.c.meter_type,
+                func.sum(s.c.meter_cons).label("consumption"),
+                func.sum(s.c.meter_total).label("total"),
+                func.array_agg(s.c.id).label("reading_ids"),
+            )
+            .where(s.c.resident_id.in_(page_ids), meter_included)
+            .group_by(s.c.resident_id, s.c.meter_id, s.c.meter_type)
+            .order_by(s.c.resident_id, func.min(s.c.id))
+        ).all()
+        for row in meter_rows:
+            meters_by_resident[int(row.resident_id)].append(row)
+
+        if include_sewerage:
+            sewer_by_resident = {
+                int(rid): (cons, amount)
+                for rid, cons, amount in db.execute(
+                    select(s.c.resident_id, func.sum(s.c.sewer_cons), func.sum(s.c.sewer_total))
+                    .where(s.c.resident_id.in_(page_ids))
+                    .group_by(s.c.resident_id)
+                    .having(func.sum(s.c.sewer_total) > 0)
+                ).all()
+            }
 
     paid_resident_ids = set(
-        rid for (rid,) in db.query(Resident.id)
-        .join(Invoice, Invoice.resident_id == Resident.id)
+        rid for (rid,) in db.query(Invoice.resident_id)
         .filter(
+            Invoice.resident_id.in_(page_ids),
             Invoice.period_year == year,
             Invoice.period_month == month,
-            Invoice.status == InvoiceStatus.PAID
+            Invoice.status == InvoiceStatus.PAID,
         ).all()
-    )
+    ) if page_ids else set()
 
-    payment_lock_maps: dict[int, dict[int, dict]] = {}
-    line_payment_states: dict[int, dict[int, dict]] = {}
-    for res_id in rows.keys():
-        payment_lock_maps[int(res_id)] = _meter_reading_payment_lock_map(
-            db=db,
-            resident_id=int(res_id),
-            year=year,
-            month=month,
-        )
-        line_payment_states[int(res_id)] = _invoice_line_payment_state_for_period(
-            db=db,
-            resident_id=int(res_id),
-            year=year,
-            month=month,
-        )
+    line_states = _period_line_payment_states(db, page_ids, year, month)
 
-    # Формируем ответ
     result_rows = []
-    for res_id, data in rows.items():
-        resident = data["resident"]
+    for res in page_residents:
+        res_id = int(res.resident_id)
+        line_state = line_states.get(res_id, {})
+        lock_map = _payment_lock_map_from_line_state(line_state)
         meters_list = []
         total_amount = Decimal("0")
-        reading_date = data.get("max_reading_date")  # last reading date for sorting/display
-        has_editable_meters = False
-        
-        for meter_id, mdata in data["meters"].items():
-            meter = mdata["meter"]
-            consumption = float(mdata["consumption"])
-            total = float(mdata["total"])
-            total_amount += Decimal(total)
-            
-            # Определяем тип для отображения
-            if meter.meter_type == MeterType.ELECTRIC:
-                display_type = "Электричество"
-            elif meter.meter_type == MeterType.GAS:
-                display_type = "Газ"
-            elif meter.meter_type == MeterType.WATER:
-                display_type = "Вода"
-            elif meter.meter_type == MeterType.SEWERAGE:
-                display_type = "Канализация"
-            elif meter.meter_type == MeterType.SERVICE:
-                display_type = "Сервис"
-            elif meter.meter_type == MeterType.RENT:
-                display_type = "Аренда"
-            elif meter.meter_type == MeterType.CONSTRUCTION:
-                display_type = "Строительство"
-            else:
-                display_type = "Неизвестно"
-
-            meter_lock_map = payment_lock_maps.get(int(res_id), {})
-            reading_ids = [int(x) for x in (mdata.get("reading_ids") or []) if x is not None]
-
-            line_total_amount = Decimal("0")
-            paid_amount = Decimal("0")
-            remaining_amount = Decimal("0")
-            has_payment_meta = False
-
-            for rid in reading_ids:
-                meta = meter_lock_map.get(rid)
-                if not meta:
-                    continue
-                has_payment_meta = True
-                line_total_amount += Decimal(str(meta.get("line_total", 0) or 0))
-                paid_amount += Decimal(str(meta.get("paid_amount", 0) or 0))
-                remaining_amount += Decimal(str(meta.get("remaining_amount", 0) or 0))
-
-            if not has_payment_meta:
-                line_total_amount = Decimal(str(total))
-                paid_amount = Decimal("0")
-                remaining_amount = Decimal(str(total))
-
-            line_total_amount = money(line_total_amount)
-            paid_amount = money(paid_amount)
-            remaining_amount = money(remaining_amount)
-
-            meter_is_paid = line_total_amount > Decimal("0.0001") and remaining_amount <= Decimal("0.0001")
-            meter_is_partial = paid_amount > Decimal("0.0001") and remaining_amount > Decimal("0.0001")
-            payment_status = "Оплачено" if meter_is_paid else ("Частично" if meter_is_partial else "Не оплачено")
-            meter_is_editable = paid_amount <= Decimal("0.0001")
-            if meter_is_editable:
-                has_editable_meters = True
-            
-            meters_list.append({
-                "type": display_type,
-                "consumption": consumption,
-                "unit": mdata["unit"],
-                "total": total,
-                "is_paid": meter_is_paid,
-                "is_partial": meter_is_partial,
-                "is_editable": meter_is_editable,
-                "payment_status": payment_status,
-                "paid_amount": float(paid_amount),
-                "remaining_amount": float(remaining_amount),
-                "line_total_amount": float(line_total_amount),
-            })
 
-        auto_sewer = data.get("auto_sewer")
-        if auto_sewer and auto_sewer["total"] > 0:
-            auto_cons = float(auto_sewer["consumption"])
-            auto_total = float(auto_sewer["total"])
-            total_amount += Decimal(auto_total)
+        for mrow in meters_by_resident[res_id]:
+            display_type, unit = METER_DISPLAY.get(mrow.meter_type, ("Неизвестно", "мес."))
+            consumption = float(mrow.consumption or 0)
+            meter_total = float(mrow.total or 0)
+            total_amount += Decimal(meter_total)
+            meta_items = [lock_map[int(rid)] for rid in (mrow.reading_ids or []) if int(rid) in lock_map]
+            meters_list.append(_overview_meter_entry(
+                display_type, unit, consumption, meter_total,
+                *_payment_meta(meta_items, Decimal(str(meter_total))),
+            ))
 
-            resident_line_state = line_payment_states.get(int(res_id), {})
+        # Редактируемость строки резидента — по реальным счётчикам, авто-канализация не в счёт.
+        has_editable_meters = any(m["is_editable"] for m in meters_list)
+        if res_id in sewer_by_resident:
+            auto_cons, auto_total = sewer_by_resident[res_id]
+            auto_total = float(auto_total)
+            total_amount += Decimal(auto_total)
             sewer_line_states = [
-                state
-                for state in resident_line_state.values()
-                if _is_sewer_line_desc((state.get("description") or ""))
+                state for state in line_state.values()
+                if is_sewerage_line_description(state.get("description") or "")
             ]
+            meters_list.append(_overview_meter_entry(
+                "Канализация", "м³", float(auto_cons or 0), auto_total,
+                *_payment_meta(sewer_line_states, Decimal(str(auto_total))),
+            ))
 
-            sewer_line_total = money(
-                sum((Decimal(str(s.get("line_total", 0) or 0)) for s in sewer_line_states), Decimal("0"))
-            )
-            sewer_paid = money(
-                sum((Decimal(str(s.get("paid_amount", 0) or 0)) for s in sewer_line_states), Decimal("0"))
-            )
-            sewer_remaining = money(
-                sum((Decimal(str(s.get("remaining_amount", 0) or 0)) for s in sewer_line_states), Decimal("0"))
-            )
-            if not sewer_line_states:
-                sewer_line_total = money(Decimal(str(auto_total)))
-                sewer_paid = Decimal("0")
-                sewer_remaining = sewer_line_total
-
-            sewer_is_paid = sewer_line_total > Decimal("0.0001") and sewer_remaining <= Decimal("0.0001")
-            sewer_is_partial = sewer_paid > Decimal("0.0001") and sewer_remaining > Decimal("0.0001")
-            sewer_payment_status = "Оплачено" if sewer_is_paid else ("Частично" if sewer_is_partial else "Не оплачено")
-
-            meters_list.append({
-                "type": "Канализация",
-                "consumption": auto_cons,
-                "unit": auto_sewer["unit"],
-                "total": auto_total,
-                "is_paid": sewer_is_paid,
-                "is_partial": sewer_is_partial,
-                "is_editable": sewer_paid <= Decimal("0.0001"),
-                "payment_status": sewer_payment_status,
-                "paid_amount": float(sewer_paid),
-                "remaining_amount": float(sewer_remaining),
-                "line_total_amount": float(sewer_line_total),
-            })
-
-        if not meters_list:
-            continue
-        
+        block_name = res.block_name or ""
         result_rows.append({
             "resident_id": res_id,
-            "resident_code": f"{resident.block.name if resident.block else ''} / {resident.unit_number}",
-            "resident_info": f"Блок {resident.block.name if resident.block else ''}, №{resident.unit_number}",
-            "block_name": resident.block.name if resident.block else "",
-            "unit_number": resident.unit_number,
+            "resident_code": f"{block_name} / {res.unit_number}",
+            "resident_info": f"Блок {block_name}, №{res.unit_number}",
+            "block_name": block_name,
+            "unit_number": res.unit_number,
             "meters": meters_list,
             "total_amount": float(total_amount),
             "is_paid": res_id in paid_resident_ids,
             "has_editable_meters": has_editable_meters,
-            "reading_date": reading_date.strftime("%Y-%m-%d") if reading_date else None,
-            "_reading_date_dt": reading_date,
+            "reading_date": res.reading_date.strftime("%Y-%m-%d") if res.reading_date else None,
         })
 
-    # Сортировка: последние записи сверху.
-    # В качестве основного ключа используем ID резидента (новые ID первыми),
-    # а дату последнего показания оставляем вторичным критерием.
-    result_rows.sort(
-        key=lambda r: (
-            int(r.get("resident_id") or 0),
-            r.get("_reading_date_dt") or datetime.min,
-        ),
-        reverse=True,
-    )
-    for r in result_rows:
-        r.pop("_reading_date_dt", None)
-
-    # Apply pagination
-    total = len(result_rows)
-    last_page = max(1, (total + per_page - 1) // per_page)
-    if page > last_page:
-        page = last_page
-    
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    paginated_rows = result_rows[start_idx:end_idx]
-
     return {
-        "blocks": [{"id": b.id, "name": b.name} for b in blocks],
-        "residents": [{"id": r.id, "unit_number": r.unit_number, "block_name": r.block.name if r.block else ""} for r in residents],
-        "rows": paginated_rows,
+        "rows": result_rows,
         "year": year,
         "month": month,
-        "total_amount": float(sum(r["total_amount"] for r in result_rows)),
+        "total_amount": float(grand_total),
         "pagination": {
             "page": page,
             "per_page": per_page,
@@ -1062,7 +687,6 @@ def get_resident_meters(
     """
     Данные для модалки: список счётчиков резидента.
     """
-    cleanup_expired_meter_photos(db)
     r = db.get(Resident, resident_id)
     if not r:
         raise HTTPException(status_code=404, detail="Resident not found")
@@ -1204,11 +828,19 @@ def get_resident_meters(
         existing_value_float = float(existing.value) if existing else None
 
         existing_photo_url = None
+        existing_photo_thumb_url = None
         if existing:
-            photo = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.meter_reading_id == existing.id).first()
+            photo = (
+                db.query(MeterReadingPhoto)
+                .filter(
+                    MeterReadingPhoto.meter_reading_id == existing.id,
+                    MeterReadingPhoto.expires_at > datetime.utcnow(),
+                )
+                .first()
+            )
             if photo:
-                normalized_photo_path = str(photo.file_path).replace("\\", "/")
-                existing_photo_url = f"/uploads/{normalized_photo_path}"
+                existing_photo_url = photo_url(photo.file_path)
+                existing_photo_thumb_url = photo_url(photo.thumb_path)
 
         payment_meta = None
         if existing:
@@ -1239,11 +871,12 @@ def get_resident_meters(
             "existing_reading_id": (existing.id if existing else None),
             "last_reading_id": (last_any.id if last_any else None),
             "existing_photo_url": existing_photo_url,
+            "existing_photo_thumb_url": existing_photo_thumb_url,
             "payment_locked": payment_locked,
             "paid_amount": float(payment_meta.get("paid_amount", 0)) if payment_meta else 0.0,
             "remaining_amount": float(payment_meta.get("remaining_amount", 0)) if payment_meta else 0.0,
             "line_total_amount": float(payment_meta.get("line_total", 0)) if payment_meta else 0.0,
-            "sewerage_percent": float(_effective_sewerage_percent(tariff_obj)),
+            "sewerage_percent": float(effective_sewerage_percent(tariff_obj)),
             "stable_tariff": float(Decimal(str(getattr(tariff_obj, "stable_tariff", 0) or 0))) if tariff_obj else 0.0,
             "use_multiplier": bool(getattr(tariff_obj, "use_multiplier", False)) if tariff_obj else False,
             "consumption_multiplier": float(Decimal(str(getattr(tariff_obj, "consumption_multiplier", 1) or 1))) if tariff_obj else 1.0,
@@ -1310,7 +943,6 @@ def upload_meter_photo(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    cleanup_expired_meter_photos(db)
     meter = db.get(ResidentMeter, meter_id)
     if not meter:
         raise HTTPException(status_code=404, detail="Meter not found")
@@ -1352,44 +984,48 @@ def upload_meter_photo(
     if ext not in {".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif"}:
         ext = ".jpg"
 
-    raw_bytes = file.file.read()
-    if not raw_bytes:
+    try:
+        stored = store_upload(db, file.file, ext)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError:
         raise HTTPException(status_code=400, detail="Empty image file")
-
-    processed_bytes, processed_ext = _compress_meter_photo_if_needed(raw_bytes, ext)
-    filename = f"{meter_id}_{reading.id}_{uuid4().hex}{processed_ext}"
-    relative_path = os.path.join("meter_readings", filename)
-    os.makedirs(os.path.join("uploads", "meter_readings"), exist_ok=True)
-    full_path = os.path.join("uploads", relative_path)
-
-    with open(full_path, "wb") as buffer:
-        buffer.write(processed_bytes)
+    UPLOAD_SIZE.labels("meter_photo").observe(stored.size)
 
     expires_at = datetime.utcnow() + timedelta(days=PHOTO_TTL_DAYS)
-    existing = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.meter_reading_id == reading.id).first()
+    existing = (
+        db.query(MeterReadingPhoto)
+        .filter(MeterReadingPhoto.meter_reading_id == reading.id)
+        .with_for_update()
+        .first()
+    )
     if existing:
-        try:
-            old_path = _photo_disk_path(existing)
-            if os.path.exists(old_path):
-                os.remove(old_path)
-        except Exception:
-            pass
-        existing.file_path = relative_path.replace("\\", "/")
+        release_after_commit(db, [k for k in photo_keys(existing) if k != stored.key])
+        existing.file_path = stored.key
+        existing.thumb_path = None
         existing.created_at = datetime.utcnow()
         existing.expires_at = expires_at
         existing.created_by_id = user.id
+        photo = existing
     else:
-        db.add(MeterReadingPhoto(
+        photo = MeterReadingPhoto(
             meter_reading_id=reading.id,
-            file_path=relative_path.replace("\\", "/"),
+            file_path=stored.key,
             created_at=datetime.utcnow(),
             expires_at=expires_at,
             created_by_id=user.id,
-        ))
+        )
+        db.add(photo)
 
-    db.commit()
-    normalized_relative_path = relative_path.replace("\\", "/")
-    return {"ok": True, "photo_url": f"/uploads/{normalized_relative_path}"}
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        delete_unreferenced(db, [stored.key])
+        raise
+    # Сжатие и превью — в фоне; до их готовности отдаётся оригинал.
+    submit_photo_processing(photo.id, stored.key)
+    return {"ok": True, "photo_url": photo_url(stored.key), "processing": True}
 
 
 @router.delete("/meter/{meter_id}/photo")
@@ -1399,7 +1035,6 @@ def delete_meter_photo(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    cleanup_expired_meter_photos(db)
     meter = db.get(ResidentMeter, meter_id)
     if not meter:
         raise HTTPException(status_code=404, detail="Meter not found")
@@ -1447,7 +1082,6 @@ def create_readings_internal(
     """
     Internal function for creating/updating readings.
     """
-    cleanup_expired_meter_photos(db)
     r = db.get(Resident, data.resident_id)
     if not r:
         raise HTTPException(status_code=404, detail="Resident not found")
@@ -1466,6 +1100,8 @@ def create_readings_internal(
     lock_map = _meter_reading_payment_lock_map(db, r.id, period_year, period_month)
     
     upserted: list[MeterReading] = []
+    # Счета, из которых сняли строку фикс-услуги: пересчитываются перед commit
+    unchecked_invoice_ids: set[int] = set()
 
     for it in data.items:
         meter_id = it.meter_id
@@ -1494,7 +1130,7 @@ def create_readings_internal(
                     db.rollback()
                     raise HTTPException(status_code=409, detail="This line is paid and cannot be edited")
                 # Удаляем строку инвойса
-                db.query(InvoiceLine).filter(InvoiceLine.meter_reading_id == existing.id).delete()
+                unchecked_invoice_ids.update(delete_reading_lines(db, existing.id))
                 # Удаляем запись показания
                 db.add(ReadingLog(
                     action="DELETE",
@@ -1727,21 +1363,18 @@ def create_readings_internal(
                     line.amount_vat = rd.amount_vat
                     line.amount_total = rd.amount_total
 
-            # Автодобавление/обновление синтетической строки канализации (от воды).
-            _upsert_auto_sewerage_line_for_invoice(db, invoice, all_period_readings)
+            # Строка авто-канализации (от воды) и итоги счёта после синхронизации всех строк
+            refresh_invoice(db, invoice)
+            # Долг открытого счёта вырос — проверить авто-списание аванса к сроку оплаты
+            enqueue_residents(db, [invoice.resident_id])
+            unchecked_invoice_ids.discard(invoice.id)
 
-            # Пересчитываем итоги счёта после синхронизации всех строк
-            db.flush()  # Важно: сохраняем все изменения перед пересчетом
-            totals = db.query(
-                func.coalesce(func.sum(InvoiceLine.amount_net), 0).label("net"),
-                func.coalesce(func.sum(InvoiceLine.amount_vat), 0).label("vat"),
-                func.coalesce(func.sum(InvoiceLine.amount_total), 0).label("total"),
-            ).filter(InvoiceLine.invoice_id == invoice.id).first()
-
-            if totals:
-                invoice.amount_net = Decimal(str(totals.net or 0))
-                invoice.amount_vat = Decimal(str(totals.vat or 0))
-                invoice.amount_total = Decimal(str(totals.total or 0))
+    # Запрос только снимал фикс-услуги: итоги и оплата по строкам этих счетов тоже пересчитываются
+    if unchecked_invoice_ids:
+        db.flush()
+        for invoice in db.query(Invoice).filter(Invoice.id.in_(unchecked_invoice_ids)).all():
+            refresh_invoice(db, invoice)
+            enqueue_residents(db, [invoice.resident_id])
 
     db.commit()
 
@@ -1784,38 +1417,19 @@ def get_resident_meters_public(
 
 
 # ====== Get detailed reading history for resident ======
-@router.get("/resident/{resident_id}/history")
-def get_reading_history(
-    resident_id: int,
-    db: Session = Depends(get_db),
-    from_month: Optional[str] = Query(None, description="Начальный месяц в формате YYYY-MM"),
-    to_month: Optional[str] = Query(None, description="Конечный месяц в формате YYYY-MM"),
-):
-    """
-    Получить детальную историю показаний для резидента по всем счётчикам.
-    Поддерживает фильтрацию по диапазону месяцев.
-    """
-    cleanup_expired_meter_photos(db)
-    r = db.get(Resident, resident_id)
-    if not r:
-        raise HTTPException(status_code=404, detail="Resident not found")
+HISTORY_DEFAULT_LIMIT = 200
+HISTORY_MAX_LIMIT = 1000
 
-    meters = r.meters
-    result = []
-    meter_entries = []
-    has_real_sewerage = False
-    
-    # Парсим даты фильтрации по месяцам
+def _parse_month_bounds(from_month: Optional[str], to_month: Optional[str]) -> tuple[Optional[datetime], Optional[datetime]]:
+    """YYYY-MM -> [начало первого месяца, конец последнего]. Некорректные значения игнорируются."""
     start_date = None
     end_date = None
     if from_month:
         try:
             year, month = map(int, from_month.split('-'))
-            # Начало первого дня месяца
             start_date = datetime(year, month, 1)
         except (ValueError, AttributeError):
             pass
-    
     if to_month:
         try:
             year, month = map(int, to_month.split('-'))
@@ -1826,156 +1440,256 @@ def get_reading_history(
                 end_date = datetime(year, month + 1, 1) - timedelta(seconds=1)
         except (ValueError, AttributeError):
             pass
-    
-    for m in meters:
-        query = (
-            db.query(MeterReading)
-            .filter(MeterReading.resident_meter_id == m.id)
+    return start_date, end_date
+
+
+def _encode_history_cursor(reading_date: datetime, reading_id: int) -> str:
+    return f"{reading_date.isoformat()}_{reading_id}"
+
+
+def _decode_history_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        date_part, id_part = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _history_filters(resident_id: int, start_date: Optional[datetime], end_date: Optional[datetime]) -> list:
+    """Условия выборки истории: показания счётчиков резидента в диапазоне дат."""
+    filters = [ResidentMeter.resident_id == resident_id]
+    if start_date:
+        filters.append(MeterReading.reading_date >= start_date)
+    if end_date:
+        filters.append(MeterReading.reading_date <= end_date)
+    return filters
+
+
+def _history_rows(db: Session, filters: list, cursor: Optional[tuple[datetime, int]], limit: int):
+    """
+    Страница истории по всем счётчикам резидента: показания + тариф чтения,
+    новые сначала, keyset-пагинация по (reading_date, id). Одна строка на показание,
+    поэтому LIMIT — ровно число показаний; фото грузит `_history_photos`.
+    """
+    query = (
+        select(
+            MeterReading.id.label("id"),
+            MeterReading.resident_meter_id.label("meter_id"),
+            MeterReading.reading_date.label("reading_date"),
+            MeterReading.value.label("value"),
+            MeterReading.consumption.label("consumption"),
+            MeterReading.amount_total.label("amount_total"),
+            MeterReading.stable_fee_total.label("stable_fee_total"),
+            MeterReading.vat_percent.label("vat_percent"),
+            MeterReading.note.label("note"),
+            ResidentMeter.meter_type.label("meter_type"),
+            Tariff.meter_type.label("tariff_meter_type"),
+            Tariff.customer_type.label("tariff_customer_type"),
+            Tariff.sewerage_percent.label("sewerage_percent"),
         )
-        
-        # Применяем фильтр по датам, если указан
-        if start_date:
-            query = query.filter(MeterReading.reading_date >= start_date)
-        if end_date:
-            query = query.filter(MeterReading.reading_date <= end_date)
-        
-        readings = (
-            query.order_by(MeterReading.reading_date.desc(), MeterReading.id.desc())
-            .all()
+        .join(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
+        .join(Tariff, Tariff.id == MeterReading.tariff_id)
+        .where(*filters)
+        .order_by(MeterReading.reading_date.desc(), MeterReading.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        cursor_date, cursor_id = cursor
+        query = query.where(
+            (MeterReading.reading_date < cursor_date)
+            | ((MeterReading.reading_date == cursor_date) & (MeterReading.id < cursor_id))
         )
-        if m.meter_type == MeterType.SEWERAGE and readings:
-            has_real_sewerage = True
-
-        photo_map = {}
-        reading_ids = [rd.id for rd in readings]
-        if reading_ids:
-            photos = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.meter_reading_id.in_(reading_ids)).all()
-            photo_map = {
-                p.meter_reading_id: "/uploads/" + str(p.file_path).replace("\\", "/")
-                for p in photos
-            }
-        
-        meter_entries.append((m, readings, photo_map))
+    return db.execute(query).all()
 
-    for m, readings, photo_map in meter_entries:
-        # Определяем тип для отображения
-        if m.meter_type == MeterType.ELECTRIC:
-            display_type = "Электричество"
-            unit = "кВт·ч"
-        elif m.meter_type == MeterType.GAS:
-            display_type = "Газ"
-            unit = "м³"
-        elif m.meter_type == MeterType.WATER:
-            display_type = "Вода"
-            unit = "м³"
-        elif m.meter_type == MeterType.SEWERAGE:
-            display_type = "Канализация"
-            unit = "м³"
-        elif m.meter_type == MeterType.SERVICE:
-            display_type = "Сервис"
-            unit = "мес."
-        elif m.meter_type == MeterType.RENT:
-            display_type = "Аренда"
-            unit = "мес."
-        elif m.meter_type == MeterType.CONSTRUCTION:
-            display_type = "Строительство"
-            unit = "мес."
+
+def _history_photos(db: Session, reading_ids: list[int]) -> dict[int, tuple[str, Optional[str]]]:
+    """Актуальное фото показаний страницы: {reading_id: (file_path, thumb_path)}, первое по id."""
+    if not reading_ids:
+        return {}
+    photos = (
+        db.query(MeterReadingPhoto.meter_reading_id, MeterReadingPhoto.file_path, MeterReadingPhoto.thumb_path)
+        .filter(
+            MeterReadingPhoto.meter_reading_id.in_(reading_ids),
+            MeterReadingPhoto.expires_at > datetime.utcnow(),
+        )
+        .order_by(MeterReadingPhoto.id)
+        .all()
+    )
+    result: dict[int, tuple[str, Optional[str]]] = {}
+    for reading_id, file_path, thumb_path in photos:
+        result.setdefault(reading_id, (file_path, thumb_path))
+    return result
+
+
+def _history_reading_entries(
+    row, photo: Optional[tuple[str, Optional[str]]], has_real_sewerage: bool,
+) -> tuple[list[dict], Optional[dict]]:
+    """Строки истории по одному показанию: (строки счётчика, строка авто-канализации или None)."""
+    date_str = row.reading_date.strftime("%Y-%m-%d")
+    base_amount_total = Decimal(str(row.amount_total or 0))
+    base_cons = Decimal(str(row.consumption or 0))
+
+    # Стабильный тариф (фиксированная часть) — только из исторического snapshot чтения.
+    # Не читаем текущий tariff.stable_tariff, чтобы старые начисления не "переезжали".
+    stable_fee_total = money(Decimal(str(row.stable_fee_total or 0)))
+    base_amount_for_calc = base_amount_total
+    if stable_fee_total > 0 and base_amount_for_calc >= stable_fee_total:
+        base_amount_for_calc = money(base_amount_for_calc - stable_fee_total)
+
+    # По умолчанию — как есть (без стабильного тарифа)
+    amount_out = money(base_amount_for_calc)
+    cons_out = base_cons
+    sewerage = None
+
+    percent = Decimal(str(row.sewerage_percent or 0)) if row.tariff_meter_type == MeterType.WATER else Decimal("0")
+    if row.meter_type == MeterType.WATER and not has_real_sewerage and percent > 0:
+        k = percent / Decimal("100")
+        if row.tariff_customer_type == CustomerType.INDIVIDUAL:
+            cons_out = base_cons * (Decimal("1") - k)
+            amount_out = money(base_amount_for_calc * (Decimal("1") - k))
+            sewer_cons = base_cons * k
+            sewer_amount = money(base_amount_for_calc - amount_out)
         else:
-            display_type = "Неизвестно"
-            unit = "—"
-
-        readings_data = []
-        sewerage_readings = []
-
-        for rd in readings:
-            tariff = db.get(Tariff, rd.tariff_id) if rd.tariff_id else m.tariff
-            base_amount_total = Decimal(str(rd.amount_total or 0))
-            base_cons = Decimal(str(rd.consumption or 0))
-            base_value = Decimal(str(rd.value or 0))
-
-            # Стабильный тариф (фиксированная часть) — только из исторического snapshot чтения.
-            # Не читаем текущий tariff.stable_tariff, чтобы старые начисления не "переезжали".
-            try:
-                stable_fee_total = Decimal(str(getattr(rd, "stable_fee_total", 0) or 0))
-            except Exception:
-                stable_fee_total = Decimal("0")
-            stable_fee_total = money(stable_fee_total)
-
-            base_amount_for_calc = base_amount_total
-            if stable_fee_total > 0 and base_amount_for_calc >= stable_fee_total:
-                base_amount_for_calc = money(base_amount_for_calc - stable_fee_total)
-
-            # По умолчанию — как есть (без стабильного тарифа)
-            amount_out = money(base_amount_for_calc)
-            cons_out = base_cons
-
-            if m.meter_type == MeterType.WATER and not has_real_sewerage:
-                t = tariff
-                percent = _effective_sewerage_percent(t)
-                if t and t.meter_type == MeterType.WATER and percent > 0:
-                    k = percent / Decimal("100")
-                    if getattr(t, "customer_type", None) == CustomerType.INDIVIDUAL:
-                        cons_out = base_cons * (Decimal("1") - k)
-                        amount_out = money(base_amount_for_calc * (Decimal("1") - k))
-                        sewer_cons = base_cons * k
-                        sewer_amount = money(base_amount_for_calc - amount_out)
-                    else:
-                        cons_out = base_cons
-                        amount_out = money(base_amount_for_calc)
-                        sewer_cons = base_cons * k
-                        sewer_amount = money(base_amount_for_calc * k)
-
-                    sewerage_readings.append({
-                        "date": rd.reading_date.strftime("%Y-%m-%d"),
-                        "value": float(sewer_cons),
-                        "consumption": float(sewer_cons),
-                        "amount": float(sewer_amount),
-                        "vat_percent": rd.vat_percent,
-                        "comment": "Авто (от воды)",
-                        "photo_url": None,
-                    })
-
-            readings_data.append({
-                "date": rd.reading_date.strftime("%Y-%m-%d"),
-                "value": float(base_value),
-                "consumption": float(cons_out),
-                "amount": float(amount_out),
-                "vat_percent": rd.vat_percent,
-                "comment": rd.note or "—",
-                "photo_url": photo_map.get(rd.id),
-            })
+            sewer_cons = base_cons * k
+            sewer_amount = money(base_amount_for_calc * k)
+        sewerage = {
+            "date": date_str,
+            "value": float(sewer_cons),
+            "consumption": float(sewer_cons),
+            "amount": float(sewer_amount),
+            "vat_percent": row.vat_percent,
+            "comment": "Авто (от воды)",
+            "photo_url": None,
+        }
 
-            if stable_fee_total > 0:
-                readings_data.append({
-                    "date": rd.reading_date.strftime("%Y-%m-%d"),
-                    "value": 0.0,
-                    "consumption": 0.0,
-                    "amount": float(stable_fee_total),
-                    "vat_percent": 0,
-                    "comment": "Стабильный тариф",
-                    "photo_url": None,
-                })
+    entries = [{
+        "date": date_str,
+        "value": float(Decimal(str(row.value or 0))),
+        "consumption": float(cons_out),
+        "amount": float(amount_out),
+        "vat_percent": row.vat_percent,
+        "comment": row.note or "—",
+        "photo_url": photo_url(photo[0]) if photo else None,
+        "photo_thumb_url": photo_url(photo[1]) if photo else None,
+    }]
+    if stable_fee_total > 0:
+        entries.append({
+            "date": date_str,
+            "value": 0.0,
+            "consumption": 0.0,
+            "amount": float(stable_fee_total),
+            "vat_percent": 0,
+            "comment": "Стабильный тариф",
+            "photo_url": None,
+        })
+    return entries, sewerage
+
+
+_HISTORY_COLUMNS = (
+    ("dates", "date"),
+    ("values", "value"),
+    ("consumptions", "consumption"),
+    ("amounts", "amount"),
+    ("vat_percents", "vat_percent"),
+    ("comments", "comment"),
+    ("photo_urls", "photo_url"),
+    ("photo_thumb_urls", "photo_thumb_url"),
+)
+
+
+def _to_columnar(readings: list[dict]) -> dict:
+    return {column: [rd.get(field) for rd in readings] for column, field in _HISTORY_COLUMNS}
 
+
+@router.get("/resident/{resident_id}/history")
+def get_reading_history(
+    resident_id: int,
+    db: Session = Depends(get_db),
+    from_month: Optional[str] = Query(None, description="Начальный месяц в формате YYYY-MM"),
+    to_month: Optional[str] = Query(None, description="Конечный месяц в формате YYYY-MM"),
+    cursor: Optional[str] = Query(None, description="next_cursor из предыдущего ответа"),
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, ge=1, le=HISTORY_MAX_LIMIT, description="Показаний на страницу"),
+    format: str = Query("rows", pattern="^(rows|columnar)$", description="rows | columnar (массивы по счётчику)"),
+):
+    """
+    Получить детальную историю показаний для резидента по всем счётчикам.
+    Поддерживает фильтрацию по диапазону месяцев и постраничную загрузку:
+    страница — `limit` последних показаний всех счётчиков, продолжение — `cursor=next_cursor`.
+    format=columnar отдаёт по каждому счётчику массивы (dates, values, consumptions, amounts, ...)
+    вместо списка объектов.
+    """
+    meters = (
+        db.query(ResidentMeter.id, ResidentMeter.meter_type, ResidentMeter.serial_number, Tariff.name.label("tariff_name"))
+        .outerjoin(Tariff, Tariff.id == ResidentMeter.tariff_id)
+        .filter(ResidentMeter.resident_id == resident_id)
+        .order_by(ResidentMeter.id)
+        .all()
+    )
+    if not meters and not db.query(exists().where(Resident.id == resident_id)).scalar():
+        raise HTTPException(status_code=404, detail="Resident not found")
+
+    start_date, end_date = _parse_month_bounds(from_month, to_month)
+    filters = _history_filters(resident_id, start_date, end_date)
+    rows = _history_rows(db, filters, _decode_history_cursor(cursor) if cursor else None, limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    photos = _history_photos(db, [row.id for row in rows])
+    # Есть показания реальной канализации в диапазоне — авто-канализацию от воды не выводим.
+    # EXISTS останавливается на первом найденном показании, а не считает весь диапазон.
+    has_real_sewerage = bool(rows) and db.query(
+        exists()
+        .where(MeterReading.resident_meter_id == ResidentMeter.id)
+        .where(ResidentMeter.meter_type == MeterType.SEWERAGE, *filters)
+    ).scalar()
+    # total («загружено N из M») считается только для первой страницы, дальше он уже известен клиенту.
+    total = None
+    if cursor is None:
+        total = (
+            db.query(func.count(MeterReading.id))
+            .join(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
+            .filter(*filters)
+            .scalar()
+        )
+
+    readings_by_meter: dict[int, list[dict]] = {m.id: [] for m in meters}
+    sewerage_by_meter: dict[int, list[dict]] = {}
+    for row in rows:
+        entries, sewerage = _history_reading_entries(row, photos.get(row.id), has_real_sewerage)
+        readings_by_meter.setdefault(row.meter_id, []).extend(entries)
+        if sewerage:
+            sewerage_by_meter.setdefault(row.meter_id, []).append(sewerage)
+
+    result = []
+    for m in meters:
+        display_type, unit = METER_DISPLAY.get(m.meter_type, ("Неизвестно", "—"))
         result.append({
             "meter_id": m.id,
             "type": display_type,
-            "tariff_name": m.tariff.name if m.tariff else None,
+            "tariff_name": m.tariff_name,
             "serial_number": m.serial_number,
             "unit": unit,
-            "readings": readings_data,
+            "readings": readings_by_meter[m.id],
         })
-
-        if m.meter_type == MeterType.WATER and sewerage_readings:
+        if m.id in sewerage_by_meter:
             result.append({
                 "meter_id": None,
                 "type": "Канализация",
-                "tariff_name": (m.tariff.name if m.tariff else None),
+                "tariff_name": m.tariff_name,
                 "serial_number": None,
                 "unit": "м³",
-                "readings": sewerage_readings,
+                "readings": sewerage_by_meter[m.id],
             })
-    
-    return {"meters": result}
+
+    if format == "columnar":
+        for entry in result:
+            entry["columns"] = _to_columnar(entry.pop("readings"))
+
+    last = rows[-1] if rows else None
+    return {
+        "meters": result,
+        "total": total,
+        "next_cursor": _encode_history_cursor(last.reading_date, last.id) if has_more and last else None,
+    }
 
 
 @router.get("/resident/{resident_id}/history/public")
@@ -1984,7 +1698,9 @@ def get_reading_history_public(
     db: Session = Depends(get_db),
 ):
     """Public endpoint for testing."""
-    return get_reading_history(resident_id, db)
+    return get_reading_history(
+        resident_id, db, from_month=None, to_month=None, cursor=None, limit=HISTORY_DEFAULT_LIMIT, format="rows"
+    )
 
 
 # ====== Delete last reading (public endpoint must be before main) ======
@@ -2039,7 +1755,7 @@ def delete_last_reading_public(
             detail="Only the originally selected latest reading can be deleted once",
         )
 
-    db.query(InvoiceLine).filter(InvoiceLine.meter_reading_id == last.id).delete()
+    delete_reading_lines(db, last.id)
 
     db.add(ReadingLog(
         action="DELETE",
@@ -2058,18 +1774,9 @@ def delete_last_reading_public(
     ).first()
     
     if inv:
-        db.flush()
-        sums = db.query(
-            func.coalesce(func.sum(InvoiceLine.amount_net), 0),
-            func.coalesce(func.sum(InvoiceLine.amount_vat), 0),
-            func.coalesce(func.sum(InvoiceLine.amount_total), 0),
-        ).filter(InvoiceLine.invoice_id == inv.id).one()
-
-        inv.total_amount_net = Decimal(sums[0])
-        inv.total_amount_vat = Decimal(sums[1])
-        inv.total_amount_total = Decimal(sums[2])
-        
-        if inv.total_amount_total == 0:
+        refresh_invoice(db, inv)
+
+        if inv.amount_total == 0:
             line_count = db.query(func.count(InvoiceLine.id)).filter(InvoiceLine.invoice_id == inv.id).scalar()
             if line_count == 0:
                 db.delete(inv)
@@ -2115,7 +1822,7 @@ def delete_last_reading(
         )
 
     # Удаляем строку инвойса
-    db.query(InvoiceLine).filter(InvoiceLine.meter_reading_id == last.id).delete()
+    delete_reading_lines(db, last.id)
 
     # Логируем удаление
     db.add(ReadingLog(
@@ -2136,18 +1843,9 @@ def delete_last_reading(
     ).first()
     
     if inv:
-        db.flush()
-        sums = db.query(
-            func.coalesce(func.sum(InvoiceLine.amount_net), 0),
-            func.coalesce(func.sum(InvoiceLine.amount_vat), 0),
-            func.coalesce(func.sum(InvoiceLine.amount_total), 0),
-        ).filter(InvoiceLine.invoice_id == inv.id).one()
-
-        inv.total_amount_net = Decimal(sums[0])
-        inv.total_amount_vat = Decimal(sums[1])
-        inv.total_amount_total = Decimal(sums[2])
-        
-        if inv.total_amount_total == 0:
+        refresh_invoice(db, inv)
+
+        if inv.amount_total == 0:
             # Проверяем, есть ли еще строки
             line_count = db.query(func.count(InvoiceLine.id)).filter(InvoiceLine.invoice_id == inv.id).scalar()
             if line_count == 0:
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps import get_current_user
+from ..models import User
+from ..services.etag import etag_matches
+from ..services.reference_data import get_reference_snapshot
+
+
+router = APIRouter(prefix="/api/reference", tags=["reference-api"])
+
+# Браузер хранит ответ, но каждый раз сверяет ETag: 304 без тела, пока справочники не менялись.
+REFERENCE_CACHE_CONTROL = "private, no-cache"
+
+
+@router.get("")
+def get_reference_data(
+    request: Request,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Справочники для фильтров и форм админки: блоки, резиденты (коды), тарифы со ступенями,
+    типы счётчиков. Одинаковый снимок для всех страниц; списки (счета, жители) их больше не встраивают.
+    """
+    snapshot = get_reference_snapshot(db)
+    headers = {"ETag": snapshot.etag, "Cache-Control": REFERENCE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
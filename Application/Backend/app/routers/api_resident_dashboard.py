@@ -18,11 +18,14 @@ from ..models import (
     Payment, PaymentApplication, PaymentApplicationLine, PaymentMethod,
     Notification, NotificationStatus, MeterReading,
     user_residents, PaymentLog,
-    Tariff, MeterType, CustomerType
+    Tariff, CustomerType
     , OnlineTransaction
 )
 from ..security import get_user_id_from_session
 from ..utils import now_baku, to_baku_datetime
+from ..services.auto_advance_queue import enqueue_payment_pool
+from ..services.billing import effective_sewerage_percent
+from ..services.line_payments import invoice_line_payment_map, normalize_selected_line_ids
 
 
 router = APIRouter(prefix="/api/resident", tags=["resident-api"])
@@ -32,266 +35,6 @@ def _money2(x: Decimal) -> Decimal:
     return (x or Decimal("0")).quantize(Decimal("0.01"))
 
 
-def _effective_sewerage_percent(tariff: Tariff | None) -> Decimal:
-    if not tariff or tariff.meter_type != MeterType.WATER:
-        return Decimal("0")
-    try:
-        percent = Decimal(str(getattr(tariff, "sewerage_percent", 0) or 0))
-    except Exception:
-        percent = Decimal("0")
-    return percent if percent > 0 else Decimal("0")
-
-
-def _parse_selected_line_ids(reference: str | None) -> list[int]:
-    if not reference:
-        return []
-    marker = "LINESEL:"
-    idx = reference.find(marker)
-    if idx < 0:
-        return []
-    raw = reference[idx + len(marker):].split("|")[0]
-    out: list[int] = []
-    for token in raw.split(","):
-        token = token.strip()
-        if not token:
-            continue
-        try:
-            out.append(int(token))
-        except Exception:
-            continue
-    return out
-
-
-def _is_water_line_description(desc: str | None) -> bool:
-    low = (desc or "").lower()
-    return ("вода" in low) or ("water" in low) or ("meter_cold_water" in low)
-
-
-def _is_sewerage_line_description(desc: str | None) -> bool:
-    low = (desc or "").lower()
-    return ("канализац" in low) or ("sewerage" in low) or ("meter_sewerage" in low)
-
-
-def _normalize_selected_line_ids_for_water_sewer(
-    selected_ids: list[int],
-    line_desc_by_id: dict[int, str],
-) -> list[int]:
-    ids = [int(x) for x in (selected_ids or []) if int(x) > 0]
-    if not ids:
-        return []
-
-    unique_ids = list(dict.fromkeys(ids))
-    selected_has_bundle = any(
-        _is_water_line_description(line_desc_by_id.get(lid))
-        or _is_sewerage_line_description(line_desc_by_id.get(lid))
-        for lid in unique_ids
-    )
-    if not selected_has_bundle:
-        return unique_ids
-
-    sewer_ids = [
-        lid for lid, desc in line_desc_by_id.items()
-        if _is_sewerage_line_description(desc)
-    ]
-    water_ids = [
-        lid for lid, desc in line_desc_by_id.items()
-        if _is_water_line_description(desc)
-    ]
-
-    if not sewer_ids or not water_ids:
-        return unique_ids
-
-    for lid in sewer_ids + water_ids:
-        if lid not in unique_ids:
-            unique_ids.append(lid)
-
-    def _key(lid: int) -> tuple[int, int]:
-        if lid in sewer_ids:
-            return (0, unique_ids.index(lid))
-        if lid in water_ids:
-            return (1, unique_ids.index(lid))
-        return (2, unique_ids.index(lid))
-
-    return [lid for lid in sorted(unique_ids, key=_key)]
-
-
-def _build_invoice_line_payment_map(
-    lines: list[InvoiceLine],
-    apps: list[PaymentApplication],
-) -> dict[int, dict]:
-    sorted_lines = sorted(lines, key=lambda l: l.id or 0)
-    line_desc_by_id = {
-        int(l.id): (l.description or "")
-        for l in sorted_lines
-        if l.id is not None
-    }
-    line_totals = {int(l.id): Decimal(str(l.amount_total or 0)) for l in sorted_lines if l.id is not None}
-    paid_by_line = {lid: Decimal("0") for lid in line_totals}
-
-    def allocate(amount: Decimal, line_ids: list[int]) -> Decimal:
-        remaining_amt = Decimal(str(amount or 0))
-        for lid in line_ids:
-            if remaining_amt <= 0:
-                break
-            if lid not in line_totals:
-                continue
-            capacity = max(line_totals[lid] - paid_by_line[lid], Decimal("0"))
-            if capacity <= 0:
-                continue
-            take = min(capacity, remaining_amt)
-            paid_by_line[lid] += take
-            remaining_amt -= take
-        return remaining_amt
-
-    ordered_apps = sorted(
-        apps or [],
-        key=lambda a: (
-            a.created_at or datetime.min,
-            a.id or 0,
-        ),
-    )
-    default_order = list(line_totals.keys())
-    for app in ordered_apps:
-        app_amt = Decimal(str(getattr(app, "amount_applied", 0) or 0))
-        if app_amt <= 0:
-            continue
-        selected_ids = _parse_selected_line_ids(getattr(app, "reference", None))
-        if selected_ids:
-            normalized_selected_ids = _normalize_selected_line_ids_for_water_sewer(selected_ids, line_desc_by_id)
-            allocate(app_amt, normalized_selected_ids)
-        else:
-            allocate(app_amt, default_order)
-
-    result: dict[int, dict] = {}
-    for lid, total in line_totals.items():
-        paid = _money2(paid_by_line.get(lid, Decimal("0")))
-        remaining = _money2(max(total - paid, Decimal("0")))
-        if remaining <= Decimal("0.0001"):
-            status_text = "Оплачена"
-        elif paid > Decimal("0.0001"):
-            status_text = "Частично"
-        else:
-            status_text = "Не оплачена"
-        result[lid] = {"paid": paid, "remaining": remaining, "status": status_text}
-    return result
-
-
-def _ensure_auto_sewerage_line(db: Session, inv: Invoice) -> None:
-    if not inv or not inv.id:
-        return
-
-    rows = (
-        db.query(InvoiceLine, MeterReading, ResidentMeter.meter_type)
-        .join(InvoiceLine, InvoiceLine.meter_reading_id == MeterReading.id)
-        .join(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
-        .filter(InvoiceLine.invoice_id == inv.id)
-        .all()
-    )
-
-    has_real_sewerage = any(mt == MeterType.SEWERAGE for _ln, _rd, mt in rows)
-    auto_line = (
-        db.query(InvoiceLine)
-        .filter(
-            InvoiceLine.invoice_id == inv.id,
-            InvoiceLine.meter_reading_id.is_(None),
-            InvoiceLine.description.ilike("Канализация%"),
-        )
-        .first()
-    )
-
-    if has_real_sewerage:
-        for ln, rd, mt in rows:
-            if mt == MeterType.WATER:
-                ln.amount_net = _money2(Decimal(str(rd.amount_net or 0)))
-                ln.amount_vat = _money2(Decimal(str(rd.amount_vat or 0)))
-                ln.amount_total = _money2(Decimal(str(rd.amount_total or 0)))
-                ln.description = f"Вода {float(Decimal(str(rd.consumption or 0)))} м³"
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    water_rows = [(ln, rd) for ln, rd, mt in rows if mt == MeterType.WATER]
-    if not water_rows:
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    sew_net = Decimal("0")
-    sew_vat = Decimal("0")
-    sew_total = Decimal("0")
-    water_cons = Decimal("0")
-    sewer_cons = Decimal("0")
-
-    for ln, rd in water_rows:
-        water_cons += Decimal(str(rd.consumption or 0))
-
-        base_net = _money2(Decimal(str(rd.amount_net or 0)))
-        base_vat = _money2(Decimal(str(rd.amount_vat or 0)))
-        base_total = _money2(Decimal(str(rd.amount_total or 0)))
-
-        t = db.get(Tariff, rd.tariff_id) if rd.tariff_id else None
-        percent = _effective_sewerage_percent(t)
-        if percent <= 0:
-            ln.amount_net = base_net
-            ln.amount_vat = base_vat
-            ln.amount_total = base_total
-            ln.description = f"Вода {float(Decimal(str(rd.consumption or 0)))} м³"
-            continue
-
-        k = percent / Decimal("100")
-
-        consumption = Decimal(str(rd.consumption or 0))
-        if getattr(t, "customer_type", None) == CustomerType.INDIVIDUAL:
-            new_net = _money2(base_net * (Decimal("1") - k))
-            new_vat = _money2(base_vat * (Decimal("1") - k))
-            new_total = _money2(base_total * (Decimal("1") - k))
-
-            ln.amount_net = new_net
-            ln.amount_vat = new_vat
-            ln.amount_total = new_total
-
-            sew_net += (base_net - new_net)
-            sew_vat += (base_vat - new_vat)
-            sew_total += (base_total - new_total)
-            water_display_cons = consumption * (Decimal("1") - k)
-            sewer_display_cons = consumption * k
-            ln.description = f"Вода {float(water_display_cons)} м³"
-            sewer_cons += sewer_display_cons
-        else:
-            ln.amount_net = base_net
-            ln.amount_vat = base_vat
-            ln.amount_total = base_total
-
-            sew_net += _money2(base_net * k)
-            sew_vat += _money2(base_vat * k)
-            sew_total += _money2(base_total * k)
-            ln.description = f"Вода {float(consumption)} м³"
-            sewer_cons += consumption * k
-
-    if sew_total <= 0:
-        if auto_line:
-            db.delete(auto_line)
-        return
-
-    # Для инвойса канализация выводится только как начисление (без объёма).
-    desc = "Канализация"
-
-    if auto_line:
-        auto_line.description = desc
-        auto_line.amount_net = _money2(sew_net)
-        auto_line.amount_vat = _money2(sew_vat)
-        auto_line.amount_total = _money2(sew_total)
-    else:
-        db.add(InvoiceLine(
-            invoice_id=inv.id,
-            meter_reading_id=None,
-            description=desc,
-            amount_net=_money2(sew_net),
-            amount_vat=_money2(sew_vat),
-            amount_total=_money2(sew_total),
-        ))
-
-
 @router.post("/apply-advance")
 def api_resident_apply_advance(
     request: Request,
@@ -614,9 +357,7 @@ def get_resident_invoice_detail(
     resident = inv.resident
     block = resident.block if resident else None
     
-    # Get invoice lines
-    _ensure_auto_sewerage_line(db, inv)
-    db.flush()
+    # Get invoice lines (авто-канализацию поддерживает services.billing при записи)
     lines = db.query(InvoiceLine).filter(InvoiceLine.invoice_id == inv.id).all()
     
     # Get payments for this invoice
@@ -628,19 +369,6 @@ def get_resident_invoice_detail(
         .all()
     )
     
-    # Recalculate totals from lines
-    lines_sum = db.query(
-        func.coalesce(func.sum(InvoiceLine.amount_total), 0)
-    ).filter(InvoiceLine.invoice_id == inv.id).scalar() or 0
-    
-    if abs(float(inv.amount_total or 0) - float(lines_sum)) > 0.01:
-        inv.amount_total = Decimal(str(lines_sum))
-        net_sum = db.query(func.coalesce(func.sum(InvoiceLine.amount_net), 0)).filter(InvoiceLine.invoice_id == inv.id).scalar() or 0
-        vat_sum = db.query(func.coalesce(func.sum(InvoiceLine.amount_vat), 0)).filter(InvoiceLine.invoice_id == inv.id).scalar() or 0
-        inv.amount_net = Decimal(str(net_sum))
-        inv.amount_vat = Decimal(str(vat_sum))
-        db.commit()
-    
     paid_total = db.query(func.coalesce(func.sum(PaymentApplication.amount_applied), 0))\
                    .filter(PaymentApplication.invoice_id == inv.id).scalar() or 0
     remaining = float(inv.amount_total or 0) - float(paid_total)
@@ -770,7 +498,7 @@ def get_resident_invoice_detail(
         return None
 
     # Распределяем оплату по строкам с учётом явного выбора строк (LINESEL)
-    line_payment_map = _build_invoice_line_payment_map(lines, apps)
+    line_payment_map = invoice_line_payment_map(db, lines)
 
     lines_out = []
     for line in lines:
@@ -1077,7 +805,7 @@ def get_resident_detail(
 
                 if meter.meter_type == MeterType.WATER and not has_real_sewerage:
                     tariff_for_reading = db.get(Tariff, rd.tariff_id) if rd.tariff_id else meter.tariff
-                    percent = _effective_sewerage_percent(tariff_for_reading)
+                    percent = effective_sewerage_percent(tariff_for_reading)
                     if tariff_for_reading and tariff_for_reading.meter_type == MeterType.WATER and percent > 0:
                         k = percent / Decimal("100")
                         if getattr(tariff_for_reading, "customer_type", None) == CustomerType.INDIVIDUAL:
@@ -1662,17 +1390,12 @@ def create_resident_payment(
                 for row in all_invoice_lines
                 if row.id is not None
             }
-            selected_line_ids = _normalize_selected_line_ids_for_water_sewer(selected_line_ids, line_desc_by_id)
+            selected_line_ids = normalize_selected_line_ids(selected_line_ids, line_desc_by_id)
             selected_line_ids = [lid for lid in selected_line_ids if lid in existing_ids]
             if not selected_line_ids:
                 raise HTTPException(status_code=400, detail="Некорректный выбор строк счёта")
 
-            existing_apps = (
-                db.query(PaymentApplication)
-                .filter(PaymentApplication.invoice_id == target_invoice.id)
-                .all()
-            )
-            line_payment_map = _build_invoice_line_payment_map(all_invoice_lines, existing_apps)
+            line_payment_map = invoice_line_payment_map(db, all_invoice_lines)
             selected_remaining = sum(
                 (line_payment_map.get(lid, {}).get("remaining", Decimal("0")) for lid in selected_line_ids),
                 Decimal("0"),
@@ -1861,6 +1584,7 @@ def create_resident_payment(
                 data.resident_id, 
                 scope=data.scope
             )
+        enqueue_payment_pool(db, data.resident_id)
         db.commit()
         
         if target_invoice:
@@ -15,6 +15,8 @@ from ..models import (
     Invoice, InvoiceLine, InvoiceStatus, PaymentApplication
 )
 from ..deps import get_current_user
+from ..services.line_payments import sync_line_payments
+from ..services.search import apply_search
 
 
 router = APIRouter(prefix="/api/residents", tags=["residents-api"])
@@ -202,6 +204,7 @@ def _write_opening_invoice_lines(db: Session, invoice_id: int, breakdown: dict[s
             amount_vat=Decimal("0"),
             amount_total=amount,
         ))
+    sync_line_payments(db, invoice_id)
 
 
 def _upsert_opening_invoice(
@@ -425,21 +428,16 @@ def _list_residents_internal(
                     )
                 except (ValueError, Exception):
                     # Если не удалось распарсить как числа, используем LIKE
-                    stmt = stmt.where(Resident.unit_number.ilike(f"%{unit_number}%"))
+                    stmt = apply_search(stmt, unit_number, Resident.unit_number)
             else:
-                stmt = stmt.where(Resident.unit_number.ilike(f"%{unit_number}%"))
+                stmt = apply_search(stmt, unit_number, Resident.unit_number)
         else:
             # Для одиночного номера используем или точное совпадение или префикс
-            stmt = stmt.where(Resident.unit_number.ilike(f"%{unit_number}%"))
+            stmt = apply_search(stmt, unit_number, Resident.unit_number)
             
-    if q:
-        needle = f"%{q.strip().lower()}%"
-        stmt = stmt.where(
-            func.lower(Resident.unit_number).like(needle) |
-            func.lower(Resident.owner_full_name).like(needle) |
-            func.lower(Resident.owner_phone).like(needle) |
-            func.lower(Resident.owner_email).like(needle)
-        )
+    stmt = apply_search(
+        stmt, q, Resident.unit_number, Resident.owner_full_name, Resident.owner_phone, Resident.owner_email
+    )
     
     # Подсчет общего количества
     count_stmt = select(func.count(Resident.id))
@@ -463,20 +461,15 @@ def _list_residents_internal(
                         func.cast(Resident.unit_number, func.Integer).between(start, end)
                     )
                 except (ValueError, Exception):
-                    count_stmt = count_stmt.where(Resident.unit_number.ilike(f"%{unit_number}%"))
+                    count_stmt = apply_search(count_stmt, unit_number, Resident.unit_number)
             else:
-                count_stmt = count_stmt.where(Resident.unit_number.ilike(f"%{unit_number}%"))
+                count_stmt = apply_search(count_stmt, unit_number, Resident.unit_number)
         else:
-            count_stmt = count_stmt.where(Resident.unit_number.ilike(f"%{unit_number}%"))
-
-    if q:
-        needle = f"%{q.strip().lower()}%"
-        count_stmt = count_stmt.where(
-            func.lower(Resident.unit_number).like(needle) |
-            func.lower(Resident.owner_full_name).like(needle) |
-            func.lower(Resident.owner_phone).like(needle) |
-            func.lower(Resident.owner_email).like(needle)
-        )
+            count_stmt = apply_search(count_stmt, unit_number, Resident.unit_number)
+
+    count_stmt = apply_search(
+        count_stmt, q, Resident.unit_number, Resident.owner_full_name, Resident.owner_phone, Resident.owner_email
+    )
     
     total = db.execute(count_stmt).scalar() or 0
     last_page = max(1, (total + per_page - 1) // per_page)
@@ -29,6 +29,7 @@ from ..models import (
     SalesContractType,
     User,
 )
+from ..services.search import apply_search
 
 
 router = APIRouter(prefix="/api/sales", tags=["sales"])
@@ -307,13 +308,9 @@ def list_contracts(
 
     if status_filter:
         query = query.filter(SalesContract.status == status_filter)
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            (SalesContract.buyer_full_name.ilike(like))
-            | (SalesContract.house_number.ilike(like))
-            | (SalesContract.contract_number.ilike(like))
-        )
+    query = apply_search(
+        query, q, SalesContract.buyer_full_name, SalesContract.house_number, SalesContract.contract_number
+    )
 
     total = query.count()
     last_page = max(1, (total + per_page - 1) // per_page)
@@ -0,0 +1,98 @@
+from typing import List, Optional
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import get_db
+from ..deps import require_any_role
+from ..models import RoleEnum, SchedulerJobState
+from ..services import scheduler, sql_stats
+
+router = APIRouter(prefix="/api/system", tags=["system-api"])
+
+
+class JobStateOut(BaseModel):
+    name: str
+    interval_sec: int
+    leader: Optional[str] = None
+    last_started_at: Optional[datetime] = None
+    last_finished_at: Optional[datetime] = None
+    last_duration_ms: Optional[int] = None
+    last_processed: Optional[int] = None
+    backlog: Optional[int] = None
+    last_error: Optional[str] = None
+    runs: int = 0
+    failures: int = 0
+
+    class Config:
+        from_attributes = True
+
+
+class JobsOut(BaseModel):
+    worker: str
+    worker_is_leader: bool
+    jobs: List[JobStateOut]
+
+
+@router.get("/jobs", response_model=JobsOut)
+def list_jobs(
+    db: Session = Depends(get_db),
+    actor=Depends(require_any_role(RoleEnum.ROOT, RoleEnum.ADMIN)),
+):
+    """
+    Состояние фоновых задач. Данные пишет воркер-лидер в scheduler_jobs,
+    поэтому ответ одинаковый, на какой бы воркер ни попал запрос.
+    """
+    rows = db.query(SchedulerJobState).order_by(SchedulerJobState.name.asc()).all()
+    return {
+        "worker": scheduler.WORKER_ID,
+        "worker_is_leader": scheduler.is_leader(),
+        "jobs": rows,
+    }
+
+
+class RouteSqlStatsOut(BaseModel):
+    route: str
+    requests: int
+    avg_queries: float
+    max_queries: int
+    avg_db_ms: float
+    max_db_ms: float
+    n_plus_one: int
+    last_repeated_sql: Optional[str] = None
+
+
+class SqlStatsOut(BaseModel):
+    worker: str
+    sample_rate: float
+    n_plus_one_threshold: int
+    routes: List[RouteSqlStatsOut]
+
+
+@router.get("/sql-stats", response_model=SqlStatsOut)
+def list_sql_stats(
+    limit: int = Query(20, ge=1, le=200),
+    order_by: str = Query("avg_queries", pattern="^(avg_queries|max_queries|avg_db_ms|max_db_ms|n_plus_one|requests)$"),
+    actor=Depends(require_any_role(RoleEnum.ROOT, RoleEnum.ADMIN)),
+):
+    """
+    Худшие маршруты по числу SQL-запросов / времени в БД.
+    Статистика собирается по выборке запросов и хранится в памяти текущего воркера.
+    """
+    return {
+        "worker": scheduler.WORKER_ID,
+        "sample_rate": settings.SQL_STATS_SAMPLE_RATE,
+        "n_plus_one_threshold": settings.SQL_STATS_N1_THRESHOLD,
+        "routes": sql_stats.worst_routes(limit=limit, order_by=order_by),
+    }
+
+
+@router.delete("/sql-stats")
+def reset_sql_stats(
+    actor=Depends(require_any_role(RoleEnum.ROOT, RoleEnum.ADMIN)),
+):
+    sql_stats.reset_route_stats()
+    return {"ok": True}
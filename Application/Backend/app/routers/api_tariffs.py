@@ -11,6 +11,7 @@ import json
 from ..database import get_db
 from ..models import Tariff, TariffStep, MeterType, CustomerType, ResidentMeter, MeterReading
 from ..deps import get_current_user
+from ..services.billing import effective_sewerage_percent, enqueue_sewerage_recompute
 from ..models import User
 
 router = APIRouter(prefix="/api/tariffs", tags=["tariffs-api"])
@@ -189,6 +190,11 @@ def _ensure_tariff_type_allowed(meter_type: str) -> None:
         )
 
 
+def _sewerage_signature(tariff: Tariff) -> tuple:
+    """То, от чего зависит строка авто-канализации в счетах по этому тарифу."""
+    return effective_sewerage_percent(tariff), tariff.customer_type
+
+
 def _parse_steps(steps_data: List[TariffStepCreate], meter_type: str) -> List[tuple]:
     """Валидация и преобразование ступеней."""
     if not steps_data:
@@ -537,6 +543,7 @@ def update_tariff_api(
     meter_type = payload.meter_type or tariff.meter_type.value
     if payload.meter_type is not None:
         _ensure_tariff_type_allowed(payload.meter_type)
+    sewerage_before = _sewerage_signature(tariff)
     
     if payload.name is not None:
         name = (payload.name or "").strip()
@@ -636,6 +643,10 @@ def update_tariff_api(
                     to_value=float(t) if t is not None else None,
                     price=float(p),
                 ))
+
+    # Авто-канализация открытых счетов пересчитывается задачей sewerage-recompute
+    if _sewerage_signature(tariff) != sewerage_before:
+        enqueue_sewerage_recompute(db, tariff.id)
     
     db.commit()
     db.refresh(tariff)
@@ -657,6 +668,7 @@ def update_tariff_public(
     meter_type = payload.meter_type or tariff.meter_type.value
     if payload.meter_type is not None:
         _ensure_tariff_type_allowed(payload.meter_type)
+    sewerage_before = _sewerage_signature(tariff)
     
     if payload.name is not None:
         name = (payload.name or "").strip()
@@ -752,6 +764,10 @@ def update_tariff_public(
                     to_value=float(t) if t is not None else None,
                     price=float(p),
                 ))
+
+    # Авто-канализация открытых счетов пересчитывается задачей sewerage-recompute
+    if _sewerage_signature(tariff) != sewerage_before:
+        enqueue_sewerage_recompute(db, tariff.id)
     
     db.commit()
     db.refresh(tariff)
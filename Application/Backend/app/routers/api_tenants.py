@@ -3,13 +3,14 @@ from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
 
 from ..database import get_db
 from ..deps import get_current_user
-from ..models import User, RoleEnum, Block, Resident
+from ..models import User, RoleEnum, Resident
 from ..security import hash_password
-from ..utils import generate_temp_password, to_baku_datetime
+from ..utils import generate_temp_password, sync_invoice_numbers, to_baku_datetime
+from ..services.avatars import avatar_urls
+from ..services.search import apply_search
 
 router = APIRouter(prefix="/api/tenants", tags=["tenants-api"])
 
@@ -63,14 +64,7 @@ def _list_tenants_internal(
     """
     query = db.query(User).filter(User.role == RoleEnum.RESIDENT)
 
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            (User.username.ilike(like))
-            | (User.full_name.ilike(like))
-            | (User.phone.ilike(like))
-            | (User.email.ilike(like))
-        )
+    query = apply_search(query, q, User.username, User.full_name, User.phone, User.email)
 
     if block_id:
         query = query.join(User.resident_links).filter(Resident.block_id == block_id)
@@ -91,11 +85,11 @@ def _list_tenants_internal(
                         func.cast(Resident.unit_number, func.Integer).between(start, end)
                     )
                 except (ValueError, Exception):
-                    query = query.filter(Resident.unit_number.ilike(f"%{unit_number}%"))
+                    query = apply_search(query, unit_number, Resident.unit_number)
             else:
-                query = query.filter(Resident.unit_number.ilike(f"%{unit_number}%"))
+                query = apply_search(query, unit_number, Resident.unit_number)
         else:
-            query = query.filter(Resident.unit_number.ilike(f"%{unit_number}%"))
+            query = apply_search(query, unit_number, Resident.unit_number)
 
     if block_id or unit_number:
         query = query.distinct()
@@ -115,9 +109,6 @@ def _list_tenants_internal(
         .all()
     )
 
-    blocks = db.query(Block).order_by(Block.name.asc()).all()
-    residents = db.query(Resident).order_by(Resident.block_id.asc(), Resident.unit_number.asc()).all()
-
     result = []
     for u in tenants:
         homes = []
@@ -134,6 +125,7 @@ def _list_tenants_internal(
             "full_name": u.full_name or "",
             "phone": u.phone or "",
             "email": u.email or "",
+            "avatar_urls": avatar_urls(u.avatar_path),
             "last_login": to_baku_datetime(u.last_login_at) if u.last_login_at else None,
             "require_password_change": u.require_password_change,
             "temp_password": u.temp_password_plain or None,
@@ -144,8 +136,6 @@ def _list_tenants_internal(
 
     return {
         "tenants": result,
-        "blocks": [{"id": b.id, "name": b.name} for b in blocks],
-        "residents": [{"id": r.id, "block_name": r.block.name if r.block else "", "unit_number": r.unit_number} for r in residents],
         "pagination": {
             "page": page,
             "per_page": per_page,
@@ -221,6 +211,7 @@ def _get_tenant_internal(
         "full_name": u.full_name or "",
         "phone": u.phone or "",
         "email": u.email or "",
+        "avatar_urls": avatar_urls(u.avatar_path),
         "comment": u.comment or "",
         "resident_ids": [r.id for r in (u.resident_links or [])],
         "homes": homes,
@@ -281,6 +272,9 @@ def _create_tenant_internal(
     if data.resident_ids:
         objs = db.query(Resident).filter(Resident.id.in_(data.resident_ids)).all()
         u.resident_links = objs
+        db.flush()
+        # Номер счёта содержит id жителя — обновляем сохранённые номера
+        sync_invoice_numbers(db, [r.id for r in objs])
 
     db.commit()
     db.refresh(u)
@@ -369,8 +363,12 @@ def update_tenant_api(
     u.email = data.email
     u.comment = data.comment or None
 
+    previous_ids = [r.id for r in (u.resident_links or [])]
     objs = db.query(Resident).filter(Resident.id.in_(data.resident_ids or [])).all()
     u.resident_links = objs
+    db.flush()
+    # Номер счёта содержит id жителя — обновляем сохранённые номера у отвязанных и привязанных
+    sync_invoice_numbers(db, previous_ids + [r.id for r in objs])
 
     db.commit()
     db.refresh(u)
@@ -461,7 +459,10 @@ def _delete_tenant_internal(
     if not u or u.role != RoleEnum.RESIDENT:
         raise HTTPException(status_code=404, detail="Tenant not found")
 
+    resident_ids = [r.id for r in (u.resident_links or [])]
     db.delete(u)
+    db.flush()
+    sync_invoice_numbers(db, resident_ids)
     db.commit()
 
     return {"success": True, "message": "Tenant deleted successfully"}
@@ -1,5 +1,4 @@
-from typing import List, Optional
-import pathlib
+from typing import Dict, List, Optional
 
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Query
@@ -10,7 +9,10 @@ from ..database import get_db
 from ..models import User, RoleEnum
 from ..deps import get_current_user, can_manage_user
 from ..security import hash_password, verify_password, get_user_id_from_session
-from ..utils import generate_temp_password, to_baku_datetime
+from ..utils import generate_temp_password, sync_invoice_numbers, to_baku_datetime
+from ..services.metrics import UPLOAD_SIZE
+from ..services.avatars import avatar_urls, is_processed, store_avatar_upload, submit_avatar_processing
+from ..services.storage import UploadTooLargeError, release_after_commit, storage_url
 
 
 router = APIRouter(prefix="/api/users", tags=["users-api"])
@@ -23,6 +25,8 @@ class UserOut(BaseModel):
     phone: Optional[str] = None
     email: Optional[EmailStr] = None
     avatar_path: Optional[str] = None
+    # Квадратные варианты ("64.webp", "64.jpg", ... "256.jpg"); None — аватар ещё обрабатывается
+    avatar_urls: Optional[Dict[str, str]] = None
     role: RoleEnum
     is_active: bool
     require_password_change: bool
@@ -41,7 +45,8 @@ class UserOut(BaseModel):
             "full_name": obj.full_name,
             "phone": obj.phone,
             "email": obj.email,
-            "avatar_path": obj.avatar_path,
+            "avatar_path": storage_url(obj.avatar_path),
+            "avatar_urls": avatar_urls(obj.avatar_path),
             "role": obj.role,
             "is_active": obj.is_active,
             "require_password_change": obj.require_password_change,
@@ -138,36 +143,21 @@ def create_user_api(
 
 
 # Функция для сохранения аватара
-def _save_avatar(file: UploadFile, user_id: int) -> str | None:
+def _save_avatar(db: Session, file: UploadFile) -> str | None:
+    """Сохраняет исходник аватара в хранилище и возвращает ключ. Варианты строятся в фоне."""
     if not file:
         return None
     if file.content_type not in ("image/jpeg", "image/png", "image/webp"):
         return None
     ext = ".jpg" if file.content_type == "image/jpeg" else (".png" if file.content_type == "image/png" else ".webp")
-    base_dir = pathlib.Path("uploads/avatars") / str(user_id)
-    base_dir.mkdir(parents=True, exist_ok=True)
-    path = base_dir / f"avatar{ext}"
-    with open(path, "wb") as f:
-        f.write(file.file.read())
-    rel_path = f"/uploads/avatars/{user_id}/avatar{ext}"
-    return rel_path
-
-
-def _delete_avatar_files(user_id: int) -> None:
-    """Delete stored avatar files for a user, if they exist."""
     try:
-        base_dir = pathlib.Path("uploads/avatars") / str(user_id)
-        if not base_dir.exists():
-            return
-        for path in base_dir.glob("avatar.*"):
-            try:
-                if path.is_file():
-                    path.unlink()
-            except Exception:
-                # Non-fatal cleanup failure must not break profile update.
-                pass
-    except Exception:
-        pass
+        stored = store_avatar_upload(db, file.file, ext)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except ValueError:
+        return None
+    UPLOAD_SIZE.labels("avatar").observe(stored.size)
+    return stored.key
 
 
 class ChangePasswordRequest(BaseModel):
@@ -186,8 +176,10 @@ def get_current_user_profile(
     return UserOut.from_orm_with_tz(user)
 
 
+# Обычный def: загрузка аватара (хеш, fsync, S3) синхронная — FastAPI выполнит её в пуле потоков,
+# а не в цикле событий.
 @router.put("/me", response_model=UserOut)
-async def update_current_user_profile(
+def update_current_user_profile(
     full_name: str = Form(""),
     phone: str = Form(""),
     email: str = Form(""),
@@ -211,19 +203,21 @@ async def update_current_user_profile(
     user.email = email_clean
     
     remove_avatar_flag = str(remove_avatar or "").strip().lower() in {"1", "true", "yes", "on"}
-    if remove_avatar_flag:
-        _delete_avatar_files(user.id)
+    if remove_avatar_flag and user.avatar_path:
+        release_after_commit(db, [user.avatar_path])
         user.avatar_path = None
 
     # Обработка аватара
     if avatar and avatar.filename:
-        _delete_avatar_files(user.id)
-        rel = _save_avatar(avatar, user.id)
-        if rel:
-            user.avatar_path = rel
+        key = _save_avatar(db, avatar)
+        if key and key != user.avatar_path:
+            release_after_commit(db, [user.avatar_path])
+            user.avatar_path = key
     
     db.commit()
     db.refresh(user)
+    if user.avatar_path and not is_processed(user.avatar_path):
+        submit_avatar_processing(user.id, user.avatar_path)
     return UserOut.from_orm_with_tz(user)
 
 
@@ -323,7 +317,11 @@ def delete_user_api(
     if not can_manage_user(target, actor):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
 
+    resident_ids = [r.id for r in (target.resident_links or [])]
     db.delete(target)
+    db.flush()
+    # Номер счёта содержит id жителя: у его домов номер переходит к следующему жителю
+    sync_invoice_numbers(db, resident_ids)
     db.commit()
     return None
 
@@ -0,0 +1,107 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+
+from ..config import settings
+from ..services.storage import IMMUTABLE_CACHE_CONTROL, content_type, get_storage, is_content_addressed
+
+router = APIRouter(tags=["uploads"])
+
+# Старые файлы без хеша в имени (avatars/<id>/avatar.jpg) перезаписывались по тому же пути.
+LEGACY_CACHE_CONTROL = "public, max-age=3600"
+
+
+def _etag(key: str, stat: os.stat_result) -> str:
+    """
+    Для файлов по содержимому ETag — сам sha256 из имени (сильный, не зависит от узла и mtime).
+    Для старых — размер и mtime: этого хватает, чтобы заметить перезапись файла.
+    """
+    if is_content_addressed(key):
+        return '"' + os.path.splitext(os.path.basename(key))[0] + '"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _not_modified(request: Request, etag: str, stat: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _resolve_if_range(request: Request, etag: str, last_modified: str) -> None:
+    """
+    If-Range решаем сами: FileResponse сверяет его со своим ETag (md5 от mtime), а не с нашим.
+    Совпал — оставляем Range, нет — убираем Range и отдаём файл целиком.
+    """
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return
+    drop = b"if-range" if if_range in (etag, last_modified) else b"range"
+    request.scope["headers"] = [(k, v) for k, v in request.scope["headers"] if k != drop]
+
+
+def _s3_redirect(storage, key: str) -> RedirectResponse:
+    response = RedirectResponse(storage.redirect_url(key), status_code=302)
+    if settings.STORAGE_PUBLIC_BASE_URL and is_content_addressed(key):
+        # Публичный адрес объекта не меняется — редирект можно кэшировать.
+        response.headers["Cache-Control"] = "public, max-age=86400"
+    else:
+        # Подписанная ссылка живёт STORAGE_S3_URL_TTL_SEC — браузер переиспользует её половину срока.
+        response.headers["Cache-Control"] = f"private, max-age={max(0, settings.STORAGE_S3_URL_TTL_SEC // 2)}"
+    return response
+
+
+@router.api_route("/uploads/{key:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_upload(key: str, request: Request):
+    """
+    Отдача загруженных файлов по ключу хранилища.
+
+    Локальный бэкенд: ETag + Last-Modified, 304 на If-None-Match/If-Modified-Since,
+    Range-запросы (206). При UPLOADS_ACCEL_MODE=nginx|sendfile приложение только проверяет
+    ключ и условные заголовки, а байты отдаёт фронтовой прокси (X-Accel-Redirect / X-Sendfile) —
+    воркер не занят на время передачи. S3 — редирект на подписанную (или публичную) ссылку.
+    """
+    if any(part.startswith(".") for part in key.split("/")):
+        # .tmp/ — недописанные загрузки
+        raise HTTPException(status_code=404, detail="Not found")
+    storage = get_storage()
+    if storage.name == "s3":
+        return _s3_redirect(storage, key)
+
+    try:
+        path = storage.path(key)
+        stat = os.stat(path)
+    except (ValueError, OSError):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    etag = _etag(key, stat)
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if is_content_addressed(key) else LEGACY_CACHE_CONTROL,
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+    }
+    if _not_modified(request, etag, stat):
+        return Response(status_code=304, headers=headers)
+
+    media_type = content_type(os.path.splitext(key)[1])
+    if settings.UPLOADS_ACCEL_MODE == "nginx":
+        headers["X-Accel-Redirect"] = settings.UPLOADS_ACCEL_PREFIX.rstrip("/") + "/" + key
+        return Response(media_type=media_type, headers=headers)
+    if settings.UPLOADS_ACCEL_MODE == "sendfile":
+        headers["X-Sendfile"] = path
+        return Response(media_type=media_type, headers=headers)
+
+    # Range (206/416) обрабатывает FileResponse; ETag/Last-Modified берутся наши.
+    _resolve_if_range(request, etag, headers["Last-Modified"])
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
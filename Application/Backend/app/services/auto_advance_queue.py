@@ -0,0 +1,185 @@
+"""
+Очередь авто-списания аванса (вместо полного сканирования открытых счетов).
+
+Резидент попадает в очередь, когда:
+- ему выставлен счёт / изменён срок оплаты — available_at = min(due_date) + grace;
+- вырос долг уже открытого счёта: ввод показаний (refresh_invoice), пересчёт канализации
+  (задача sewerage-recompute), оплаченный счёт снова открылся после пересчёта;
+- поступили деньги (платёж) — ставим всех резидентов того же "пула" аванса
+  (связанных через общих пользователей), т.к. auto_apply_advance берёт аванс из пула.
+
+Воркер забирает только строки с available_at <= now() через FOR UPDATE SKIP LOCKED
+(можно запускать параллельно) и вызывает auto_apply_advance лишь для тех, у кого
+одновременно есть просроченный открытый счёт и положительный остаток аванса.
+Когда очередь пуста, холостой цикл — это один индексный запрос.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from ..models import AutoAdvanceQueueItem
+from ..utils import now_baku
+
+QUEUE_REASON_INVOICE = "INVOICE_ISSUED"
+QUEUE_REASON_PAYMENT = "PAYMENT"
+QUEUE_REASON_RESCHEDULE = "RESCHEDULE"
+
+AUTO_ADVANCE_BATCH_SIZE = 100
+# Сколько ждём после срока оплаты, прежде чем списывать аванс автоматически.
+AUTO_ADVANCE_GRACE_SECONDS = 3 * 24 * 60 * 60
+
+
+# available_at резидента = самый ранний срок оплаты открытого счёта (полночь по Баку) + grace.
+# :only_future — учитывать только счета, grace которых ещё не истёк (для перепланирования).
+_ENQUEUE_SQL = """
+INSERT INTO auto_advance_queue (resident_id, available_at, reason, enqueued_at)
+SELECT d.resident_id, d.available_at, :reason, NOW()
+FROM (
+    SELECT i.resident_id,
+           MIN((i.due_date::timestamp AT TIME ZONE 'Asia/Baku') + make_interval(secs => :grace)) AS available_at
+    FROM invoices i
+    WHERE i.resident_id = ANY(:resident_ids)
+      AND i.status IN ('ISSUED', 'PARTIAL')
+      AND i.due_date IS NOT NULL
+      AND (NOT :only_future
+           OR (i.due_date::timestamp AT TIME ZONE 'Asia/Baku') + make_interval(secs => :grace) > NOW())
+    GROUP BY i.resident_id
+) d
+ON CONFLICT (resident_id) DO UPDATE
+   SET available_at = LEAST(auto_advance_queue.available_at, EXCLUDED.available_at),
+       reason = EXCLUDED.reason,
+       enqueued_at = EXCLUDED.enqueued_at
+"""
+
+# Резиденты того же пула аванса (общие пользователи через user_residents) + сами резиденты.
+_POOL_RESIDENTS_SQL = """
+SELECT DISTINCT ur2.resident_id
+FROM user_residents ur1
+JOIN user_residents ur2 ON ur2.user_id = ur1.user_id
+WHERE ur1.resident_id = ANY(:resident_ids)
+"""
+
+# Из захваченных строк оставляем только тех, у кого есть и просроченный счёт, и остаток аванса в пуле.
+_ELIGIBLE_SQL = """
+SELECT c.resident_id
+FROM unnest(CAST(:resident_ids AS integer[])) AS c(resident_id)
+WHERE EXISTS (
+    SELECT 1 FROM invoices i
+    WHERE i.resident_id = c.resident_id
+      AND i.status IN ('ISSUED', 'PARTIAL')
+      AND i.due_date IS NOT NULL
+      AND (i.due_date::timestamp AT TIME ZONE 'Asia/Baku') + make_interval(secs => :grace) <= NOW()
+)
+AND EXISTS (
+    SELECT 1 FROM payments p
+    WHERE p.method <> 'ADVANCE'
+      AND (
+        p.resident_id = c.resident_id
+        OR p.resident_id IN (
+            SELECT ur2.resident_id
+            FROM user_residents ur1
+            JOIN user_residents ur2 ON ur2.user_id = ur1.user_id
+            WHERE ur1.resident_id = c.resident_id
+        )
+      )
+      AND p.amount_total > COALESCE(
+        (SELECT SUM(pa.amount_applied) FROM payment_applications pa WHERE pa.payment_id = p.id), 0
+      )
+)
+"""
+
+
+def _clean_ids(resident_ids: Iterable[int | None]) -> list[int]:
+    return sorted({int(rid) for rid in resident_ids if rid})
+
+
+def enqueue_residents(db: Session, resident_ids: Iterable[int | None], reason: str = QUEUE_REASON_INVOICE) -> None:
+    """
+    Ставит резидентов в очередь в текущей транзакции (коммитит вызывающий код).
+    Резиденты без открытых счетов со сроком оплаты в очередь не попадают.
+    """
+    ids = _clean_ids(resident_ids)
+    if not ids:
+        return
+    # autoflush выключен: статус/срок оплаты должны попасть в БД до INSERT ... SELECT
+    db.flush()
+    db.execute(
+        text(_ENQUEUE_SQL),
+        {"resident_ids": ids, "reason": reason, "grace": AUTO_ADVANCE_GRACE_SECONDS, "only_future": False},
+    )
+
+
+def enqueue_payment_pool(db: Session, resident_id: int | None) -> None:
+    """Новые деньги у резидента: ставим в очередь весь его пул аванса."""
+    if not resident_id:
+        return
+    pool_ids = [row[0] for row in db.execute(text(_POOL_RESIDENTS_SQL), {"resident_ids": [int(resident_id)]})]
+    enqueue_residents(db, [int(resident_id), *pool_ids], reason=QUEUE_REASON_PAYMENT)
+
+
+def _claim_due_batch(db: Session, limit: int) -> list[int]:
+    rows = (
+        db.query(AutoAdvanceQueueItem.resident_id)
+        .filter(AutoAdvanceQueueItem.available_at <= func.now())
+        .order_by(AutoAdvanceQueueItem.available_at.asc())
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    return [int(row[0]) for row in rows]
+
+
+def process_due_residents(db: Session, batch_size: int = AUTO_ADVANCE_BATCH_SIZE) -> int:
+    """
+    Обрабатывает очередь пачками. Каждая пачка — отдельная транзакция:
+    захват (SKIP LOCKED) → удаление из очереди → auto_apply_advance для подходящих →
+    перепланирование на следующий (ещё не наступивший) срок оплаты.
+    Возвращает число резидентов, которым реально списан аванс.
+    """
+    from ..routers.api_payment_logic import auto_apply_advance
+    from .auto_advance_scheduler import _notify_resident_auto_advance
+
+    processed = 0
+    while True:
+        claimed = _claim_due_batch(db, batch_size)
+        if not claimed:
+            db.commit()
+            return processed
+
+        eligible = [
+            int(row[0])
+            for row in db.execute(text(_ELIGIBLE_SQL), {"resident_ids": claimed, "grace": AUTO_ADVANCE_GRACE_SECONDS})
+        ]
+        (
+            db.query(AutoAdvanceQueueItem)
+            .filter(AutoAdvanceQueueItem.resident_id.in_(claimed))
+            .delete(synchronize_session=False)
+        )
+
+        now_ts = int(now_baku().timestamp())
+        for resident_id in eligible:
+            reference_tag = f"AUTOADV:{resident_id}:{now_ts}"
+            affected_count, total_applied = auto_apply_advance(db, resident_id, reference_tag=reference_tag)
+            if affected_count > 0 and total_applied > 0:
+                _notify_resident_auto_advance(db, resident_id, reference_tag, float(total_applied))
+                processed += 1
+
+        # Счета, чей grace ещё не истёк, вернут резидента в очередь на свой срок.
+        db.execute(
+            text(_ENQUEUE_SQL),
+            {"resident_ids": claimed, "reason": QUEUE_REASON_RESCHEDULE, "grace": AUTO_ADVANCE_GRACE_SECONDS, "only_future": True},
+        )
+        db.commit()
+
+
+def queue_backlog(db: Session) -> int:
+    return (
+        db.query(func.count(AutoAdvanceQueueItem.resident_id))
+        .filter(AutoAdvanceQueueItem.available_at <= func.now())
+        .scalar()
+        or 0
+    )
@@ -1,15 +1,9 @@
 from __future__ import annotations
 
-import threading
-import time
-from datetime import timedelta
-
 from sqlalchemy import func
 
-from ..database import SessionLocal
 from ..models import (
     Invoice,
-    InvoiceStatus,
     PaymentApplication,
     Notification,
     NotificationStatus,
@@ -22,25 +16,13 @@ from ..models import (
     TariffStep,
     MeterType,
 )
-from ..routers.api_payment_logic import auto_apply_advance
-from ..utils import now_baku, to_baku_datetime
-
-# TEMP: shorter values for testing
-AUTO_ADVANCE_CHECK_INTERVAL_SEC = 10
-AUTO_ADVANCE_GRACE_SECONDS = 3 * 24 * 60 * 60
+from ..utils import now_baku
+from .auto_advance_queue import process_due_residents, queue_backlog
+from .notification_archive import notified_user_ids
 
-_scheduler_thread: threading.Thread | None = None
-_stop_event = threading.Event()
 TARIFF_EXPIRED_NOTIFICATION_TYPE = "TARIFF_EXPIRED"
 
 
-def _is_due_for_auto(due_date, now_dt) -> bool:
-    if not due_date:
-        return False
-    due_dt = to_baku_datetime(due_date)
-    return now_dt >= due_dt + timedelta(seconds=AUTO_ADVANCE_GRACE_SECONDS)
-
-
 def _build_invoice_label(inv_number: str | None, year: int, month: int) -> str:
     if inv_number:
         return f"{inv_number} ({month:02d}.{year})"
@@ -113,114 +95,64 @@ def _notify_resident_auto_advance(db, resident_id: int, reference_tag: str, tota
         ))
 
 
-def _run_once() -> None:
-    db = SessionLocal()
-    try:
-        now_dt = now_baku()
-        today = now_dt.date()
-
-        # Notify admins when construction tariff step end date has expired.
-        expired_steps = (
-            db.query(TariffStep, Tariff)
-            .join(Tariff, Tariff.id == TariffStep.tariff_id)
-            .filter(
-                Tariff.is_active.is_(True),
-                Tariff.meter_type == MeterType.CONSTRUCTION,
-                TariffStep.to_date.isnot(None),
-                TariffStep.to_date < today,
-            )
-            .all()
-        )
-        if expired_steps:
-            admin_users = (
-                db.query(User)
-                .filter(
-                    User.is_active.is_(True),
-                    User.role.in_([RoleEnum.ROOT, RoleEnum.ADMIN]),
-                )
-                .all()
-            )
-            for step, tariff in expired_steps:
-                expired_at = step.to_date.strftime("%d.%m.%Y") if step.to_date else "—"
-                message = (
-                    f"Срок тарифа \"{tariff.name}\" (Строительство) истёк "
-                    f"{expired_at}. Проверьте и обновите период действия."
-                )
-                for admin in admin_users:
-                    exists = (
-                        db.query(Notification.id)
-                        .filter(
-                            Notification.user_id == admin.id,
-                            Notification.notification_type == TARIFF_EXPIRED_NOTIFICATION_TYPE,
-                            Notification.related_id == step.id,
-                        )
-                        .first()
-                    )
-                    if exists:
-                        continue
-                    db.add(Notification(
-                        user_id=admin.id,
-                        resident_id=None,
-                        message=message,
-                        status=NotificationStatus.UNREAD,
-                        notification_type=TARIFF_EXPIRED_NOTIFICATION_TYPE,
-                        related_id=step.id,
-                    ))
-
-        # Find residents with open invoices and a due date
-        rows = (
-            db.query(
-                Invoice.resident_id,
-                func.min(Invoice.due_date).label("min_due"),
-            )
-            .filter(
-                Invoice.status.in_([InvoiceStatus.ISSUED, InvoiceStatus.PARTIAL]),
-                Invoice.due_date.isnot(None),
-            )
-            .group_by(Invoice.resident_id)
-            .all()
+def run_tariff_expiry_check(db) -> int:
+    """Уведомляет админов об истёкших датированных ступенях тарифов (Строительство)."""
+    today = now_baku().date()
+    expired_steps = (
+        db.query(TariffStep, Tariff)
+        .join(Tariff, Tariff.id == TariffStep.tariff_id)
+        .filter(
+            Tariff.is_active.is_(True),
+            Tariff.meter_type == MeterType.CONSTRUCTION,
+            TariffStep.to_date.isnot(None),
+            TariffStep.to_date < today,
         )
+        .all()
+    )
+    if not expired_steps:
+        return 0
 
-        for resident_id, min_due in rows:
-            if not _is_due_for_auto(min_due, now_dt):
+    admin_users = (
+        db.query(User)
+        .filter(
+            User.is_active.is_(True),
+            User.role.in_([RoleEnum.ROOT, RoleEnum.ADMIN]),
+        )
+        .all()
+    )
+    created = 0
+    for step, tariff in expired_steps:
+        expired_at = step.to_date.strftime("%d.%m.%Y") if step.to_date else "—"
+        message = (
+            f"Срок тарифа \"{tariff.name}\" (Строительство) истёк "
+            f"{expired_at}. Проверьте и обновите период действия."
+        )
+        # Прочитанные уведомления со временем уходят в архив — проверяем и его, иначе каждый
+        # цикл архивации давал бы админам новое непрочитанное по тому же шагу тарифа.
+        notified = notified_user_ids(db, TARIFF_EXPIRED_NOTIFICATION_TYPE, step.id)
+        for admin in admin_users:
+            if admin.id in notified:
                 continue
-            reference_tag = f"AUTOADV:{resident_id}:{int(now_dt.timestamp())}"
-            # Apply available advance to this resident (FIFO)
-            affected_count, total_applied = auto_apply_advance(
-                db,
-                int(resident_id),
-                reference_tag=reference_tag
-            )
-            if affected_count > 0 and total_applied > 0:
-                _notify_resident_auto_advance(
-                    db,
-                    int(resident_id),
-                    reference_tag,
-                    float(total_applied)
-                )
-
-        db.commit()
-    except Exception as exc:
-        print(f"[auto-advance] failed: {exc}")
-        db.rollback()
-    finally:
-        db.close()
-
-
-def _loop() -> None:
-    while not _stop_event.is_set():
-        _run_once()
-        _stop_event.wait(AUTO_ADVANCE_CHECK_INTERVAL_SEC)
-
-
-def start_auto_advance_scheduler() -> None:
-    global _scheduler_thread
-    if _scheduler_thread and _scheduler_thread.is_alive():
-        return
-    _stop_event.clear()
-    _scheduler_thread = threading.Thread(target=_loop, name="auto-advance-scheduler", daemon=True)
-    _scheduler_thread.start()
-
-
-def stop_auto_advance_scheduler() -> None:
-    _stop_event.set()
+            db.add(Notification(
+                user_id=admin.id,
+                resident_id=None,
+                message=message,
+                status=NotificationStatus.UNREAD,
+                notification_type=TARIFF_EXPIRED_NOTIFICATION_TYPE,
+                related_id=step.id,
+            ))
+            created += 1
+    return created
+
+
+def run_auto_advance(db) -> int:
+    """
+    Списывает аванс в счёт просроченных (с учётом grace) счетов.
+    Работает по очереди auto_advance_queue, а не сканирует все открытые счета.
+    """
+    return process_due_residents(db)
+
+
+def auto_advance_backlog(db) -> int:
+    """Сколько резидентов в очереди уже ждут обработки."""
+    return queue_backlog(db)
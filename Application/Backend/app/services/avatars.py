@@ -0,0 +1,202 @@
+"""
+Аватары пользователей: загрузка и варианты фиксированных размеров.
+
+Запрос загрузки только потоково сохраняет исходник (services/storage.py, с лимитом размера),
+пишет его ключ в users.avatar_path и ставит обработку в очередь (services/image_workers.py).
+Обработка декодирует исходник один раз и кладёт семейство вариантов
+`avatars/<sha[:2]>/<sha>_<размер>.<webp|jpg>` (sha — хеш исходника, поэтому ключи версионные
+и кэшируются навсегда). Затем avatar_path переключается на старший JPEG-вариант, а исходник
+с метаданными камеры удаляется.
+
+Старые и ещё не обработанные аватары догоняет фоновая задача avatar-variants.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import User
+from .image_workers import run_in_process, submit_task
+from .photo_processing import build_avatar_variants
+from .storage import (
+    StoredFile,
+    delete_unreferenced,
+    family_keys,
+    get_storage,
+    keys_present,
+    lock_keys,
+    normalize_key,
+    parse_variant_key,
+    register_variant_family,
+    storage_url,
+    variant_key,
+)
+
+
+AVATAR_PREFIX = "avatars"
+AVATAR_MAX_UPLOAD_BYTES = int(os.getenv("AVATAR_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+AVATAR_SIZES = sorted({int(s) for s in os.getenv("AVATAR_SIZES", "64,128,256").split(",") if s.strip()})
+AVATAR_QUALITY = int(os.getenv("AVATAR_QUALITY", "82"))
+AVATAR_BACKFILL_BATCH = max(1, int(os.getenv("AVATAR_BACKFILL_BATCH", "50")))
+
+AVATAR_VARIANTS = tuple(f"{size}{ext}" for size in AVATAR_SIZES for ext in (".webp", ".jpg"))
+# На него указывает avatar_path после обработки: JPEG открывается везде, включая старые клиенты.
+AVATAR_PRIMARY_VARIANT = f"{AVATAR_SIZES[-1]}.jpg"
+
+register_variant_family(AVATAR_PREFIX, AVATAR_VARIANTS)
+
+
+def avatar_urls(value: Optional[str]) -> Optional[dict[str, str]]:
+    """
+    URL вариантов: {"64.webp": "/uploads/...", "64.jpg": ..., ...}.
+    None — аватара нет или он ещё не обработан (тогда есть только avatar_path).
+    """
+    parsed = parse_variant_key(normalize_key(value) or "")
+    if not parsed or parsed[0] != AVATAR_PREFIX:
+        return None
+    _, sha, _ = parsed
+    return {name: storage_url(variant_key(AVATAR_PREFIX, sha, name)) for name in AVATAR_VARIANTS}
+
+
+def is_processed(value: Optional[str]) -> bool:
+    return avatar_urls(value) is not None
+
+
+def store_avatar_upload(
+    db: Session, stream: BinaryIO, ext: str, max_bytes: int = AVATAR_MAX_UPLOAD_BYTES,
+) -> StoredFile:
+    """
+    Потоково сохраняет исходник аватара. Ключ блокируется в транзакции db (storage.lock_keys) до её
+    commit — файл не удалят как «без ссылок», пока строка пользователя на него не сохранена.
+    Ошибки: storage.UploadTooLargeError, ValueError (пустой файл).
+    """
+    return get_storage().save_stream(
+        stream, AVATAR_PREFIX, ext, max_bytes=max_bytes, claim=lambda key: lock_keys(db, [key])
+    )
+
+
+# ---------------------------------------------------------------------------
+# Background processing
+# ---------------------------------------------------------------------------
+
+def _build_variants(key: str) -> Optional[str]:
+    """Кладёт семейство вариантов в хранилище. Возвращает ключ основного варианта или None."""
+    storage = get_storage()
+    work_dir = tempfile.mkdtemp(prefix="avatar-", dir=storage.work_dir())
+    try:
+        with storage.local_copy(key) as src_path:
+            # Хеш исходника — из его ключа; у старых аватаров (без хеша в имени) считаем по файлу.
+            sha = _source_sha(key, src_path)
+            outcome = run_in_process(build_avatar_variants, src_path, work_dir, AVATAR_SIZES, AVATAR_QUALITY)
+        if outcome["result"] != "ok":
+            return None
+        for name in outcome["files"]:
+            storage.save_as(os.path.join(work_dir, name), variant_key(AVATAR_PREFIX, sha, name))
+        return variant_key(AVATAR_PREFIX, sha, AVATAR_PRIMARY_VARIANT)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _source_sha(key: str, src_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(key))[0]
+    if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem):
+        return stem
+    digest = hashlib.sha256()
+    with open(src_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def process_avatar(user_id: int, value: str) -> bool:
+    """
+    Строит варианты для avatar_path == value и переключает пользователя на них.
+    False — исходник не читается как изображение (остаётся как есть) или аватар успели сменить.
+    """
+    key = normalize_key(value)
+    primary = _build_variants(key)
+    if primary is None:
+        print(f"[avatars] cannot decode avatar of user {user_id}: {key}")
+        return False
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).with_for_update().first()
+        if not user or normalize_key(user.avatar_path) != key:
+            # Аватар заменили или удалили, пока шла обработка.
+            db.rollback()
+            delete_unreferenced(db, [primary])
+            return False
+        # Варианты писались без строки в БД: такое же семейство у другого пользователя могли
+        # удалить как «без ссылок» — под lock убеждаемся, что файлы на месте.
+        lock_keys(db, [primary])
+        if not keys_present(family_keys(primary)):
+            db.rollback()
+            print(f"[avatars] variants of user {user_id} vanished before swap, keeping source: {key}")
+            return False
+        user.avatar_path = primary
+        db.commit()
+        delete_unreferenced(db, [value])
+        return True
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def submit_avatar_processing(user_id: int, value: str) -> None:
+    """Ставит построение вариантов в очередь. Вызывать после commit avatar_path."""
+    submit_task(process_avatar, user_id, value)
+
+
+# ---------------------------------------------------------------------------
+# Backfill (scheduler job)
+# ---------------------------------------------------------------------------
+
+def _pending_filter():
+    # Обработанный аватар — всегда основной вариант семейства: avatars/xx/<sha>_256.jpg.
+    return (
+        User.avatar_path.isnot(None),
+        ~User.avatar_path.like(f"{AVATAR_PREFIX}/%\\_{AVATAR_PRIMARY_VARIANT}", escape="\\"),
+    )
+
+
+# Курсор по id: нечитаемые исходники остаются необработанными и не должны
+# занимать каждую пачку. Сбрасывается, когда проход дошёл до конца таблицы.
+_backfill_after_id = 0
+
+
+def backfill_avatar_variants(db: Session, batch_size: int = AVATAR_BACKFILL_BATCH) -> int:
+    """Строит варианты для старых аватаров и тех, чья обработка потерялась (рестарт воркера)."""
+    global _backfill_after_id
+    rows = (
+        db.query(User.id, User.avatar_path)
+        .filter(*_pending_filter(), User.id > _backfill_after_id)
+        .order_by(User.id)
+        .limit(batch_size)
+        .all()
+    )
+    db.rollback()  # не держим транзакцию, пока идёт обработка изображений
+    _backfill_after_id = rows[-1].id if len(rows) == batch_size else 0
+
+    processed = 0
+    for user_id, value in rows:
+        try:
+            if process_avatar(user_id, value):
+                processed += 1
+        except Exception as e:
+            print(f"[avatars] backfill failed for user {user_id}: {e}")
+    return processed
+
+
+def count_pending_avatars(db: Session) -> int:
+    return db.query(func.count(User.id)).filter(*_pending_filter()).scalar() or 0
@@ -3,6 +3,8 @@ from __future__ import annotations
 import base64
 import hashlib
 import secrets
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
 from decimal import Decimal
 from typing import Iterable, Optional
@@ -11,8 +13,11 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey, RSAPublicKey
 from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 from ..config import settings
+from .cache_bus import publish_invalidation, register_cache
 
 
 CREATE_SIGN_FIELDS = ["AMOUNT", "CURRENCY", "TERMINAL", "TRTYPE", "TIMESTAMP", "NONCE", "BACKREF"]
@@ -96,14 +101,94 @@ def _public_key_raw(category: Optional[str] = None, terminal_group: Optional[str
     return settings.AZERICARD_PUBLIC_KEY
 
 
+def _load_private(raw: str) -> RSAPrivateKey:
+    return load_pem_private_key(_as_pem(raw, "private").encode("utf-8"), password=None)
+
+
+def _load_public(raw: str) -> RSAPublicKey:
+    return load_pem_public_key(_as_pem(raw, "public").encode("utf-8"))
+
+
+# ---------------------------------------------------------------------------
+# Parsed key cache
+# ---------------------------------------------------------------------------
+# Разбор PEM стоит на порядок дороже самой подписи, поэтому объекты ключей кэшируются
+# по (вид, категория, группа терминала). Вместе с объектом хранится исходная строка из
+# settings: поменяли ключ в settings — следующий вызов разберёт новый. reload_keys()
+# сбрасывает кэш явно и заново проверяет ключи.
+
+_KEY_ENV_SUFFIXES = {
+    "": (None, None),
+    "_UTILITY": (TERMINAL_CATEGORY_UTILITY, None),
+    "_MAINTENANCE": (TERMINAL_CATEGORY_MAINTENANCE, None),
+    "_ADVANCE": (TERMINAL_CATEGORY_ADVANCE, None),
+    "_WALLET": (None, TERMINAL_GROUP_WALLET),
+}
+
+_key_cache: dict[tuple[str, Optional[str], Optional[str]], tuple[str, object]] = {}
+_key_cache_lock = threading.Lock()
+
+
+def _cached_key(kind: str, category: Optional[str], terminal_group: Optional[str]):
+    raw_for, load = (_private_key_raw, _load_private) if kind == "private" else (_public_key_raw, _load_public)
+    raw = raw_for(category, terminal_group)
+    cache_key = (kind, category, terminal_group)
+    cached = _key_cache.get(cache_key)
+    if cached is not None and cached[0] == raw:
+        return cached[1]
+    # Категории без своего ключа делят ключ по умолчанию — не разбираем его повторно.
+    shared = next((k for (kd, _, _), (r, k) in list(_key_cache.items()) if kd == kind and r == raw), None)
+    key = shared if shared is not None else load(raw)
+    with _key_cache_lock:
+        _key_cache[cache_key] = (raw, key)
+    return key
+
+
 def _private_key(category: Optional[str] = None, terminal_group: Optional[str] = None) -> RSAPrivateKey:
-    key_pem = _as_pem(_private_key_raw(category, terminal_group), "private").encode("utf-8")
-    return load_pem_private_key(key_pem, password=None)
+    return _cached_key("private", category, terminal_group)
 
 
 def _public_key(category: Optional[str] = None, terminal_group: Optional[str] = None) -> RSAPublicKey:
-    key_pem = _as_pem(_public_key_raw(category, terminal_group), "public").encode("utf-8")
-    return load_pem_public_key(key_pem)
+    return _cached_key("public", category, terminal_group)
+
+
+def _is_placeholder(raw: str) -> bool:
+    return "DUMMY_" in (raw or "").upper()
+
+
+def validate_keys() -> list[str]:
+    """
+    Разбирает все заданные AZERICARD_*_KEY* и прогревает кэш. Пустые ключи и заглушки
+    DUMMY_* пропускаются (терминал не настроен). Возвращает имена проверенных переменных,
+    при битом ключе — RuntimeError со списком переменных.
+    """
+    checked: list[str] = []
+    errors: list[str] = []
+    for suffix, (category, terminal_group) in _KEY_ENV_SUFFIXES.items():
+        for kind, load in (("PRIVATE", _load_private), ("PUBLIC", _load_public)):
+            env_name = f"AZERICARD_{kind}_KEY{suffix}"
+            raw = getattr(settings, env_name, "") or ""
+            if not raw.strip() or _is_placeholder(raw):
+                continue
+            try:
+                key = load(raw)
+            except Exception as exc:
+                errors.append(f"{env_name}: {exc.__class__.__name__}")
+                continue
+            checked.append(env_name)
+            cache_key = (kind.lower(), category, terminal_group)
+            with _key_cache_lock:
+                _key_cache[cache_key] = (raw, key)
+    if errors:
+        raise RuntimeError("AzeriCard keys are malformed: " + ", ".join(errors))
+    return checked
+
+
+def reload_keys() -> list[str]:
+    """Явный сброс кэша после смены ключей в settings; сразу проверяет новые."""
+    with _key_cache_lock:
+        _key_cache.clear()
+    return validate_keys()
 
 
 # ---------------------------------------------------------------------------
@@ -209,27 +294,128 @@ def _classify_description(description: str) -> str:
     return TERMINAL_CATEGORY_UTILITY
 
 
-def classify_invoice_amounts(db, invoice_id: int) -> dict[str, Decimal]:
-    """Return {"utility": Decimal, "maintenance": Decimal} for an invoice's lines."""
+# Разбивка счёта по терминалам кэшируется по id счёта. Запись сбрасывается при любом
+# изменении счёта или его строк (ключ — id счёта), при правке показаний/счётчиков —
+# целиком; через шину (services/cache_bus.py) — во всех воркерах.
+# Хук after_flush видит только объекты сессии: Query.delete()/update() и сырой SQL по
+# invoice_lines, meter_readings, resident_meters его обходят — такой код обязан сам вызвать
+# invalidate_invoice_split и publish_invalidation(session, INVOICE_SPLIT_CACHE[, key]).
+INVOICE_SPLIT_CACHE = "invoice-split"
+_SPLIT_CACHE_MAX = 4096
+
+_split_cache: "OrderedDict[int, dict[str, Decimal]]" = OrderedDict()
+_split_lock = threading.Lock()
+_split_generation = 0
+
+
+def _classify_group(meter_type, description: Optional[str], has_reading: bool) -> str:
+    if has_reading:
+        # как раньше: строка показания без типа счётчика — utility, описание не смотрим
+        if meter_type is None:
+            return TERMINAL_CATEGORY_UTILITY
+        return _classify_meter_type(str(getattr(meter_type, "value", meter_type)))
+    return _classify_description(description or "")
+
+
+def _query_invoice_amounts(db, invoice_ids: list[int]) -> dict[int, dict[str, Decimal]]:
+    """Один агрегат по строкам: (счёт, тип счётчика, описание строки без показания) → сумма."""
+    from sqlalchemy import case, func
+
     from ..models import InvoiceLine, MeterReading, ResidentMeter
 
-    lines = db.query(InvoiceLine).filter(InvoiceLine.invoice_id == invoice_id).all()
-    totals: dict[str, Decimal] = {
-        TERMINAL_CATEGORY_UTILITY: Decimal("0"),
-        TERMINAL_CATEGORY_MAINTENANCE: Decimal("0"),
+    has_reading = InvoiceLine.meter_reading_id.isnot(None)
+    # Описание нужно только строкам без показаний; у остальных не дробим группы.
+    description = case((has_reading, None), else_=InvoiceLine.description)
+    rows = (
+        db.query(
+            InvoiceLine.invoice_id,
+            has_reading.label("has_reading"),
+            ResidentMeter.meter_type,
+            description.label("description"),
+            func.sum(InvoiceLine.amount_total).label("total"),
+        )
+        .outerjoin(MeterReading, MeterReading.id == InvoiceLine.meter_reading_id)
+        .outerjoin(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
+        .filter(InvoiceLine.invoice_id.in_(invoice_ids))
+        .group_by(InvoiceLine.invoice_id, has_reading, ResidentMeter.meter_type, description)
+        .all()
+    )
+    result: dict[int, dict[str, Decimal]] = {
+        invoice_id: {TERMINAL_CATEGORY_UTILITY: Decimal("0"), TERMINAL_CATEGORY_MAINTENANCE: Decimal("0")}
+        for invoice_id in invoice_ids
+    }
+    for r in rows:
+        category = _classify_group(r.meter_type, r.description, bool(r.has_reading))
+        totals = result[r.invoice_id]
+        totals[category] = totals[category] + Decimal(str(r.total or 0))
+    return {
+        invoice_id: {k: v for k, v in totals.items() if v > 0}
+        for invoice_id, totals in result.items()
     }
 
-    for line in lines:
-        category = TERMINAL_CATEGORY_UTILITY
-        if line.meter_reading_id:
-            reading = db.get(MeterReading, line.meter_reading_id)
-            if reading and reading.resident_meter_id:
-                meter = db.get(ResidentMeter, reading.resident_meter_id)
-                if meter and meter.meter_type:
-                    category = _classify_meter_type(str(meter.meter_type.value if hasattr(meter.meter_type, "value") else meter.meter_type))
-        else:
-            category = _classify_description(line.description)
 
-        totals[category] = totals[category] + Decimal(str(line.amount_total or 0))
+def classify_invoices_amounts(db, invoice_ids: Iterable[int]) -> dict[int, dict[str, Decimal]]:
+    """
+    Пакетный вариант classify_invoice_amounts (оплата всех открытых счетов):
+    {invoice_id: {"utility": Decimal, "maintenance": Decimal}}; промахи кэша — одним запросом.
+    """
+    ids = list(dict.fromkeys(int(i) for i in invoice_ids))
+    found: dict[int, dict[str, Decimal]] = {}
+    with _split_lock:
+        for invoice_id in ids:
+            cached = _split_cache.get(invoice_id)
+            if cached is not None:
+                _split_cache.move_to_end(invoice_id)
+                found[invoice_id] = dict(cached)
+        generation = _split_generation
+    missing = [i for i in ids if i not in found]
+    if missing:
+        computed = _query_invoice_amounts(db, missing)
+        with _split_lock:
+            if generation == _split_generation:
+                for invoice_id, totals in computed.items():
+                    _split_cache[invoice_id] = totals
+                while len(_split_cache) > _SPLIT_CACHE_MAX:
+                    _split_cache.popitem(last=False)
+        for invoice_id, totals in computed.items():
+            found[invoice_id] = dict(totals)
+    return {invoice_id: found[invoice_id] for invoice_id in ids}
 
-    return {k: v for k, v in totals.items() if v > 0}
+
+def classify_invoice_amounts(db, invoice_id: int) -> dict[str, Decimal]:
+    """Return {"utility": Decimal, "maintenance": Decimal} for an invoice's lines."""
+    return classify_invoices_amounts(db, [invoice_id])[invoice_id]
+
+
+def invalidate_invoice_split(key: Optional[str] = None) -> None:
+    """key — id счёта строкой (как приходит из шины); None — весь кэш."""
+    global _split_generation
+    with _split_lock:
+        _split_generation += 1
+        if key is None:
+            _split_cache.clear()
+        else:
+            _split_cache.pop(int(key), None)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_split_on_change(session: Session, flush_context) -> None:
+    from ..models import Invoice, InvoiceLine, MeterReading, ResidentMeter
+
+    invoice_ids: set[int] = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, InvoiceLine) and obj.invoice_id:
+            invoice_ids.add(obj.invoice_id)
+        elif isinstance(obj, Invoice) and obj.id:
+            invoice_ids.add(obj.id)
+        elif isinstance(obj, (MeterReading, ResidentMeter)) and obj not in session.new:
+            # новое показание ещё не в счетах; правка старого/счётчика — сбрасываем всё
+            invalidate_invoice_split()
+            publish_invalidation(session, INVOICE_SPLIT_CACHE)
+            return
+    for invoice_id in invoice_ids:
+        invalidate_invoice_split(str(invoice_id))
+        publish_invalidation(session, INVOICE_SPLIT_CACHE, str(invoice_id))
+
+
+register_cache(INVOICE_SPLIT_CACHE, invalidate_invoice_split)
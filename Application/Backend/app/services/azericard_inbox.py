@@ -0,0 +1,168 @@
+"""
+Входящие callback AzeriCard: приём отдельно от проведения платежа.
+
+`POST /api/azericard/callback` проверяет подпись (неверная — 400, в inbox не попадает),
+кладёт запрос в azericard_callback_inbox (ключ — ORDER) и сразу отвечает шлюзу. Создание Payment,
+разнесение по счетам и очередь авто-аванса делает `process_inbox` — в том же воркере сразу после ответа (BackgroundTasks),
+а пропущенное (воркер упал, ошибка конфигурации, БД) добирает задача планировщика.
+
+Ровно один раз:
+- строка inbox захватывается `FOR UPDATE SKIP LOCKED` — дубль callback, пришедший во время
+  проведения, не ждёт и не проводит второй раз;
+- OnlineTransaction блокируется `FOR UPDATE` и повторно проверяется payment_id.
+
+Повторный callback по ORDER, который ещё не оплачен, заменяет payload ожидающей записи
+(или ставит в обработку заново после отказа), как раньше каждый callback обрабатывался заново.
+Не меняются только оплаченные записи и запись, которую проводят прямо сейчас.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import AzericardCallbackInbox
+
+
+INBOX_PENDING = "PENDING"
+INBOX_DONE = "DONE"
+INBOX_FAILED = "FAILED"
+
+RESULT_CONFIRMED = "CONFIRMED"
+RESULT_ALREADY_PROCESSED = "ALREADY_PROCESSED"
+# После этих результатов оплата уже есть: повторный callback ничего не меняет.
+PAID_RESULTS = (RESULT_CONFIRMED, RESULT_ALREADY_PROCESSED)
+
+# Задача планировщика за один запуск проводит не больше стольких callback.
+INBOX_BATCH_SIZE = 100
+_MAX_BACKOFF_SEC = 300
+
+_INSERT_SQL = """
+INSERT INTO azericard_callback_inbox (order_id, payload, status)
+VALUES (:order_id, :payload, 'PENDING')
+ON CONFLICT (order_id) DO NOTHING
+"""
+
+
+def store_callback(db: Session, order_id: str, data: dict[str, str]) -> bool:
+    """
+    Сохраняет callback (подпись уже проверена эндпоинтом) и коммитит. True — запись поставлена
+    в обработку (новая, заменила ещё не захваченную PENDING или повтор после неуспеха),
+    False — дубль: тот же callback уже ждёт, ORDER проводится прямо сейчас или оплачен.
+    """
+    payload = json.dumps(data, ensure_ascii=False)
+    inserted = db.execute(text(_INSERT_SQL), {"order_id": order_id, "payload": payload}).rowcount
+    if inserted:
+        db.commit()
+        return True
+
+    # Строку, которую сейчас проводят, пропускаем (SKIP LOCKED): ответ шлюзу не ждёт проведения.
+    item = (
+        db.query(AzericardCallbackInbox)
+        .filter(
+            AzericardCallbackInbox.order_id == order_id,
+            or_(AzericardCallbackInbox.result.is_(None), AzericardCallbackInbox.result.notin_(PAID_RESULTS)),
+        )
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if item is None or (item.status == INBOX_PENDING and item.payload == payload):
+        db.rollback()
+        return False
+    # Ожидающая (в т.ч. на паузе после ошибки) запись заменяется последним callback шлюза.
+    item.payload = payload
+    item.status = INBOX_PENDING
+    item.result = None
+    item.attempts = 0
+    item.last_error = None
+    item.received_at = func.now()
+    item.available_at = func.now()
+    item.processed_at = None
+    db.commit()
+    return True
+
+
+def _claim(db: Session, order_id: Optional[str]) -> Optional[AzericardCallbackInbox]:
+    query = db.query(AzericardCallbackInbox).filter(
+        AzericardCallbackInbox.status == INBOX_PENDING,
+        AzericardCallbackInbox.available_at <= func.now(),
+    )
+    if order_id is not None:
+        query = query.filter(AzericardCallbackInbox.order_id == order_id)
+    return query.order_by(AzericardCallbackInbox.received_at.asc()).limit(1).with_for_update(skip_locked=True).first()
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, _MAX_BACKOFF_SEC))
+
+
+def _process_claimed(db: Session, item: AzericardCallbackInbox) -> None:
+    from ..routers.api_azericard import process_gateway_callback
+
+    try:
+        data = json.loads(item.payload)
+        # Savepoint: при ошибке откатывается только проведение, строка inbox остаётся захваченной.
+        with db.begin_nested():
+            result = process_gateway_callback(db, item.order_id, data)
+    except Exception as exc:
+        item.attempts = (item.attempts or 0) + 1
+        item.last_error = f"{type(exc).__name__}: {getattr(exc, 'detail', None) or exc}"[:2000]
+        if item.attempts >= settings.AZERICARD_INBOX_MAX_ATTEMPTS:
+            item.status = INBOX_FAILED
+            item.processed_at = func.now()
+        else:
+            item.available_at = datetime.now(timezone.utc) + _retry_delay(item.attempts)
+        print(f"[azericard-inbox] ORDER={item.order_id} attempt {item.attempts} failed: {item.last_error}")
+    else:
+        item.status = INBOX_DONE
+        item.result = result
+        item.last_error = None
+        item.processed_at = func.now()
+    db.commit()
+
+
+def process_inbox(db: Session, order_id: Optional[str] = None, limit: int = INBOX_BATCH_SIZE) -> int:
+    """
+    Проводит готовые к обработке callback по одному, каждый в своей транзакции.
+    С order_id — только этот ORDER (если он не захвачен другим обработчиком).
+    Возвращает число обработанных записей (включая ушедшие на повтор).
+    """
+    processed = 0
+    while processed < limit:
+        item = _claim(db, order_id)
+        if item is None:
+            db.commit()
+            break
+        _process_claimed(db, item)
+        processed += 1
+        if order_id is not None:
+            break
+    return processed
+
+
+def process_order_after_response(order_id: str) -> None:
+    """Задача BackgroundTasks callback-эндпоинта: своя сессия, ошибки остаются в inbox."""
+    db = SessionLocal()
+    try:
+        process_inbox(db, order_id=order_id)
+    except Exception as exc:
+        db.rollback()
+        # запись осталась PENDING — её доберёт задача планировщика
+        print(f"[azericard-inbox] ORDER={order_id} deferred to scheduler: {exc}")
+    finally:
+        db.close()
+
+
+def inbox_backlog(db: Session) -> int:
+    return (
+        db.query(func.count(AzericardCallbackInbox.order_id))
+        .filter(AzericardCallbackInbox.status == INBOX_PENDING, AzericardCallbackInbox.available_at <= func.now())
+        .scalar()
+        or 0
+    )
@@ -0,0 +1,218 @@
+"""
+Авто-канализация в счетах (% от воды по WATER-тарифу) — единственная реализация.
+
+Строка «Канализация» без meter_reading_id и доля воды в WATER-строках пересчитываются
+только при записи: ввод/удаление показаний, повторное выставление счёта и смена
+sewerage_percent тарифа (через очередь sewerage_recompute_queue и задачу sewerage-recompute).
+Чтение счёта (детали в админке и у жителя) ничего не пересчитывает и не коммитит.
+
+Правила:
+- в счёте есть реальное SEWERAGE-показание — авто-строки нет, вода по исходным суммам показания;
+- INDIVIDUAL: WATER-строка делится на воду total*(1-k) и канализацию (остаток), итог счёта не растёт;
+- прочие: вода остаётся целиком, канализация total*k добавляется сверху.
+"""
+
+from __future__ import annotations
+
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from ..models import (
+    CustomerType,
+    Invoice,
+    InvoiceLine,
+    InvoiceStatus,
+    MeterReading,
+    MeterType,
+    ResidentMeter,
+    SewerageRecomputeQueueItem,
+    Tariff,
+)
+from .auto_advance_queue import enqueue_residents
+from .line_payments import sync_line_payments
+
+
+AUTO_SEWERAGE_DESCRIPTION = "Канализация"
+SEWERAGE_RECOMPUTE_BATCH = 200
+# Оплаченные и отменённые счета не трогаем: изменение суммы «переоткрыло» бы закрытый счёт.
+RECOMPUTE_STATUSES = (InvoiceStatus.DRAFT, InvoiceStatus.ISSUED, InvoiceStatus.PARTIAL)
+
+_ENQUEUE_SQL = """
+INSERT INTO sewerage_recompute_queue (tariff_id, after_invoice_id, enqueued_at)
+VALUES (:tariff_id, 0, NOW())
+ON CONFLICT (tariff_id) DO UPDATE SET after_invoice_id = 0, enqueued_at = NOW()
+"""
+
+
+def _money(x) -> Decimal:
+    return Decimal(str(x or 0)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def effective_sewerage_percent(tariff: Optional[Tariff]) -> Decimal:
+    """% канализации берётся только из WATER-тарифа; 0 — авто-канализации нет."""
+    if not tariff or tariff.meter_type != MeterType.WATER:
+        return Decimal("0")
+    try:
+        percent = Decimal(str(getattr(tariff, "sewerage_percent", 0) or 0))
+    except Exception:
+        percent = Decimal("0")
+    return percent if percent > 0 else Decimal("0")
+
+
+def _water_description(consumption: Decimal) -> str:
+    return f"Вода {float(consumption)} м³"
+
+
+def sync_auto_sewerage_line(db: Session, inv: Invoice) -> None:
+    """Приводит WATER-строки и строку авто-канализации счёта в соответствие с тарифами показаний."""
+    if not inv or not inv.id:
+        return
+    db.flush()
+
+    rows = (
+        db.query(InvoiceLine, MeterReading, ResidentMeter.meter_type, Tariff)
+        .join(MeterReading, InvoiceLine.meter_reading_id == MeterReading.id)
+        .join(ResidentMeter, ResidentMeter.id == MeterReading.resident_meter_id)
+        .outerjoin(Tariff, Tariff.id == MeterReading.tariff_id)
+        .filter(InvoiceLine.invoice_id == inv.id)
+        .all()
+    )
+    auto_line = (
+        db.query(InvoiceLine)
+        .filter(
+            InvoiceLine.invoice_id == inv.id,
+            InvoiceLine.meter_reading_id.is_(None),
+            InvoiceLine.description.ilike(f"{AUTO_SEWERAGE_DESCRIPTION}%"),
+        )
+        .first()
+    )
+
+    has_real_sewerage = any(mt == MeterType.SEWERAGE for _ln, _rd, mt, _t in rows)
+    sew_net = sew_vat = sew_total = Decimal("0")
+
+    for ln, rd, mt, tariff in rows:
+        if mt != MeterType.WATER:
+            continue
+        base_net, base_vat, base_total = _money(rd.amount_net), _money(rd.amount_vat), _money(rd.amount_total)
+        consumption = Decimal(str(rd.consumption or 0))
+        percent = Decimal("0") if has_real_sewerage else effective_sewerage_percent(tariff)
+        k = percent / Decimal("100")
+
+        if percent > 0 and tariff.customer_type == CustomerType.INDIVIDUAL:
+            new_net = _money(base_net * (1 - k))
+            new_vat = _money(base_vat * (1 - k))
+            new_total = _money(base_total * (1 - k))
+            sew_net += base_net - new_net
+            sew_vat += base_vat - new_vat
+            sew_total += base_total - new_total
+            ln.amount_net, ln.amount_vat, ln.amount_total = new_net, new_vat, new_total
+            ln.description = _water_description(consumption * (1 - k))
+        else:
+            if percent > 0:
+                sew_net += _money(base_net * k)
+                sew_vat += _money(base_vat * k)
+                sew_total += _money(base_total * k)
+            ln.amount_net, ln.amount_vat, ln.amount_total = base_net, base_vat, base_total
+            ln.description = _water_description(consumption)
+
+    if sew_total <= 0:
+        if auto_line:
+            db.delete(auto_line)
+        return
+
+    if auto_line is None:
+        auto_line = InvoiceLine(invoice_id=inv.id, meter_reading_id=None)
+        db.add(auto_line)
+    # В счёте канализация выводится только суммой, без объёма.
+    auto_line.description = AUTO_SEWERAGE_DESCRIPTION
+    auto_line.amount_net = _money(sew_net)
+    auto_line.amount_vat = _money(sew_vat)
+    auto_line.amount_total = _money(sew_total)
+
+
+def recompute_invoice_totals(db: Session, inv: Invoice) -> None:
+    """Итоги счёта = сумма строк."""
+    db.flush()
+    net, vat, total = db.query(
+        func.coalesce(func.sum(InvoiceLine.amount_net), 0),
+        func.coalesce(func.sum(InvoiceLine.amount_vat), 0),
+        func.coalesce(func.sum(InvoiceLine.amount_total), 0),
+    ).filter(InvoiceLine.invoice_id == inv.id).one()
+    inv.amount_net = Decimal(str(net))
+    inv.amount_vat = Decimal(str(vat))
+    inv.amount_total = Decimal(str(total))
+
+
+def refresh_invoice(db: Session, inv: Invoice) -> None:
+    """Авто-канализация, итоги и оплата по строкам: вызывать после любого изменения строк счёта."""
+    sync_auto_sewerage_line(db, inv)
+    recompute_invoice_totals(db, inv)
+    sync_line_payments(db, inv.id)
+
+
+# ---------------------------------------------------------------------------
+# Смена sewerage_percent тарифа → пересчёт открытых счетов (scheduler job)
+# ---------------------------------------------------------------------------
+
+def enqueue_sewerage_recompute(db: Session, tariff_id: Optional[int]) -> None:
+    """Ставит тариф в очередь пересчёта в текущей транзакции (коммитит вызывающий)."""
+    if tariff_id:
+        db.execute(text(_ENQUEUE_SQL), {"tariff_id": int(tariff_id)})
+
+
+def _affected_invoice_ids(db: Session, tariff_id: int, after_id: int, limit: int) -> list[int]:
+    rows = (
+        db.query(InvoiceLine.invoice_id)
+        .join(MeterReading, MeterReading.id == InvoiceLine.meter_reading_id)
+        .join(Invoice, Invoice.id == InvoiceLine.invoice_id)
+        .filter(
+            MeterReading.tariff_id == tariff_id,
+            InvoiceLine.invoice_id > after_id,
+            Invoice.status.in_(RECOMPUTE_STATUSES),
+        )
+        .distinct()
+        .order_by(InvoiceLine.invoice_id)
+        .limit(limit)
+        .all()
+    )
+    return [int(r[0]) for r in rows]
+
+
+def run_sewerage_recompute(db: Session, batch_size: int = SEWERAGE_RECOMPUTE_BATCH) -> int:
+    """
+    Пересчитывает счета тарифов из очереди. Каждая пачка — отдельная транзакция;
+    курсор after_invoice_id в строке очереди, поэтому прерванный проход продолжается с места.
+    Возвращает число пересчитанных счетов.
+    """
+    processed = 0
+    while True:
+        item = (
+            db.query(SewerageRecomputeQueueItem)
+            .order_by(SewerageRecomputeQueueItem.enqueued_at)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if item is None:
+            db.commit()
+            return processed
+
+        invoice_ids = _affected_invoice_ids(db, item.tariff_id, item.after_invoice_id, batch_size)
+        if invoice_ids:
+            invoices = db.query(Invoice).filter(Invoice.id.in_(invoice_ids)).order_by(Invoice.id).all()
+            for inv in invoices:
+                refresh_invoice(db, inv)
+                processed += 1
+            # Итоги открытых счетов изменились — авто-аванс проверит их заново
+            enqueue_residents(db, [inv.resident_id for inv in invoices])
+        if len(invoice_ids) < batch_size:
+            db.delete(item)
+        else:
+            item.after_invoice_id = invoice_ids[-1]
+        db.commit()
+
+
+def sewerage_recompute_backlog(db: Session) -> int:
+    return db.query(func.count(SewerageRecomputeQueueItem.tariff_id)).scalar() or 0
@@ -0,0 +1,125 @@
+"""
+Шина инвалидации кэшей в памяти между воркерами и узлами — через PostgreSQL NOTIFY, без Redis.
+
+Кэш регистрируется именем и функцией сброса: `register_cache("reference", evict)`,
+evict(key) сбрасывает одну запись, evict(None) — весь кэш.
+
+Писатель вызывает `publish_invalidation(db, cache, key)` в той же транзакции, что и запись:
+`pg_notify` уходит подписчикам только при COMMIT (при откате — никуда), поэтому ни один
+воркер не увидит событие раньше самих данных. В своём воркере сброс делается сразу после
+commit (хук сессии), не дожидаясь круга через БД.
+
+Каждый воркер слушает канал cache_invalidation общим LISTEN-потоком (services/pg_listen.py).
+После (пере)подключения все зарегистрированные кэши сбрасываются целиком: события,
+пришедшие, пока соединения не было, потеряны.
+
+Изменение данных в обход приложения (psql, миграции) сбрасывается так:
+    SELECT pg_notify('cache_invalidation', '{"cache": "reference"}');
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import threading
+from typing import Callable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from . import metrics, pg_listen
+
+
+CACHE_CHANNEL = "cache_invalidation"
+# Лимит payload NOTIFY — 8000 байт; длинный ключ заменяется сбросом всего кэша.
+_MAX_KEY_CHARS = 1000
+_SESSION_PENDING = "cache_bus_pending"
+
+_caches: dict[str, Callable[[Optional[str]], None]] = {}
+_lock = threading.Lock()
+
+
+def _origin() -> str:
+    # pid берётся при каждом вызове: с preload_app модуль импортируется ещё в мастере gunicorn.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def register_cache(name: str, evict: Callable[[Optional[str]], None]) -> None:
+    with _lock:
+        _caches[name] = evict
+
+
+def evict_local(cache: str, key: Optional[str] = None, source: str = "local") -> None:
+    with _lock:
+        evict = _caches.get(cache)
+    if evict is None:
+        return
+    try:
+        evict(key)
+    except Exception as exc:
+        print(f"[cache-bus] evict {cache}/{key} failed: {exc}")
+        return
+    metrics.CACHE_INVALIDATIONS.labels(cache, source).inc()
+
+
+def flush_all(source: str = "reconnect") -> None:
+    with _lock:
+        names = list(_caches)
+    for name in names:
+        evict_local(name, None, source=source)
+
+
+def publish_invalidation(db: Session, cache: str, key: Optional[str] = None) -> None:
+    """
+    Ставит событие (cache, key) в текущую транзакцию сессии. Можно вызывать из after_flush:
+    запрос идёт через соединение сессии. Повтор того же события в транзакции ничего не делает.
+    """
+    if key is not None and len(key) > _MAX_KEY_CHARS:
+        key = None
+    pending: set = db.info.setdefault(_SESSION_PENDING, set())
+    if (cache, key) in pending:
+        return
+    pending.add((cache, key))
+    if not settings.CACHE_BUS_ENABLED:
+        return
+    conn = db.connection()
+    if conn.dialect.name != "postgresql":
+        return
+    payload = json.dumps({"cache": cache, "key": key, "origin": _origin()}, ensure_ascii=False)
+    conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CACHE_CHANNEL, "payload": payload})
+
+
+def _on_notify(payload: str) -> None:
+    try:
+        data = json.loads(payload)
+        cache = str(data["cache"])
+        key = data.get("key")
+    except Exception:
+        print(f"[cache-bus] bad payload: {payload[:200]!r}")
+        return
+    if data.get("origin") == _origin():
+        # своё событие: сброс уже сделан после commit
+        return
+    evict_local(cache, None if key is None else str(key), source="bus")
+
+
+def start_cache_bus() -> None:
+    if settings.CACHE_BUS_ENABLED:
+        pg_listen.start_listener()
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_after_commit(session: Session) -> None:
+    for cache, key in session.info.pop(_SESSION_PENDING, ()):
+        evict_local(cache, key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_PENDING, None)
+
+
+pg_listen.add_channel_handler(CACHE_CHANNEL, _on_notify)
+pg_listen.add_reconnect_handler(flush_all)
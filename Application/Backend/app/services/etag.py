@@ -0,0 +1,23 @@
+"""
+Сильные ETag для JSON-ответов, которые отдаются из кэша в процессе.
+
+ETag считается по байтам тела, поэтому одинаков на всех воркерах и после перестройки
+кэша с тем же содержимым: клиент получает 304, пока данные действительно не изменились.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Optional
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: список тегов или '*'; слабые (W/) сравниваются по значению, как для GET."""
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
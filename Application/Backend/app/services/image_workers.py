@@ -0,0 +1,81 @@
+"""
+Общие пулы для обработки изображений (фото счётчиков, аватары).
+
+- пул процессов: декодирование/кодирование Pillow держит GIL и заняло бы поток запроса;
+- пул потоков: фоновые задачи «скачать → обработать в процессе → переключить строку в БД»,
+  запускаются после commit, чтобы ответ не ждал обработки.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+
+# Историческое имя переменной: пул общий для фото счётчиков и аватаров.
+IMAGE_WORKERS = max(1, int(os.getenv("METER_PHOTO_WORKERS", "2")))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_task_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # spawn: воркер uvicorn многопоточный и держит соединения с БД — fork здесь небезопасен.
+            _process_pool = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def _reset_process_pool() -> None:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def _get_task_pool() -> ThreadPoolExecutor:
+    global _task_pool
+    with _pool_lock:
+        if _task_pool is None:
+            _task_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-task")
+        return _task_pool
+
+
+def run_in_process(fn: Callable, *args):
+    """Выполняет fn(*args) в пуле процессов и ждёт результат. fn и аргументы должны быть picklable."""
+    try:
+        return _get_process_pool().submit(fn, *args).result()
+    except BrokenProcessPool:
+        # Дочерний процесс убит (OOM и т.п.) — пересоздаём пул, текущую задачу делаем в этом потоке.
+        _reset_process_pool()
+        return fn(*args)
+
+
+def _log_failure(future: Future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        print(f"[image-workers] task failed: {exc}")
+
+
+def submit_task(fn: Callable, *args) -> None:
+    """Ставит фоновую задачу в пул потоков; ошибки пишутся в лог."""
+    _get_task_pool().submit(fn, *args).add_done_callback(_log_failure)
+
+
+def shutdown_image_workers() -> None:
+    global _task_pool
+    with _pool_lock:
+        task_pool, _task_pool = _task_pool, None
+    if task_pool is not None:
+        task_pool.shutdown(wait=True, cancel_futures=True)
+    _reset_process_pool()
@@ -0,0 +1,79 @@
+"""
+Реестр фоновых задач приложения.
+
+Интервалы настраиваются через .env (см. config.Settings); сами задачи выполняет
+только воркер-лидер планировщика (services/scheduler.py).
+"""
+
+from __future__ import annotations
+
+from ..config import settings
+from .scheduler import register_job
+
+
+JOB_AUTO_ADVANCE = "auto-advance"
+JOB_TARIFF_EXPIRY = "tariff-expiry-check"
+JOB_PHOTO_CLEANUP = "photo-cleanup"
+JOB_AVATAR_VARIANTS = "avatar-variants"
+JOB_SEWERAGE_RECOMPUTE = "sewerage-recompute"
+JOB_LINE_PAYMENTS = "line-payments"
+JOB_NOTIFICATION_ARCHIVE = "notification-archive"
+JOB_AZERICARD_INBOX = "azericard-inbox"
+
+
+def register_default_jobs() -> None:
+    from .auto_advance_scheduler import run_auto_advance, auto_advance_backlog, run_tariff_expiry_check
+    from .meter_photos import cleanup_expired_meter_photos, count_expired_meter_photos
+    from .avatars import backfill_avatar_variants, count_pending_avatars
+    from .billing import run_sewerage_recompute, sewerage_recompute_backlog
+    from .line_payments import backfill_line_payments, count_pending_line_payments
+    from .notification_archive import archive_notifications, count_archivable_notifications
+    from .azericard_inbox import inbox_backlog, process_inbox
+
+    register_job(
+        JOB_AUTO_ADVANCE,
+        run_auto_advance,
+        settings.AUTO_ADVANCE_INTERVAL_SEC,
+        backlog=auto_advance_backlog,
+    )
+    register_job(
+        JOB_TARIFF_EXPIRY,
+        run_tariff_expiry_check,
+        settings.TARIFF_EXPIRY_CHECK_INTERVAL_SEC,
+    )
+    register_job(
+        JOB_PHOTO_CLEANUP,
+        cleanup_expired_meter_photos,
+        settings.PHOTO_CLEANUP_INTERVAL_SEC,
+        backlog=count_expired_meter_photos,
+    )
+    register_job(
+        JOB_AVATAR_VARIANTS,
+        backfill_avatar_variants,
+        settings.AVATAR_VARIANTS_INTERVAL_SEC,
+        backlog=count_pending_avatars,
+    )
+    register_job(
+        JOB_SEWERAGE_RECOMPUTE,
+        run_sewerage_recompute,
+        settings.SEWERAGE_RECOMPUTE_INTERVAL_SEC,
+        backlog=sewerage_recompute_backlog,
+    )
+    register_job(
+        JOB_LINE_PAYMENTS,
+        backfill_line_payments,
+        settings.LINE_PAYMENTS_BACKFILL_INTERVAL_SEC,
+        backlog=count_pending_line_payments,
+    )
+    register_job(
+        JOB_NOTIFICATION_ARCHIVE,
+        archive_notifications,
+        settings.NOTIFICATION_ARCHIVE_INTERVAL_SEC,
+        backlog=count_archivable_notifications,
+    )
+    register_job(
+        JOB_AZERICARD_INBOX,
+        process_inbox,
+        settings.AZERICARD_INBOX_INTERVAL_SEC,
+        backlog=inbox_backlog,
+    )
@@ -0,0 +1,282 @@
+"""
+Оплата по строкам счёта: сколько из каждой InvoiceLine уже погашено.
+
+Распределение единое для админки, кабинета жителя и блокировки показаний:
+применения (PaymentApplication) по порядку created_at, id покрывают строки по очереди.
+Без выбора строк — по id строки; с выбором (`LINESEL:1,2` в reference) — только выбранные,
+причём вода и канализация гасятся вместе (сначала канализация).
+
+Результат хранится, а не пересчитывается на каждом чтении:
+- invoice_lines.amount_paid — погашено по строке (NULL — ещё не посчитано);
+- payment_application_lines — какая часть каждого применения легла на какую строку.
+sync_line_payments вызывается при записи: применение оплаты (_recompute_invoice_status),
+изменение строк счёта (billing.refresh_invoice, начальный долг). Старые счета догоняет
+задача line-payments; пока строка не посчитана, чтение считает её в памяти, ничего не записывая.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import InvoiceLine, PaymentApplication, PaymentApplicationLine
+
+
+LINESEL_MARKER = "LINESEL:"
+LINE_PAYMENTS_BACKFILL_BATCH = 500
+PAID_EPS = Decimal("0.0001")
+
+_CENT = Decimal("0.01")
+
+
+def _money(x) -> Decimal:
+    return Decimal(str(x or 0)).quantize(_CENT)
+
+
+def parse_selected_line_ids(reference: str | None) -> list[int]:
+    """id строк из `...|LINESEL:1,2,3|...`; пусто, если применение не привязано к строкам."""
+    if not reference:
+        return []
+    idx = reference.find(LINESEL_MARKER)
+    if idx < 0:
+        return []
+    out: list[int] = []
+    for token in reference[idx + len(LINESEL_MARKER):].split("|")[0].split(","):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            out.append(int(token))
+        except Exception:
+            continue
+    return out
+
+
+def is_water_line_description(desc: str | None) -> bool:
+    low = (desc or "").lower()
+    return ("вода" in low) or ("water" in low) or ("meter_cold_water" in low)
+
+
+def is_sewerage_line_description(desc: str | None) -> bool:
+    low = (desc or "").lower()
+    return ("канализац" in low) or ("sewerage" in low) or ("meter_sewerage" in low)
+
+
+def normalize_selected_line_ids(selected_ids: list[int], line_desc_by_id: dict[int, str]) -> list[int]:
+    """Если выбрана вода или канализация — добавляет вторую и ставит канализацию первой."""
+    ids = [int(x) for x in (selected_ids or []) if int(x) > 0]
+    if not ids:
+        return []
+
+    unique_ids = list(dict.fromkeys(ids))
+    selected_has_bundle = any(
+        is_water_line_description(line_desc_by_id.get(lid))
+        or is_sewerage_line_description(line_desc_by_id.get(lid))
+        for lid in unique_ids
+    )
+    if not selected_has_bundle:
+        return unique_ids
+
+    sewer_ids = [lid for lid, desc in line_desc_by_id.items() if is_sewerage_line_description(desc)]
+    water_ids = [lid for lid, desc in line_desc_by_id.items() if is_water_line_description(desc)]
+    if not sewer_ids or not water_ids:
+        return unique_ids
+
+    for lid in sewer_ids + water_ids:
+        if lid not in unique_ids:
+            unique_ids.append(lid)
+
+    def _key(lid: int) -> tuple[int, int]:
+        if lid in sewer_ids:
+            return (0, unique_ids.index(lid))
+        if lid in water_ids:
+            return (1, unique_ids.index(lid))
+        return (2, unique_ids.index(lid))
+
+    return sorted(unique_ids, key=_key)
+
+
+def allocate_line_payments(lines: Iterable, apps: Iterable) -> dict[int, dict[int, Decimal]]:
+    """
+    Распределение применений одного счёта по его строкам: app_id -> {line_id: сумма}.
+    lines — объекты/строки с id, description, amount_total; apps — с id, amount_applied,
+    reference, уже упорядоченные по (created_at, id). Ничего не читает из БД.
+    """
+    sorted_lines = sorted((ln for ln in lines if ln.id is not None), key=lambda ln: ln.id)
+    line_desc_by_id = {int(ln.id): (ln.description or "") for ln in sorted_lines}
+    line_totals = {int(ln.id): _money(ln.amount_total) for ln in sorted_lines}
+    paid_by_line = {lid: Decimal("0") for lid in line_totals}
+    default_order = list(line_totals)
+
+    distribution: dict[int, dict[int, Decimal]] = {}
+    for app in apps:
+        remaining_amt = Decimal(str(app.amount_applied or 0))
+        if remaining_amt <= 0:
+            continue
+        selected_ids = parse_selected_line_ids(app.reference)
+        order = normalize_selected_line_ids(selected_ids, line_desc_by_id) if selected_ids else default_order
+        shares: dict[int, Decimal] = {}
+        for lid in order:
+            if remaining_amt <= 0:
+                break
+            if lid not in line_totals:
+                continue
+            capacity = max(line_totals[lid] - paid_by_line[lid], Decimal("0"))
+            if capacity <= 0:
+                continue
+            take = min(capacity, remaining_amt)
+            paid_by_line[lid] += take
+            shares[lid] = shares.get(lid, Decimal("0")) + take
+            remaining_amt -= take
+        if shares:
+            distribution[int(app.id)] = shares
+    return distribution
+
+
+def _paid_by_line(distribution: dict[int, dict[int, Decimal]]) -> dict[int, Decimal]:
+    paid: dict[int, Decimal] = defaultdict(Decimal)
+    for shares in distribution.values():
+        for lid, amount in shares.items():
+            paid[lid] += amount
+    return paid
+
+
+def _ordered_apps_query(db: Session, invoice_ids: list[int]):
+    return (
+        db.query(
+            PaymentApplication.id,
+            PaymentApplication.invoice_id,
+            PaymentApplication.amount_applied,
+            PaymentApplication.reference,
+        )
+        .filter(PaymentApplication.invoice_id.in_(invoice_ids))
+        .order_by(PaymentApplication.created_at.asc(), PaymentApplication.id.asc())
+    )
+
+
+def sync_line_payments(db: Session, invoice_id: int | None) -> None:
+    """Пересчитывает amount_paid строк и payment_application_lines счёта (коммитит вызывающий)."""
+    if not invoice_id:
+        return
+    db.flush()
+    lines = (
+        db.query(InvoiceLine)
+        .filter(InvoiceLine.invoice_id == invoice_id)
+        .order_by(InvoiceLine.id)
+        .all()
+    )
+    apps = _ordered_apps_query(db, [invoice_id]).all()
+    distribution = allocate_line_payments(lines, apps)
+
+    paid = _paid_by_line(distribution)
+    for ln in lines:
+        value = _money(paid.get(int(ln.id)))
+        if ln.amount_paid is None or _money(ln.amount_paid) != value:
+            ln.amount_paid = value
+
+    wanted = {
+        (app_id, lid, _money(amount))
+        for app_id, shares in distribution.items()
+        for lid, amount in shares.items()
+    }
+    app_ids = [int(a.id) for a in apps]
+    current = set()
+    if app_ids:
+        current = {
+            (int(app_id), int(lid), _money(amount))
+            for app_id, lid, amount in db.query(
+                PaymentApplicationLine.application_id,
+                PaymentApplicationLine.invoice_line_id,
+                PaymentApplicationLine.amount,
+            ).filter(PaymentApplicationLine.application_id.in_(app_ids))
+        }
+    if current == wanted:
+        return
+    if app_ids:
+        db.query(PaymentApplicationLine).filter(
+            PaymentApplicationLine.application_id.in_(app_ids)
+        ).delete(synchronize_session=False)
+    db.add_all(
+        PaymentApplicationLine(application_id=app_id, invoice_line_id=lid, amount=amount)
+        for app_id, lid, amount in sorted(wanted)
+    )
+
+
+def line_paid_amounts(db: Session, lines: Iterable) -> dict[int, Decimal]:
+    """
+    line_id -> погашено. Берёт сохранённый amount_paid; строки, которые ещё не посчитаны
+    (до прохода line-payments), считает в памяти. Ничего не пишет.
+    """
+    lines = [ln for ln in lines if ln.id is not None]
+    result = {int(ln.id): _money(ln.amount_paid) for ln in lines if ln.amount_paid is not None}
+    stale_invoice_ids = sorted({int(ln.invoice_id) for ln in lines if ln.amount_paid is None})
+    if not stale_invoice_ids:
+        return result
+
+    invoice_lines: dict[int, list] = defaultdict(list)
+    for ln in (
+        db.query(InvoiceLine.id, InvoiceLine.invoice_id, InvoiceLine.description, InvoiceLine.amount_total)
+        .filter(InvoiceLine.invoice_id.in_(stale_invoice_ids))
+    ):
+        invoice_lines[int(ln.invoice_id)].append(ln)
+    invoice_apps: dict[int, list] = defaultdict(list)
+    for app in _ordered_apps_query(db, stale_invoice_ids):
+        invoice_apps[int(app.invoice_id)].append(app)
+
+    for invoice_id in stale_invoice_ids:
+        paid = _paid_by_line(allocate_line_payments(invoice_lines[invoice_id], invoice_apps[invoice_id]))
+        for ln in invoice_lines[invoice_id]:
+            result.setdefault(int(ln.id), _money(paid.get(int(ln.id))))
+    return result
+
+
+def invoice_line_payment_map(db: Session, lines: Iterable) -> dict[int, dict]:
+    """line_id -> {paid, remaining, status} для вывода строк счёта."""
+    lines = [ln for ln in lines if ln.id is not None]
+    paid_by_line = line_paid_amounts(db, lines)
+    result: dict[int, dict] = {}
+    for ln in lines:
+        total = _money(ln.amount_total)
+        paid = paid_by_line.get(int(ln.id), Decimal("0"))
+        remaining = _money(max(total - paid, Decimal("0")))
+        if remaining <= PAID_EPS:
+            status_text = "Оплачена"
+        elif paid > PAID_EPS:
+            status_text = "Частично"
+        else:
+            status_text = "Не оплачена"
+        result[int(ln.id)] = {"paid": paid, "remaining": remaining, "status": status_text}
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Догон старых счетов (scheduler job line-payments)
+# ---------------------------------------------------------------------------
+
+def backfill_line_payments(db: Session, batch_size: int = LINE_PAYMENTS_BACKFILL_BATCH) -> int:
+    """Считает amount_paid для счетов, строки которых ещё не посчитаны. Возвращает число счетов."""
+    invoice_ids = [
+        int(invoice_id)
+        for (invoice_id,) in db.query(InvoiceLine.invoice_id)
+        .filter(InvoiceLine.amount_paid.is_(None))
+        .distinct()
+        .order_by(InvoiceLine.invoice_id)
+        .limit(batch_size)
+    ]
+    for invoice_id in invoice_ids:
+        sync_line_payments(db, invoice_id)
+    db.commit()
+    return len(invoice_ids)
+
+
+def count_pending_line_payments(db: Session) -> int:
+    return (
+        db.query(func.count(func.distinct(InvoiceLine.invoice_id)))
+        .filter(InvoiceLine.amount_paid.is_(None))
+        .scalar()
+        or 0
+    )
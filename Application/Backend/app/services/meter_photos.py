@@ -0,0 +1,223 @@
+"""
+Хранение и фоновая обработка фото счётчиков.
+
+Запрос загрузки только потоково пишет файл в хранилище (services/storage.py, с лимитом размера)
+и сохраняет строку MeterReadingPhoto с оригиналом. Сжатие (бинарный поиск качества JPEG)
+и превью делаются в пуле процессов (services/image_workers.py) — Pillow держит GIL и занимал
+бы поток запроса на секунды.
+Когда варианты готовы, строка под блокировкой переключается на сжатый файл, оригинал удаляется.
+
+Просроченные фото (PHOTO_TTL_DAYS) удаляет фоновая задача photo-cleanup пачками,
+пути запросов очисткой не занимаются.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import MeterReadingPhoto
+from .image_workers import run_in_process, submit_task
+from .metrics import PHOTO_CLEANUP_BYTES, PHOTO_COMPRESS_SECONDS
+from .photo_processing import optimize_photo
+from .storage import (
+    StoredFile,
+    delete_unreferenced,
+    get_storage,
+    keys_present,
+    lock_keys,
+    release_unreferenced,
+    storage_url,
+)
+
+
+PHOTO_TTL_DAYS = 90
+PHOTO_PREFIX = "meter_readings"
+PHOTO_MAX_UPLOAD_BYTES = int(os.getenv("METER_PHOTO_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+PHOTO_COMPRESS_THRESHOLD_BYTES = int(os.getenv("METER_PHOTO_COMPRESS_THRESHOLD_BYTES", str(3 * 1024 * 1024)))
+PHOTO_TARGET_MAX_BYTES = int(os.getenv("METER_PHOTO_TARGET_MAX_BYTES", str(1 * 1024 * 1024)))
+PHOTO_JPEG_QUALITY_MAX = int(os.getenv("METER_PHOTO_JPEG_QUALITY_START", "85"))
+PHOTO_JPEG_QUALITY_MIN = int(os.getenv("METER_PHOTO_JPEG_QUALITY_MIN", "45"))
+PHOTO_THUMB_SIDE = int(os.getenv("METER_PHOTO_THUMB_SIDE", "320"))
+PHOTO_CLEANUP_BATCH = max(1, int(os.getenv("METER_PHOTO_CLEANUP_BATCH", "500")))
+# Недописанные загрузки старше этого срока — мусор после падения воркера.
+_STALE_TEMP_SECONDS = 24 * 3600
+
+
+def photo_url(key: Optional[str]) -> Optional[str]:
+    return storage_url(key)
+
+
+def photo_keys(photo: MeterReadingPhoto) -> list[str]:
+    """Все файлы фото в хранилище: основной вариант и превью."""
+    return [key for key in (photo.file_path, photo.thumb_path) if key]
+
+
+# ---------------------------------------------------------------------------
+# Upload
+# ---------------------------------------------------------------------------
+
+def store_upload(db: Session, stream: BinaryIO, ext: str, max_bytes: int = PHOTO_MAX_UPLOAD_BYTES) -> StoredFile:
+    """
+    Потоково сохраняет загрузку в хранилище под ключом по sha256 содержимого.
+    Ключ блокируется в транзакции db (storage.lock_keys) до её commit: готовый файл с тем же
+    содержимым не удалят, пока строка фото на него не сохранена.
+    Ошибки: storage.UploadTooLargeError (превышен лимит), ValueError (пустой файл).
+    """
+    return get_storage().save_stream(
+        stream, PHOTO_PREFIX, ext, max_bytes=max_bytes, claim=lambda key: lock_keys(db, [key])
+    )
+
+
+# ---------------------------------------------------------------------------
+# Background processing
+# ---------------------------------------------------------------------------
+
+def _run_optimize(src_path: str, optimized_path: str, thumb_path: str) -> dict:
+    return run_in_process(
+        optimize_photo,
+        src_path,
+        optimized_path,
+        thumb_path,
+        PHOTO_COMPRESS_THRESHOLD_BYTES,
+        PHOTO_TARGET_MAX_BYTES,
+        PHOTO_JPEG_QUALITY_MIN,
+        PHOTO_JPEG_QUALITY_MAX,
+        PHOTO_THUMB_SIDE,
+    )
+
+
+def _build_variants(key: str) -> tuple[dict, Optional[str], Optional[str]]:
+    """Сжатый вариант и превью в хранилище. Возвращает (итог, ключ сжатого, ключ превью)."""
+    storage = get_storage()
+    work_dir = tempfile.mkdtemp(prefix="photo-", dir=storage.work_dir())
+    optimized_path = os.path.join(work_dir, "optimized.jpg")
+    thumb_path = os.path.join(work_dir, "thumb.jpg")
+    try:
+        with storage.local_copy(key) as src_path:
+            outcome = _run_optimize(src_path, optimized_path, thumb_path)
+        optimized_key = storage.save_file(optimized_path, PHOTO_PREFIX, ".jpg").key if outcome["optimized"] else None
+        thumb_key = storage.save_file(thumb_path, PHOTO_PREFIX, ".jpg").key if outcome["thumb"] else None
+        return outcome, optimized_key, thumb_key
+    finally:
+        for name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, name))
+        os.rmdir(work_dir)
+
+
+def _process_and_swap(photo_id: int, key: str) -> None:
+    started = time.perf_counter()
+    outcome, optimized_key, thumb_key = _build_variants(key)
+    PHOTO_COMPRESS_SECONDS.labels(outcome["result"]).observe(time.perf_counter() - started)
+    produced = [k for k in (optimized_key, thumb_key) if k]
+
+    db = SessionLocal()
+    try:
+        photo = db.query(MeterReadingPhoto).filter(MeterReadingPhoto.id == photo_id).with_for_update().first()
+        if not photo or photo.file_path != key:
+            # Фото успели заменить или удалить, пока шла обработка.
+            db.rollback()
+            delete_unreferenced(db, produced)
+            return
+        # Варианты писались без строки в БД: совпавший файл другого фото могли удалить как
+        # «без ссылок» — под lock убеждаемся, что файлы на месте, иначе остаёмся на оригинале.
+        lock_keys(db, produced)
+        if not keys_present(produced):
+            db.rollback()
+            print(f"[meter-photo] variants of photo {photo_id} vanished before swap, keeping original")
+            return
+        replaced = []
+        if thumb_key and photo.thumb_path != thumb_key:
+            replaced.append(photo.thumb_path)
+            photo.thumb_path = thumb_key
+        if optimized_key:
+            replaced.append(photo.file_path)
+            photo.file_path = optimized_key
+        db.commit()
+        delete_unreferenced(db, replaced)
+    except Exception as e:
+        db.rollback()
+        delete_unreferenced(db, produced)
+        print(f"[meter-photo] swap failed for photo {photo_id}: {e}")
+    finally:
+        db.close()
+
+
+def submit_photo_processing(photo_id: int, key: str) -> None:
+    """Ставит сжатие/превью в очередь. Вызывать после commit строки с оригиналом."""
+    submit_task(_process_and_swap, photo_id, key)
+
+
+# ---------------------------------------------------------------------------
+# Expired photo cleanup (scheduler job)
+# ---------------------------------------------------------------------------
+
+def _delete_expired_batch(db: Session, now: datetime, batch_size: int) -> tuple[list[str], int]:
+    """
+    Одна пачка: DELETE ... RETURNING ключей. SKIP LOCKED — не ждём строк, которые прямо сейчас
+    меняет загрузка или фоновая обработка; они попадут в следующий запуск.
+    """
+    ids = (
+        select(MeterReadingPhoto.id)
+        .where(MeterReadingPhoto.expires_at <= now)
+        .order_by(MeterReadingPhoto.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        delete(MeterReadingPhoto)
+        .where(MeterReadingPhoto.id.in_(ids))
+        .returning(MeterReadingPhoto.file_path, MeterReadingPhoto.thumb_path)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [key for row in rows for key in row if key], len(rows)
+
+
+def cleanup_expired_meter_photos(db: Session, batch_size: int = PHOTO_CLEANUP_BATCH) -> int:
+    """
+    Удаляет просроченные фото пачками по batch_size. Строки удаляются и коммитятся до файлов:
+    при падении посреди прогона останутся лишь файлы без строк, а повторный запуск
+    просто продолжит с оставшихся строк (отсутствующие файлы пропускаются).
+    Файлы удаляются в отдельном потоке, пока в БД удаляется следующая пачка.
+    """
+    now = datetime.utcnow()
+    photos = 0
+    files = 0
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="photo-cleanup") as unlinker:
+        pending = []
+        while True:
+            values, deleted = _delete_expired_batch(db, now, batch_size)
+            photos += deleted
+            if values:
+                # Файл с тем же содержимым может принадлежать другому (живому) фото — такие не трогаем;
+                # проверка ссылок и удаление — под lock ключей (storage.release_unreferenced).
+                pending.append(unlinker.submit(release_unreferenced, values))
+            if deleted < batch_size:
+                break
+        swept = unlinker.submit(get_storage().sweep_temp, _STALE_TEMP_SECONDS)
+        freed = 0
+        for future in pending:
+            removed, size = future.result()
+            files += removed
+            freed += size
+        freed += swept.result()
+
+    if photos or freed:
+        PHOTO_CLEANUP_BYTES.inc(freed)
+        print(f"[photo-cleanup] removed {photos} expired photos, {files} files, {freed / (1024 * 1024):.1f} MB")
+    return photos
+
+
+def count_expired_meter_photos(db: Session) -> int:
+    now = datetime.utcnow()
+    return db.query(func.count(MeterReadingPhoto.id)).filter(MeterReadingPhoto.expires_at <= now).scalar() or 0
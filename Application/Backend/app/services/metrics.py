@@ -0,0 +1,207 @@
+"""
+Метрики Prometheus (`GET /metrics`).
+
+Под gunicorn каждый воркер — отдельный процесс. Если задан PROMETHEUS_MULTIPROC_DIR,
+prometheus_client пишет значения в mmap-файлы этого каталога, а /metrics на любом
+воркере собирает их через MultiProcessCollector. Каталог нужно очищать перед стартом
+сервера; умершие воркеры помечаются в gunicorn.conf.py (child_exit).
+Без переменной окружения метрики — обычный in-process реестр (uvicorn, один процесс).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+import anyio.to_thread
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy.pool import QueuePool
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", multiprocess_mode="livesum"
+)
+
+# ---------------------------------------------------------------------------
+# SQLAlchemy pool / threadpool
+# ---------------------------------------------------------------------------
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections checked out of the SQLAlchemy pool", multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Overflow connections opened above pool_size", multiprocess_mode="livesum"
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+THREADPOOL_IN_USE = Gauge(
+    "threadpool_tokens_in_use", "Busy worker threads of the sync-endpoint threadpool", multiprocess_mode="livesum"
+)
+THREADPOOL_TOTAL = Gauge(
+    "threadpool_tokens_total", "Size of the sync-endpoint threadpool", multiprocess_mode="livesum"
+)
+
+# ---------------------------------------------------------------------------
+# Scheduler
+# ---------------------------------------------------------------------------
+
+JOB_LAG = Histogram(
+    "scheduler_job_lag_seconds",
+    "Delay between planned and actual job start",
+    ["job"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+JOB_DURATION = Histogram(
+    "scheduler_job_duration_seconds",
+    "Job run duration",
+    ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+JOB_RUNS = Counter("scheduler_job_runs_total", "Job runs by result", ["job", "result"])
+JOB_PROCESSED = Counter("scheduler_job_processed_total", "Objects processed by jobs", ["job"])
+JOB_BACKLOG = Gauge("scheduler_job_backlog", "Work waiting for the job", ["job"], multiprocess_mode="livemax")
+
+# ---------------------------------------------------------------------------
+# Push / uploads
+# ---------------------------------------------------------------------------
+
+PUSH_PENDING = Gauge(
+    "push_pending_tokens", "Device tokens queued in an in-flight FCM send", multiprocess_mode="livesum"
+)
+PUSH_MESSAGES = Counter("push_messages_total", "FCM per-token results", ["result"])
+FCM_ERRORS = Counter("fcm_errors_total", "FCM errors by error code", ["code"])
+NOTIFICATION_STREAMS = Gauge(
+    "notification_stream_clients", "Open SSE notification streams", multiprocess_mode="livesum"
+)
+CACHE_INVALIDATIONS = Counter(
+    "cache_invalidations_total", "In-process cache evictions by cache and source", ["cache", "source"]
+)
+
+UPLOAD_SIZE = Histogram(
+    "upload_size_bytes",
+    "Size of uploaded files",
+    ["kind"],
+    buckets=(16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 3e6, 5e6, 10e6, 20e6),
+)
+PHOTO_COMPRESS_SECONDS = Histogram(
+    "meter_photo_compress_seconds",
+    "Pillow compression time of meter photos",
+    ["result"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16),
+)
+PHOTO_CLEANUP_BYTES = Counter("meter_photo_cleanup_bytes_total", "Disk space reclaimed by expired photo cleanup")
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation helpers
+# ---------------------------------------------------------------------------
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который отдаёт в метрики время ожидания и занятость пула."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+            self._update_gauges()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        DB_POOL_CHECKED_OUT.set(self.checkedout())
+        DB_POOL_OVERFLOW.set(max(0, self.overflow()))
+
+
+def observe_job(name: str, lag: float, duration: float, ok: bool, processed: int, backlog: int | None) -> None:
+    JOB_LAG.labels(name).observe(max(0.0, lag))
+    JOB_DURATION.labels(name).observe(duration)
+    JOB_RUNS.labels(name, "ok" if ok else "error").inc()
+    if processed:
+        JOB_PROCESSED.labels(name).inc(processed)
+    if backlog is not None:
+        JOB_BACKLOG.labels(name).set(backlog)
+
+
+def _update_threadpool() -> None:
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except Exception:
+        return
+    THREADPOOL_IN_USE.set(limiter.borrowed_tokens)
+    THREADPOOL_TOTAL.set(limiter.total_tokens)
+
+
+def _route_label(scope) -> str:
+    # Шаблон пути, а не сам путь: /api/invoices/{invoice_id}, чтобы не плодить серии.
+    return getattr(scope.get("route"), "path", None) or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Латентность и статусы по маршрутам + загрузка threadpool."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        _update_threadpool()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            _update_threadpool()
+            method = scope.get("method", "")
+            route = _route_label(scope)
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,202 @@
+"""
+Лента новостей для жителей (`GET /api/news/public`) с кэшем готовых ответов в процессе.
+
+Виджет новостей грузится на каждом просмотре страниц кабинета. Раньше каждый запрос читал
+все активные новости (с joined created_by), разбирал JSON каждой и фильтровал блоки
+и limit уже в Python. Теперь фильтр блоков (`target_blocks ?| :blocks`, GIN-индекс),
+сортировка и LIMIT — в SQL, тело ответа собирается один раз на (набор блоков, limit)
+и отдаётся с сильным ETag.
+
+Ответ несёт все переводы (ru/az/en): кабинет переключает язык без повторного запроса,
+поэтому язык в ключ кэша не входит.
+
+Срок жизни записи: кроме NEWS_CACHE_TTL_SEC, запись живёт не дольше ближайшего
+момента, когда лента сама поменяется по времени (публикация отложенной новости или
+истечение expires_at). Изменения News сбрасывают кэш во всех воркерах (services/cache_bus.py).
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy import event, or_, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import News, User
+from .cache_bus import publish_invalidation, register_cache
+from .etag import strong_etag
+
+
+CACHE_NAME = "news"
+# Разных наборов блоков немного (по блокам жителя), но ключ приходит из query — ограничиваем.
+_MAX_ENTRIES = 256
+
+
+@dataclass(frozen=True)
+class NewsFeed:
+    body: bytes
+    etag: str
+    built_at: float
+    # naive UTC, как published_at/expires_at
+    valid_until: Optional[datetime]
+
+
+_feeds: "OrderedDict[tuple, NewsFeed]" = OrderedDict()
+_lock = threading.Lock()
+# Растёт при каждом сбросе: снимок, начатый до сброса, в кэш не кладётся.
+_generation = 0
+
+
+def normalize_blocks(blocks: Optional[str]) -> tuple[str, ...]:
+    """`A, B,A` → ("A", "B"): порядок и повторы в query не плодят записи кэша."""
+    if not blocks:
+        return ()
+    return tuple(sorted({b.strip() for b in blocks.split(",") if b.strip()}))
+
+
+def _loads(value) -> dict:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return {}
+    return value or {}
+
+
+def _active_filter(query, now: datetime):
+    return query.filter(
+        News.is_active.is_(True),
+        News.published_at <= now,
+        or_(News.expires_at.is_(None), News.expires_at > now),
+    )
+
+
+def _block_filter(query, block_names: tuple[str, ...]):
+    """Новости без target_blocks — всем; иначе хотя бы один блок из запроса (`?|`, GIN)."""
+    if not block_names:
+        return query
+    matches = text("news.target_blocks ?| CAST(:news_blocks AS text[])").bindparams(news_blocks=list(block_names))
+    return query.filter(or_(News.target_blocks.is_(None), matches))
+
+
+def _next_change(db: Session, now: datetime) -> Optional[datetime]:
+    """Ближайший момент, когда состав ленты поменяется без записи в news."""
+    next_publish = (
+        db.query(News.published_at)
+        .filter(News.is_active.is_(True), News.published_at > now)
+        .order_by(News.published_at.asc())
+        .limit(1)
+        .scalar()
+    )
+    next_expiry = (
+        db.query(News.expires_at)
+        .filter(News.is_active.is_(True), News.expires_at > now)
+        .order_by(News.expires_at.asc())
+        .limit(1)
+        .scalar()
+    )
+    moments = [m for m in (next_publish, next_expiry) if m is not None]
+    return min(moments) if moments else None
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _build(db: Session, block_names: tuple[str, ...], limit: int) -> NewsFeed:
+    now = datetime.utcnow()
+    query = db.query(
+        News.id,
+        News.title,
+        News.content,
+        News.icon,
+        News.icon_color,
+        News.is_active,
+        News.priority,
+        News.published_at,
+        News.expires_at,
+        News.created_at,
+        News.updated_at,
+        News.target_blocks,
+        User.full_name.label("created_by_name"),
+    ).outerjoin(User, User.id == News.created_by_id)
+    query = _block_filter(_active_filter(query, now), block_names)
+    rows = query.order_by(News.priority.desc(), News.published_at.desc()).limit(limit).all()
+
+    items = [
+        {
+            "id": r.id,
+            "title": _loads(r.title),
+            "content": _loads(r.content),
+            "icon": r.icon,
+            "icon_color": r.icon_color,
+            "is_active": r.is_active,
+            "priority": r.priority,
+            "published_at": _iso(r.published_at),
+            "expires_at": _iso(r.expires_at),
+            "created_at": _iso(r.created_at),
+            "updated_at": _iso(r.updated_at),
+            "created_by_name": r.created_by_name,
+            "target_blocks": r.target_blocks or None,
+        }
+        for r in rows
+    ]
+    body = json.dumps({"items": items, "total": len(items)}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return NewsFeed(
+        body=body,
+        etag=strong_etag(body),
+        built_at=time.monotonic(),
+        valid_until=_next_change(db, now),
+    )
+
+
+def _fresh(feed: NewsFeed) -> bool:
+    if time.monotonic() - feed.built_at >= settings.NEWS_CACHE_TTL_SEC:
+        return False
+    return feed.valid_until is None or datetime.utcnow() < feed.valid_until
+
+
+def get_public_feed(db: Session, block_names: Iterable[str], limit: int) -> NewsFeed:
+    key = (tuple(block_names), limit)
+    with _lock:
+        feed = _feeds.get(key)
+        if feed is not None and _fresh(feed):
+            _feeds.move_to_end(key)
+            return feed
+        generation = _generation
+    # Строим вне блокировки: одновременный промах по тому же ключу просто построит дважды.
+    feed = _build(db, key[0], limit)
+    with _lock:
+        if generation != _generation:
+            return feed
+        _feeds[key] = feed
+        _feeds.move_to_end(key)
+        while len(_feeds) > _MAX_ENTRIES:
+            _feeds.popitem(last=False)
+    return feed
+
+
+def invalidate_news_feed() -> None:
+    global _generation
+    with _lock:
+        _generation += 1
+        _feeds.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_change(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, News):
+            invalidate_news_feed()
+            publish_invalidation(session, CACHE_NAME)
+            return
+
+
+register_cache(CACHE_NAME, lambda key: invalidate_news_feed())
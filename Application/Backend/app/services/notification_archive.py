@@ -0,0 +1,139 @@
+"""
+Архивация уведомлений: notifications хранит только «живые» записи.
+
+Прочитанные уведомления старше срока своего типа задача notification-archive переносит
+в notifications_archive пачками (`DELETE … RETURNING` → `INSERT … ON CONFLICT DO UPDATE`,
+одна транзакция на пачку).
+Непрочитанные не трогаются никогда, поэтому счётчики непрочитанных не меняются.
+
+Сроки (в месяцах) — NOTIFICATION_RETENTION_MONTHS (`TYPE=N,...`), для остальных типов —
+NOTIFICATION_ARCHIVE_AFTER_MONTHS; 0 — тип не архивируется. Уведомления без типа —
+старые обращения, для них действует срок APPEAL.
+
+Списки и карточка читают архив только по запросу (`?archived=true`);
+карточка по id, не найденная в notifications, ищется в архиве по первичному ключу.
+
+Проверки «уже уведомляли» (по user_id + notification_type + related_id) смотрят в обе таблицы —
+`notified_user_ids`: иначе после архивации прочитанного уведомления оно создалось бы заново.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import select, text, union
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Notification, NotificationArchive
+
+
+NOTIFICATION_ARCHIVE_BATCH = 1000
+# Тип, срок которого действует для уведомлений без notification_type
+LEGACY_TYPE = "APPEAL"
+
+_COLUMNS = (
+    "id, user_id, resident_id, message, status, notification_type, related_id, "
+    "created_at, read_at, appeal_workflow, staff_message, workflow_updated_at"
+)
+
+# Запись с тем же id в архиве (повторная архивация после восстановления) заменяется живой:
+# удалённая из notifications строка не должна пропасть.
+_ARCHIVE_UPDATE = ", ".join(
+    f"{col} = EXCLUDED.{col}" for col in (c.strip() for c in _COLUMNS.split(",")) if col != "id"
+)
+
+_TYPE_EXPR = f"COALESCE(notification_type, '{LEGACY_TYPE}')"
+
+# Число перенесённых берётся из DELETE (moved): строка, удалённая из notifications,
+# всегда оказывается в архиве — вставкой или заменой записи с тем же id.
+_MOVE_SQL = f"""
+WITH moved AS (
+  DELETE FROM notifications
+  WHERE id IN (
+    SELECT id FROM notifications
+    WHERE status = 'READ'
+      AND created_at < NOW() - make_interval(months => :months)
+      AND {{type_filter}}
+    ORDER BY id
+    LIMIT :batch
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING {_COLUMNS}
+), archived AS (
+  INSERT INTO notifications_archive ({_COLUMNS}, archived_at)
+  SELECT {_COLUMNS}, NOW() FROM moved
+  ON CONFLICT (id) DO UPDATE SET {_ARCHIVE_UPDATE}, archived_at = EXCLUDED.archived_at
+)
+SELECT COUNT(*) FROM moved
+"""
+
+_COUNT_SQL = """
+SELECT COUNT(*) FROM notifications
+WHERE status = 'READ'
+  AND created_at < NOW() - make_interval(months => :months)
+  AND {type_filter}
+"""
+
+
+def retention_policy() -> tuple[dict[str, int], int]:
+    """(срок по типам, срок по умолчанию) из настроек; битые записи пропускаются."""
+    per_type: dict[str, int] = {}
+    for item in (settings.NOTIFICATION_RETENTION_MONTHS or "").split(","):
+        name, _, months = item.partition("=")
+        name = name.strip().upper()
+        if not name:
+            continue
+        try:
+            per_type[name] = max(0, int(months.strip()))
+        except ValueError:
+            print(f"[notification-archive] bad retention entry: {item!r}")
+    return per_type, max(0, settings.NOTIFICATION_ARCHIVE_AFTER_MONTHS)
+
+
+def _policy_groups() -> list[tuple[str, dict, int]]:
+    """(фильтр по типу, параметры, срок) для каждой архивируемой группы типов."""
+    per_type, default_months = retention_policy()
+    groups = [
+        (f"{_TYPE_EXPR} = :type_name", {"type_name": name}, months)
+        for name, months in sorted(per_type.items())
+        if months > 0
+    ]
+    if default_months > 0:
+        groups.append((f"NOT ({_TYPE_EXPR} = ANY(:explicit_types))", {"explicit_types": sorted(per_type)}, default_months))
+    return groups
+
+
+def archive_notifications(db: Session, batch_size: int = NOTIFICATION_ARCHIVE_BATCH) -> int:
+    """Переносит просроченные прочитанные уведомления в архив. Возвращает число перенесённых."""
+    moved_total = 0
+    for type_filter, params, months in _policy_groups():
+        sql = text(_MOVE_SQL.format(type_filter=type_filter))
+        while True:
+            moved = int(db.execute(sql, {**params, "months": months, "batch": batch_size}).scalar() or 0)
+            db.commit()
+            moved_total += moved
+            if moved < batch_size:
+                break
+    if moved_total:
+        print(f"[notification-archive] moved={moved_total}")
+    return moved_total
+
+
+def notified_user_ids(db: Session, notification_type: str, related_id: int) -> set[int]:
+    """Пользователи, у которых уже есть уведомление этого типа по related_id — живое или в архиве."""
+    query = union(
+        select(Notification.user_id).where(
+            Notification.notification_type == notification_type, Notification.related_id == related_id
+        ),
+        select(NotificationArchive.user_id).where(
+            NotificationArchive.notification_type == notification_type, NotificationArchive.related_id == related_id
+        ),
+    )
+    return set(db.execute(query).scalars())
+
+
+def count_archivable_notifications(db: Session) -> int:
+    total = 0
+    for type_filter, params, months in _policy_groups():
+        sql = text(_COUNT_SQL.format(type_filter=type_filter))
+        total += int(db.execute(sql, {**params, "months": months}).scalar() or 0)
+    return total
@@ -0,0 +1,192 @@
+"""
+Счётчики непрочитанных уведомлений.
+
+Бейджи админки и кабинета жителя раньше на каждый опрос делали COUNT(*) по notifications
+с OR по типам. Теперь число хранится в notification_unread_counters и ведётся триггером
+на notifications: вставка, смена статуса/типа/адресата и удаление (включая каскад от users)
+сдвигают нужные счётчики в той же транзакции. Кто бы ни писал уведомления — роутеры,
+планировщик, сырой SQL — счётчики сходятся сами.
+
+Области (scope, user_id) повторяют прежние фильтры:
+- ('admin', 0)   — APPEAL, TARIFF_EXPIRED и старые уведомления без типа;
+- ('admin', id)  — персональные админские (CONTRACT_*), видит только адресат;
+- ('user', id)   — кабинет жителя: всё с типом, кроме APPEAL.
+
+Каждое изменение счётчика публикуется через pg_notify в канал NOTIFY_CHANNEL: новое значение
+и, для вставки, краткое содержание уведомления. Его слушает services/notification_stream.py.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import NotificationUnreadCounter
+
+
+ADMIN_NOTIFICATION_TYPES = {"APPEAL", "TARIFF_EXPIRED"}
+# Персональные админ-уведомления: доставляются конкретному user_id
+# (видны только адресату, независимо от его роли).
+ADMIN_PERSONAL_NOTIFICATION_TYPES = {"CONTRACT_APPROVAL", "CONTRACT_DECISION"}
+
+SCOPE_ADMIN = "admin"
+SCOPE_USER = "user"
+
+NOTIFY_CHANNEL = "notification_counts"
+# Сколько символов сообщения уходит в push-сводку (лимит payload pg_notify — 8000 байт)
+SUMMARY_MESSAGE_CHARS = 200
+
+_TRIGGER_NAME = "trg_notifications_unread_counters"
+
+
+def _sql_list(values: set[str]) -> str:
+    return ", ".join(f"'{v}'" for v in sorted(values))
+
+
+def _scope_keys_sql(type_expr: str, user_expr: str) -> str:
+    """VALUES (scope, user_id, hit): в какие счётчики попадает уведомление с таким типом и адресатом."""
+    return f"""(VALUES
+          ('{SCOPE_ADMIN}', 0, {type_expr} IS NULL OR {type_expr} IN ({_sql_list(ADMIN_NOTIFICATION_TYPES)})),
+          ('{SCOPE_ADMIN}', {user_expr}, {type_expr} IN ({_sql_list(ADMIN_PERSONAL_NOTIFICATION_TYPES)})),
+          ('{SCOPE_USER}', {user_expr}, {type_expr} IS NOT NULL AND {type_expr} <> 'APPEAL')
+        )"""
+
+
+_REBUILD_SQL = f"""
+        INSERT INTO notification_unread_counters (scope, user_id, unread)
+        SELECT k.scope, k.user_id, COUNT(*)
+        FROM notifications n
+        CROSS JOIN LATERAL {_scope_keys_sql("n.notification_type", "n.user_id")} AS k(scope, user_id, hit)
+        WHERE n.status = 'UNREAD' AND k.hit
+        GROUP BY k.scope, k.user_id
+"""
+
+
+def notification_counter_ddl() -> list[str]:
+    """
+    DDL для run_bootstrap_schema: функции и триггер. Таблица создаётся по модели.
+    Первичное наполнение — только когда триггера ещё нет (первый старт после обновления);
+    запись в notifications на это время блокируется, чтобы ни одно изменение не потерялось.
+    """
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION notification_counters_bump(
+          n_type TEXT, n_user INTEGER, delta INTEGER, summary JSON
+        ) RETURNS VOID AS $$
+        DECLARE
+          key_scope TEXT;
+          key_user INTEGER;
+          new_unread INTEGER;
+        BEGIN
+          FOR key_scope, key_user IN
+            SELECT k.scope, k.user_id FROM {_scope_keys_sql("n_type", "n_user")} AS k(scope, user_id, hit)
+            WHERE k.hit
+          LOOP
+            INSERT INTO notification_unread_counters AS c (scope, user_id, unread)
+            VALUES (key_scope, key_user, GREATEST(delta, 0))
+            ON CONFLICT (scope, user_id) DO UPDATE SET unread = GREATEST(c.unread + delta, 0)
+            RETURNING c.unread INTO new_unread;
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object(
+              'scope', key_scope, 'user_id', key_user, 'unread', new_unread, 'notification', summary
+            )::text);
+          END LOOP;
+        END $$ LANGUAGE plpgsql;
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION notifications_unread_counters_trg() RETURNS TRIGGER AS $$
+        DECLARE
+          summary JSON;
+        BEGIN
+          IF TG_OP = 'UPDATE' THEN
+            IF OLD.status IS NOT DISTINCT FROM NEW.status
+               AND OLD.notification_type IS NOT DISTINCT FROM NEW.notification_type
+               AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id THEN
+              RETURN NULL;
+            END IF;
+          END IF;
+          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF OLD.status = 'UNREAD' THEN
+              PERFORM notification_counters_bump(OLD.notification_type, OLD.user_id, -1, NULL);
+            END IF;
+          END IF;
+          IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF NEW.status = 'UNREAD' THEN
+              IF TG_OP = 'INSERT' THEN
+                summary := json_build_object(
+                  'id', NEW.id,
+                  'notification_type', NEW.notification_type,
+                  'related_id', NEW.related_id,
+                  'resident_id', NEW.resident_id,
+                  'message', left(NEW.message, {SUMMARY_MESSAGE_CHARS}),
+                  'created_at', NEW.created_at
+                );
+              END IF;
+              PERFORM notification_counters_bump(NEW.notification_type, NEW.user_id, 1, summary);
+            END IF;
+          END IF;
+          RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        """,
+        f"""
+        DO $$
+        BEGIN
+          IF NOT EXISTS (
+            SELECT 1 FROM pg_trigger
+            WHERE tgname = '{_TRIGGER_NAME}' AND tgrelid = 'notifications'::regclass
+          ) THEN
+            LOCK TABLE notifications IN SHARE ROW EXCLUSIVE MODE;
+            DELETE FROM notification_unread_counters;
+            {_REBUILD_SQL.strip()};
+            CREATE TRIGGER {_TRIGGER_NAME}
+              AFTER INSERT OR UPDATE OF status, notification_type, user_id OR DELETE ON notifications
+              FOR EACH ROW EXECUTE FUNCTION notifications_unread_counters_trg();
+          END IF;
+        END $$;
+        """,
+    ]
+
+
+def rebuild_unread_counters(db: Session) -> None:
+    """Пересчитывает все счётчики с нуля (ручной ремонт; в обычной работе не нужен)."""
+    conn = db.connection()
+    conn.exec_driver_sql("LOCK TABLE notifications IN SHARE ROW EXCLUSIVE MODE")
+    conn.exec_driver_sql("DELETE FROM notification_unread_counters")
+    conn.exec_driver_sql(_REBUILD_SQL)
+    db.commit()
+
+
+def _sum_counters(db: Session, scope: str, user_ids: list[int]) -> int:
+    return int(
+        db.query(func.coalesce(func.sum(NotificationUnreadCounter.unread), 0))
+        .filter(
+            NotificationUnreadCounter.scope == scope,
+            NotificationUnreadCounter.user_id.in_(user_ids),
+        )
+        .scalar()
+        or 0
+    )
+
+
+def read_counters(db: Session, keys) -> dict[tuple[str, int], int]:
+    """Значения счётчиков по ключам (scope, user_id); отсутствующие — 0."""
+    result = {(str(scope), int(user_id)): 0 for scope, user_id in keys}
+    for scope in {scope for scope, _ in result}:
+        user_ids = [user_id for key_scope, user_id in result if key_scope == scope]
+        for user_id, unread in db.query(NotificationUnreadCounter.user_id, NotificationUnreadCounter.unread).filter(
+            NotificationUnreadCounter.scope == scope,
+            NotificationUnreadCounter.user_id.in_(user_ids),
+        ):
+            result[(scope, int(user_id))] = int(unread or 0)
+    return result
+
+
+def admin_unread_count(db: Session, user_id: Optional[int]) -> int:
+    """Бейдж админки: общие админ-уведомления + персональные текущего пользователя."""
+    return _sum_counters(db, SCOPE_ADMIN, [0, user_id] if user_id else [0])
+
+
+def user_unread_count(db: Session, user_id: int) -> int:
+    """Бейдж кабинета жителя."""
+    return _sum_counters(db, SCOPE_USER, [user_id])
@@ -0,0 +1,113 @@
+"""
+Доставка изменений счётчиков уведомлений в SSE-потоки (`GET /api/notifications/stream`).
+
+Триггер notifications (services/notification_counters.py) делает pg_notify на каждое
+изменение счётчика. В каждом воркере слушатель канала `notification_counts` раздаёт
+события подписчикам — открытым SSE-потокам этого воркера — через их asyncio-очереди.
+Так событие, записанное любым воркером или планировщиком, приходит во все потоки
+всех воркеров, а сами потоки в БД не ходят.
+
+Соединение — общий LISTEN-поток воркера (services/pg_listen.py). После каждого его
+подключения рассылается RESYNC: пропущенные события не восстановить, поэтому потоки
+перечитывают счётчики.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from dataclasses import dataclass, field
+
+from . import metrics, pg_listen
+from .notification_counters import NOTIFY_CHANNEL, SCOPE_ADMIN, SCOPE_USER
+
+
+# Событие «перечитай счётчики»: слушатель переподключился и мог что-то пропустить.
+RESYNC = {"resync": True}
+
+_QUEUE_MAXSIZE = 256
+
+
+@dataclass(eq=False)
+class Subscriber:
+    """Один SSE-поток: какие счётчики ему интересны и куда класть события."""
+
+    keys: frozenset[tuple[str, int]]
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=_QUEUE_MAXSIZE))
+
+    def push(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: следующее событие всё равно несёт актуальное число.
+            pass
+
+
+def stream_keys(scope: str, user_id: int) -> frozenset[tuple[str, int]]:
+    """Счётчики, из которых складывается бейдж: админке — общий + персональный, жителю — свой."""
+    if scope == SCOPE_ADMIN:
+        return frozenset({(SCOPE_ADMIN, 0), (SCOPE_ADMIN, int(user_id))})
+    return frozenset({(SCOPE_USER, int(user_id))})
+
+
+_subscribers: set[Subscriber] = set()
+_lock = threading.Lock()
+
+
+def subscribe(keys: frozenset[tuple[str, int]]) -> Subscriber:
+    """Регистрирует поток (вызывать из event loop) и при необходимости запускает слушателя."""
+    sub = Subscriber(keys=keys, loop=asyncio.get_running_loop())
+    with _lock:
+        _subscribers.add(sub)
+    metrics.NOTIFICATION_STREAMS.inc()
+    pg_listen.start_listener()
+    return sub
+
+
+def unsubscribe(sub: Subscriber) -> None:
+    with _lock:
+        if sub not in _subscribers:
+            return
+        _subscribers.discard(sub)
+    metrics.NOTIFICATION_STREAMS.dec()
+
+
+def subscriber_count() -> int:
+    with _lock:
+        return len(_subscribers)
+
+
+def _deliver(sub: Subscriber, event: dict) -> None:
+    try:
+        sub.loop.call_soon_threadsafe(sub.push, event)
+    except RuntimeError:
+        # event loop воркера уже закрыт (shutdown)
+        pass
+
+
+def _dispatch(payload: str) -> None:
+    try:
+        data = json.loads(payload)
+        key = (str(data["scope"]), int(data["user_id"]))
+    except Exception:
+        print(f"[notification-stream] bad payload: {payload[:200]!r}")
+        return
+    with _lock:
+        targets = [sub for sub in _subscribers if key in sub.keys]
+    event = {"key": key, "unread": int(data.get("unread") or 0), "notification": data.get("notification")}
+    for sub in targets:
+        _deliver(sub, event)
+
+
+def _broadcast_resync() -> None:
+    with _lock:
+        targets = list(_subscribers)
+    for sub in targets:
+        _deliver(sub, RESYNC)
+
+
+pg_listen.add_channel_handler(NOTIFY_CHANNEL, _dispatch)
+# И после первого подключения: поток мог прочитать счётчики до LISTEN.
+pg_listen.add_reconnect_handler(_broadcast_resync)
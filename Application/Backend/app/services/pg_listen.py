@@ -0,0 +1,142 @@
+"""
+Один LISTEN-поток на воркер для всех каналов PostgreSQL NOTIFY.
+
+Подписчики регистрируют обработчик канала (`add_channel_handler`) и, при необходимости,
+колбэк переподключения (`add_reconnect_handler`). Поток держит выделенное соединение
+(не из пула SQLAlchemy, autocommit), слушает все зарегистрированные каналы и вызывает
+обработчики в своём потоке — обработчик должен быть быстрым и потокобезопасным.
+
+Обрыв соединения: переподключение с паузой 1→30 с. После каждого подключения (и первого
+тоже — до LISTEN уведомления не приходили) вызываются колбэки переподключения:
+пропущенные события не восстановить, поэтому подписчики сбрасывают или перечитывают своё состояние.
+
+Каналы сейчас: notification_counts (services/notification_stream.py),
+cache_invalidation (services/cache_bus.py).
+"""
+
+from __future__ import annotations
+
+import select
+import threading
+from typing import Callable, Optional
+
+import psycopg2
+
+from ..database import DATABASE_URL
+
+
+_POLL_TIMEOUT_SEC = 5
+_RECONNECT_MIN_SEC = 1
+_RECONNECT_MAX_SEC = 30
+
+_handlers: dict[str, list[Callable[[str], None]]] = {}
+_reconnect_handlers: list[Callable[[], None]] = []
+_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_stop_event = threading.Event()
+_connected = False
+
+
+def add_channel_handler(channel: str, handler: Callable[[str], None]) -> None:
+    """handler(payload) вызывается на каждое NOTIFY канала. Имя канала — идентификатор SQL."""
+    with _lock:
+        _handlers.setdefault(channel, []).append(handler)
+
+
+def add_reconnect_handler(handler: Callable[[], None]) -> None:
+    with _lock:
+        _reconnect_handlers.append(handler)
+
+
+def is_connected() -> bool:
+    return _connected
+
+
+def _call(handler: Callable, *args) -> None:
+    try:
+        handler(*args)
+    except Exception as exc:
+        print(f"[pg-listen] handler {getattr(handler, '__qualname__', handler)} failed: {exc}")
+
+
+def _listen_new_channels(conn, listening: set[str]) -> None:
+    with _lock:
+        channels = [ch for ch in _handlers if ch not in listening]
+    if not channels:
+        return
+    with conn.cursor() as cur:
+        for channel in channels:
+            cur.execute(f"LISTEN {channel}")
+            listening.add(channel)
+
+
+def _dispatch(notify) -> None:
+    with _lock:
+        handlers = list(_handlers.get(notify.channel, ()))
+    for handler in handlers:
+        _call(handler, notify.payload)
+
+
+def _listen_forever() -> None:
+    global _connected
+    backoff = _RECONNECT_MIN_SEC
+    while not _stop_event.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL, application_name="pg-listen")
+            conn.autocommit = True
+            listening: set[str] = set()
+            _listen_new_channels(conn, listening)
+            _connected = True
+            backoff = _RECONNECT_MIN_SEC
+            with _lock:
+                reconnect_handlers = list(_reconnect_handlers)
+            for handler in reconnect_handlers:
+                _call(handler)
+
+            while not _stop_event.is_set():
+                ready, _, _ = select.select([conn], [], [], _POLL_TIMEOUT_SEC)
+                conn.poll()
+                while conn.notifies:
+                    _dispatch(conn.notifies.pop(0))
+                # Канал, зарегистрированный после старта потока
+                _listen_new_channels(conn, listening)
+                if not ready:
+                    # Тишина: пингуем, чтобы полуоткрытое соединение не висело незамеченным.
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+        except Exception as exc:
+            if _stop_event.is_set():
+                break
+            print(f"[pg-listen] connection lost: {exc}; retry in {backoff}s")
+        finally:
+            _connected = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        if _stop_event.wait(backoff):
+            break
+        backoff = min(backoff * 2, _RECONNECT_MAX_SEC)
+
+
+def start_listener() -> None:
+    """Запускает поток (повторный вызов ничего не делает)."""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _stop_event.clear()
+        _thread = threading.Thread(target=_listen_forever, name="pg-listen", daemon=True)
+        _thread.start()
+
+
+def stop_listener(timeout: Optional[float] = _POLL_TIMEOUT_SEC + 1) -> None:
+    """Останавливает поток (shutdown воркера); соединение закрывает сам поток."""
+    global _thread
+    _stop_event.set()
+    thread = _thread
+    if thread is not None:
+        thread.join(timeout=timeout)
+    _thread = None
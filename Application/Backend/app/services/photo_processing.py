@@ -0,0 +1,130 @@
+"""
+Обработка изображений: сжатие и превью фото счётчиков, варианты аватаров.
+
+Функции выполняются в дочерних процессах (см. services/image_workers.py), поэтому модуль
+не импортирует приложение — только Pillow — и работает с путями, а не с байтами:
+между процессами передаются строки, а не мегабайты изображения.
+"""
+
+from __future__ import annotations
+
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+def _encode_jpeg(img: Image.Image, quality: int) -> bytes:
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def _bisect_quality(img: Image.Image, target_bytes: int, q_min: int, q_max: int) -> bytes:
+    """
+    Наибольшее качество в [q_min, q_max], при котором JPEG укладывается в target_bytes.
+    Размер монотонно растёт с качеством, поэтому хватает ~log2(q_max - q_min) кодирований.
+    Если не укладывается даже q_min — возвращается самый маленький вариант.
+    """
+    lo, hi = q_min, q_max
+    best: bytes | None = None
+    smallest: bytes | None = None
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        candidate = _encode_jpeg(img, quality)
+        if smallest is None or len(candidate) < len(smallest):
+            smallest = candidate
+        if len(candidate) <= target_bytes:
+            best = candidate
+            lo = quality + 1
+        else:
+            hi = quality - 1
+    return best if best is not None else smallest
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
+def optimize_photo(
+    src_path: str,
+    optimized_path: str,
+    thumb_path: str,
+    compress_threshold: int,
+    target_bytes: int,
+    quality_min: int,
+    quality_max: int,
+    thumb_side: int,
+) -> dict:
+    """
+    Готовит варианты исходного фото:
+    - optimized_path — JPEG под target_bytes, только если исходник больше compress_threshold
+      и сжатие действительно уменьшило файл;
+    - thumb_path — превью для списков (длинная сторона thumb_side).
+
+    Возвращает {"result": compressed|unchanged|error, "optimized": bool, "thumb": bool}.
+    """
+    try:
+        src_size = os.path.getsize(src_path)
+        with Image.open(src_path) as img:
+            normalized = ImageOps.exif_transpose(img)
+            if normalized.mode != "RGB":
+                normalized = normalized.convert("RGB")
+
+            optimized = False
+            result = "unchanged"
+            if src_size > compress_threshold:
+                candidate = _bisect_quality(normalized, target_bytes, quality_min, quality_max)
+                if candidate and len(candidate) < src_size:
+                    _write_atomic(optimized_path, candidate)
+                    optimized = True
+                    result = "compressed"
+
+            thumb = normalized.copy()
+            thumb.thumbnail((thumb_side, thumb_side))
+            _write_atomic(thumb_path, _encode_jpeg(thumb, 75))
+        return {"result": result, "optimized": optimized, "thumb": True}
+    except (UnidentifiedImageError, OSError, ValueError):
+        return {"result": "error", "optimized": False, "thumb": False}
+
+
+_AVATAR_FORMATS = (
+    (".webp", {"format": "WEBP", "method": 6}),
+    (".jpg", {"format": "JPEG", "optimize": True, "progressive": True}),
+)
+
+
+def build_avatar_variants(src_path: str, out_dir: str, sizes: list[int], quality: int) -> dict:
+    """
+    Квадратные варианты аватара: для каждого размера WebP и JPEG (`<size>.webp`, `<size>.jpg`
+    в out_dir). Исходник декодируется один раз; EXIF (в том числе геометка камеры) и ICC
+    в варианты не переносятся — Pillow сохраняет метаданные только если их передать явно.
+
+    Возвращает {"result": ok|error, "files": [имена файлов]}.
+    """
+    try:
+        with Image.open(src_path) as img:
+            normalized = ImageOps.exif_transpose(img)
+            if normalized.mode in ("RGBA", "LA", "P"):
+                # Прозрачный фон -> белый: JPEG без альфы, а WebP пусть выглядит так же.
+                rgba = normalized.convert("RGBA")
+                normalized = Image.new("RGB", rgba.size, (255, 255, 255))
+                normalized.paste(rgba, mask=rgba.getchannel("A"))
+            elif normalized.mode != "RGB":
+                normalized = normalized.convert("RGB")
+
+            files = []
+            for size in sorted(sizes, reverse=True):
+                square = ImageOps.fit(normalized, (size, size), method=Image.Resampling.LANCZOS)
+                for ext, options in _AVATAR_FORMATS:
+                    out = BytesIO()
+                    square.save(out, quality=quality, **options)
+                    name = f"{size}{ext}"
+                    _write_atomic(os.path.join(out_dir, name), out.getvalue())
+                    files.append(name)
+        return {"result": "ok", "files": files}
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return {"result": "error", "files": []}
@@ -10,6 +10,7 @@ from sqlalchemy.orm import Session
 
 from ..config import settings
 from ..models import PushDeviceToken
+from .metrics import FCM_ERRORS, PUSH_MESSAGES, PUSH_PENDING
 
 try:
     import firebase_admin
@@ -216,6 +217,8 @@ def send_push_to_users(
         return
 
     now = _now_utc()
+    pending = len(tokens)
+    PUSH_PENDING.inc(pending)
     try:
         chunk_size = 500
         for i in range(0, len(tokens), chunk_size):
@@ -231,12 +234,17 @@ def send_push_to_users(
                 ),
             )
             response = messaging.send_each_for_multicast(message)
+            PUSH_PENDING.dec(len(batch_tokens))
+            pending -= len(batch_tokens)
             bad_tokens: list[str] = []
             for idx, res in enumerate(response.responses):
                 token_value = batch_tokens[idx]
                 if res.success:
+                    PUSH_MESSAGES.labels("success").inc()
                     continue
                 err_code = getattr(getattr(res, "exception", None), "code", "") or ""
+                PUSH_MESSAGES.labels("failure").inc()
+                FCM_ERRORS.labels(err_code or "unknown").inc()
                 if err_code in {"registration-token-not-registered", "invalid-argument"}:
                     bad_tokens.append(token_value)
             if bad_tokens:
@@ -247,5 +255,9 @@ def send_push_to_users(
             row.updated_at = now
         db.commit()
     except Exception as exc:
+        FCM_ERRORS.labels("exception").inc()
         print(f"FCM send failed: {exc}")
+    finally:
+        # Токены, до которых не дошли из-за исключения, тоже снимаем с учёта
+        PUSH_PENDING.dec(pending)
 
@@ -0,0 +1,195 @@
+"""
+Справочные данные (блоки, резиденты, тарифы со ступенями, типы счётчиков) с кэшем в процессе.
+
+Раньше каждый запрос списков (счета, жители, показания) заново грузил все блоки и резидентов
+ORM-объектами с joined-связями и отдавал их в каждом ответе. Теперь снимок строится
+лёгкими запросами по колонкам и живёт REFERENCE_CACHE_TTL_SEC; изменения Block/Resident/
+Tariff/TariffStep сбрасывают его сразу (хук на flush сессии) и через шину инвалидации
+(services/cache_bus.py) — во всех воркерах после commit.
+
+Фронтенд берёт справочники одним запросом `GET /api/reference`: тело сериализуется один раз
+при построении снимка, ETag — хеш тела, повторные запросы получают 304.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Block, MeterType, Resident, Tariff, TariffStep
+from .cache_bus import publish_invalidation, register_cache
+from .etag import strong_etag
+
+
+METER_DISPLAY = {
+    MeterType.ELECTRIC: ("Электричество", "кВт·ч"),
+    MeterType.GAS: ("Газ", "м³"),
+    MeterType.WATER: ("Вода", "м³"),
+    MeterType.SEWERAGE: ("Канализация", "м³"),
+    MeterType.SERVICE: ("Сервис", "мес."),
+    MeterType.RENT: ("Аренда", "мес."),
+    MeterType.CONSTRUCTION: ("Строительство", "мес."),
+}
+
+_INVALIDATING_MODELS = (Block, Resident, Tariff, TariffStep)
+CACHE_NAME = "reference"
+
+
+@dataclass(frozen=True)
+class ResidentRef:
+    id: int
+    block_id: int
+    block_name: str
+    unit_number: str
+
+
+@dataclass(frozen=True)
+class ReferenceSnapshot:
+    blocks: tuple[dict, ...]
+    residents: tuple[ResidentRef, ...]
+    built_at: float
+    # готовый ответ GET /api/reference
+    body: bytes
+    etag: str
+
+
+_snapshot: Optional[ReferenceSnapshot] = None
+_lock = threading.Lock()
+
+
+def _num(x) -> Optional[float]:
+    return float(x) if x is not None else None
+
+
+def _build_tariffs(db: Session) -> list[dict]:
+    steps_by_tariff: dict[int, list[dict]] = defaultdict(list)
+    for s in db.query(
+        TariffStep.id,
+        TariffStep.tariff_id,
+        TariffStep.from_value,
+        TariffStep.to_value,
+        TariffStep.from_date,
+        TariffStep.to_date,
+        TariffStep.price,
+    ).order_by(TariffStep.tariff_id, TariffStep.id):
+        steps_by_tariff[s.tariff_id].append({
+            "id": s.id,
+            "from_value": _num(s.from_value),
+            "to_value": _num(s.to_value),
+            "from_date": s.from_date.isoformat() if s.from_date else None,
+            "to_date": s.to_date.isoformat() if s.to_date else None,
+            "price": float(s.price),
+        })
+    return [
+        {
+            "id": t.id,
+            "name": t.name,
+            "meter_type": t.meter_type.value,
+            "customer_type": t.customer_type.value,
+            "vat_percent": t.vat_percent,
+            "use_multiplier": bool(t.use_multiplier),
+            "consumption_multiplier": float(t.consumption_multiplier or 1),
+            "stable_tariff": float(t.stable_tariff or 0),
+            "sewerage_percent": float(t.sewerage_percent or 0),
+            "is_active": bool(t.is_active),
+            "steps": steps_by_tariff.get(t.id, []),
+        }
+        for t in db.query(
+            Tariff.id,
+            Tariff.name,
+            Tariff.meter_type,
+            Tariff.customer_type,
+            Tariff.vat_percent,
+            Tariff.use_multiplier,
+            Tariff.consumption_multiplier,
+            Tariff.stable_tariff,
+            Tariff.sewerage_percent,
+            Tariff.is_active,
+        ).order_by(Tariff.meter_type, Tariff.name)
+    ]
+
+
+def _build(db: Session) -> ReferenceSnapshot:
+    blocks = db.query(Block.id, Block.name).order_by(Block.name.asc()).all()
+    block_names = {b.id: b.name for b in blocks}
+    rows = (
+        db.query(
+            Resident.id,
+            Resident.block_id,
+            Resident.unit_number,
+        )
+        .order_by(Resident.unit_number.asc())
+        .all()
+    )
+    residents = tuple(
+        ResidentRef(
+            id=r.id,
+            block_id=r.block_id,
+            block_name=block_names.get(r.block_id, ""),
+            unit_number=r.unit_number,
+        )
+        for r in rows
+    )
+    block_dicts = tuple({"id": b.id, "name": b.name} for b in blocks)
+
+    data = {
+        "blocks": block_dicts,
+        "residents": [
+            {"id": r.id, "block_id": r.block_id, "block_name": r.block_name, "unit_number": r.unit_number}
+            for r in residents
+        ],
+        "tariffs": _build_tariffs(db),
+        "meter_types": [
+            {"value": mt.value, "name": name, "unit": unit} for mt, (name, unit) in METER_DISPLAY.items()
+        ],
+    }
+    content = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = strong_etag(content)
+    # version — тот же хеш, чтобы клиент мог сравнить снимки без заголовков
+    body = b'{"version":' + json.dumps(etag.strip('"')).encode() + b"," + content[1:]
+    return ReferenceSnapshot(
+        blocks=block_dicts,
+        residents=residents,
+        built_at=time.monotonic(),
+        body=body,
+        etag=etag,
+    )
+
+
+def get_reference_snapshot(db: Session) -> ReferenceSnapshot:
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.built_at < settings.REFERENCE_CACHE_TTL_SEC:
+        return snapshot
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or time.monotonic() - snapshot.built_at >= settings.REFERENCE_CACHE_TTL_SEC:
+            snapshot = _snapshot = _build(db)
+    return snapshot
+
+
+def invalidate_reference_data() -> None:
+    global _snapshot
+    _snapshot = None
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_change(session: Session, flush_context) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _INVALIDATING_MODELS):
+            invalidate_reference_data()
+            # Между flush и commit другой запрос мог пересобрать снимок из ещё старых данных:
+            # шина сбросит его ещё раз после commit — здесь и в остальных воркерах.
+            publish_invalidation(session, CACHE_NAME)
+            return
+
+
+register_cache(CACHE_NAME, lambda key: invalidate_reference_data())
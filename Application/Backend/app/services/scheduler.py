@@ -0,0 +1,277 @@
+"""
+Фоновый планировщик задач, безопасный для нескольких воркеров.
+
+Каждый процесс (gunicorn/uvicorn воркер) запускает один поток планировщика, но задачи
+выполняет только лидер — процесс, удерживающий session-level advisory lock PostgreSQL
+на выделенном соединении. Остальные воркеры раз в SCHEDULER_LEADER_RETRY_SEC (+jitter)
+делают один `pg_try_advisory_lock` и больше ничего не читают, поэтому нагрузка на БД
+от 8 воркеров такая же, как от одного.
+
+Failover: если лидер умер (процесс/соединение закрыто), PostgreSQL сам снимает lock,
+и следующий воркер забирает лидерство на ближайшей попытке.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal, engine
+from ..models import SchedulerJobState
+from . import metrics
+
+# Произвольный, но постоянный ключ advisory lock для лидера планировщика.
+SCHEDULER_LOCK_KEY = 52_710_026
+
+# Как часто лидер проверяет, что его соединение (и lock) ещё живы.
+LEADER_HEARTBEAT_SEC = 5
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class Job:
+    """Зарегистрированная периодическая задача."""
+
+    name: str
+    func: Callable[[Session], Optional[int]]  # возвращает кол-во обработанных объектов
+    interval_sec: float
+    backlog: Optional[Callable[[Session], int]] = None  # сколько работы ещё ждёт
+
+    next_run_at: float = 0.0
+    last_started_at: Optional[datetime] = None
+    last_duration_ms: Optional[int] = None
+    last_processed: Optional[int] = None
+    last_backlog: Optional[int] = None
+    last_error: Optional[str] = None
+    runs: int = 0
+    failures: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+_jobs: dict[str, Job] = {}
+_scheduler_thread: threading.Thread | None = None
+_stop_event = threading.Event()
+_leader_conn: Connection | None = None
+_is_leader = False
+
+
+def _jitter() -> float:
+    return random.uniform(0, max(0, settings.SCHEDULER_JITTER_SEC))
+
+
+def register_job(
+    name: str,
+    func: Callable[[Session], Optional[int]],
+    interval_sec: float,
+    backlog: Optional[Callable[[Session], int]] = None,
+) -> Job:
+    """Регистрирует (или переопределяет) задачу. Первый запуск — через случайный jitter."""
+    job = Job(name=name, func=func, interval_sec=max(1.0, float(interval_sec)), backlog=backlog)
+    job.next_run_at = time.monotonic() + _jitter()
+    _jobs[name] = job
+    return job
+
+
+def get_jobs() -> list[Job]:
+    return list(_jobs.values())
+
+
+def is_leader() -> bool:
+    return _is_leader
+
+
+# ---------------------------------------------------------------------------
+# Leader election
+# ---------------------------------------------------------------------------
+
+def _try_acquire_leadership() -> bool:
+    global _leader_conn
+    conn = None
+    try:
+        conn = engine.connect()
+        acquired = bool(conn.exec_driver_sql("SELECT pg_try_advisory_lock(%s)", (SCHEDULER_LOCK_KEY,)).scalar())
+        # Закрываем транзакцию, чтобы соединение не висело "idle in transaction";
+        # session-level lock при этом сохраняется.
+        conn.commit()
+        if not acquired:
+            conn.close()
+            return False
+        _leader_conn = conn
+        return True
+    except Exception as exc:
+        print(f"[scheduler] leader election failed: {exc}")
+        if conn is not None:
+            try:
+                conn.invalidate()
+            except Exception:
+                pass
+        return False
+
+
+def _leadership_alive() -> bool:
+    """Проверяет соединение лидера. Обрыв соединения = потеря lock."""
+    if _leader_conn is None:
+        return False
+    try:
+        _leader_conn.exec_driver_sql("SELECT 1")
+        _leader_conn.commit()
+        return True
+    except Exception as exc:
+        print(f"[scheduler] lost leader connection: {exc}")
+        _drop_leadership(invalidate=True)
+        return False
+
+
+def _drop_leadership(invalidate: bool = False) -> None:
+    global _leader_conn, _is_leader
+    conn = _leader_conn
+    _leader_conn = None
+    _is_leader = False
+    if conn is None:
+        return
+    try:
+        if invalidate:
+            # Соединение битое — выбрасываем его из пула, lock снимет сервер.
+            conn.invalidate()
+        else:
+            conn.exec_driver_sql("SELECT pg_advisory_unlock(%s)", (SCHEDULER_LOCK_KEY,))
+            conn.commit()
+    except Exception:
+        pass
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Job execution
+# ---------------------------------------------------------------------------
+
+def _persist_state(job: Job, finished_at: datetime) -> None:
+    db = SessionLocal()
+    try:
+        row = db.get(SchedulerJobState, job.name)
+        if row is None:
+            row = SchedulerJobState(name=job.name)
+            db.add(row)
+        row.interval_sec = int(job.interval_sec)
+        row.leader = WORKER_ID
+        row.last_started_at = job.last_started_at
+        row.last_finished_at = finished_at
+        row.last_duration_ms = job.last_duration_ms
+        row.last_processed = job.last_processed
+        row.backlog = job.last_backlog
+        row.last_error = job.last_error
+        row.runs = job.runs
+        row.failures = job.failures
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        print(f"[scheduler] failed to persist state of {job.name}: {exc}")
+    finally:
+        db.close()
+
+
+def run_job(job: Job) -> None:
+    """Выполняет задачу один раз в собственной сессии и сохраняет метрики запуска."""
+    if not job.lock.acquire(blocking=False):
+        return
+    try:
+        lag = time.monotonic() - job.next_run_at
+        job.last_started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        ok = False
+        db = SessionLocal()
+        try:
+            processed = job.func(db)
+            db.commit()
+            job.last_processed = int(processed or 0)
+            job.last_error = None
+            ok = True
+            if job.backlog is not None:
+                job.last_backlog = int(job.backlog(db) or 0)
+                db.rollback()
+        except Exception as exc:
+            db.rollback()
+            job.failures += 1
+            job.last_error = str(exc)[:1000]
+            print(f"[scheduler] job {job.name} failed: {exc}")
+        finally:
+            db.close()
+        job.runs += 1
+        duration = time.perf_counter() - started
+        job.last_duration_ms = int(duration * 1000)
+        metrics.observe_job(job.name, lag, duration, ok, job.last_processed if ok else 0, job.last_backlog)
+        _persist_state(job, datetime.now(timezone.utc))
+    finally:
+        job.lock.release()
+
+
+def _run_due_jobs() -> float:
+    """Запускает задачи, у которых подошёл срок. Возвращает секунды до следующей."""
+    now = time.monotonic()
+    for job in get_jobs():
+        if _stop_event.is_set():
+            break
+        if now < job.next_run_at:
+            continue
+        run_job(job)
+        job.next_run_at = time.monotonic() + job.interval_sec + _jitter()
+    upcoming = [job.next_run_at for job in get_jobs()]
+    if not upcoming:
+        return LEADER_HEARTBEAT_SEC
+    return max(0.0, min(upcoming) - time.monotonic())
+
+
+def _loop() -> None:
+    global _is_leader
+    while not _stop_event.is_set():
+        if not _is_leader:
+            if _try_acquire_leadership():
+                _is_leader = True
+                print(f"[scheduler] {WORKER_ID} became leader")
+                # Новый лидер не должен запускать всё сразу — сохраняем расписание + jitter.
+                for job in get_jobs():
+                    job.next_run_at = min(job.next_run_at, time.monotonic() + _jitter())
+            else:
+                _stop_event.wait(settings.SCHEDULER_LEADER_RETRY_SEC + _jitter())
+                continue
+
+        if not _leadership_alive():
+            continue
+
+        wait_sec = _run_due_jobs()
+        _stop_event.wait(min(wait_sec, LEADER_HEARTBEAT_SEC))
+
+    _drop_leadership()
+
+
+def start_scheduler() -> None:
+    global _scheduler_thread
+    if not settings.SCHEDULER_ENABLED:
+        return
+    if _scheduler_thread and _scheduler_thread.is_alive():
+        return
+    _stop_event.clear()
+    _scheduler_thread = threading.Thread(target=_loop, name="job-scheduler", daemon=True)
+    _scheduler_thread.start()
+
+
+def stop_scheduler() -> None:
+    _stop_event.set()
+    thread = _scheduler_thread
+    if thread and thread.is_alive():
+        thread.join(timeout=LEADER_HEARTBEAT_SEC + 1)
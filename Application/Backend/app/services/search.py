@@ -0,0 +1,80 @@
+"""
+Поиск по подстроке для списков (жители, арендаторы, счета, оплаты, уведомления, договоры).
+
+Все списки ищут одинаково: `col ILIKE '%q%'` по нескольким колонкам через OR.
+Такой шаблон с ведущим `%` обычный btree не обслуживает, поэтому на каждую искомую колонку
+есть GIN-индекс pg_trgm (TRIGRAM_INDEXES, создаются в run_bootstrap_schema). Чтобы планировщик
+собрал BitmapOr, индекс нужен на КАЖДОЙ колонке из OR — новую колонку в поиск добавлять
+вместе с индексом. Запросы короче 3 символов триграммами не режутся и идут полным проходом.
+"""
+
+from __future__ import annotations
+
+from typing import Optional, TypeVar
+
+from sqlalchemy import or_
+from sqlalchemy.sql.elements import ColumnElement
+
+
+# table -> искомые колонки; по ним создаются индексы idx_<table>_<column>_trgm
+TRIGRAM_INDEXES: dict[str, tuple[str, ...]] = {
+    "residents": ("unit_number", "owner_full_name", "owner_phone", "owner_email"),
+    "users": ("username", "full_name", "phone", "email"),
+    "invoices": ("number", "notes"),
+    "payments": ("reference", "comment"),
+    "notifications": ("message",),
+    "notifications_archive": ("message",),
+    "sales_contracts": ("buyer_full_name", "house_number", "contract_number"),
+}
+
+_Q = TypeVar("_Q")
+
+
+def trigram_index_ddl() -> list[str]:
+    """
+    DDL для run_bootstrap_schema: расширение pg_trgm и GIN-индексы.
+    Без прав на CREATE EXTENSION (управляемые БД) старт не падает — индексы просто не создаются.
+    """
+    statements = [
+        """
+        DO $$
+        BEGIN
+          CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN insufficient_privilege THEN
+          RAISE NOTICE 'pg_trgm is not available: search falls back to sequential scans';
+        END $$;
+        """
+    ]
+    for table, columns in TRIGRAM_INDEXES.items():
+        for column in columns:
+            statements.append(f"""
+        DO $$
+        BEGIN
+          IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+            CREATE INDEX IF NOT EXISTS idx_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops);
+          END IF;
+        END $$;
+        """)
+    return statements
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_condition(q: Optional[str], *columns) -> Optional[ColumnElement[bool]]:
+    """
+    `col1 ILIKE '%q%' OR col2 ILIKE '%q%' ...`; None, если строка поиска пустая.
+    % и _ из запроса ищутся буквально.
+    """
+    term = (q or "").strip()
+    if not term or not columns:
+        return None
+    pattern = f"%{escape_like(term)}%"
+    return or_(*(column.ilike(pattern, escape="\\") for column in columns))
+
+
+def apply_search(query: _Q, q: Optional[str], *columns) -> _Q:
+    """Добавляет search_condition к Query/Select (без изменений, если искать нечего)."""
+    condition = search_condition(q, *columns)
+    return query if condition is None else query.filter(condition)
@@ -0,0 +1,215 @@
+"""
+Учёт SQL-запросов на HTTP-запрос и детектор N+1.
+
+- события SQLAlchemy (before/after_cursor_execute) считают запросы и время в БД;
+- ASGI-middleware включает учёт для выборки запросов (SQL_STATS_SAMPLE_RATE),
+  добавляет заголовок `Server-Timing: db;dur=..;desc="N queries"` и копит агрегаты по маршрутам;
+- одинаковый SQL (по тексту с плейсхолдерами), повторённый >= SQL_STATS_N1_THRESHOLD раз
+  за запрос, помечается как N+1 и пишется в лог одной JSON-строкой.
+
+Для невыбранных запросов обработчики событий делают только ContextVar.get(),
+поэтому учёт можно держать включённым в проде.
+
+Агрегаты живут в памяти процесса (каждый воркер — свои), их отдаёт
+`GET /api/system/sql-stats`.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ..config import settings
+
+
+_WS_RE = re.compile(r"\s+")
+# IN (%(id_1)s, %(id_2)s, ...) разной длины — одна и та же "форма" запроса
+_EXPANDED_PARAMS_RE = re.compile(r"%\((\w+?)_\d+\)s(?:, %\(\1_\d+\)s)*")
+
+
+@dataclass
+class RequestSqlStats:
+    """Счётчики одного HTTP-запроса."""
+
+    queries: int = 0
+    db_time: float = 0.0  # секунды
+    shapes: Counter = field(default_factory=Counter)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.shapes.most_common(5) if n >= threshold]
+
+
+@dataclass
+class RouteSqlStats:
+    """Агрегат по маршруту (шаблон пути + метод) в пределах процесса."""
+
+    route: str
+    requests: int = 0
+    queries_total: int = 0
+    queries_max: int = 0
+    db_ms_total: float = 0.0
+    db_ms_max: float = 0.0
+    n_plus_one: int = 0
+    last_repeated_sql: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        requests = max(1, self.requests)
+        return {
+            "route": self.route,
+            "requests": self.requests,
+            "avg_queries": round(self.queries_total / requests, 2),
+            "max_queries": self.queries_max,
+            "avg_db_ms": round(self.db_ms_total / requests, 2),
+            "max_db_ms": round(self.db_ms_max, 2),
+            "n_plus_one": self.n_plus_one,
+            "last_repeated_sql": self.last_repeated_sql,
+        }
+
+
+_current: ContextVar[Optional[RequestSqlStats]] = ContextVar("sql_stats", default=None)
+_routes: dict[str, RouteSqlStats] = {}
+_routes_lock = threading.Lock()
+
+
+def _shape(statement: str) -> str:
+    return _EXPANDED_PARAMS_RE.sub(r"%(\1_N)s", _WS_RE.sub(" ", statement).strip())
+
+
+# ---------------------------------------------------------------------------
+# SQLAlchemy events
+# ---------------------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._sql_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_sql_stats_started", None)
+    if stats is None or started is None:
+        return
+    stats.queries += 1
+    stats.db_time += time.perf_counter() - started
+    stats.shapes[_shape(statement)] += 1
+
+
+@contextmanager
+def capture_sql_stats():
+    """Учёт SQL вне HTTP-запроса (бенчмарки, фоновые задачи) в текущем потоке."""
+    stats = RequestSqlStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def install_sql_stats(engine: Engine) -> None:
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ---------------------------------------------------------------------------
+# Aggregation / reporting
+# ---------------------------------------------------------------------------
+
+def _record(route: str, status: int, elapsed: float, stats: RequestSqlStats) -> None:
+    db_ms = stats.db_time * 1000
+    repeated = stats.repeated(settings.SQL_STATS_N1_THRESHOLD)
+    with _routes_lock:
+        item = _routes.get(route)
+        if item is None:
+            item = _routes[route] = RouteSqlStats(route=route)
+        item.requests += 1
+        item.queries_total += stats.queries
+        item.queries_max = max(item.queries_max, stats.queries)
+        item.db_ms_total += db_ms
+        item.db_ms_max = max(item.db_ms_max, db_ms)
+        if repeated:
+            item.n_plus_one += 1
+            item.last_repeated_sql = repeated[0][0][:500]
+
+    if repeated or stats.queries >= settings.SQL_STATS_LOG_MIN_QUERIES:
+        print(json.dumps({
+            "event": "sql_stats",
+            "route": route,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "queries": stats.queries,
+            "db_ms": round(db_ms, 2),
+            "n_plus_one": [{"count": n, "sql": sql[:300]} for sql, n in repeated],
+        }, ensure_ascii=False))
+
+
+def worst_routes(limit: int = 20, order_by: str = "avg_queries") -> list[dict]:
+    with _routes_lock:
+        rows = [item.as_dict() for item in _routes.values()]
+    key = order_by if rows and order_by in rows[0] else "avg_queries"
+    rows.sort(key=lambda row: row[key] or 0, reverse=True)
+    return rows[:limit]
+
+
+def reset_route_stats() -> None:
+    with _routes_lock:
+        _routes.clear()
+
+
+# ---------------------------------------------------------------------------
+# ASGI middleware
+# ---------------------------------------------------------------------------
+
+def _route_key(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "<unmatched>"
+    return f"{scope.get('method', '')} {path}"
+
+
+class SqlStatsMiddleware:
+    """Включает учёт SQL для выборки HTTP-запросов и пишет Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not settings.SQL_STATS_ENABLED
+            or random.random() >= settings.SQL_STATS_SAMPLE_RATE
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSqlStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                timing = f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"'
+                headers.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _record(_route_key(scope), status_code, time.perf_counter() - started, stats)
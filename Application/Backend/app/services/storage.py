@@ -0,0 +1,542 @@
+"""
+Хранилище загруженных файлов (фото счётчиков, аватары).
+
+Файлы адресуются содержимым: ключ `<раздел>/<sha256[:2]>/<sha256><ext>`. Одинаковые файлы
+хранятся один раз, а URL по ключу никогда не меняет содержимое — клиенты и прокси могут
+кэшировать его навсегда (Cache-Control: immutable).
+
+Бэкенды (STORAGE_BACKEND):
+- local — каталог STORAGE_LOCAL_ROOT (по умолчанию uploads/), один узел или общий диск;
+- s3 — любой S3-совместимый сервис (AWS, MinIO для локальных стендов); узлы приложения
+  не делят диск, /uploads/<key> отвечает редиректом на подписанную или публичную ссылку.
+
+В БД хранится ключ; наружу отдаётся `storage_url(key)` = `/uploads/<key>` — одинаково для
+обоих бэкендов, поэтому фронтенды и мобильное приложение не меняются. Старые значения вида
+`/uploads/avatars/...` и ключи без хеша (`meter_readings/<имя>`) продолжают работать.
+
+Дедупликация и удаление файлов без ссылок сериализуются advisory lock по ключу (`lock_keys`):
+- загрузка берёт разделяемый lock до проверки «файл уже есть» и держит его до commit своей строки;
+- удаление (`delete_unreferenced`, `release_unreferenced`) берёт исключительный lock на время
+  проверки ссылок и удаления файла.
+Иначе загрузка, нашедшая готовый файл, могла бы сохранить строку на файл, который удалили
+между проверкой и её commit. Фоновая обработка, которая пишет варианты без строки в БД,
+перед переключением строки берёт lock и проверяет, что варианты на месте (`keys_present`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except Exception:  # pragma: no cover
+    boto3 = None
+    ClientError = Exception
+
+
+CHUNK_SIZE = 1024 * 1024
+# Первая половина ключа advisory lock (pg_advisory_xact_lock(класс, hashtext(ключ))) для файлов хранилища.
+STORAGE_LOCK_CLASS = 52_710_035
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_CONTENT_KEY_RE = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{64}(_[a-z0-9]+)?\.[a-z0-9]+$")
+_VARIANT_KEY_RE = re.compile(r"^(?P<prefix>.+)/[0-9a-f]{2}/(?P<sha>[0-9a-f]{64})_(?P<name>[a-z0-9]+\.[a-z0-9]+)$")
+
+# Семейства вариантов: `<раздел>/<sha[:2]>/<sha>_<имя>` — производные одного исходника (sha — его хеш).
+# БД ссылается на один ключ семейства, остальные удаляются вместе с ним (см. delete_keys).
+_VARIANT_FAMILIES: dict[str, tuple[str, ...]] = {}
+
+
+class UploadTooLargeError(ValueError):
+    pass
+
+
+@dataclass
+class StoredFile:
+    key: str
+    size: int
+    sha256: str
+    created: bool  # False — такой файл уже был (дедупликация)
+
+
+def content_key(prefix: str, sha256: str, ext: str) -> str:
+    return f"{prefix.strip('/')}/{sha256[:2]}/{sha256}{ext.lower()}"
+
+
+def variant_key(prefix: str, sha256: str, name: str) -> str:
+    return content_key(prefix, sha256, f"_{name}")
+
+
+def parse_variant_key(key: str) -> Optional[tuple[str, str, str]]:
+    """(раздел, sha исходника, имя варианта) или None, если ключ не из семейства."""
+    match = _VARIANT_KEY_RE.match(key)
+    return (match["prefix"], match["sha"], match["name"]) if match else None
+
+
+def register_variant_family(prefix: str, names: Iterable[str]) -> None:
+    _VARIANT_FAMILIES[prefix.strip("/")] = tuple(names)
+
+
+def family_keys(key: str) -> list[str]:
+    """Все ключи семейства, к которому относится key (или [key], если семейства нет)."""
+    parsed = parse_variant_key(key)
+    if not parsed or parsed[0] not in _VARIANT_FAMILIES:
+        return [key]
+    prefix, sha, _ = parsed
+    return [variant_key(prefix, sha, name) for name in _VARIANT_FAMILIES[prefix]]
+
+
+def is_content_addressed(key: str) -> bool:
+    return bool(_CONTENT_KEY_RE.search(key))
+
+
+def normalize_key(value: Optional[str]) -> Optional[str]:
+    """Ключ из значения в БД: убирает старый префикс `/uploads/` и обратные слэши."""
+    if not value:
+        return None
+    key = str(value).replace("\\", "/")
+    if key.startswith("/uploads/"):
+        key = key[len("/uploads/"):]
+    return key.lstrip("/")
+
+
+def storage_url(value: Optional[str]) -> Optional[str]:
+    key = normalize_key(value)
+    return f"/uploads/{key}" if key else None
+
+
+def _copy_hashing(stream: BinaryIO, out: BinaryIO, max_bytes: Optional[int]) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise UploadTooLargeError(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+        digest.update(chunk)
+        out.write(chunk)
+    return size, digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Local filesystem
+# ---------------------------------------------------------------------------
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, ".tmp")
+
+    def path(self, key: str) -> str:
+        full = os.path.abspath(os.path.join(self.root, key))
+        if not full.startswith(self.root + os.sep):
+            raise ValueError("Invalid storage key")
+        return full
+
+    def save_stream(
+        self, stream: BinaryIO, prefix: str, ext: str, max_bytes: Optional[int] = None,
+        claim: Optional[Callable[[str], None]] = None,
+    ) -> StoredFile:
+        """
+        Потоково пишет во временный файл внутри root (тот же диск — rename атомарен), считая sha256.
+        fsync до rename: после возврата файл на диске целиком.
+        claim(key) вызывается, когда ключ известен, до проверки «файл уже есть» (см. lock_keys).
+        """
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                size, sha = _copy_hashing(stream, out, max_bytes)
+                out.flush()
+                os.fsync(out.fileno())
+            if size == 0:
+                raise ValueError("Empty file")
+            return self._commit(tmp_path, prefix, ext, size, sha, claim)
+        except BaseException:
+            _unlink(tmp_path)
+            raise
+
+    def save_file(self, path: str, prefix: str, ext: str) -> StoredFile:
+        """Забирает готовый локальный файл (варианты после обработки). Исходный файл удаляется."""
+        with open(path, "rb") as fh:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._commit(path, prefix, ext, os.path.getsize(path), digest.hexdigest())
+
+    def save_as(self, path: str, key: str) -> None:
+        """Забирает локальный файл под заданным ключом (варианты семейства). Исходный файл удаляется."""
+        final = self.path(key)
+        if os.path.exists(final):
+            _unlink(path)
+            return
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(path, final)
+
+    def _commit(
+        self, tmp_path: str, prefix: str, ext: str, size: int, sha: str,
+        claim: Optional[Callable[[str], None]] = None,
+    ) -> StoredFile:
+        key = content_key(prefix, sha, ext)
+        if claim is not None:
+            claim(key)
+        final = self.path(key)
+        if os.path.exists(final):
+            _unlink(tmp_path)
+            return StoredFile(key, size, sha, created=False)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.replace(tmp_path, final)
+        return StoredFile(key, size, sha, created=True)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[str]:
+        yield self.path(key)
+
+    def delete(self, key: str) -> int:
+        try:
+            full = self.path(key)
+            size = os.path.getsize(full)
+            os.remove(full)
+            return size
+        except (OSError, ValueError):
+            return 0
+
+    def redirect_url(self, key: str) -> Optional[str]:
+        return None
+
+    def work_dir(self) -> Optional[str]:
+        """Каталог для промежуточных файлов: тот же диск, что и root, чтобы save_file делал rename."""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return self.tmp_dir
+
+    def sweep_temp(self, max_age_sec: int) -> int:
+        """Удаляет недописанные загрузки, оставшиеся после падения процесса. Возвращает байты."""
+        cutoff = time.time() - max_age_sec
+        freed = 0
+        try:
+            with os.scandir(self.tmp_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        freed += entry.stat().st_size
+                        _unlink(entry.path)
+        except FileNotFoundError:
+            pass
+        return freed
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        base = self.path(prefix) if prefix else self.root
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                yield os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+
+
+# ---------------------------------------------------------------------------
+# S3-compatible
+# ---------------------------------------------------------------------------
+
+class S3Storage:
+    name = "s3"
+
+    def __init__(self):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3")
+        if not settings.STORAGE_S3_BUCKET:
+            raise RuntimeError("STORAGE_S3_BUCKET is not configured")
+        self.bucket = settings.STORAGE_S3_BUCKET
+        self.prefix = settings.STORAGE_S3_PREFIX.strip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.STORAGE_S3_ENDPOINT_URL or None,
+            region_name=settings.STORAGE_S3_REGION or None,
+            aws_access_key_id=settings.STORAGE_S3_ACCESS_KEY or None,
+            aws_secret_access_key=settings.STORAGE_S3_SECRET_KEY or None,
+        )
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def save_stream(
+        self, stream: BinaryIO, prefix: str, ext: str, max_bytes: Optional[int] = None,
+        claim: Optional[Callable[[str], None]] = None,
+    ) -> StoredFile:
+        # Хеш известен только после чтения всего потока — буферизуем на локальный диск, не в память.
+        with tempfile.TemporaryFile() as spool:
+            size, sha = _copy_hashing(stream, spool, max_bytes)
+            if size == 0:
+                raise ValueError("Empty file")
+            spool.seek(0)
+            return self._upload(spool, prefix, ext, size, sha, claim)
+
+    def save_file(self, path: str, prefix: str, ext: str) -> StoredFile:
+        with open(path, "rb") as fh:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+            fh.seek(0)
+            stored = self._upload(fh, prefix, ext, os.path.getsize(path), digest.hexdigest())
+        _unlink(path)
+        return stored
+
+    def save_as(self, path: str, key: str) -> None:
+        if not self.exists(key):
+            with open(path, "rb") as fh:
+                self.client.upload_fileobj(
+                    fh, self.bucket, self._object_key(key),
+                    ExtraArgs={
+                        "ContentType": content_type(os.path.splitext(key)[1]),
+                        "CacheControl": IMMUTABLE_CACHE_CONTROL,
+                    },
+                )
+        _unlink(path)
+
+    def _upload(
+        self, fh: BinaryIO, prefix: str, ext: str, size: int, sha: str,
+        claim: Optional[Callable[[str], None]] = None,
+    ) -> StoredFile:
+        key = content_key(prefix, sha, ext)
+        if claim is not None:
+            claim(key)
+        if self.exists(key):
+            return StoredFile(key, size, sha, created=False)
+        self.client.upload_fileobj(
+            fh,
+            self.bucket,
+            self._object_key(key),
+            ExtraArgs={"ContentType": content_type(ext), "CacheControl": IMMUTABLE_CACHE_CONTROL},
+        )
+        return StoredFile(key, size, sha, created=True)
+
+    def exists(self, key: str) -> bool:
+        return self.size(key) is not None
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            return None
+        return int(head["ContentLength"])
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[str]:
+        fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, "wb") as out:
+                self.client.download_fileobj(self.bucket, self._object_key(key), out)
+            yield tmp_path
+        finally:
+            _unlink(tmp_path)
+
+    def delete(self, key: str) -> int:
+        size = self.size(key) or 0
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            return 0
+        return size
+
+    def redirect_url(self, key: str) -> Optional[str]:
+        if settings.STORAGE_PUBLIC_BASE_URL:
+            return f"{settings.STORAGE_PUBLIC_BASE_URL.rstrip('/')}/{self._object_key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=settings.STORAGE_S3_URL_TTL_SEC,
+        )
+
+    def put_file(self, key: str, path: str) -> None:
+        """Кладёт локальный файл под готовым ключом (перенос старых загрузок, scripts/migrate_uploads.py)."""
+        with open(path, "rb") as fh:
+            self.client.upload_fileobj(
+                fh, self.bucket, self._object_key(key),
+                ExtraArgs={"ContentType": content_type(os.path.splitext(key)[1])},
+            )
+
+    def work_dir(self) -> Optional[str]:
+        return None
+
+    def sweep_temp(self, max_age_sec: int) -> int:
+        return 0
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".heic": "image/heic",
+    ".heif": "image/heif",
+}
+
+
+def content_type(ext: str) -> str:
+    return _CONTENT_TYPES.get(ext.lower(), "application/octet-stream")
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if settings.STORAGE_BACKEND == "s3":
+                _storage = S3Storage()
+            else:
+                _storage = LocalStorage(settings.STORAGE_LOCAL_ROOT)
+        return _storage
+
+
+def _reference_columns():
+    from ..models import MeterReadingPhoto, User
+
+    return [MeterReadingPhoto.file_path, MeterReadingPhoto.thumb_path, User.avatar_path]
+
+
+def lock_keys(db: Session, values: Iterable[Optional[str]], exclusive: bool = False) -> None:
+    """
+    Advisory lock транзакции db на ключи (освобождается при commit/rollback). Разделяемый —
+    загрузка/переключение строки на файл, исключительный — удаление файла без ссылок.
+    Ключи сортируются, чтобы два процесса не ждали друг друга по кругу. Вне PostgreSQL — no-op.
+    """
+    keys = sorted({normalize_key(v) for v in values if v} - {None})
+    conn = db.connection()
+    if not keys or conn.dialect.name != "postgresql":
+        return
+    func_name = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    for key in keys:
+        conn.execute(text(f"SELECT {func_name}(:cls, hashtext(:key))"), {"cls": STORAGE_LOCK_CLASS, "key": key})
+
+
+def keys_present(keys: Iterable[str]) -> bool:
+    """Все ли файлы на месте (вызывать под lock_keys, перед тем как сослаться на них из строки)."""
+    storage = get_storage()
+    return all(storage.exists(key) for key in keys)
+
+
+def unreferenced_keys(db: Session, values: Iterable[Optional[str]]) -> set[str]:
+    """
+    Ключи, на которые больше не ссылается ни одна строка: из-за дедупликации один файл
+    может принадлежать нескольким фото/аватарам, удалять его можно только последним.
+    """
+    keys = {normalize_key(v) for v in values if v}
+    keys.discard(None)
+    if not keys:
+        return set()
+    candidates = keys | {f"/uploads/{k}" for k in keys}
+    for column in _reference_columns():
+        for (value,) in db.execute(select(column).where(column.in_(candidates))):
+            keys.discard(normalize_key(value))
+        if not keys:
+            break
+    return keys
+
+
+def delete_keys(keys: Iterable[str]) -> int:
+    storage = get_storage()
+    expanded = {member for key in keys for member in family_keys(key)}
+    return sum(storage.delete(key) for key in expanded)
+
+
+def _delete_locked(db: Session, values: Iterable[Optional[str]]) -> tuple[int, int]:
+    """Под исключительным lock: проверка ссылок и удаление файлов, затем commit. (файлов, байт)."""
+    values = [v for v in values if v]
+    if not values:
+        return 0, 0
+    try:
+        lock_keys(db, values, exclusive=True)
+        keys = unreferenced_keys(db, values)
+        freed = delete_keys(keys)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(keys), freed
+
+
+def delete_unreferenced(db: Session, values: Iterable[Optional[str]]) -> int:
+    """
+    Удаляет файлы без ссылок из БД. Вызывать после commit (функция коммитит сама, освобождая lock).
+    Возвращает освобождённые байты.
+    """
+    return _delete_locked(db, values)[1]
+
+
+def release_unreferenced(values: Iterable[Optional[str]]) -> tuple[int, int]:
+    """delete_unreferenced в отдельной сессии (потоки очистки, after_commit). Возвращает (файлов, байт)."""
+    from ..database import SessionLocal
+
+    with SessionLocal() as db:
+        return _delete_locked(db, values)
+
+
+def release_after_commit(db: Session, values: Iterable[Optional[str]]) -> None:
+    """
+    Помечает файлы к удалению после успешного commit сессии (если на них не осталось ссылок).
+    При rollback файлы остаются — строка в БД по-прежнему на них указывает.
+    """
+    if not event.contains(db, "after_commit", _release_pending):
+        event.listen(db, "after_commit", _release_pending)
+        event.listen(db, "after_rollback", _forget_pending)
+    db.info.setdefault("storage_release", set()).update(v for v in values if v)
+
+
+def _release_pending(session: Session) -> None:
+    values = session.info.pop("storage_release", set())
+    if not values:
+        return
+    # В after_commit исходная сессия уже не может выполнять SQL — проверяем ссылки в отдельной.
+    try:
+        release_unreferenced(values)
+    except Exception as e:
+        print(f"[storage] release failed: {e}")
+
+
+def _forget_pending(session: Session) -> None:
+    session.info.pop("storage_release", None)
@@ -78,10 +78,31 @@ def build_invoice_number(db, resident_id: int, period_year: int, period_month: i
     INV-(resident_id)/(tenant_id)/(YYYY-MM)
     """
     rid = int(resident_id or 0)
-    tenant_id = _resolve_invoice_tenant_id(db, rid)
+    return _format_invoice_number(rid, _resolve_invoice_tenant_id(db, rid), period_year, period_month)
+
+
+def _format_invoice_number(resident_id: int, tenant_id: int, period_year: int, period_month: int) -> str:
     yyyy = int(period_year or 0)
     mm = int(period_month or 0)
-    return f"INV-{rid}/{tenant_id}/{yyyy}-{mm:02d}"
+    return f"INV-{resident_id}/{tenant_id}/{yyyy}-{mm:02d}"
+
+
+def sync_invoice_numbers(db, resident_ids) -> int:
+    """
+    Сохраняет канонический номер во всех счетах резидентов (номер зависит от привязанного жителя).
+    Вызывать после изменения связки user_residents, до commit. Возвращает число исправленных счетов.
+    """
+    from .models import Invoice
+
+    changed = 0
+    for rid in sorted({int(r) for r in resident_ids if r}):
+        tenant_id = _resolve_invoice_tenant_id(db, rid)
+        for inv in db.query(Invoice).filter(Invoice.resident_id == rid).all():
+            number = _format_invoice_number(rid, tenant_id, inv.period_year, inv.period_month)
+            if inv.number != number:
+                inv.number = number
+                changed += 1
+    return changed
 
 
 def to_baku_datetime(value: Any) -> datetime:
@@ -306,12 +327,7 @@ def create_news_notification(db, news):
         print(f"News {news.id} is scheduled for future (diff: {time_diff}s), skipping notifications")
         return
     
-    target_blocks = None
-    if getattr(news, "target_blocks", None):
-        try:
-            target_blocks = json.loads(news.target_blocks)
-        except Exception:
-            target_blocks = None
+    target_blocks = getattr(news, "target_blocks", None) or None
 
     # Получаем всех активных пользователей-резидентов
     if target_blocks:
@@ -370,7 +386,8 @@ def create_news_notification(db, news):
             ru="Новая новость",
         )
 
-        # Проверяем, нет ли уже такого уведомления
+        # Проверяем, нет ли уже такого непрочитанного уведомления
+        # (в архив уходят только прочитанные, поэтому notifications достаточно)
         existing = db.query(Notification).filter(
             Notification.user_id == user.id,
             Notification.notification_type == NotificationType.NEWS.value,
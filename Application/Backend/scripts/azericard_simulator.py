@@ -0,0 +1,260 @@
+"""
+Локальный симулятор шлюза AzeriCard для проверки приёма callback (inbox) на тестовом стенде.
+
+Подписывает callback ключом заглушки из scripts/load_test.py (StubGateway): стенд должен быть
+настроен через `python scripts/load_test.py stub-env >> .env`.
+
+run — без браузера: для каждого заказа /initiate, затем --duplicates одинаковых callback
+      одновременно (как ретраи шлюза), опрос GET /api/azericard/result до итога. Проверяет,
+      что подтверждённый заказ проведён ровно один раз (--check-db: ровно один Payment
+      с reference = ORDER), и печатает p50/p95 ответа на callback и время до проведения.
+
+serve — шлюз для ручной проверки из браузера: в .env стенда
+      AZERICARD_GATEWAY_URL=http://127.0.0.1:8099/stub-gateway. Форма оплаты приходит сюда,
+      симулятор шлёт --duplicates серверных callback на BACKREF и отдаёт браузеру форму,
+      которая отправляет тот же callback (браузер попадает на /result → /success или /fail).
+
+Запуск (из Application/Backend, стенд уже поднят):
+    python scripts/azericard_simulator.py run --resident-id 1 --orders 20 --duplicates 3 --check-db
+    python scripts/azericard_simulator.py serve --port 8099 --decline-ratio 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import html
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qsl
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from load_test import StubGateway  # noqa: E402
+
+JSON_HEADERS = {"accept": "application/json"}
+
+
+def _p(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+# ---------------------------------------------------------------------------
+# run: initiate → duplicate callbacks → result
+# ---------------------------------------------------------------------------
+
+async def _one_order(client: httpx.AsyncClient, gateway: StubGateway, args, approve: bool, stats: dict) -> None:
+    init = await client.post("/api/azericard/initiate", json={
+        "resident_id": args.resident_id,
+        "invoice_id": args.invoice_id,
+        "amount": f"{args.amount:.2f}",
+    })
+    init.raise_for_status()
+    params = init.json()["params"]
+    order_id = params["ORDER"]
+    callback = gateway.callback_for(params, approve=approve)
+
+    async def send() -> None:
+        started = time.perf_counter()
+        response = await client.post("/api/azericard/callback", data=callback, headers=JSON_HEADERS)
+        stats["ack_ms"].append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            stats["ack_errors"].append(f"{order_id}: HTTP {response.status_code} {response.text[:200]}")
+
+    sent_at = time.perf_counter()
+    await asyncio.gather(*(send() for _ in range(args.duplicates)))
+
+    deadline = sent_at + args.timeout
+    result: Optional[dict] = None
+    while time.perf_counter() < deadline:
+        response = await client.get("/api/azericard/result", params={"order_id": order_id}, headers=JSON_HEADERS)
+        if response.status_code == 200 and response.json()["status"] != "PENDING":
+            result = response.json()
+            stats["processed_ms"].append((time.perf_counter() - sent_at) * 1000)
+            break
+        await asyncio.sleep(args.poll_interval)
+
+    expected = "CONFIRMED" if approve else "DECLINED"
+    if result is None:
+        stats["problems"].append(f"{order_id}: still PENDING after {args.timeout}s")
+    elif result["result"] != expected:
+        stats["problems"].append(f"{order_id}: expected {expected}, got {result['status']}/{result['result']}")
+    stats["orders"].append((order_id, approve))
+
+
+def _check_payments(orders: list[tuple[str, bool]]) -> list[str]:
+    from sqlalchemy import func
+
+    from app.database import SessionLocal
+    from app.models import Payment
+
+    ids = [order_id for order_id, _ in orders]
+    db = SessionLocal()
+    try:
+        counts = dict(
+            db.query(Payment.reference, func.count(Payment.id))
+            .filter(Payment.reference.in_(ids))
+            .group_by(Payment.reference)
+            .all()
+        )
+    finally:
+        db.close()
+    problems = []
+    for order_id, approve in orders:
+        expected = 1 if approve else 0
+        if counts.get(order_id, 0) != expected:
+            problems.append(f"{order_id}: {counts.get(order_id, 0)} payments, expected {expected}")
+    return problems
+
+
+async def run(args) -> int:
+    gateway = StubGateway(Path(args.stub_key))
+    rng = random.Random(args.seed)
+    stats: dict[str, list] = {"ack_ms": [], "processed_ms": [], "ack_errors": [], "problems": [], "orders": []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        async def guarded(approve: bool) -> None:
+            async with semaphore:
+                await _one_order(client, gateway, args, approve, stats)
+
+        await asyncio.gather(*(guarded(rng.random() >= args.decline_ratio) for _ in range(args.orders)))
+
+    if args.check_db:
+        stats["problems"].extend(_check_payments(stats["orders"]))
+
+    ack, processed = stats["ack_ms"], stats["processed_ms"]
+    print(f"orders: {len(stats['orders'])}, callbacks: {len(ack)} ({args.duplicates} per order)")
+    print(f"callback ack ms:  p50={statistics.median(ack) if ack else 0:.1f}  p95={_p(ack, 0.95):.1f}  max={max(ack, default=0):.1f}")
+    print(f"processed in ms:  p50={statistics.median(processed) if processed else 0:.1f}  p95={_p(processed, 0.95):.1f}")
+    for line in stats["ack_errors"][:10] + stats["problems"][:20]:
+        print(f"  ! {line}")
+    failed = bool(stats["ack_errors"] or stats["problems"])
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+# ---------------------------------------------------------------------------
+# serve: gateway page for the browser flow
+# ---------------------------------------------------------------------------
+
+def _autosubmit_form(action: str, fields: dict) -> bytes:
+    inputs = "\n".join(
+        f'<input type="hidden" name="{html.escape(k)}" value="{html.escape(str(v))}">' for k, v in fields.items()
+    )
+    verdict = "approved" if fields.get("ACTION") == "0" else "declined"
+    return f"""<html><body onload="document.forms[0].submit()" style="font-family:Arial,sans-serif;padding:24px;">
+<p>AzeriCard simulator: {verdict}</p>
+<form method="POST" action="{html.escape(action)}">
+{inputs}
+<button type="submit">Continue</button>
+</form></body></html>""".encode("utf-8")
+
+
+def serve(args) -> int:
+    gateway = StubGateway(Path(args.stub_key))
+    rng = random.Random(args.seed)
+    lock = threading.Lock()
+
+    def send_server_callbacks(url: str, callback: dict) -> None:
+        time.sleep(args.callback_delay)
+        with httpx.Client(timeout=30) as client:
+            def send() -> None:
+                started = time.perf_counter()
+                try:
+                    response = client.post(url, data=callback, headers=JSON_HEADERS)
+                    outcome = f"HTTP {response.status_code} {response.text[:120]}"
+                except httpx.HTTPError as exc:
+                    outcome = f"error {exc}"
+                print(f"[simulator] callback ORDER={callback['ORDER']}: {outcome} in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            threads = [threading.Thread(target=send) for _ in range(args.duplicates)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.split("?")[0] != "/stub-gateway":
+                self.send_error(404)
+                return
+            length = int(self.headers.get("content-length") or 0)
+            params = dict(parse_qsl(self.rfile.read(length).decode("utf-8")))
+            backref = params.get("BACKREF")
+            if not params.get("ORDER") or not backref:
+                self.send_error(400, "ORDER and BACKREF are required")
+                return
+            with lock:
+                approve = rng.random() >= args.decline_ratio
+                callback = gateway.callback_for(params, approve=approve)
+            if args.duplicates:
+                threading.Thread(target=send_server_callbacks, args=(backref, callback), daemon=True).start()
+            body = _autosubmit_form(backref, callback)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *fmt_args):
+            print(f"[simulator] {self.address_string()} {fmt % fmt_args}")
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"[simulator] AZERICARD_GATEWAY_URL=http://{args.host}:{args.port}/stub-gateway")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="initiate payments and send duplicate signed callbacks")
+    p_run.add_argument("--base-url", default="http://127.0.0.1:8000")
+    p_run.add_argument("--stub-key", default="loadtest-azericard.pem")
+    p_run.add_argument("--resident-id", type=int, required=True)
+    p_run.add_argument("--invoice-id", type=int, default=None)
+    p_run.add_argument("--amount", type=float, default=1.0)
+    p_run.add_argument("--orders", type=int, default=10)
+    p_run.add_argument("--duplicates", type=int, default=3, help="identical callbacks sent at once per order")
+    p_run.add_argument("--concurrency", type=int, default=5, help="orders in flight")
+    p_run.add_argument("--decline-ratio", type=float, default=0.2)
+    p_run.add_argument("--timeout", type=float, default=30, help="seconds to wait for processing")
+    p_run.add_argument("--poll-interval", type=float, default=0.2)
+    p_run.add_argument("--check-db", action="store_true", help="count payments per ORDER in the stand DB (.env)")
+    p_run.add_argument("--seed", type=int, default=1)
+
+    p_serve = sub.add_parser("serve", help="gateway page for the browser payment flow")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8099)
+    p_serve.add_argument("--stub-key", default="loadtest-azericard.pem")
+    p_serve.add_argument("--duplicates", type=int, default=2, help="server-to-server callbacks per payment")
+    p_serve.add_argument("--callback-delay", type=float, default=0.0, help="seconds before server callbacks")
+    p_serve.add_argument("--decline-ratio", type=float, default=0.0)
+    p_serve.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        return serve(args)
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Бенчмарки горячих эндпоинтов и функций на синтетических данных.
+
+Прогоняет запросы через ASGI-приложение (TestClient, без сети) против локального
+PostgreSQL из .env и пишет для каждого кейса латентность (p50/p95/mean), число SQL-запросов,
+время в БД и пиковую память Python (tracemalloc, отдельный прогон).
+Изменяющие данные кейсы (create_readings_internal, auto_apply_advance, bulk issue)
+выполняются в транзакции с откатом — БД после прогона не меняется.
+
+Подготовка и запуск (из Application/Backend):
+    python scripts/seed_synthetic.py --scale default
+    python scripts/bench.py                                   # -> bench-results/<время>_<commit>.json
+    python scripts/bench.py --compare bench-results/old.json  # сравнение, код 1 при регрессии
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+# Учёт SQL на каждый запрос, без фонового планировщика — он исказил бы замеры.
+os.environ["SQL_STATS_SAMPLE_RATE"] = "1"
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import MeterReading, User  # noqa: E402
+from app.routers.api_invoices import _bulk_issue_internal  # noqa: E402
+from app.routers.api_payment_logic import auto_apply_advance  # noqa: E402
+from app.routers.api_readings import ReadingCreate, ReadingCreateItem, create_readings_internal  # noqa: E402
+from app.services.sql_stats import capture_sql_stats  # noqa: E402
+
+
+@contextmanager
+def rollback_session():
+    """Сессия, чьи commit() превращаются в savepoint внутри внешней транзакции с откатом."""
+    conn = engine.connect()
+    trans = conn.begin()
+    db = Session(bind=conn, join_transaction_mode="create_savepoint", autoflush=False)
+    try:
+        yield db
+    finally:
+        db.close()
+        trans.rollback()
+        conn.close()
+
+
+def _parse_server_timing(header: str | None) -> tuple[int, float]:
+    # db;dur=12.3;desc="45 queries"
+    if not header:
+        return 0, 0.0
+    dur, queries = 0.0, 0
+    for part in header.split(";"):
+        part = part.strip()
+        if part.startswith("dur="):
+            dur = float(part[4:])
+        elif part.startswith("desc="):
+            queries = int(part[5:].strip('"').split()[0])
+    return queries, dur
+
+
+class Case:
+    def __init__(self, name: str, run: Callable[[], tuple[int, float]]):
+        self.name = name
+        self.run = run  # -> (queries, db_ms)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def measure(case: Case, iterations: int) -> dict:
+    case.run()  # прогрев
+    timings, queries, db_ms = [], [], []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        q, d = case.run()
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(q)
+        db_ms.append(d)
+
+    tracemalloc.start()
+    case.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(_percentile(timings, 95), 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "max_ms": round(max(timings), 2),
+        "queries": max(queries),
+        "db_ms": round(statistics.median(db_ms), 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _login(client: TestClient, username: str, password: str) -> None:
+    resp = client.post("/api/auth/login", json={"username": username, "password": password})
+    if resp.status_code != 200:
+        raise SystemExit(f"login failed for {username}: {resp.status_code} {resp.text[:200]}")
+
+
+def build_cases(manifest: dict, admin: TestClient, resident: TestClient) -> list[Case]:
+    draft = manifest["draft_period"]
+    year, month = draft["year"], draft["month"]
+    target = manifest["residents"][len(manifest["residents"]) // 2]
+
+    def http(client: TestClient, url: str) -> Callable[[], tuple[int, float]]:
+        def _run():
+            resp = client.get(url)
+            if resp.status_code >= 400:
+                raise RuntimeError(f"GET {url}: {resp.status_code} {resp.text[:200]}")
+            return _parse_server_timing(resp.headers.get("server-timing"))
+        return _run
+
+    def in_session(fn: Callable[[Session], None]) -> Callable[[], tuple[int, float]]:
+        def _run():
+            with rollback_session() as db, capture_sql_stats() as stats:
+                fn(db)
+            return stats.queries, round(stats.db_time * 1000, 2)
+        return _run
+
+    def _create_readings(db: Session) -> None:
+        operator = db.query(User).filter(User.username == manifest["operator"]).one()
+        items = []
+        for meter_id in target["meter_ids"]:
+            last = (
+                db.query(MeterReading)
+                .filter(MeterReading.resident_meter_id == meter_id)
+                .order_by(MeterReading.reading_date.desc())
+                .first()
+            )
+            items.append(ReadingCreateItem(meter_id=meter_id, new_value=float(last.value) + 10 if last else 10))
+        payload = ReadingCreate(resident_id=target["resident_id"], date_str=f"{year}-{month:02d}-26", items=items)
+        create_readings_internal(payload, operator, db)
+
+    def _auto_apply(db: Session) -> None:
+        auto_apply_advance(db, target["resident_id"])
+        db.commit()
+
+    def _bulk_issue(db: Session) -> None:
+        due = (date(year, month, 28) + timedelta(days=18)).isoformat()
+        _bulk_issue_internal(db, "all", None, due)
+
+    return [
+        Case("invoices_list", http(admin, "/api/invoices?per_page=50")),
+        Case("invoices_list_filtered", http(admin, f"/api/invoices?status=ISSUED&year={year}&month={month}&per_page=50")),
+        Case("payments_list", http(admin, "/api/payments/?per_page=50")),
+        Case("readings_list", http(admin, f"/api/readings/?year={year}&month={month}&per_page=50")),
+        Case("reference", http(admin, "/api/reference")),
+        Case("reading_history", http(admin, f"/api/readings/resident/{target['resident_id']}/history")),
+        Case("admin_dashboard_stats", http(admin, "/api/dashboard/stats")),
+        Case("resident_dashboard", http(resident, "/api/resident/dashboard")),
+        Case("resident_invoices", http(resident, "/api/resident/invoices")),
+        Case("create_readings_internal", in_session(_create_readings)),
+        Case("auto_apply_advance", in_session(_auto_apply)),
+        Case("bulk_issue", in_session(_bulk_issue)),
+    ]
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, threshold_pct: float) -> bool:
+    """Печатает разницу с базовым прогоном. True — есть регрессия."""
+    regressed = False
+    print(f"\n{'case':<28}{'p50 ms':>18}{'queries':>16}{'peak KiB':>20}")
+    for name, cur in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            print(f"{name:<28}{cur['p50_ms']:>18}{cur['queries']:>16}{cur['peak_kib']:>20}  (new)")
+            continue
+        delta = (cur["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0.0
+        flag = ""
+        if delta > threshold_pct or cur["queries"] > base["queries"]:
+            flag = "  REGRESSION"
+            regressed = True
+        print(
+            f"{name:<28}{base['p50_ms']:>8} -> {cur['p50_ms']:<7}"
+            f"{base['queries']:>6} -> {cur['queries']:<6}"
+            f"{base['peak_kib']:>9} -> {cur['peak_kib']:<8}{flag}"
+        )
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark hot endpoints on the synthetic dataset.")
+    parser.add_argument("--manifest", default="seed-manifest.json")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="run only these cases")
+    parser.add_argument("--out", help="result file (default bench-results/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", help="baseline result file")
+    parser.add_argument("--threshold", type=float, default=20.0, help="allowed p50 regression, %%")
+    args = parser.parse_args()
+
+    manifest = json.loads(Path(args.manifest).read_text(encoding="utf-8"))
+    password = manifest["password"]
+
+    with TestClient(app) as admin, TestClient(app) as resident:
+        _login(admin, manifest["admin"], password)
+        _login(resident, manifest["residents"][0]["username"], password)
+
+        results = {}
+        for case in build_cases(manifest, admin, resident):
+            if args.only and case.name not in args.only:
+                continue
+            results[case.name] = measure(case, args.iterations)
+            r = results[case.name]
+            print(f"{case.name:<28} p50={r['p50_ms']:>8} ms  p95={r['p95_ms']:>8} ms  "
+                  f"queries={r['queries']:>5}  db={r['db_ms']:>8} ms  peak={r['peak_kib']:>9} KiB")
+
+    commit = _git_commit()
+    output = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "dataset": {"prefix": manifest["prefix"], "seed": manifest["seed"], **manifest["totals"]},
+        },
+        "cases": results,
+    }
+    out_path = Path(args.out) if args.out else (
+        BACKEND_ROOT / "bench-results" / f"{datetime.utcnow():%Y%m%dT%H%M%S}_{commit}.json"
+    )
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(output, indent=2), encoding="utf-8")
+    print(f"\nSaved: {out_path}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(output, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Микробенчмарк подписи и проверки подписи AzeriCard на один callback.
+
+Сравнивает (p50/p95 по --iterations вызовам):
+- parse+sign / parse+verify — как было: PEM из settings разбирается на каждый запрос;
+- sign / verify — generate_p_sign / verify_callback_signature с кэшем ключей (services/azericard.py).
+
+Ключи: из .env (AZERICARD_PRIVATE_KEY / AZERICARD_PUBLIC_KEY), если заданы; иначе генерируется
+временная пара RSA (--bits). БД не нужна.
+
+Запуск (из Application/Backend):
+    python scripts/bench_azericard_sign.py
+    python scripts/bench_azericard_sign.py --iterations 5000 --bits 4096
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import padding, rsa  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.services import azericard  # noqa: E402
+
+
+CALLBACK = {
+    "AMOUNT": "125.40",
+    "CURRENCY": "AZN",
+    "TERMINAL": "17204001",
+    "TRTYPE": "1",
+    "ORDER": "172040251019123456",
+    "RRN": "529212345678",
+    "INT_REF": "A1B2C3D4E5F60718",
+}
+
+
+def _ensure_keys(bits: int) -> str:
+    if settings.AZERICARD_PRIVATE_KEY and settings.AZERICARD_PUBLIC_KEY:
+        return "keys from .env"
+    key = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+    settings.AZERICARD_PRIVATE_KEY = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    settings.AZERICARD_PUBLIC_KEY = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return f"temporary RSA-{bits}"
+
+
+def _measure(fn: Callable[[], object], iterations: int) -> tuple[float, float]:
+    fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--bits", type=int, default=2048)
+    args = parser.parse_args()
+
+    source = _ensure_keys(args.bits)
+    azericard.reload_keys()
+    content = azericard.build_signature_content(CALLBACK, azericard.CALLBACK_SIGN_FIELDS).encode("utf-8")
+    signed = dict(CALLBACK, P_SIGN=azericard.generate_p_sign(CALLBACK, azericard.CALLBACK_SIGN_FIELDS))
+    signature = base64.b64decode(signed["P_SIGN"])
+    assert azericard.verify_callback_signature(signed), "signature does not verify with the configured public key"
+
+    def parse_sign():
+        azericard._load_private(azericard._private_key_raw()).sign(content, padding.PKCS1v15(), hashes.SHA256())
+
+    def parse_verify():
+        azericard._load_public(azericard._public_key_raw()).verify(signature, content, padding.PKCS1v15(), hashes.SHA256())
+
+    cases = [
+        ("parse+sign", parse_sign),
+        ("sign (cached)", lambda: azericard.generate_p_sign(CALLBACK, azericard.CALLBACK_SIGN_FIELDS)),
+        ("parse+verify", parse_verify),
+        ("verify (cached)", lambda: azericard.verify_callback_signature(signed)),
+    ]
+
+    print(f"{source}, {args.iterations} iterations")
+    print(f"{'case':<18}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, fn in cases:
+        p50, p95 = _measure(fn, args.iterations)
+        print(f"{name:<18}{p50:>10.3f}{p95:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Бенчмарк поиска в списках: trigram-индексы (services/search.py) против полного прохода.
+
+Каждый кейс вызывает внутреннюю функцию списка с поиском по фрагменту реального значения
+из середины таблицы (p50/p95 по --iterations прогонам) дважды:
+- indexed — обычный план, ILIKE '%q%' идёт через GIN pg_trgm (BitmapOr по колонкам);
+- seqscan — те же запросы с `enable_bitmapscan/indexscan = off`, как было до индексов.
+Время indexed зависит от числа совпадений, а не от размера таблицы, поэтому на большом
+наборе (seed_synthetic.py --scale month-end) разрыв растёт вместе с числом строк.
+
+Запуск (из Application/Backend, БД из .env, схема создана init_db):
+    python scripts/seed_synthetic.py --scale month-end
+    python scripts/bench_search.py
+    python scripts/bench_search.py --iterations 20 --only residents invoices
+
+Все запросы выполняются в транзакции с откатом — данные не меняются.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.models import Invoice, Notification, Payment, Resident, RoleEnum, SalesContract, User  # noqa: E402
+from app.routers.api_invoices import _list_invoices_internal  # noqa: E402
+from app.routers.api_notifications import _list_notifications_internal  # noqa: E402
+from app.routers.api_payments import _list_payments_internal  # noqa: E402
+from app.routers.api_residents import _list_residents_internal  # noqa: E402
+from app.routers.api_sales import list_contracts  # noqa: E402
+from app.routers.api_tenants import _list_tenants_internal  # noqa: E402
+
+
+NEEDLE_LEN = 5
+
+
+def _needle(db: Session, column, *filters) -> Optional[str]:
+    """Фрагмент значения из середины таблицы: поиск селективный, но не пустой."""
+    query = db.query(column).filter(column.isnot(None), func.length(column) >= NEEDLE_LEN, *filters)
+    total = query.count()
+    if not total:
+        return None
+    value = query.order_by(column).offset(total // 2).limit(1).scalar()
+    start = max(0, (len(value) - NEEDLE_LEN) // 2)
+    return value[start:start + NEEDLE_LEN]
+
+
+def build_cases(db: Session) -> list[tuple[str, int, Optional[str], Callable[[str], object]]]:
+    """(name, строк в таблице, needle, run(needle))."""
+    admin = db.query(User).filter(User.role.in_([RoleEnum.ROOT, RoleEnum.ADMIN])).order_by(User.id).first()
+    count = lambda model: db.query(func.count(model.id)).scalar() or 0  # noqa: E731
+    return [
+        ("residents", count(Resident), _needle(db, Resident.owner_full_name),
+         lambda q: _list_residents_internal(db, q=q)),
+        ("tenants", count(User), _needle(db, User.full_name, User.role == RoleEnum.RESIDENT),
+         lambda q: _list_tenants_internal(db, q=q)),
+        ("invoices", count(Invoice), _needle(db, Invoice.number),
+         lambda q: _list_invoices_internal(db, q=q)),
+        ("payments", count(Payment), _needle(db, Payment.reference),
+         lambda q: _list_payments_internal(db, q=q)),
+        ("notifications", count(Notification), _needle(db, Notification.message),
+         lambda q: _list_notifications_internal(db, q=q)),
+        ("sales_contracts", count(SalesContract), _needle(db, SalesContract.buyer_full_name),
+         lambda q: list_contracts(db=db, actor=admin, page=1, per_page=25, status_filter=None, q=q)),
+    ]
+
+
+def _measure(run: Callable[[], object], iterations: int) -> tuple[float, float]:
+    run()  # прогрев
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, round(0.95 * (len(timings) - 1)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark list search with and without trigram indexes.")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="run only these cases")
+    args = parser.parse_args()
+
+    conn = engine.connect()
+    trans = conn.begin()
+    db = Session(bind=conn, join_transaction_mode="create_savepoint", autoflush=False)
+    try:
+        print(f"{'case':<18}{'rows':>10}  {'needle':<10}{'indexed p50/p95 ms':>22}{'seqscan p50/p95 ms':>22}{'x':>8}")
+        for name, rows, needle, run in build_cases(db):
+            if args.only and name not in args.only:
+                continue
+            if needle is None:
+                print(f"{name:<18}{rows:>10}  (no data)")
+                continue
+            indexed = _measure(lambda: run(needle), args.iterations)
+            conn.exec_driver_sql("SET LOCAL enable_bitmapscan = off")
+            conn.exec_driver_sql("SET LOCAL enable_indexscan = off")
+            try:
+                seqscan = _measure(lambda: run(needle), args.iterations)
+            finally:
+                conn.exec_driver_sql("SET LOCAL enable_bitmapscan = on")
+                conn.exec_driver_sql("SET LOCAL enable_indexscan = on")
+            ratio = seqscan[0] / indexed[0] if indexed[0] else 0.0
+            print(f"{name:<18}{rows:>10}  {needle!r:<10}"
+                  f"{indexed[0]:>12.2f} /{indexed[1]:>8.2f}{seqscan[0]:>12.2f} /{seqscan[1]:>8.2f}{ratio:>7.1f}x")
+    finally:
+        db.close()
+        trans.rollback()
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
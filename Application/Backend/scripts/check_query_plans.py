@@ -0,0 +1,223 @@
+"""
+Проверка планов запросов, которые реально выполняют горячие эндпоинты и фоновые задачи.
+
+Эндпоинты списков, дашбордов и поиска вызываются через ASGI-приложение (TestClient, как
+scripts/bench.py) на синтетических данных. Каждый SQL, который при этом отправляет SQLAlchemy,
+перехватывается вместе с параметрами и прогоняется через EXPLAIN (FORMAT JSON) с настройками
+планировщика по умолчанию — проверяются именно отгружаемые запросы, а не их пересказ.
+Так же проверяются запросы backlog всех задач планировщика (services/jobs.py).
+
+Ошибка — Seq Scan по таблице, в которой не меньше --min-rows строк (pg_class.reltuples после
+ANALYZE): на маленьких справочниках последовательное чтение — нормальный выбор планировщика.
+Поэтому БД должна быть наполнена: на пустой схеме проверять нечего.
+
+Запуск (из Application/Backend, БД из .env — только тестовая):
+    python scripts/seed_synthetic.py --scale month-end
+    python scripts/check_query_plans.py
+    python scripts/check_query_plans.py --verbose   # печатать SQL и планы проблемных запросов
+
+Эндпоинты только читают; запросы задач выполняются в транзакции с откатом.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+# EXPLAIN имеет смысл только для чтения/изменения строк; SET, SAVEPOINT, pg_notify и т.п. пропускаем.
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE)\b", re.IGNORECASE)
+_SKIP = re.compile(r"pg_notify|pg_try_advisory|pg_advisory", re.IGNORECASE)
+
+
+def endpoints(manifest: dict) -> list[tuple[str, str]]:
+    """(клиент, URL): admin — админка, resident — кабинет жителя."""
+    draft = manifest["draft_period"]
+    year, month = draft["year"], draft["month"]
+    target = manifest["residents"][len(manifest["residents"]) // 2]
+    return [
+        ("admin", "/api/invoices?per_page=50"),
+        ("admin", f"/api/invoices?status=ISSUED&year={year}&month={month}&per_page=50"),
+        ("admin", f"/api/invoices?q={year}-{month:02d}&per_page=50"),
+        ("admin", "/api/payments/?per_page=50"),
+        ("admin", "/api/payments/?q=kapital&per_page=50"),
+        ("admin", "/api/residents/?per_page=50"),
+        ("admin", "/api/residents/?q=ivan&per_page=50"),
+        ("admin", "/api/tenants?q=ivan"),
+        ("admin", f"/api/readings/?year={year}&month={month}&per_page=50"),
+        ("admin", f"/api/readings/resident/{target['resident_id']}/history"),
+        ("admin", "/api/reference"),
+        ("admin", "/api/notifications/?q=invoice"),
+        ("admin", "/api/dashboard/stats"),
+        ("admin", "/api/dashboard/recent-payments"),
+        ("admin", "/api/dashboard/recent-activity"),
+        ("admin", "/api/dashboard/payment-chart"),
+        ("resident", "/api/resident/dashboard"),
+        ("resident", "/api/resident/invoices"),
+        ("resident", "/api/notifications/user/me"),
+        ("resident", "/api/notifications/user/me/unread-count"),
+        ("resident", "/api/news/public"),
+    ]
+
+
+@contextmanager
+def capture_statements() -> Iterator[list[tuple[str, object]]]:
+    """Собирает (SQL, параметры) всех запросов к engine — в том виде, в каком их получил драйвер."""
+    captured: list[tuple[str, object]] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and _EXPLAINABLE.match(statement) and not _SKIP.search(statement):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+
+
+def _analyze_and_sizes() -> dict[str, float]:
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("ANALYZE")
+        cur.execute(
+            "SELECT c.relname, c.reltuples FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind IN ('r', 'p') AND n.nspname = current_schema()"
+        )
+        sizes = {name: float(rows) for name, rows in cur.fetchall()}
+        raw.commit()
+        return sizes
+    finally:
+        raw.close()
+
+
+def _explain(statement: str, parameters) -> dict:
+    # Сырой курсор: параметры передаются драйверу ровно так же, как в исходном запросе.
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+        doc = cur.fetchone()[0]
+        raw.rollback()
+    finally:
+        raw.close()
+    doc = doc if isinstance(doc, list) else json.loads(doc)
+    return doc[0]["Plan"]
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []) or []:
+        found.extend(_seq_scans(child))
+    return found
+
+
+def _check(name: str, statements: list[tuple[str, object]], sizes: dict[str, float], min_rows: int,
+           verbose: bool) -> list[str]:
+    problems = []
+    seen = set()
+    for statement, parameters in statements:
+        if statement in seen:
+            continue
+        seen.add(statement)
+        plan = _explain(statement, parameters)
+        big = sorted({t for t in _seq_scans(plan) if sizes.get(t, 0) >= min_rows})
+        if big:
+            problems.append(f"Seq Scan on {', '.join(big)}: {' '.join(statement.split())[:300]}")
+            if verbose:
+                print(statement)
+                print(json.dumps(plan, indent=2, ensure_ascii=False))
+    status = "FAIL" if problems else "ok"
+    print(f"[{status:>4}] {name}  ({len(seen)} statements)")
+    for problem in problems:
+        print(f"       {problem}")
+    return problems
+
+
+def _login(client: TestClient, username: str, password: str) -> None:
+    resp = client.post("/api/auth/login", json={"username": username, "password": password})
+    if resp.status_code != 200:
+        raise SystemExit(f"login failed for {username}: {resp.status_code} {resp.text[:200]}")
+
+
+def _job_backlogs() -> list[tuple[str, Callable[[Session], int]]]:
+    from app.services.jobs import register_default_jobs
+    from app.services.scheduler import get_jobs
+
+    register_default_jobs()
+    return [(f"job backlog: {job.name}", job.backlog) for job in get_jobs() if job.backlog is not None]
+
+
+def check_plans(manifest: dict, min_rows: int, verbose: bool = False) -> tuple[int, int]:
+    sizes = _analyze_and_sizes()
+    checked = failed = 0
+
+    with TestClient(app) as admin, TestClient(app) as resident:
+        _login(admin, manifest["admin"], manifest["password"])
+        _login(resident, manifest["residents"][0]["username"], manifest["password"])
+        clients = {"admin": admin, "resident": resident}
+        for client_name, url in endpoints(manifest):
+            with capture_statements() as statements:
+                resp = clients[client_name].get(url)
+            checked += 1
+            if resp.status_code >= 400:
+                print(f"[FAIL] GET {url}: HTTP {resp.status_code} {resp.text[:200]}")
+                failed += 1
+                continue
+            if _check(f"GET {url}", statements, sizes, min_rows, verbose):
+                failed += 1
+
+    for name, backlog in _job_backlogs():
+        conn = engine.connect()
+        trans = conn.begin()
+        db = Session(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            with capture_statements() as statements:
+                backlog(db)
+        finally:
+            db.close()
+            trans.rollback()
+            conn.close()
+        checked += 1
+        if _check(name, statements, sizes, min_rows, verbose):
+            failed += 1
+    return checked, failed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN the SQL of hot endpoints and fail on sequential scans.")
+    parser.add_argument("--manifest", default="seed-manifest.json")
+    parser.add_argument("--min-rows", type=int, default=10000, help="tables smaller than this may be seq-scanned")
+    parser.add_argument("--verbose", action="store_true", help="print SQL and JSON plans of failing statements")
+    args = parser.parse_args()
+
+    manifest = json.loads(Path(args.manifest).read_text(encoding="utf-8"))
+    checked, failed = check_plans(manifest, args.min_rows, verbose=args.verbose)
+    print(f"\n{checked - failed}/{checked} endpoints/jobs without Seq Scan on tables >= {args.min_rows} rows")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
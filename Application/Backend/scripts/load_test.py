@@ -0,0 +1,393 @@
+"""
+Нагрузочный тест портала жильца и операторских сценариев против запущенного стенда.
+
+Сценарии (каждый виртуальный пользователь крутит свой сценарий до конца --duration):
+- жилец:   login → dashboard → invoices → invoice detail → notifications → оплата через
+           заглушку AzeriCard (initiate + подписанный callback, доля — --pay-ratio);
+- оператор: readings list → ввод показаний → загрузка фото → bulk issue по блоку (доля — --issue-ratio).
+
+Отчёт: пропускная способность, p50/p90/p95/p99 латентности и доля ошибок по каждому шагу,
+JSON в load-results/<время>.json.
+
+Стенд для month-end пика (из Application/Backend, БД только тестовая — сценарии пишут в неё):
+    python scripts/load_test.py stub-env >> .env        # ключи/терминал заглушки AzeriCard
+    python scripts/load_test.py seed --scale month-end  # тот же генератор, что и для бенчмарков
+    uvicorn app.main:app --port 8000 --workers 4         # или gunicorn -c gunicorn.conf.py
+    python scripts/load_test.py run --residents 200 --operators 10 --ramp 60 --duration 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+# Поля подписи callback — как в app/services/azericard.py (CALLBACK_SIGN_FIELDS).
+CALLBACK_SIGN_FIELDS = ["AMOUNT", "CURRENCY", "TERMINAL", "TRTYPE", "ORDER", "RRN", "INT_REF"]
+STUB_TERMINAL_ID = "17299001"
+
+
+# ---------------------------------------------------------------------------
+# AzeriCard stub
+# ---------------------------------------------------------------------------
+
+def _load_or_create_key(path: Path):
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    if path.exists():
+        return serialization.load_pem_private_key(path.read_bytes(), password=None)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    return key
+
+
+class StubGateway:
+    """Вместо банка: подписывает callback тем же ключом, чей публичный ключ прописан в .env стенда."""
+
+    def __init__(self, key_path: Path):
+        self.key = _load_or_create_key(key_path)
+        self._seq = 0
+
+    def callback_for(self, params: dict, approve: bool = True) -> dict:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        self._seq += 1
+        data = {
+            "AMOUNT": params["AMOUNT"],
+            "CURRENCY": params["CURRENCY"],
+            "TERMINAL": params["TERMINAL"],
+            "TRTYPE": params["TRTYPE"],
+            "ORDER": params["ORDER"],
+            "RRN": f"{int(time.time()) % 10**8:08d}{self._seq % 10**4:04d}",
+            "INT_REF": f"STUB{self._seq:012d}",
+            "ACTION": "0" if approve else "1",
+            "RC": "00" if approve else "05",
+            "APPROVAL": f"{self._seq % 10**6:06d}",
+        }
+        content = ";".join(str(data.get(name, "") or "") for name in CALLBACK_SIGN_FIELDS).encode("utf-8")
+        signature = self.key.sign(content, padding.PKCS1v15(), hashes.SHA256())
+        data["P_SIGN"] = base64.b64encode(signature).decode("ascii")
+        return data
+
+
+def stub_env(key_path: Path, base_url: str) -> str:
+    from cryptography.hazmat.primitives import serialization
+
+    key = _load_or_create_key(key_path)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("ascii")
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("ascii")
+    base = base_url.rstrip("/")
+    lines = [
+        "# AzeriCard stub for scripts/load_test.py (test stands only)",
+        "# per-category AZERICARD_TERMINAL_*/AZERICARD_*_KEY_* must be empty so the default terminal is used",
+        f"AZERICARD_TERMINAL_ID={STUB_TERMINAL_ID}",
+        f"AZERICARD_PRIVATE_KEY={private_pem.strip().replace(chr(10), chr(92) + 'n')}",
+        f"AZERICARD_PUBLIC_KEY={public_pem.strip().replace(chr(10), chr(92) + 'n')}",
+        f"AZERICARD_GATEWAY_URL={base}/stub-gateway",
+        f"AZERICARD_CALLBACK_URL={base}/api/azericard/callback",
+        f"AZERICARD_SUCCESS_URL={base}/api/azericard/success",
+        f"AZERICARD_FAIL_URL={base}/api/azericard/fail",
+    ]
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.error_samples: dict[str, str] = {}
+        self.journeys: dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def add(self, step: str, elapsed: float, error: Optional[str]) -> None:
+        self.latencies[step].append(elapsed * 1000)
+        if error:
+            self.errors[step] += 1
+            self.error_samples.setdefault(step, error[:300])
+
+    def report(self) -> dict:
+        wall = (self.finished or time.perf_counter()) - self.started
+        steps = {}
+        for step, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+
+            def pct(p: float) -> float:
+                return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 1)
+
+            steps[step] = {
+                "requests": len(values),
+                "errors": self.errors.get(step, 0),
+                "error_rate": round(self.errors.get(step, 0) / len(values), 4),
+                "rps": round(len(values) / wall, 2),
+                "p50_ms": pct(50),
+                "p90_ms": pct(90),
+                "p95_ms": pct(95),
+                "p99_ms": pct(99),
+                "max_ms": round(ordered[-1], 1),
+                "mean_ms": round(statistics.fmean(values), 1),
+            }
+        total = sum(s["requests"] for s in steps.values())
+        errors = sum(s["errors"] for s in steps.values())
+        return {
+            "wall_seconds": round(wall, 1),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "rps": round(total / wall, 2) if wall else 0.0,
+            "journeys": dict(self.journeys),
+            "steps": steps,
+            "error_samples": self.error_samples,
+        }
+
+
+class StepFailed(Exception):
+    pass
+
+
+async def _step(rec: Recorder, name: str, request) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        resp = await request
+    except httpx.HTTPError as exc:
+        rec.add(name, time.perf_counter() - started, f"{type(exc).__name__}: {exc}")
+        raise StepFailed(name)
+    error = None if resp.status_code < 400 else f"HTTP {resp.status_code}: {resp.text}"
+    rec.add(name, time.perf_counter() - started, error)
+    if error:
+        raise StepFailed(name)
+    return resp
+
+
+# ---------------------------------------------------------------------------
+# Journeys
+# ---------------------------------------------------------------------------
+
+async def resident_journey(client: httpx.AsyncClient, rec: Recorder, ctx: dict, gateway: StubGateway,
+                           rng: random.Random) -> None:
+    resident = ctx["resident"]
+    client.cookies.clear()
+    await _step(rec, "resident.login", client.post(
+        "/api/auth/login", json={"username": resident["username"], "password": ctx["password"]}
+    ))
+    await _step(rec, "resident.dashboard", client.get("/api/resident/dashboard"))
+    invoices = (await _step(rec, "resident.invoices", client.get("/api/resident/invoices"))).json()["invoices"]
+    if invoices:
+        unpaid = [inv for inv in invoices if inv["remaining_amount"] > 0 and inv["status"] != "DRAFT"]
+        invoice = unpaid[0] if unpaid else invoices[0]
+        await _step(rec, "resident.invoice_detail", client.get(f"/api/resident/invoice/{invoice['id']}"))
+    else:
+        unpaid = []
+    await _step(rec, "resident.notifications", client.get("/api/notifications/user/me"))
+
+    if unpaid and rng.random() < ctx["pay_ratio"]:
+        invoice = unpaid[0]
+        amount = min(invoice["remaining_amount"], round(rng.uniform(1, 20), 2))
+        init = (await _step(rec, "resident.pay_initiate", client.post("/api/azericard/initiate", json={
+            "resident_id": invoice["resident_id"],
+            "invoice_id": invoice["id"],
+            "amount": f"{amount:.2f}",
+        }))).json()
+        callback = gateway.callback_for(init["params"], approve=rng.random() >= ctx["decline_ratio"])
+        await _step(rec, "gateway.callback", client.post("/api/azericard/callback", data=callback))
+    rec.journeys["resident"] += 1
+
+
+async def operator_journey(client: httpx.AsyncClient, rec: Recorder, ctx: dict, gateway: StubGateway,
+                           rng: random.Random) -> None:
+    resident = ctx["resident"]
+    year, month = ctx["year"], ctx["month"]
+    if not ctx.get("logged_in"):
+        await _step(rec, "operator.login", client.post(
+            "/api/auth/login", json={"username": ctx["operator"], "password": ctx["password"]}
+        ))
+        ctx["logged_in"] = True
+
+    await _step(rec, "operator.readings_list", client.get(
+        "/api/readings/", params={"block_id": resident["block_id"], "year": year, "month": month}
+    ))
+
+    # Показания растут монотонно, чтобы повторные вводы не упирались в проверку "меньше прошлого".
+    counters = ctx.setdefault("counters", {})
+    items = []
+    for meter_id in resident["meter_ids"]:
+        counters[meter_id] = counters.get(meter_id, 1_000_000 + rng.randint(0, 1000)) + rng.randint(1, 50)
+        items.append({"meter_id": meter_id, "new_value": counters[meter_id]})
+    date_str = f"{year}-{month:02d}-{min(28, 20 + rng.randint(0, 8)):02d}"
+    await _step(rec, "operator.enter_readings", client.post("/api/readings/", json={
+        "resident_id": resident["resident_id"], "date_str": date_str, "items": items,
+    }))
+
+    if resident["meter_ids"]:
+        meter_id = rng.choice(resident["meter_ids"])
+        await _step(rec, "operator.upload_photo", client.post(
+            f"/api/readings/meter/{meter_id}/photo",
+            data={"date_str": date_str},
+            files={"file": ("meter.jpg", ctx["photo"], "image/jpeg")},
+        ))
+
+    if rng.random() < ctx["issue_ratio"]:
+        due = (date(year, month, 28) + timedelta(days=18)).isoformat()
+        await _step(rec, "operator.bulk_issue", client.post("/api/invoices/bulk-issue", json={
+            "action": "by_block", "block_id": resident["block_id"], "due_date": due,
+        }))
+    rec.journeys["operator"] += 1
+
+
+async def virtual_user(kind: str, index: int, args, rec: Recorder, ctx: dict, gateway: StubGateway,
+                       deadline: float, start_delay: float) -> None:
+    await asyncio.sleep(start_delay)
+    rng = random.Random(f"{args.seed}:{kind}:{index}")
+    journey = resident_journey if kind == "resident" else operator_journey
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await journey(client, rec, ctx, gateway, rng)
+            except StepFailed:
+                rec.journeys[f"{kind}_failed"] += 1
+            if args.think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+
+def _synthetic_photo(kb: int) -> bytes:
+    """JPEG примерно заданного размера: шум сжимается плохо, как и реальное фото."""
+    from PIL import Image
+
+    rng = random.Random(0)
+    side = 400
+    while True:
+        img = Image.frombytes("RGB", (side, side * 3 // 4), rng.randbytes(side * (side * 3 // 4) * 3))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=92)
+        if buf.tell() >= kb * 1024 or side >= 4000:
+            return buf.getvalue()
+        side = int(side * 1.3)
+
+
+async def run(args) -> dict:
+    manifest = json.loads(Path(args.manifest).read_text(encoding="utf-8"))
+    residents = manifest["residents"]
+    draft = manifest["draft_period"]
+    gateway = StubGateway(Path(args.stub_key))
+    photo = _synthetic_photo(args.photo_kb)
+    rec = Recorder()
+
+    total = args.residents + args.operators
+    deadline = time.perf_counter() + args.ramp + args.duration
+    tasks = []
+    for i in range(total):
+        kind = "resident" if i < args.residents else "operator"
+        ctx = {
+            "resident": residents[i % len(residents)],
+            "password": manifest["password"],
+            "operator": manifest["operator"],
+            "year": draft["year"],
+            "month": draft["month"],
+            "photo": photo,
+            "pay_ratio": args.pay_ratio,
+            "decline_ratio": args.decline_ratio,
+            "issue_ratio": args.issue_ratio,
+        }
+        start_delay = args.ramp * i / total if total else 0
+        tasks.append(virtual_user(kind, i, args, rec, ctx, gateway, deadline, start_delay))
+
+    print(f"{args.residents} residents + {args.operators} operators, ramp {args.ramp}s, "
+          f"duration {args.duration}s against {args.base_url}")
+    await asyncio.gather(*tasks)
+    rec.finished = time.perf_counter()
+    return rec.report()
+
+
+def _print_report(report: dict) -> None:
+    print(f"\n{'step':<28}{'req':>8}{'err%':>8}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for step, s in report["steps"].items():
+        print(f"{step:<28}{s['requests']:>8}{s['error_rate'] * 100:>7.1f}%{s['rps']:>8}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>9}")
+    print(f"\ntotal: {report['requests']} requests, {report['rps']} rps, "
+          f"error rate {report['error_rate'] * 100:.2f}%, journeys {report['journeys']}")
+    for step, sample in report["error_samples"].items():
+        print(f"  first error in {step}: {sample}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test resident and operator journeys.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_env = sub.add_parser("stub-env", help="print .env lines for the AzeriCard stub")
+    p_env.add_argument("--stub-key", default="loadtest-azericard.pem")
+    p_env.add_argument("--base-url", default="http://127.0.0.1:8000")
+
+    p_seed = sub.add_parser("seed", help="seed synthetic data (same options as seed_synthetic.py)")
+    p_seed.add_argument("seed_args", nargs=argparse.REMAINDER)
+
+    p_run = sub.add_parser("run", help="run the load test")
+    p_run.add_argument("--base-url", default="http://127.0.0.1:8000")
+    p_run.add_argument("--manifest", default="seed-manifest.json")
+    p_run.add_argument("--stub-key", default="loadtest-azericard.pem")
+    p_run.add_argument("--residents", type=int, default=50, help="concurrent resident users")
+    p_run.add_argument("--operators", type=int, default=3, help="concurrent operator users")
+    p_run.add_argument("--ramp", type=float, default=30, help="seconds to start all users")
+    p_run.add_argument("--duration", type=float, default=120, help="seconds at full load after ramp")
+    p_run.add_argument("--think-time", type=float, default=1.0, help="mean pause between journeys, s")
+    p_run.add_argument("--pay-ratio", type=float, default=0.3)
+    p_run.add_argument("--decline-ratio", type=float, default=0.05)
+    p_run.add_argument("--issue-ratio", type=float, default=0.1)
+    p_run.add_argument("--photo-kb", type=int, default=2500)
+    p_run.add_argument("--timeout", type=float, default=30)
+    p_run.add_argument("--seed", type=int, default=1)
+    p_run.add_argument("--out", help="result file (default load-results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.command == "stub-env":
+        print(stub_env(Path(args.stub_key), args.base_url))
+        return 0
+
+    if args.command == "seed":
+        import seed_synthetic
+
+        sys.argv = ["seed_synthetic.py", *args.seed_args]
+        return seed_synthetic.main()
+
+    report = asyncio.run(run(args))
+    report["config"] = {k: v for k, v in vars(args).items() if k != "command"}
+    report["timestamp"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    _print_report(report)
+
+    out_path = Path(args.out) if args.out else (
+        BACKEND_ROOT / "load-results" / f"{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    )
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Saved: {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Перенос локальных загрузок (uploads/) в S3-совместимое хранилище.
+
+Ключи сохраняются как есть (в том числе старые, без хеша в имени), поэтому значения
+в БД менять не нужно: после переноса достаточно переключить STORAGE_BACKEND=s3.
+Уже существующие в бакете объекты пропускаются — скрипт можно перезапускать.
+
+Запуск (из Application/Backend, с заполненными STORAGE_S3_* в .env):
+    python scripts/migrate_uploads.py --source uploads
+    python scripts/migrate_uploads.py --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.services.storage import LocalStorage, S3Storage  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Copy local uploads to the S3 storage backend.")
+    parser.add_argument("--source", default="uploads", help="local uploads directory")
+    parser.add_argument("--dry-run", action="store_true", help="only list what would be copied")
+    args = parser.parse_args()
+
+    source = LocalStorage(args.source)
+    target = S3Storage()
+    copied = skipped = total_bytes = 0
+    for key in source.iter_keys():
+        if target.exists(key):
+            skipped += 1
+            continue
+        size = source.size(key) or 0
+        if not args.dry_run:
+            target.put_file(key, source.path(key))
+        copied += 1
+        total_bytes += size
+        print(f"{'would copy' if args.dry_run else 'copied'} {key} ({size} B)")
+
+    print(f"\ncopied={copied} skipped={skipped} bytes={total_bytes}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
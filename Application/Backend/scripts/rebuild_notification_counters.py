@@ -0,0 +1,40 @@
+"""
+Пересчёт счётчиков непрочитанных уведомлений с нуля.
+
+Счётчики ведёт триггер на notifications и наполняет run_bootstrap_schema при первом старте,
+поэтому в обычной работе скрипт не нужен. Он для ремонта: если триггер отключали
+(`ALTER TABLE notifications DISABLE TRIGGER ...`) или таблицу правили в обход него.
+На время пересчёта запись в notifications блокируется.
+
+Запуск (из Application/Backend, БД из .env):
+    python scripts/rebuild_notification_counters.py
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from app.database import SessionLocal  # noqa: E402
+from app.models import NotificationUnreadCounter  # noqa: E402
+from app.services.notification_counters import rebuild_unread_counters  # noqa: E402
+
+
+def main() -> int:
+    db = SessionLocal()
+    try:
+        rebuild_unread_counters(db)
+        rows = db.query(NotificationUnreadCounter).count()
+        print(f"rebuilt counters={rows}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
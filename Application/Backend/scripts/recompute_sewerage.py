@@ -0,0 +1,68 @@
+"""
+Разовый пересчёт авто-канализации во всех открытых счетах.
+
+Раньше строка «Канализация» досоздавалась при открытии счёта; теперь она пересчитывается
+только при записи (services/billing.py). Скрипт ставит в очередь sewerage_recompute_queue
+все WATER-тарифы и сразу прогоняет очередь — так счета, которые до обновления ни разу
+не открывали, получают актуальную строку и итоги.
+
+Номер счёта тоже раньше исправлялся при открытии; теперь он сохраняется при записи
+(utils.sync_invoice_numbers), а скрипт приводит к каноническому виду уже сохранённые номера
+всех счетов. Повторный запуск безопасен.
+
+Запуск (из Application/Backend, БД из .env):
+    python scripts/recompute_sewerage.py
+    python scripts/recompute_sewerage.py --enqueue-only   # пересчитает задача sewerage-recompute
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+os.environ["SCHEDULER_ENABLED"] = "0"
+
+from app.database import SessionLocal  # noqa: E402
+from app.models import Invoice, MeterType, Tariff  # noqa: E402
+from app.services.billing import enqueue_sewerage_recompute, run_sewerage_recompute  # noqa: E402
+from app.utils import sync_invoice_numbers  # noqa: E402
+
+NUMBERS_BATCH = 200
+
+
+def normalize_invoice_numbers(db) -> int:
+    """Канонические номера во всех счетах, пачками резидентов (коммит на пачку)."""
+    resident_ids = [rid for (rid,) in db.query(Invoice.resident_id).distinct().order_by(Invoice.resident_id).all()]
+    changed = 0
+    for start in range(0, len(resident_ids), NUMBERS_BATCH):
+        changed += sync_invoice_numbers(db, resident_ids[start:start + NUMBERS_BATCH])
+        db.commit()
+    return changed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Recompute auto-sewerage lines of open invoices and normalize invoice numbers.")
+    parser.add_argument("--enqueue-only", action="store_true", help="only fill the queue, leave it to the job")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        tariff_ids = [tid for (tid,) in db.query(Tariff.id).filter(Tariff.meter_type == MeterType.WATER).all()]
+        for tariff_id in tariff_ids:
+            enqueue_sewerage_recompute(db, tariff_id)
+        db.commit()
+        print(f"enqueued tariffs={len(tariff_ids)}")
+        if not args.enqueue_only:
+            print(f"recomputed invoices={run_sewerage_recompute(db)}")
+        print(f"renumbered invoices={normalize_invoice_numbers(db)}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
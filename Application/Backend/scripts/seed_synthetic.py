@@ -0,0 +1,500 @@
+"""
+Генератор синтетического комплекса для бенчмарков и нагрузочных тестов.
+
+Создаёт (в БД из .env):
+- блоки и резидентов (владельцы, арендаторы, офисы), пользователей-жителей
+  (часть жителей связана с двумя домами — общий пул аванса), оператора и админа;
+- тарифы со ступенями для всех MeterType и счётчики каждого типа;
+- показания за N месяцев (по умолчанию 24) c суммами из compute_amount_components,
+  логи показаний, счета со строками (PAID / PARTIAL / ISSUED / текущий месяц — DRAFT);
+- оплаты с распределением по строкам, частичные оплаты и пополнения аванса;
+- уведомления о счетах и новости (в т.ч. с target_blocks).
+
+Запуск (из Application/Backend, на пустой/тестовой БД):
+    python scripts/seed_synthetic.py --blocks 10 --units 40 --months 24
+    python scripts/seed_synthetic.py --scale month-end      # пресет для пика конца месяца
+
+Результат — манифест (по умолчанию seed-manifest.json) с логинами/паролем и id,
+его читают scripts/bench.py и scripts/load_test.py. Генерация детерминирована по --seed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.database import SessionLocal  # noqa: E402
+from app.models import (  # noqa: E402
+    Block,
+    CustomerType,
+    Invoice,
+    InvoiceLine,
+    InvoiceStatus,
+    MeterReading,
+    MeterType,
+    News,
+    Notification,
+    NotificationStatus,
+    Payment,
+    PaymentApplication,
+    PaymentApplicationLine,
+    PaymentMethod,
+    ReadingLog,
+    Resident,
+    ResidentMeter,
+    ResidentStatus,
+    ResidentType,
+    RoleEnum,
+    Tariff,
+    TariffStep,
+    User,
+)
+from app.routers.api_readings import compute_amount_components  # noqa: E402
+from app.security import hash_password  # noqa: E402
+from app.services.auto_advance_queue import enqueue_residents  # noqa: E402
+
+
+SCALES = {
+    "small": {"blocks": 3, "units": 10, "months": 6},
+    "default": {"blocks": 10, "units": 40, "months": 24},
+    "month-end": {"blocks": 20, "units": 60, "months": 24},
+}
+
+METER_LABELS = {
+    MeterType.ELECTRIC: ("Электричество", "кВт·ч"),
+    MeterType.GAS: ("Газ", "м³"),
+    MeterType.WATER: ("Вода", "м³"),
+    MeterType.SEWERAGE: ("Канализация", "м³"),
+    MeterType.SERVICE: ("Сервис", "мес."),
+    MeterType.RENT: ("Аренда", "мес."),
+    MeterType.CONSTRUCTION: ("Строительство", "мес."),
+}
+FIXED_TYPES = {MeterType.SERVICE, MeterType.RENT, MeterType.CONSTRUCTION}
+
+# Ступени: (from, to, price); None в "to" — без верхней границы
+TARIFF_STEPS = {
+    MeterType.ELECTRIC: [(0, 200, "0.084"), (200, 300, "0.10"), (300, None, "0.15")],
+    MeterType.GAS: [(0, 1200, "0.12"), (1200, 2500, "0.20"), (2500, None, "0.26")],
+    MeterType.WATER: [(0, None, "0.60")],
+    MeterType.SEWERAGE: [(0, None, "0.25")],
+    MeterType.SERVICE: [(0, None, "45.00")],
+    MeterType.RENT: [(0, None, "650.00")],
+}
+
+
+@dataclass
+class SeedConfig:
+    blocks: int
+    units: int
+    months: int
+    seed: int
+    password: str
+    prefix: str
+
+
+def _month_seq(months: int) -> list[tuple[int, int]]:
+    today = date.today()
+    y, m = today.year, today.month
+    seq = []
+    for _ in range(months):
+        seq.append((y, m))
+        y, m = (y - 1, 12) if m == 1 else (y, m - 1)
+    return list(reversed(seq))
+
+
+def _consumption(rng: random.Random, meter_type: MeterType, month: int) -> Decimal:
+    if meter_type == MeterType.ELECTRIC:
+        return Decimal(rng.randint(120, 480))
+    if meter_type == MeterType.GAS:
+        winter = month in (11, 12, 1, 2, 3)
+        return Decimal(rng.randint(120, 320) if winter else rng.randint(15, 70))
+    if meter_type in (MeterType.WATER, MeterType.SEWERAGE):
+        return Decimal(rng.randint(4, 22))
+    return Decimal("1")
+
+
+def _create_tariffs(db: Session, cfg: SeedConfig) -> dict[tuple[MeterType, CustomerType], Tariff]:
+    tariffs: dict[tuple[MeterType, CustomerType], Tariff] = {}
+    for customer_type in (CustomerType.INDIVIDUAL, CustomerType.LEGAL):
+        vat = 0 if customer_type == CustomerType.INDIVIDUAL else 18
+        for meter_type in MeterType:
+            tariff = Tariff(
+                name=f"{cfg.prefix} {meter_type.value.title()}",
+                meter_type=meter_type,
+                customer_type=customer_type,
+                vat_percent=vat,
+                stable_tariff=Decimal("1.00") if meter_type in (MeterType.ELECTRIC, MeterType.GAS) else Decimal("0"),
+                sewerage_percent=Decimal("20") if meter_type == MeterType.WATER else Decimal("0"),
+                use_multiplier=False,
+                consumption_multiplier=Decimal("1"),
+                is_active=True,
+            )
+            if meter_type == MeterType.CONSTRUCTION:
+                start = date.today().replace(day=1) - timedelta(days=365 * 3)
+                tariff.steps = [
+                    TariffStep(from_date=start, to_date=None, price=Decimal("300.00")),
+                ]
+            else:
+                tariff.steps = [
+                    TariffStep(
+                        from_value=Decimal(lo),
+                        to_value=(Decimal(hi) if hi is not None else None),
+                        price=Decimal(price),
+                    )
+                    for lo, hi, price in TARIFF_STEPS[meter_type]
+                ]
+            db.add(tariff)
+            tariffs[(meter_type, customer_type)] = tariff
+    db.flush()
+    return tariffs
+
+
+def _meter_types_for(rng: random.Random, resident_type: ResidentType) -> list[MeterType]:
+    types = [MeterType.ELECTRIC, MeterType.WATER, MeterType.SERVICE]
+    if resident_type != ResidentType.OFFICE:
+        types.append(MeterType.GAS)
+    if rng.random() < 0.25:
+        types.append(MeterType.SEWERAGE)
+    if resident_type in (ResidentType.TENANT, ResidentType.SUBTENANT):
+        types.append(MeterType.RENT)
+    if rng.random() < 0.05:
+        types.append(MeterType.CONSTRUCTION)
+    return types
+
+
+def _seed_resident_history(
+    db: Session,
+    rng: random.Random,
+    resident: Resident,
+    meters: list[ResidentMeter],
+    tariffs: dict[tuple[MeterType, CustomerType], Tariff],
+    months: list[tuple[int, int]],
+    operator: User,
+    resident_users: list[User],
+    tenant_id: int,
+) -> dict:
+    counts = {"readings": 0, "invoices": 0, "payments": 0, "notifications": 0}
+    values = {m.id: Decimal(m.initial_reading or 0) for m in meters}
+    gas_year_total: dict[tuple[int, int], Decimal] = {}
+    advance_topup = rng.random() < 0.2
+    last_index = len(months) - 1
+
+    for idx, (year, month) in enumerate(months):
+        reading_date = datetime(year, month, 25)
+        invoice = Invoice(
+            resident_id=resident.id,
+            period_year=year,
+            period_month=month,
+            status=InvoiceStatus.DRAFT,
+            created_at=reading_date,
+            created_by_id=operator.id,
+        )
+        db.add(invoice)
+        lines: list[InvoiceLine] = []
+        readings: list[MeterReading] = []
+
+        for meter in meters:
+            tariff = tariffs[(meter.meter_type, resident.customer_type)]
+            consumption = _consumption(rng, meter.meter_type, month)
+            if meter.meter_type not in FIXED_TYPES:
+                values[meter.id] += consumption
+            annual_prev = None
+            if meter.meter_type == MeterType.GAS:
+                annual_prev = gas_year_total.get((meter.id, year), Decimal("0"))
+                gas_year_total[(meter.id, year)] = annual_prev + consumption
+            comp = compute_amount_components(consumption, tariff, annual_prev=annual_prev)
+            reading = MeterReading(
+                resident_meter=meter,
+                reading_date=reading_date,
+                value=values[meter.id],
+                consumption=consumption,
+                tariff_id=tariff.id,
+                amount_net=comp["amount_net"],
+                vat_percent=tariff.vat_percent,
+                amount_vat=comp["amount_vat"],
+                amount_total=comp["amount_total"],
+                stable_fee_net=comp["stable_net"],
+                stable_fee_vat=comp["stable_vat"],
+                stable_fee_total=comp["stable_total"],
+                created_at=reading_date,
+                created_by_id=operator.id,
+            )
+            readings.append(reading)
+            label, unit = METER_LABELS[meter.meter_type]
+            lines.append(InvoiceLine(
+                invoice=invoice,
+                meter_reading=reading,
+                description=f"{label} {float(consumption)} {unit}",
+                amount_net=comp["amount_net"],
+                amount_vat=comp["amount_vat"],
+                amount_total=comp["amount_total"],
+            ))
+
+        db.add_all(readings)
+        db.add_all(lines)
+        invoice.amount_net = sum((l.amount_net for l in lines), Decimal("0"))
+        invoice.amount_vat = sum((l.amount_vat for l in lines), Decimal("0"))
+        invoice.amount_total = sum((l.amount_total for l in lines), Decimal("0"))
+        db.flush()
+
+        for reading in readings:
+            db.add(ReadingLog(
+                action="CREATE",
+                reading_id=reading.id,
+                resident_meter_id=reading.resident_meter_id,
+                user_id=operator.id,
+                details=f"create month={year}-{month:02d} new={float(reading.value)} cons={float(reading.consumption)}",
+                created_at=reading_date,
+            ))
+        counts["readings"] += len(readings)
+        counts["invoices"] += 1
+
+        if idx == last_index:
+            continue  # текущий месяц — черновик, его выставит bulk issue
+
+        invoice.status = InvoiceStatus.ISSUED
+        invoice.number = f"INV-{resident.id}/{tenant_id}/{year}-{month:02d}"
+        due = (date(year, month, 28) + timedelta(days=4)).replace(day=1) + timedelta(days=14)
+        invoice.due_date = due
+        for user in resident_users:
+            db.add(Notification(
+                user_id=user.id,
+                resident_id=resident.id,
+                message=f"Выставлен счёт {invoice.number} на сумму {float(invoice.amount_total):.2f} ₼",
+                notification_type="INVOICE",
+                related_id=invoice.id,
+                status=NotificationStatus.READ if idx < last_index - 1 else NotificationStatus.UNREAD,
+                created_at=reading_date + timedelta(days=1),
+            ))
+            counts["notifications"] += 1
+
+        # Последний выставленный месяц чаще не оплачен / оплачен частично
+        roll = rng.random()
+        if idx == last_index - 1:
+            share = Decimal("0") if roll < 0.5 else (Decimal("0.5") if roll < 0.8 else Decimal("1"))
+        else:
+            share = Decimal("1") if roll < 0.93 else Decimal("0.5")
+        if share <= 0 or invoice.amount_total <= 0:
+            continue
+
+        paid_total = (invoice.amount_total * share).quantize(Decimal("0.01"))
+        received_at = datetime.combine(due - timedelta(days=rng.randint(0, 12)), datetime.min.time()) + timedelta(hours=10)
+        payment = Payment(
+            resident_id=resident.id,
+            received_at=received_at,
+            amount_total=paid_total,
+            method=rng.choice([PaymentMethod.CASH, PaymentMethod.CARD, PaymentMethod.TRANSFER, PaymentMethod.ONLINE]),
+            reference=f"SYN-{resident.id}-{year}{month:02d}",
+            created_by_id=operator.id,
+        )
+        application = PaymentApplication(
+            payment=payment,
+            invoice=invoice,
+            amount_applied=paid_total,
+            reference="DIRECT",
+            created_at=received_at,
+        )
+        remaining = paid_total
+        for line in lines:
+            if remaining <= 0:
+                break
+            amount = min(Decimal(line.amount_total), remaining)
+            if amount > 0:
+                application.line_distributions.append(PaymentApplicationLine(invoice_line=line, amount=amount))
+                remaining -= amount
+        db.add(payment)
+        invoice.status = InvoiceStatus.PAID if share >= 1 else InvoiceStatus.PARTIAL
+        counts["payments"] += 1
+
+    if advance_topup:
+        db.add(Payment(
+            resident_id=resident.id,
+            received_at=datetime.utcnow() - timedelta(days=rng.randint(1, 20)),
+            amount_total=Decimal(rng.randint(50, 300)),
+            method=PaymentMethod.CARD,
+            reference=f"SYN-ADV-{resident.id}",
+            comment="Пополнение аванса",
+            created_by_id=operator.id,
+        ))
+        counts["payments"] += 1
+
+    db.flush()
+    return counts
+
+
+def seed(db: Session, cfg: SeedConfig, log=print) -> dict:
+    rng = random.Random(cfg.seed)
+    if db.query(Block).filter(Block.name.like(f"{cfg.prefix}-%")).first():
+        raise SystemExit(f"Blocks with prefix {cfg.prefix!r} already exist — use a fresh database or another --prefix")
+
+    password_hash = hash_password(cfg.password)
+    slug = cfg.prefix.lower()
+
+    def make_user(username: str, role: RoleEnum, full_name: str) -> User:
+        user = User(
+            username=username,
+            password_hash=password_hash,
+            role=role,
+            full_name=full_name,
+            require_password_change=False,
+            is_active=True,
+        )
+        db.add(user)
+        return user
+
+    admin = make_user(f"{slug}_admin", RoleEnum.ADMIN, "Synthetic Admin")
+    operator = make_user(f"{slug}_operator", RoleEnum.OPERATOR, "Synthetic Operator")
+    db.flush()
+
+    tariffs = _create_tariffs(db, cfg)
+    months = _month_seq(max(2, cfg.months))
+    totals = {"residents": 0, "readings": 0, "invoices": 0, "payments": 0, "notifications": 0}
+    manifest_residents: list[dict] = []
+    shared_user: User | None = None
+    block_names = []
+
+    for b in range(cfg.blocks):
+        block = Block(name=f"{cfg.prefix}-{chr(ord('A') + b % 26)}{b // 26 or ''}", created_by_id=admin.id)
+        db.add(block)
+        block_names.append(block.name)
+        db.flush()
+
+        for u in range(cfg.units):
+            resident_type = rng.choices(
+                [ResidentType.OWNER, ResidentType.TENANT, ResidentType.SUBTENANT, ResidentType.OFFICE],
+                weights=[70, 18, 4, 8],
+            )[0]
+            resident = Resident(
+                block_id=block.id,
+                unit_number=str(u + 1),
+                resident_type=resident_type,
+                customer_type=CustomerType.LEGAL if resident_type == ResidentType.OFFICE else CustomerType.INDIVIDUAL,
+                status=ResidentStatus.ACTIVE,
+                owner_full_name=f"Resident {block.name}/{u + 1}",
+                created_by_id=admin.id,
+            )
+            db.add(resident)
+            db.flush()
+
+            meters = [
+                ResidentMeter(
+                    resident_id=resident.id,
+                    meter_type=meter_type,
+                    serial_number=f"{cfg.prefix}-{resident.id}-{meter_type.value[:3]}",
+                    initial_reading=Decimal("0") if meter_type in FIXED_TYPES else Decimal(rng.randint(0, 5000)),
+                    tariff_id=tariffs[(meter_type, resident.customer_type)].id,
+                    is_active=True,
+                )
+                for meter_type in _meter_types_for(rng, resident_type)
+            ]
+            db.add_all(meters)
+
+            # ~10% жителей владеют двумя домами: общий пул аванса
+            if shared_user is not None and rng.random() < 0.5:
+                user = shared_user
+                shared_user = None
+            else:
+                user = make_user(f"{slug}_res_{resident.id}", RoleEnum.RESIDENT, resident.owner_full_name)
+                if rng.random() < 0.1:
+                    shared_user = user
+            db.flush()
+            user.resident_links.append(resident)
+            db.flush()
+
+            counts = _seed_resident_history(
+                db, rng, resident, meters, tariffs, months, operator, [user], tenant_id=user.id
+            )
+            for key, value in counts.items():
+                totals[key] += value
+            totals["residents"] += 1
+            manifest_residents.append({
+                "resident_id": resident.id,
+                "block_id": block.id,
+                "username": user.username,
+                "meter_ids": [m.id for m in meters],
+            })
+
+            if totals["residents"] % 50 == 0:
+                db.commit()
+                log(f"  residents: {totals['residents']}")
+        db.commit()
+
+    for i in range(12):
+        targets = None if i % 3 else [rng.choice(block_names)]
+        db.add(News(
+            title=json.dumps({"ru": f"Новость {i + 1}", "az": f"Xəbər {i + 1}", "en": f"News {i + 1}"}, ensure_ascii=False),
+            content=json.dumps({"ru": "Текст новости", "az": "Xəbər mətni", "en": "News text"}, ensure_ascii=False),
+            target_blocks=targets,  # JSONB-массив, не JSON-строка: иначе не сработает `?|`
+            is_active=True,
+            priority=rng.randint(0, 3),
+            published_at=datetime.utcnow() - timedelta(days=i * 5),
+            created_by_id=admin.id,
+        ))
+    # Как и при выставлении счетов через API — резиденты с открытыми счетами попадают в очередь авто-аванса
+    enqueue_residents(db, [item["resident_id"] for item in manifest_residents])
+    db.commit()
+
+    current_year, current_month = months[-1]
+    return {
+        "prefix": cfg.prefix,
+        "seed": cfg.seed,
+        "password": cfg.password,
+        "admin": admin.username,
+        "operator": operator.username,
+        "blocks": block_names,
+        "months": [f"{y}-{m:02d}" for y, m in months],
+        "draft_period": {"year": current_year, "month": current_month},
+        "totals": totals,
+        "residents": manifest_residents,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Seed a synthetic residential complex.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="default")
+    parser.add_argument("--blocks", type=int)
+    parser.add_argument("--units", type=int, help="residents per block")
+    parser.add_argument("--months", type=int, help="months of history (>= 2)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="Bench#2024")
+    parser.add_argument("--prefix", default="SYN")
+    parser.add_argument("--manifest", default="seed-manifest.json")
+    args = parser.parse_args()
+
+    preset = SCALES[args.scale]
+    cfg = SeedConfig(
+        blocks=args.blocks or preset["blocks"],
+        units=args.units or preset["units"],
+        months=args.months or preset["months"],
+        seed=args.seed,
+        password=args.password,
+        prefix=args.prefix,
+    )
+    print(f"Seeding {cfg.blocks} blocks x {cfg.units} units, {cfg.months} months (seed={cfg.seed})")
+    db = SessionLocal()
+    try:
+        manifest = seed(db, cfg)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    Path(args.manifest).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(manifest["totals"], indent=2))
+    print(f"Manifest: {args.manifest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
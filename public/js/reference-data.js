@@ -0,0 +1,41 @@
+// Shared reference data (blocks, residents, tariffs, meter types) from GET /api/reference.
+// One request per page load; later calls revalidate through the browser cache (ETag -> 304).
+(function initReferenceData() {
+    const MAX_AGE_MS = 30000;
+    let cached = null;
+    let loadedAt = 0;
+    let inflight = null;
+
+    function apiBase() {
+        return window.getApiBase ? window.getApiBase() : (window.API_BASE || 'http://localhost:8000');
+    }
+
+    async function fetchReference() {
+        const response = await fetch(`${apiBase()}/api/reference`, { credentials: 'include' });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const data = await response.json();
+        cached = {
+            version: data.version || null,
+            blocks: data.blocks || [],
+            residents: data.residents || [],
+            tariffs: data.tariffs || [],
+            meter_types: data.meter_types || []
+        };
+        loadedAt = Date.now();
+        return cached;
+    }
+
+    window.ReferenceData = {
+        // force=true: after creating/editing a block, resident or tariff on this page
+        get(force = false) {
+            if (!force && cached && Date.now() - loadedAt < MAX_AGE_MS) return Promise.resolve(cached);
+            if (!inflight) {
+                inflight = fetchReference().finally(() => { inflight = null; });
+            }
+            return inflight;
+        },
+        invalidate() {
+            cached = null;
+        }
+    };
+})();
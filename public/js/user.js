@@ -310,8 +310,9 @@ window.updateUserHeader = function updateUserHeader(userData) {
         const initials = fullName.split(' ').map(n => n[0]).join('').toUpperCase().substring(0, 2);
         
         if (userData.avatar_path) {
-            const ts = Date.now();
-            const photoUrl = `${API_BASE_URL}${userData.avatar_path}?t=${ts}`;
+            // Маленький вариант для шапки; URL версионный, поэтому кэшируется браузером
+            const variants = userData.avatar_urls || {};
+            const photoUrl = `${API_BASE_URL}${variants['128.webp'] || userData.avatar_path}`;
             const img = new Image();
             img.onload = function() {
                 userAvatarEl.classList.add('has-preview-photo');
@@ -1463,6 +1464,18 @@ function ensureDashboardNewsModal() {
     return overlay;
 }
 
+// Лента для жителя: сервер уже отдаёт только активные новости его блоков (кэш + ETag)
+function dashboardNewsUrl() {
+    const params = new URLSearchParams({ limit: '100' });
+    const blocks = (window.dashboardData?.residents || [])
+        .map(r => (r.code || '').split('/')[0].trim())
+        .filter(Boolean);
+    if (blocks.length) {
+        params.append('blocks', Array.from(new Set(blocks)).join(','));
+    }
+    return `${API_BASE_URL}/api/news/public?${params.toString()}`;
+}
+
 // Load latest 3 news for dashboard
 window.loadDashboardNews = async function loadDashboardNews() {
     const newsGrid = document.getElementById('dashboardNewsGrid');
@@ -1470,7 +1483,7 @@ window.loadDashboardNews = async function loadDashboardNews() {
     
     try {
         const lang = resolveUiLanguage();
-        const response = await fetch(`${API_BASE_URL}/api/news/admin?per_page=100`, {
+        const response = await fetch(dashboardNewsUrl(), {
             credentials: 'include'
         });
         
@@ -1599,7 +1612,7 @@ window.openDashboardNewsDetail = async function openDashboardNewsDetail(newsId)
         let news = (window._dashboardNewsCache || []).find(n => n.id === id);
 
         if (!news) {
-            const response = await fetch(`${API_BASE_URL}/api/news/admin?per_page=100`, {
+            const response = await fetch(dashboardNewsUrl(), {
                 credentials: 'include'
             });
             if (!response.ok) throw new Error('Failed to load news');
@@ -2182,9 +2195,37 @@ window.addEventListener('beforeunload', () => {
     
     // Load notifications count on page load
     updateNotificationCount();
-    
-    // Refresh count more often so notifications appear faster (every 10 seconds)
-    setInterval(updateNotificationCount, 10000);
+
+    // Count and new notifications are pushed over SSE; poll only while the stream is down
+    let notificationStream = null;
+    function openNotificationStream() {
+        if (typeof EventSource === 'undefined' || notificationStream) return;
+        const stream = new EventSource(`${API_BASE}/api/notifications/stream?scope=user`, { withCredentials: true });
+        notificationStream = stream;
+        stream.addEventListener('count', (e) => {
+            let count = 0;
+            try { count = JSON.parse(e.data).count || 0; } catch (_e) { /* ignore */ }
+            if (notificationBadge) {
+                notificationBadge.textContent = count;
+                notificationBadge.style.display = count > 0 ? 'flex' : 'none';
+            }
+        });
+        stream.addEventListener('notification', () => {
+            if (notificationsModal && notificationsModal.classList.contains('show')) {
+                loadNotifications();
+            }
+        });
+        stream.onerror = () => {
+            // 401/503: the browser gives up on the stream, fall back to polling
+            if (stream.readyState === EventSource.CLOSED) notificationStream = null;
+        };
+    }
+    openNotificationStream();
+    setInterval(() => {
+        if (!notificationStream || notificationStream.readyState !== EventSource.OPEN) {
+            updateNotificationCount();
+        }
+    }, 60000);
 
     // Re-render notification texts on language switch.
     window.addEventListener('languageChanged', () => {